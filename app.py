@@ -3,9 +3,6 @@
 import eventlet
 eventlet.monkey_patch()
 
-import logging
-import sys
-
 # Flask-related imports
 from flask import Flask
 from flask_cors import CORS
@@ -14,6 +11,10 @@ from flask_socketio import SocketIO
 # Importing API route blueprints
 from routes.campaign_routes import campaign_bp
 from routes.task_routes import task_bp
+from routes.admin_routes import admin_bp
+
+from services.watchdog_service import start_hub_watchdog
+from utils.logging_config import configure_logging
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -30,23 +31,13 @@ app.extensions['socketio'] = socketio
 # Register API routes with URL prefixes
 app.register_blueprint(campaign_bp, url_prefix='/campaigns')  # Routes related to campaign management
 app.register_blueprint(task_bp, url_prefix='/tasks')  # Routes related to task handling
+app.register_blueprint(admin_bp, url_prefix='/admin')  # Diagnostics, require ADMIN_TOKEN
+
+# JSON logs (LOG_LEVEL, default INFO) written by a background thread, so handlers never wait on stdout
+configure_logging()
 
-logging.basicConfig(
-    level=logging.DEBUG,  # Ensure DEBUG messages are shown
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout)  # Ensure logs are printed to the terminal
-    ]
-)
-
-# Ensure Flask doesn't override logging
-app.logger.setLevel(logging.DEBUG)
-
-# Manually attach handlers to Flask logging
-if not app.logger.handlers:
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-    app.logger.addHandler(handler)
+# Report anything that blocks the eventlet hub (and with it every request and socket)
+start_hub_watchdog()
 
 # Run the Flask application with WebSocket support
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+# ASGI entry point serving the same routes as app.py, without eventlet monkey-patching.
+#
+# Run side by side with the eventlet/gunicorn server, e.g.:
+#   uvicorn asgi:application --host 0.0.0.0 --port 5002 --workers 4
+#
+# Flask routes run in asgiref's thread pool, media processing runs on the event
+# loop via process_media_async, and CPU-bound image conversion goes to a process pool.
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import socketio
+from asgiref.wsgi import WsgiToAsgi
+
+# Flask-related imports
+from flask import Flask
+from flask_cors import CORS
+
+# Importing API route blueprints
+from routes.campaign_routes import campaign_bp
+from routes.task_routes import task_bp
+from routes.admin_routes import admin_bp
+
+from services.async_media_processing_service import process_media_async
+from utils.logging_config import configure_logging
+
+configure_logging()
+
+# Socket.IO server running natively on the event loop
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="http://localhost:3000")
+
+# Process pool for CPU-bound work (Pillow conversions) so it never blocks the loop
+cpu_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+
+class AsyncSocketIOBridge:
+    """
+    Exposes Flask-SocketIO's `emit` on top of the AsyncServer.
+
+    Route handlers and services call `get_socketio().emit(...)` from worker
+    threads; the emit is scheduled onto the server's event loop.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+
+    def emit(self, event, data=None, **kwargs):
+        if self.loop is None:
+            logging.error(f"Socket.IO loop not started; dropping '{event}' event.")
+            return None
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        coroutine = self.server.emit(event, data, **kwargs)
+        if running_loop is self.loop:
+            return self.loop.create_task(coroutine)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+socketio_bridge = AsyncSocketIOBridge(sio)
+
+def run_media_async(app, task_id, campaign_id, folders, config, total_media, temp_dir):
+    """
+    Media runner for the ASGI server: schedules `process_media_async` on the
+    event loop and returns immediately so campaign submission stays fast.
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        process_media_async(
+            app, task_id, campaign_id, folders, config, total_media, temp_dir,
+            emit=sio.emit, cpu_executor=cpu_executor,
+        ),
+        socketio_bridge.loop,
+    )
+
+    def log_failure(f):
+        if not f.cancelled() and f.exception():
+            logging.error(f"Media processing for task {task_id} failed: {f.exception()}")
+
+    future.add_done_callback(log_failure)
+
+# Initialize Flask app with the same blueprints as app.py
+app = Flask(__name__)
+CORS(app)
+app.extensions['socketio'] = socketio_bridge
+app.extensions['media_runner'] = run_media_async
+app.register_blueprint(campaign_bp, url_prefix='/campaigns')  # Routes related to campaign management
+app.register_blueprint(task_bp, url_prefix='/tasks')  # Routes related to task handling
+app.register_blueprint(admin_bp, url_prefix='/admin')  # Diagnostics, require ADMIN_TOKEN
+
+async def on_startup():
+    socketio_bridge.loop = asyncio.get_running_loop()
+
+def on_shutdown():
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
+
+# Socket.IO handles /socket.io/, everything else goes to the Flask routes
+application = socketio.ASGIApp(sio, WsgiToAsgi(app), on_startup=on_startup, on_shutdown=on_shutdown)
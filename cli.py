@@ -0,0 +1,286 @@
+# Headless runner: creates a campaign (or adds to one) from a media directory on this machine.
+#
+#   python cli.py /data/creatives --config campaign.json --result result.json
+#
+# The config file is a JSON object with the same fields as the /create_campaign
+# form. The directory is read in place and never modified: media is linked into
+# a staging directory (hardlink, reflink or symlink) instead of being copied.
+# Progress goes to stderr; the outcome is written to the result file.
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from flask import Flask
+
+from services.task_manager import add_task, cancel_task, cleanup_task_pid, get_created_objects
+from services.campaign_service import (
+    build_campaign_config,
+    find_campaign_by_id,
+    get_campaign_budget_optimization,
+    create_campaign,
+)
+from services.media_processing_service import process_ad_set_groups, group_media_by_ad_set
+from services.sync_service import process_sync_media
+from services.progress_service import start_progress, set_phase, get_progress
+from services.planning_service import plan_campaign
+from services.file_service import link_local_tree, clean_temp_files
+from services.staging_service import create_staging_dir, flush_deletes
+from utils.facebook_client import get_api_for_config
+from utils.logging_config import configure_logging
+
+# Credentials read from the environment when the config file leaves them out
+CREDENTIAL_ENV = {"access_token": "FB_ACCESS_TOKEN", "app_id": "FB_APP_ID", "app_secret": "FB_APP_SECRET"}
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_CANCELED = 130
+
+class TerminalProgress:
+    """Stands in for SocketIO: renders the pipeline's events on a terminal instead of a browser."""
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.interactive = stream.isatty()
+        self.last_percent = -1
+
+    def emit(self, event, data=None, **kwargs):
+        data = data or {}
+        if event == 'progress':
+            self._progress(data.get('progress', 0), data.get('step', ''))
+        elif event == 'error':
+            self._line(f"error: {data.get('message')}")
+        elif event == 'preflight':
+            self._line(f"preflight: {len(data.get('rejected', []))} rejected, {len(data.get('flagged', []))} flagged")
+        elif event == 'sync_complete':
+            self._line(
+                f"sync: {data['added']} added, {data['changed']} changed, {data['unchanged']} unchanged, "
+                f"{data['removed']} removed, {data['paused_ads']} ads paused"
+            )
+        elif event == 'task_complete':
+            self._line("done")
+
+    def _progress(self, percent, step):
+        if self.interactive:
+            filled = percent * 30 // 100
+            self.stream.write(f"\r[{'#' * filled}{' ' * (30 - filled)}] {percent:3d}% {step}")
+            self.stream.flush()
+        elif percent // 10 != self.last_percent // 10 or percent == 100:
+            self.stream.write(f"{percent}% {step}\n")  # One line per 10% when piped to a file
+        self.last_percent = percent
+
+    def _line(self, text):
+        if self.interactive and self.last_percent >= 0:
+            self.stream.write("\n")
+            self.last_percent = -1
+        self.stream.write(text + "\n")
+        self.stream.flush()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Create Facebook ads from a local media directory.")
+    parser.add_argument("directory", help="Media directory; one ad set per folder, as with an upload")
+    parser.add_argument("--config", required=True, help="JSON file with the /create_campaign form fields")
+    parser.add_argument("--result", help="Where to write the JSON result (default: result-<task_id>.json)")
+    parser.add_argument("--task-id", help="Task ID (default: taken from the config, or generated)")
+    parser.add_argument("--dry-run", action="store_true", help="Plan and estimate only; nothing is created")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "WARNING"), help="Log level (default: WARNING)")
+    return parser.parse_args(argv)
+
+def load_form(path):
+    """
+    Reads a config file into form fields, as the route would receive them:
+    booleans become "true"/"false", objects and lists JSON strings and
+    numbers strings. Missing credentials are read from the environment.
+
+    Returns:
+        dict: Field name -> string value.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} must hold a JSON object")
+
+    form = {}
+    for key, value in data.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            form[key] = "true" if value else "false"
+        elif isinstance(value, (dict, list)):
+            form[key] = json.dumps(value)
+        else:
+            form[key] = str(value)
+    for key, env_name in CREDENTIAL_ENV.items():
+        if not form.get(key) and os.environ.get(env_name):
+            form[key] = os.environ[env_name]
+    return form
+
+def _json_field(form, name):
+    """Parses a JSON object field (platforms, placements); empty when absent."""
+    value = json.loads(form.get(name) or "{}")
+    if not isinstance(value, dict):
+        raise ValueError(f"'{name}' must be a JSON object")
+    return value
+
+def _resolve_campaign(config, create):
+    """
+    Returns the campaign to add to (checking its budget optimization, as the
+    route does), or creates one when `create` is set and none is configured.
+    """
+    campaign_id = config.get("campaign_id")
+    if campaign_id:
+        campaign_id = find_campaign_by_id(campaign_id, config["ad_account_id"], get_api_for_config(config))
+        if not campaign_id:
+            raise LookupError(f"Campaign ID {config['campaign_id']} not found for ad account {config['ad_account_id']}")
+        if create:
+            existing_campaign_budget_optimization = get_campaign_budget_optimization(config)
+            config['is_existing_cbo'] = existing_campaign_budget_optimization.get('is_campaign_budget_optimization', False)
+        return campaign_id
+    if not create:
+        return None
+    campaign_id, _ = create_campaign(config)
+    if not campaign_id:
+        raise RuntimeError(f"Failed to create campaign with name {config['campaign_name']}")
+    return campaign_id
+
+def _describe_results(results, staged_root):
+    """Maps the pipeline's results back to paths relative to the source directory."""
+    relative = lambda path: Path(path).relative_to(staged_root).as_posix()
+    return [
+        {
+            "ad_set_name": result["ad_set_name"],
+            "ad_set_id": result["ad_set_id"],
+            "ads": {relative(media_file): ad_id for media_file, ad_id in result["ads"].items()},
+            "without_ad": [relative(media_file) for media_file in result["media"] if media_file not in result["ads"]],
+        }
+        for result in results
+    ]
+
+def _handle_interrupts(task_id):
+    """Cancels the task on the first Ctrl-C (or SIGTERM); a second one aborts at once."""
+    def handler(signum, frame):
+        if handler.canceled:
+            raise KeyboardInterrupt
+        handler.canceled = True
+        sys.stderr.write("\nCanceling; press Ctrl-C again to abort.\n")
+        cancel_task(task_id)
+    handler.canceled = False
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+
+def run(args, result):
+    """
+    Runs one task against a local directory, filling `result` as it goes.
+
+    Returns:
+        int: Exit code.
+    """
+    source = Path(args.directory)
+    if not source.is_dir():
+        raise NotADirectoryError(f"{source} is not a directory")
+
+    form = load_form(args.config)
+    if args.task_id:
+        form["task_id"] = args.task_id
+    form["task_id"] = form.get("task_id") or f"cli-{uuid.uuid4().hex[:12]}"
+    if args.dry_run:
+        form["dry_run"] = "true"
+
+    config = build_campaign_config(form, [], _json_field(form, "platforms"), _json_field(form, "placements"))
+    task_id = config["task_id"]
+    result.update({"task_id": task_id, "source": str(source.resolve()), "dry_run": config["dry_run"]})
+
+    app = Flask(__name__)
+    app.extensions['socketio'] = TerminalProgress()
+
+    temp_dir = create_staging_dir()
+    started = False
+    try:
+        with app.app_context():
+            media_index, result["links"] = link_local_tree(source, temp_dir)
+            total_media = len(media_index)
+            result["media_files"] = total_media
+
+            if config["dry_run"]:
+                campaign_id = _resolve_campaign(config, create=False)
+                result["plan"] = plan_campaign(config, temp_dir, campaign_id)
+                result["status"] = "planned"
+                return EXIT_OK
+
+            add_task(task_id)
+            start_progress(task_id)
+            _handle_interrupts(task_id)
+            try:
+                campaign_id = _resolve_campaign(config, create=True)
+            except Exception:
+                set_phase(task_id, "failed", error="Campaign processing did not start")
+                cleanup_task_pid(task_id)
+                raise
+            result["campaign_id"] = campaign_id
+
+            # The runners clean up the task and the staging directory themselves
+            started = True
+            if config["sync_mode"]:
+                process_sync_media(app, task_id, campaign_id, media_index.folders(), config, total_media, temp_dir)
+            else:
+                groups = group_media_by_ad_set(media_index.folders(), temp_dir)
+                results = process_ad_set_groups(app, task_id, campaign_id, groups, config, total_media, temp_dir)
+                result["ad_sets"] = _describe_results(results, temp_dir / source.resolve().name)
+
+        progress = get_progress(task_id)
+        result["progress"] = progress.snapshot() if progress else None
+        result["status"] = result["progress"]["phase"] if progress else "unknown"
+        result["created"] = get_created_objects(task_id)
+        if result["status"] == "canceled":
+            return EXIT_CANCELED
+        return EXIT_OK if result["status"] == "complete" else EXIT_FAILED
+    finally:
+        if not started:
+            clean_temp_files(temp_dir)
+
+def write_result(path, result):
+    """Writes the result file atomically."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(level=args.log_level.upper(), fmt="text", stream=sys.stderr)
+
+    started_at = time.time()
+    result = {"status": "failed"}
+    try:
+        code = run(args, result)
+    except (OSError, ValueError) as e:  # Unreadable directory or config
+        logging.error(f"{e}")
+        result["error"] = str(e)
+        code = EXIT_USAGE
+    except KeyboardInterrupt:
+        result["status"] = "aborted"
+        code = EXIT_CANCELED
+    except Exception as e:
+        logging.exception(f"Task failed: {e}")
+        result["error"] = str(e)
+        code = EXIT_FAILED
+    finally:
+        flush_deletes()  # The janitor thread dies with the process; delete the staged links now
+
+    result["elapsed_seconds"] = round(time.time() - started_at, 1)
+    result_path = args.result or f"result-{result.get('task_id', 'unknown')}.json"
+    write_result(result_path, result)
+    sys.stderr.write(f"{result['status']}: result written to {result_path}\n")
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import logging
+from flask import Blueprint, Response, request, jsonify
+from utils.validators import validate_admin_request
+from services.profiler_service import profile_workers, ProfilerBusy, DEFAULT_HZ
+from services.watchdog_service import get_watchdog_report
+
+admin_bp = Blueprint("admin", __name__)
+
+@admin_bp.route("/profile", methods=["POST"])
+def profile_route():
+    """
+    Route running the sampling profiler over this worker's threads for
+    `?seconds=` (default 10, at most 60) at `?hz=` samples per second.
+
+    Returns JSON with collapsed stacks, top-N functions (`?top=`) and samples
+    per task, or just the collapsed stacks as text with `?format=collapsed`
+    (ready for flamegraph.pl or speedscope). Requires the admin token.
+    """
+    is_valid, response, status_code = validate_admin_request()
+    if not is_valid:
+        return response, status_code
+
+    try:
+        result = profile_workers(
+            seconds=request.args.get("seconds", default=10, type=float),
+            hz=request.args.get("hz", default=DEFAULT_HZ, type=int),
+            top=request.args.get("top", default=30, type=int),
+            include_idle=request.args.get("idle", default="false").lower() == "true",
+        )
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        logging.error(f"Error in profile_route: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+    if request.args.get("format") == "collapsed":
+        return Response(result["collapsed"] + "\n", mimetype="text/plain")
+    return jsonify(result), 200
+
+@admin_bp.route("/watchdog", methods=["GET"])
+def watchdog_report_route():
+    """
+    Route reporting eventlet hub stalls: totals, the functions that blocked
+    the hub most often, and the latest stalls with their stack samples.
+    Accepts `?limit=` for the number of recent stalls (default 20).
+    Requires the admin token.
+    """
+    is_valid, response, status_code = validate_admin_request()
+    if not is_valid:
+        return response, status_code
+
+    try:
+        limit = request.args.get("limit", default=20, type=int)
+        return jsonify(get_watchdog_report(max(limit, 0))), 200
+    except Exception as e:
+        logging.error(f"Error in watchdog_report_route: {e}")
+        return jsonify({"error": "Internal server error"}), 500
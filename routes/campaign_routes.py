@@ -1,29 +1,48 @@
 import logging
-import tempfile
-from pathlib import Path
+import threading
+import uuid
 
 # Flask-related imports
 from flask import Blueprint, request, jsonify, current_app
 
 # Services
 from services import is_campaign_budget_optimized
-from services.task_manager import add_task
+from services.task_manager import add_task, cleanup_task_pid
 from services.campaign_service import (
     process_campaign_config, 
     find_campaign_by_id, 
     get_campaign_budget_optimization, 
     create_campaign
 )
-from services.media_processing_service  import process_media
+from services.media_processing_service  import process_media, group_media_by_ad_set
+from services.sync_service import process_sync_media
+from services.multi_account_service import (
+    parse_ad_account_ids,
+    build_account_configs,
+    process_multi_account_media,
+)
+from services.retry_service import release_retry_budget
+from services.admission_service import admit_submission, AdmissionRejected
+from services.progress_service import start_progress, set_phase
+from services.planning_service import plan_campaign
+from services.copy_service import OBJECT_TYPES, copy_object, is_large_copy, run_copy_task
+from services.bulk_campaign_service import (
+    ManifestError,
+    parse_manifest,
+    resolve_campaign_media,
+    build_campaign_configs,
+    process_bulk_campaigns,
+)
 
 # Utilities
-from utils.validators import validate_campaign_request
+from utils.validators import validate_campaign_request, validate_bulk_campaign_request
 from utils.error_handler import emit_error
+from utils.facebook_client import get_api_for_config
 from services.file_service import (
-    save_uploaded_files,
-    get_subfolders,
-    get_total_media_count,
+    stage_config_uploads,
+    clean_temp_files,
 )
+from services.staging_service import create_staging_dir
 
 # Create a Blueprint for campaign-related routes
 campaign_bp = Blueprint("campaigns", __name__)
@@ -36,7 +55,8 @@ def handle_get_campaign_budget_optimization():
     Expects a JSON payload with:
     {
         "campaign_id": "123456789",
-        "ad_account_id": "act_123456789"
+        "ad_account_id": "act_123456789",
+        "access_token": "...",  (optional, with app_id/app_secret)
     }
 
     Returns:
@@ -54,9 +74,12 @@ def handle_get_campaign_budget_optimization():
         if missing_fields:
             return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
 
+        # Optional credentials select the account's pooled Graph API session
+        credentials = {key: data[key] for key in ("app_id", "app_secret", "access_token") if data.get(key)}
+
         # Call the service function to check budget optimization
         campaign_budget_optimization = is_campaign_budget_optimized(
-            data["campaign_id"], data["ad_account_id"]
+            data["campaign_id"], data["ad_account_id"], credentials
         )
 
         return jsonify({"campaign_budget_optimization": campaign_budget_optimization}), 200
@@ -69,6 +92,21 @@ def handle_get_campaign_budget_optimization():
 
 @campaign_bp.route('/create_campaign', methods=['POST'])
 def handle_create_campaign():
+    """
+    API route to create a campaign (or add to one) from uploaded media.
+
+    Submissions pass admission control before their upload body is read;
+    when the server is saturated they are parked briefly or get a 429 with
+    `Retry-After` and their queue position.
+    """
+    # Admit before touching the form so a saturated server never buffers the upload
+    try:
+        ticket = admit_submission(request.content_length)
+    except AdmissionRejected as e:
+        return _busy_response(e)
+
+    started = False
+    task_id = None
     try:
         # Validate request
         is_valid, response, status_code = validate_campaign_request()
@@ -80,13 +118,26 @@ def handle_create_campaign():
         if not config:
             return jsonify({"error": "Failed to process campaign configuration"}), 500
 
-        # Add task using Task Manager
-        add_task(config["task_id"])
+        # Dry run: plan and estimate the task without writing to Graph
+        if config["dry_run"]:
+            return _plan_dry_run(config)
+
+        # Add task using Task Manager; its progress can be polled from here on
+        task_id = config["task_id"]
+        add_task(task_id)
+        start_progress(task_id)
+
+        # Fan out to several ad accounts if requested
+        ad_account_ids = parse_ad_account_ids(request.form.get("ad_account_ids"), config["ad_account_id"])
+        if len(ad_account_ids) > 1:
+            response = _start_multi_account_task(config, ad_account_ids, ticket)
+            started = response[1] == 200
+            return response
 
         # Determine campaign ID (existing or new)
         campaign_id = config.get("campaign_id")
         if campaign_id:
-            campaign_id = find_campaign_by_id(config)
+            campaign_id = find_campaign_by_id(config["campaign_id"], config["ad_account_id"], get_api_for_config(config))
             if not campaign_id:
                 logging.error(f"Campaign ID {config['campaign_id']} not found for ad account {config['ad_account_id']}")
                 return jsonify({"error": "Campaign ID not found"}), 404
@@ -101,21 +152,32 @@ def handle_create_campaign():
                 logging.error(f"Failed to create campaign with name {config['campaign_name']}")
                 return jsonify({"error": "Failed to create campaign"}), 500
 
-        # Create a temporary directory
-        temp_dir = Path(tempfile.mkdtemp())
+        # Create a staging directory
+        temp_dir = create_staging_dir()
 
-        # Save uploaded files
-        save_uploaded_files(config["upload_folder"], temp_dir)
+        # Save uploaded files, indexing them as they are written
+        media_index = stage_config_uploads(config, temp_dir)
 
         # Get all subfolders
-        folders = get_subfolders(temp_dir)
+        folders = media_index.folders()
 
         # Get total media count
-        total_media = total_media = get_total_media_count(temp_dir)
+        total_media = len(media_index)
         logging.info(f"Total media files found: {total_media}")  # Add this line
 
         app = current_app._get_current_object()
-        process_media( app, config["task_id"], campaign_id, folders, config, total_media, temp_dir )
+
+        # The admitted capacity is held until the runner cleans the task up
+        ticket.bind(config["task_id"], total_media)
+        started = True
+
+        # Servers may register their own runner (e.g. the ASGI event loop); default runs inline.
+        # Sync mode only creates ads for media that changed since the campaign's last sync.
+        if config["sync_mode"]:
+            media_runner = process_sync_media
+        else:
+            media_runner = app.extensions.get('media_runner', process_media)
+        media_runner( app, config["task_id"], campaign_id, folders, config, total_media, temp_dir )
 
         return jsonify({"message": "Campaign processing started", "task_id": config["task_id"]})
 
@@ -123,3 +185,224 @@ def handle_create_campaign():
         logging.error(f"Error in handle_create_campaign: {e}")
         emit_error(f"Error in handle_create_campaign: {e}")
         return jsonify({"error": "Internal server error"}), 500
+    finally:
+        if not started:
+            ticket.release()
+            if task_id:
+                set_phase(task_id, "failed", error="Campaign processing did not start")
+                cleanup_task_pid(task_id)  # Otherwise it would stay tracked as running
+
+
+def _busy_response(e):
+    """Returns the 429 response for a submission the admission controller turned away."""
+    logging.warning(f"Rejected campaign submission: {e.reason}")
+    response = jsonify({"error": "Server is busy, retry later", "reason": e.reason,
+                        "queue_position": e.queue_position, "retry_after": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 429
+
+def _plan_dry_run(config):
+    """
+    Stages the upload, builds the task's full plan and cost estimate, and
+    discards the upload. Only Graph reads (campaign lookup) are made.
+
+    Returns:
+        tuple: JSON response with the plan.
+    """
+    campaign_id = config.get("campaign_id")
+    if campaign_id:
+        campaign_id = find_campaign_by_id(campaign_id, config["ad_account_id"], get_api_for_config(config))
+        if not campaign_id:
+            return jsonify({"error": "Campaign ID not found"}), 404
+
+    ad_account_ids = parse_ad_account_ids(request.form.get("ad_account_ids"), config["ad_account_id"])
+    temp_dir = create_staging_dir()
+    try:
+        stage_config_uploads(config, temp_dir)
+        plan = plan_campaign(config, temp_dir, campaign_id, accounts=len(ad_account_ids))
+    finally:
+        clean_temp_files(temp_dir)
+    return jsonify({"message": "Dry run; nothing was created", "task_id": config["task_id"], "plan": plan}), 200
+
+def _start_multi_account_task(config, ad_account_ids, ticket):
+    """
+    Stages the upload once and starts creating the campaign in every account.
+
+    Args:
+        config (dict): The parent task's config.
+        ad_account_ids (list): Target ad accounts, primary first.
+        ticket (AdmissionTicket): Admission capacity, held until every account is done.
+
+    Returns:
+        tuple: JSON response with the parent task ID and one sub-task ID per account.
+    """
+    if config.get("campaign_id"):
+        return jsonify({"error": "campaign_id cannot be combined with ad_account_ids"}), 400
+    if config.get("sync_mode"):
+        return jsonify({"error": "sync_mode cannot be combined with ad_account_ids"}), 400
+
+    temp_dir = create_staging_dir()
+    media_index = stage_config_uploads(config, temp_dir)
+    groups = list(group_media_by_ad_set(media_index.folders(), temp_dir))
+    total_media = sum(len(media) for _, media in groups)
+    account_configs = build_account_configs(config, ad_account_ids)
+    ticket.bind(config["task_id"], total_media * len(account_configs))
+
+    app = current_app._get_current_object()
+    threading.Thread(
+        target=process_multi_account_media,
+        args=(app, config["task_id"], account_configs, groups, total_media, temp_dir),
+        daemon=True,
+    ).start()
+
+    return jsonify({
+        "message": "Multi-account campaign processing started",
+        "task_id": config["task_id"],
+        "accounts": [{"ad_account_id": c["ad_account_id"], "task_id": c["task_id"]} for c in account_configs],
+    }), 200
+
+@campaign_bp.route('/bulk_create_campaigns', methods=['POST'])
+def handle_bulk_create_campaigns():
+    """
+    API route to create many campaigns from one manifest and one media bundle.
+
+    Expects multipart form data with:
+        - manifest: JSON text, or a JSON/CSV file, describing campaigns, their
+          ad sets and the media (paths within the bundle) for each ad set
+        - uploadFolders: the media bundle
+        - the same shared fields as /create_campaign (credentials, targeting,
+          creative defaults); manifest entries override them per campaign
+
+    Returns:
+        200 OK: Bulk task ID and one task ID per campaign for progress events
+        400 Bad Request: Missing fields or invalid manifest
+        429 Too Many Requests: The server is saturated, as for /create_campaign
+        500 Internal Server Error: Unexpected failure
+    """
+    # Admitted like /create_campaign, before the bundle is buffered
+    try:
+        ticket = admit_submission(request.content_length)
+    except AdmissionRejected as e:
+        return _busy_response(e)
+
+    started = False
+    temp_dir = None
+    try:
+        is_valid, response, status_code = validate_bulk_campaign_request()
+        if not is_valid:
+            return response, status_code
+
+        manifest_file = request.files.get("manifest")
+        if manifest_file:
+            campaigns = parse_manifest(manifest_file.read().decode("utf-8-sig"), manifest_file.filename)
+        else:
+            campaigns = parse_manifest(request.form["manifest"])
+
+        # Shared parsing and timezone lookup happen once for the whole manifest
+        config = process_campaign_config(request)
+        if not config:
+            return jsonify({"error": "Failed to process campaign configuration"}), 500
+
+        # Save the media bundle once; every campaign references it
+        temp_dir = create_staging_dir()
+        stage_config_uploads(config, temp_dir)
+        campaigns = resolve_campaign_media(campaigns, temp_dir)
+
+        bulk_task_id = config["task_id"] or uuid.uuid4().hex
+        campaign_configs = build_campaign_configs(config, campaigns, bulk_task_id)
+
+        # The admitted capacity is held until every campaign of the run is done
+        ticket.hold(sum(len(media) for _, ad_sets in campaign_configs for _, media in ad_sets))
+        app = current_app._get_current_object()
+        threading.Thread(
+            target=process_bulk_campaigns,
+            args=(app, bulk_task_id, campaign_configs, temp_dir, ticket),
+            daemon=True,
+        ).start()
+        started = True
+
+        return jsonify({
+            "message": "Bulk campaign processing started",
+            "task_id": bulk_task_id,
+            "campaigns": [
+                {"task_id": c["task_id"], "campaign_name": c.get("campaign_name", "")}
+                for c, _ in campaign_configs
+            ],
+        })
+
+    except ManifestError as e:
+        if temp_dir:
+            clean_temp_files(temp_dir)
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        if temp_dir:
+            clean_temp_files(temp_dir)
+        logging.error(f"Error in handle_bulk_create_campaigns: {e}")
+        emit_error(f"Error in handle_bulk_create_campaigns: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    finally:
+        if not started:
+            ticket.release()
+
+
+@campaign_bp.route('/copy', methods=['POST'])
+def handle_copy_object():
+    """
+    API route to duplicate a campaign or ad set server-side with Graph's `/copies` edge.
+
+    Expects a JSON payload with:
+    {
+        "object_type": "campaign" | "adset",
+        "object_id": "123456789",
+        "ad_account_id": "act_123456789",
+        "app_id": "...", "app_secret": "...", "access_token": "...",
+        "task_id": "...",
+        "deep_copy": true,
+        "campaign_id": "...",  (optional destination for an ad set copy)
+        "overrides": {"name": "...", "daily_budget": 50, "start_time": "...", "targeting": {...}}
+    }
+
+    Returns:
+        200 OK: IDs of the copied objects, or the task ID for large copies that run in the background
+        400 Bad Request: Missing or invalid fields
+        500 Internal Server Error: Unexpected failure
+    """
+    try:
+        data = request.get_json()
+
+        required_fields = ["object_type", "object_id", "ad_account_id", "access_token", "task_id"]
+        missing_fields = [field for field in required_fields if not data.get(field)]
+        if missing_fields:
+            return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
+        if data["object_type"] not in OBJECT_TYPES:
+            return jsonify({"error": f"object_type must be one of: {', '.join(OBJECT_TYPES)}"}), 400
+
+        config = {key: data.get(key) for key in ("ad_account_id", "app_id", "app_secret", "access_token")}
+        task_id = data["task_id"]
+        deep_copy = data.get("deep_copy", True)
+        overrides = data.get("overrides") or {}
+
+        # Trees too big for one synchronous Graph copy run as a background task
+        large = is_large_copy(data["object_type"], data["object_id"], deep_copy, config)
+        add_task(task_id)
+        if large:
+            app = current_app._get_current_object()
+            threading.Thread(
+                target=run_copy_task,
+                args=(app, task_id, config, data["object_type"], data["object_id"], deep_copy, overrides, data.get("campaign_id")),
+                daemon=True,
+            ).start()
+            return jsonify({"message": "Copy started", "task_id": task_id}), 200
+
+        try:
+            result = copy_object(task_id, config, data["object_type"], data["object_id"], deep_copy, overrides,
+                                 data.get("campaign_id"), large=False)
+        finally:
+            cleanup_task_pid(task_id)
+            release_retry_budget(task_id)
+        return jsonify({"message": "Copy complete", "task_id": task_id, **result}), 200
+
+    except Exception as e:
+        logging.error(f"Error in handle_copy_object: {e}")
+        emit_error(f"Error in handle_copy_object: {e}")
+        return jsonify({"error": "Internal server error"}), 500
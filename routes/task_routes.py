@@ -1,5 +1,12 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, Response, request, jsonify
 from services import cancel_task
+from services.task_manager import get_created_objects, TaskCanceledException
+from services.progress_service import get_progress, wait_for_change
+from services.status_service import update_object_statuses, VALID_STATUSES, OBJECT_CLASSES
+from services.admission_service import admission_controller
+from services.memory_service import get_task_memory
+from utils.validators import validate_admin_request
 
 task_bp = Blueprint("tasks", __name__)
 
@@ -15,7 +22,133 @@ def cancel_task_route():
             return jsonify({"error": "task_id is required"}), 400
 
         response = cancel_task(task_id)
+        if response.pop("not_found", False):
+            return jsonify(response), 404
         return jsonify(response), 200 if "message" in response else 500
 
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
+
+@task_bp.route("/<task_id>", methods=["GET"])
+def task_status_route(task_id):
+    """
+    Route returning a compact snapshot of a task: phase, done/failed/pending
+    counts (overall and per ad set), bytes uploaded, ETA and created object IDs.
+
+    The response carries an ETag. A request with a matching `If-None-Match`
+    gets 304; adding `?wait=<seconds>` (up to 30) holds it until the task
+    changes, so dashboards can long-poll instead of re-fetching.
+    """
+    try:
+        progress = get_progress(task_id)
+        if progress is None:
+            return jsonify({"error": "Task not found"}), 404
+
+        etag = f"{int(progress.started_at * 1000)}-{progress.version}"
+        if request.if_none_match.contains(etag):
+            wait = request.args.get("wait", default=0, type=float)
+            if wait > 0:
+                progress = wait_for_change(task_id, progress.version, wait) or progress
+                etag = f"{int(progress.started_at * 1000)}-{progress.version}"
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+        snapshot = progress.snapshot()
+        created = {}
+        for obj in get_created_objects(task_id):
+            created.setdefault(obj["type"], []).append(obj["id"])
+        snapshot["created"] = created
+
+        response = jsonify(snapshot)
+        response.set_etag(f"{int(progress.started_at * 1000)}-{snapshot['version']}")
+        response.headers["Cache-Control"] = "no-cache"
+        return response, 200
+
+    except Exception as e:
+        logging.error(f"Error in task_status_route: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@task_bp.route("/<task_id>/memory", methods=["GET"])
+def task_memory_route(task_id):
+    """
+    Route returning a task's memory at each phase boundary: RSS and, when
+    MEMORY_TRACE_FRAMES enables tracemalloc, the top allocations grown in
+    each phase. Also includes the process's idle baselines and leak flag.
+    Requires the admin token.
+    """
+    is_valid, response, status_code = validate_admin_request()
+    if not is_valid:
+        return response, status_code
+
+    try:
+        memory = get_task_memory(task_id)
+        if memory is None:
+            return jsonify({"error": "Task not found"}), 404
+        return jsonify(memory), 200
+    except Exception as e:
+        logging.error(f"Error in task_memory_route: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@task_bp.route("/update_status", methods=["POST"])
+def update_status_route():
+    """
+    Route to activate or pause the objects a task created, in bulk.
+    Expects a JSON payload with 'task_id', 'status' (ACTIVE or PAUSED),
+    'ad_account_id' and credentials ('app_id', 'app_secret', 'access_token').
+    Optional filters: 'object_types' (campaign, adset, ad; defaults to ads),
+    'ids' and 'ad_set_ids'. An optional 'operation_id' lets the update be
+    canceled through /cancel_task while it runs.
+    """
+    try:
+        data = request.json or {}
+        task_id = data.get("task_id")
+        status = str(data.get("status", "")).upper()
+        object_types = data.get("object_types") or ["ad"]
+
+        missing = [field for field in ("task_id", "ad_account_id", "app_id", "app_secret", "access_token") if not data.get(field)]
+        if missing:
+            return jsonify({"error": f"Missing required fields: {', '.join(missing)}"}), 400
+        if status not in VALID_STATUSES:
+            return jsonify({"error": f"status must be one of {', '.join(VALID_STATUSES)}"}), 400
+        unknown = [t for t in object_types if t not in OBJECT_CLASSES]
+        if unknown:
+            return jsonify({"error": f"Unsupported object types: {', '.join(unknown)}"}), 400
+
+        objects = get_created_objects(task_id, object_types, data.get("ids"), data.get("ad_set_ids"))
+        if not objects:
+            return jsonify({"error": "No matching objects found for this task"}), 404
+
+        operation_id = data.get("operation_id") or None
+        results = update_object_statuses(task_id, data, objects, status, operation_id=operation_id)
+        failed = [r for r in results if not r["success"]]
+        return jsonify({
+            "task_id": task_id,
+            "operation_id": operation_id,
+            "status": status,
+            "updated": len(results) - len(failed),
+            "failed": len(failed),
+            "results": results,
+        }), 200
+
+    except ValueError as e:  # operation_id already in use
+        return jsonify({"error": str(e)}), 400
+    except TaskCanceledException:
+        return jsonify({"error": "Status update was canceled"}), 409
+    except Exception as e:
+        logging.error(f"Error in update_status_route: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@task_bp.route("/admission", methods=["GET"])
+def admission_metrics_route():
+    """
+    Route exposing admission control metrics: in-flight bytes, active tasks,
+    queued media, parked requests, free staging disk, the configured limits
+    and admitted/parked/rejected/timed-out counters.
+    """
+    try:
+        return jsonify(admission_controller.metrics()), 200
+    except Exception as e:
+        logging.error(f"Error in admission_metrics_route: {e}")
+        return jsonify({"error": "Internal server error"}), 500
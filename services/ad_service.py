@@ -1,84 +1,201 @@
 import os
 import subprocess
 import signal
+import logging
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Facebook Ads SDK
 from facebook_business.adobjects.adcreative import AdCreative
 from facebook_business.adobjects.ad import Ad
 
 # Task Management & Error Handling
-from services.task_manager import check_cancellation, TaskCanceledException
-from services.upload_service import upload_image, upload_video
+from services.task_manager import check_cancellation, get_cancel_token, record_created_object, TaskCanceledException
+from services.upload_service import upload_image, upload_video, is_thumbnail_url
+from services.retry_service import call_with_retry
+from services.timing_service import timed_stage
 from utils.error_handler import emit_error
-
+from utils.facebook_client import get_api_for_config
+from utils.logging_config import task_log_context
+
+DEFAULT_URL_PARAMETERS = 'utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}'
+IMAGE_FILE_EXTENSIONS = ('.jpg', '.png', '.jpeg', '.webp')
+CAROUSEL_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CAROUSEL_VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi')
+
+# Carousel cards uploaded at once, and what to do when one of them fails:
+# "fail_ad" skips the whole carousel, "drop_card" builds it from the cards that worked
+MAX_PARALLEL_CARDS = 10
+CAROUSEL_FAILURE_POLICIES = ('fail_ad', 'drop_card')
+MIN_CAROUSEL_CARDS = 2
+
+def get_utm_parameters(config):
+    """Returns the configured URL parameters, prefixed with '?'."""
+    utm_parameters = config.get('url_parameters', DEFAULT_URL_PARAMETERS)
+    if utm_parameters and not utm_parameters.startswith('?'):
+        utm_parameters = '?' + utm_parameters
+    return utm_parameters
+
+def build_image_object_story_spec(config, image_hash):
+    """Builds the object story spec for a single image ad."""
+    link = config.get('link', '') + get_utm_parameters(config)
+    call_to_action_type = config.get('call_to_action', 'SHOP_NOW')
+
+    object_story_spec = {
+        "page_id": config.get('facebook_page_id', ''),
+        "link_data": {
+            "image_hash": image_hash,
+            "link": link,  # This is the link to your website or product page
+            "message": config.get('ad_creative_primary_text', 'default text'),
+            "name": config.get('ad_creative_headline', 'Your Headline Here'),
+            "description": config.get('ad_creative_description', 'Your Description Here'),
+            "call_to_action": {
+                "type": call_to_action_type,
+                "value": {
+                    "link": link
+                }
+            }
+        }
+    }
+
+    # Conditionally add instagram_actor_id
+    if config.get('instagram_actor_id'):
+        object_story_spec["instagram_actor_id"] = config['instagram_actor_id']
+    return object_story_spec
+
+def thumbnail_fields(thumbnail, url_field="image_url"):
+    """Returns the spec field for a thumbnail: a Graph-hosted URL or an uploaded image hash."""
+    return {url_field: thumbnail} if is_thumbnail_url(thumbnail) else {"image_hash": thumbnail}
+
+def build_video_object_story_spec(config, video_id, image_hash):
+    """Builds the object story spec for a single video ad; `image_hash` may also be a thumbnail URL."""
+    link = config.get('link', '') + get_utm_parameters(config)
+    call_to_action_type = config.get('call_to_action', 'SHOP_NOW')
+
+    object_story_spec = {
+        "page_id": config.get('facebook_page_id', ''),
+        "video_data": {
+            "video_id": video_id,
+            "call_to_action": {
+                "type": call_to_action_type,
+                "value": {
+                    "link": link
+                }
+            },
+            "message": config.get('ad_creative_primary_text', 'default text'),
+            "title": config.get('ad_creative_headline', 'No More Neuropathic Foot Pain'),
+            **thumbnail_fields(image_hash),
+            "link_description": config.get('ad_creative_description', 'FREE Shipping & 60-Day Money-Back Guarantee')
+        }
+    }
+
+    # Conditionally add instagram_actor_id
+    if config.get('instagram_actor_id'):
+        object_story_spec["instagram_actor_id"] = config['instagram_actor_id']
+    return object_story_spec
+
+def build_carousel_card(config, image_hash, video_id=None):
+    """Builds one carousel card for an uploaded image, or a video with its thumbnail hash or URL."""
+    card = {
+        "link": config.get('link', '') + get_utm_parameters(config),
+        **thumbnail_fields(image_hash, url_field="picture"),
+        "call_to_action": {
+            "type": config.get('call_to_action', 'SHOP_NOW'),  # Default to "SHOP_NOW" if not provided
+            "value": {
+                "link": config.get('link', '')
+            }
+        }
+    }
+    if video_id:
+        card["video_id"] = video_id
+    return card
+
+def build_carousel_object_story_spec(config, carousel_cards):
+    """Builds the object story spec for a carousel ad from its cards."""
+    object_story_spec = {
+        "page_id": config.get('facebook_page_id', '102076431877514'),
+        "link_data": {
+            "link": config.get('link', 'https://kyronaclinic.com/pages/review-1'),
+            "child_attachments": carousel_cards,
+            "multi_share_optimized": True,
+            "multi_share_end_card": False,
+            "name": config.get('ad_creative_headline', 'No More Neuropathic Foot Pain'),
+            "description": config.get('ad_creative_description', 'FREE Shipping & 60-Day Money-Back Guarantee'),
+            "caption": config.get('ad_creative_primary_text', 'default text'),
+        }
+    }
+
+    # Conditionally add instagram_actor_id
+    if config.get('instagram_actor_id'):
+        object_story_spec["instagram_actor_id"] = config['instagram_actor_id']
+    return object_story_spec
+
+def build_creative_params(name, object_story_spec):
+    """Builds the ad creative parameters, opting out of standard enhancements."""
+    degrees_of_freedom_spec = {
+        "creative_features_spec": {
+            "standard_enhancements": {
+                "enroll_status": "OPT_OUT"  # explicitly opting out
+            }
+        }
+    }
+    return {
+        AdCreative.Field.name: name,
+        AdCreative.Field.object_story_spec: object_story_spec,
+        AdCreative.Field.degrees_of_freedom_spec: degrees_of_freedom_spec
+    }
+
+def build_ad_params(name, ad_set_id, creative_id):
+    """Builds the parameters for a paused ad using an existing creative."""
+    return {
+        Ad.Field.name: name,
+        Ad.Field.adset_id: ad_set_id,
+        Ad.Field.creative: {"creative_id": creative_id},
+        Ad.Field.status: "PAUSED",
+    }
+
+def get_ad_name(media_file):
+    """Names an ad after its media file, without the extension."""
+    return os.path.splitext(os.path.basename(media_file))[0]
+
+def _create_creative_and_ad(config, ad_set_id, creative_name, object_story_spec, ad_name, task_id):
+    """Creates the ad creative and the paused ad that uses it, retrying transient Graph errors."""
+    api = get_api_for_config(config)
+    ad_account_id = config['ad_account_id']
+
+    ad_creative = AdCreative(parent_id=ad_account_id, api=api)
+    ad_creative.update(build_creative_params(creative_name, object_story_spec))
+    with timed_stage("creative", task_id=task_id):
+        call_with_retry(ad_creative.remote_create, task_id=task_id, ad_account_id=ad_account_id,
+                        idempotent=False, description=f"Creative for {ad_name}")
+
+    ad = Ad(parent_id=ad_account_id, api=api)
+    ad.update(build_ad_params(ad_name, ad_set_id, ad_creative.get_id()))
+    with timed_stage("ad", task_id=task_id):
+        call_with_retry(ad.remote_create, task_id=task_id, ad_account_id=ad_account_id,
+                        idempotent=False, description=f"Ad {ad_name}")
+    record_created_object(task_id, "ad", ad.get_id(), name=ad_name, ad_set_id=ad_set_id)
+    return ad
+
+@task_log_context
 def create_ad(app, ad_set_id, media_file, config, task_id):
     check_cancellation(task_id)
     try:
         ad_format = config.get('ad_format', 'Single image or video')
         if ad_format == 'Single image or video':
-            if media_file.lower().endswith(('.jpg', '.png', '.jpeg', '.webp')):
+            if media_file.lower().endswith(IMAGE_FILE_EXTENSIONS):
                 # Image ad logic
                 image_hash = upload_image(app, media_file, task_id, config)
                 if not image_hash:
-                    print(f"Failed to upload image: {media_file}")
+                    logging.error(f"Failed to upload image: {media_file}")
                     return
-                
-                base_link = config.get('link', '')
-                utm_parameters = config.get('url_parameters', 'utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}')
-
-                if utm_parameters and not utm_parameters.startswith('?'):
-                    utm_parameters = '?' + utm_parameters
-                
-                link = base_link + utm_parameters
-
-                call_to_action_type = config.get('call_to_action', 'SHOP_NOW')
-
-                object_story_spec = {
-                    "page_id": config.get('facebook_page_id', ''),
-                    "link_data": {
-                        "image_hash": image_hash,
-                        "link": link,  # This is the link to your website or product page
-                        "message": config.get('ad_creative_primary_text', 'default text'),
-                        "name": config.get('ad_creative_headline', 'Your Headline Here'),
-                        "description": config.get('ad_creative_description', 'Your Description Here'),
-                        "call_to_action": {
-                            "type": call_to_action_type,
-                            "value": {
-                                "link": link
-                            }
-                        }
-                    }
-                }
 
-                # Conditionally add instagram_actor_id
-                if config.get('instagram_actor_id'):
-                    object_story_spec["instagram_actor_id"] = config['instagram_actor_id']
-                                
-                degrees_of_freedom_spec = {
-                    "creative_features_spec": {
-                        "standard_enhancements": {
-                            "enroll_status": "OPT_OUT"  # explicitly opting out
-                        }
-                    }
-                }
-
-                ad_creative = AdCreative(parent_id=config['ad_account_id'])
-                params = {
-                    AdCreative.Field.name: "Creative Name",
-                    AdCreative.Field.object_story_spec: object_story_spec,
-                    AdCreative.Field.degrees_of_freedom_spec: degrees_of_freedom_spec
-                }
-                ad_creative.update(params)
-                ad_creative.remote_create()
+                object_story_spec = build_image_object_story_spec(config, image_hash)
+                ad = _create_creative_and_ad(config, ad_set_id, "Creative Name", object_story_spec, get_ad_name(media_file), task_id)
 
-                ad = Ad(parent_id=config['ad_account_id'])
-                ad[Ad.Field.name] = os.path.splitext(os.path.basename(media_file))[0]
-                ad[Ad.Field.adset_id] = ad_set_id
-                ad[Ad.Field.creative] = {"creative_id": ad_creative.get_id()}
-                ad[Ad.Field.status] = "PAUSED"
-                ad.remote_create()
-
-                print(f"Created image ad with ID: {ad.get_id()}")
+                logging.info(f"Created image ad with ID: {ad.get_id()}", extra={"hot_path": "ad_created"})
+                return ad
 
             else:
                 # Video ad logic
@@ -86,191 +203,135 @@ def create_ad(app, ad_set_id, media_file, config, task_id):
 
                 video_id, image_hash = upload_video(app, video_path, task_id, config)
                 if not video_id:
-                    print(f"Failed to upload video: {media_file}")
+                    logging.error(f"Failed to upload video: {media_file}")
                     return
                 
                 if not image_hash:
-                    print(f"Failed to upload thumbnail")
+                    logging.error(f"Failed to upload thumbnail for {media_file}")
                     return
 
-                base_link = config.get('link', '')
-                utm_parameters = config.get('url_parameters', 'utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}')
-
-                if utm_parameters and not utm_parameters.startswith('?'):
-                    utm_parameters = '?' + utm_parameters
-
-                link = base_link + utm_parameters
-
-                call_to_action_type = config.get('call_to_action', 'SHOP_NOW')
-
-                object_story_spec = {
-                    "page_id": config.get('facebook_page_id', ''),
-                    "video_data": {
-                        "video_id": video_id,
-                        "call_to_action": {
-                            "type": call_to_action_type,
-                            "value": {
-                                "link": link
-                            }
-                        },
-                        "message": config.get('ad_creative_primary_text', 'default text'),
-                        "title": config.get('ad_creative_headline', 'No More Neuropathic Foot Pain'),
-                        "image_hash": image_hash,
-                        "link_description": config.get('ad_creative_description', 'FREE Shipping & 60-Day Money-Back Guarantee')
-                    }
-                }
-
-                # Conditionally add instagram_actor_id
-                if config.get('instagram_actor_id'):
-                    object_story_spec["instagram_actor_id"] = config['instagram_actor_id']
-                    print("Instagram Actor ID:", config.get('instagram_actor_id'))
-                                
-                degrees_of_freedom_spec = {
-                    "creative_features_spec": {
-                        "standard_enhancements": {
-                            "enroll_status": "OPT_OUT"  # explicitly opting out
-                        }
-                    }
-                }
-
-                ad_creative = AdCreative(parent_id=config['ad_account_id'])
-                params = {
-                    AdCreative.Field.name: "Creative Name",
-                    AdCreative.Field.object_story_spec: object_story_spec,
-                    AdCreative.Field.degrees_of_freedom_spec: degrees_of_freedom_spec
-                }
-                ad_creative.update(params)
-                ad_creative.remote_create()
+                object_story_spec = build_video_object_story_spec(config, video_id, image_hash)
 
-                ad = Ad(parent_id=config['ad_account_id'])
-                ad[Ad.Field.name] = os.path.splitext(os.path.basename(media_file))[0]
-                ad[Ad.Field.adset_id] = ad_set_id
-                ad[Ad.Field.creative] = {"creative_id": ad_creative.get_id()}
-                ad[Ad.Field.status] = "PAUSED"
-                ad.remote_create()
+                ad = _create_creative_and_ad(config, ad_set_id, "Creative Name", object_story_spec, get_ad_name(media_file), task_id)
 
-                print(f"Created video ad with ID: {ad.get_id()}")
+                logging.info(f"Created video ad with ID: {ad.get_id()}", extra={"hot_path": "ad_created"})
+                return ad
 
     except TaskCanceledException:
-        print(f"Task {task_id} has been canceled during ad creation.")
+        logging.warning(f"Task {task_id} has been canceled during ad creation.")
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError) and e.returncode == -signal.SIGTERM:
-            print(f"Task {task_id} process was terminated by signal.")
+            logging.warning(f"Task {task_id} process was terminated by signal.")
         else:
             error_msg = f"Error creating ad: {e}"
             emit_error(task_id, error_msg)
 
-def create_carousel_ad(app, ad_set_id, media_files, config, task_id):
+@task_log_context
+def upload_carousel_card(app, media_file, config, task_id):
+    """
+    Uploads one carousel card's media and builds the card.
+
+    Returns:
+        dict: The card, or None if the upload failed.
+    """
+    check_cancellation(task_id)
+    with app.app_context():
+        if media_file.lower().endswith(CAROUSEL_VIDEO_EXTENSIONS):
+            video_id, image_hash = upload_video(app, media_file, task_id, config)
+            if not video_id:
+                logging.error(f"Failed to upload video: {media_file}")
+                return None
+            if not image_hash:
+                logging.error(f"Failed to upload thumbnail for {media_file}")
+                return None
+            return build_carousel_card(config, image_hash, video_id)
+
+        image_hash = upload_image(app, media_file, task_id, config)
+        if not image_hash:
+            logging.error(f"Failed to upload image: {media_file}")
+            return None
+        return build_carousel_card(config, image_hash)
+
+@task_log_context
+def create_carousel_ad(app, ad_set_id, media_files, config, task_id, on_card_done=None, used_media=None):
+    """
+    Creates a carousel ad, uploading its cards concurrently.
+
+    Cards keep the order of `media_files`. With the `carousel_failure_policy`
+    "drop_card", failed cards are left out (as long as two remain); with the
+    default "fail_ad", any failed card skips the ad.
+
+    Args:
+        on_card_done (callable, optional): Called once per card as its upload finishes,
+            with whether the upload succeeded.
+        used_media (list, optional): Filled with the media files the ad was built from.
+
+    Returns:
+        Ad: The created ad, or None.
+    """
     check_cancellation(task_id)
     try:
         ad_format = config.get('ad_format', 'Carousel')
         if ad_format == 'Carousel':
-            carousel_cards = []
-
+            supported = CAROUSEL_VIDEO_EXTENSIONS + CAROUSEL_IMAGE_EXTENSIONS
             for media_file in media_files:
-                if media_file.lower().endswith(('.mp4', '.mov', '.avi')):
-                    # Video processing
-                    video_path = media_file
-                    video_id, image_hash = upload_video(app, video_path, task_id, config)
-
-                    if not video_id:
-                        print(f"Failed to upload video: {media_file}")
-                        return
-                    
-                    if not image_hash:
-                        print(f"Failed to upload thumbnail")
-                        return
-
-
-                    card = {
-                        "link": config.get('link', ''),
-                        "video_id": video_id,
-                        "call_to_action": {
-                            "type": config.get('call_to_action', 'SHOP_NOW'),  # Default to "SHOP_NOW" if not provided
-                            "value": {
-                                "link": config.get('link', '')
-                            }
-                        },
-                        "image_hash": image_hash
-                    }
-
-                elif media_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    # Image processing
-                    image_hash = upload_image(app, media_file, task_id, config)
-                    if not image_hash:
-                        print(f"Failed to upload image: {media_file}")
-                        return
-
-                    card = {
-                        "link": config.get('link', ''),
-                        "image_hash": image_hash,
-                        "call_to_action": {
-                            "type": config.get('call_to_action', 'SHOP_NOW'),  # Default to "SHOP_NOW" if not provided
-                            "value": {
-                                "link": config.get('link', '')
-                            }
-                        }
-                    }
-
-                else:
-                    print(f"Unsupported media file format: {media_file}")
-                    continue
-
-                # Add UTM parameters if provided
-                utm_parameters = config.get('url_parameters', 'utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}')
-                if utm_parameters and not utm_parameters.startswith('?'):
-                    utm_parameters = '?' + utm_parameters
-
-                card['link'] += utm_parameters
-                carousel_cards.append(card)
-
-            object_story_spec = {
-                "page_id": config.get('facebook_page_id', '102076431877514'),
-                "link_data": {
-                    "link": config.get('link', 'https://kyronaclinic.com/pages/review-1'),
-                    "child_attachments": carousel_cards,
-                    "multi_share_optimized": True,
-                    "multi_share_end_card": False,
-                    "name": config.get('ad_creative_headline', 'No More Neuropathic Foot Pain'),
-                    "description": config.get('ad_creative_description', 'FREE Shipping & 60-Day Money-Back Guarantee'),
-                    "caption": config.get('ad_creative_primary_text', 'default text'),
-                }
-            }
-
-            # Conditionally add instagram_actor_id
-            if config.get('instagram_actor_id'):
-                object_story_spec["instagram_actor_id"] = config['instagram_actor_id']
-
-            degrees_of_freedom_spec = {
-                "creative_features_spec": {
-                    "standard_enhancements": {
-                        "enroll_status": "OPT_OUT"  # explicitly opting out
-                    }
-                }
-            }
-
-            ad_creative = AdCreative(parent_id=config['ad_account_id'])
-            params = {
-                AdCreative.Field.name: "Carousel Ad Creative",
-                AdCreative.Field.object_story_spec: object_story_spec,
-                AdCreative.Field.degrees_of_freedom_spec: degrees_of_freedom_spec
-            }
-            ad_creative.update(params)
-            ad_creative.remote_create()
-
-            ad = Ad(parent_id=config['ad_account_id'])
-            ad[Ad.Field.name] = "Carousel Ad"
-            ad[Ad.Field.adset_id] = ad_set_id
-            ad[Ad.Field.creative] = {"creative_id": ad_creative.get_id()}
-            ad[Ad.Field.status] = "PAUSED"
-            ad.remote_create()
-
-            print(f"Created carousel ad with ID: {ad.get_id()}")
+                if not media_file.lower().endswith(supported):
+                    logging.warning(f"Unsupported media file format: {media_file}")
+            media_files = [f for f in media_files if f.lower().endswith(supported)]
+
+            cards = _upload_carousel_cards(app, media_files, config, task_id, on_card_done)
+            failed = [f for f, card in zip(media_files, cards) if card is None]
+            if failed:
+                policy = config.get('carousel_failure_policy', 'fail_ad')
+                if policy != 'drop_card' or len(media_files) - len(failed) < MIN_CAROUSEL_CARDS:
+                    emit_error(task_id, f"Carousel ad skipped: {len(failed)} card(s) failed to upload")
+                    return None
+                logging.warning(f"Dropping {len(failed)} failed card(s) from carousel: {failed}")
+
+            carousel_cards = [card for card in cards if card is not None]
+            if used_media is not None:
+                used_media.extend(f for f, card in zip(media_files, cards) if card is not None)
+
+            object_story_spec = build_carousel_object_story_spec(config, carousel_cards)
+            ad = _create_creative_and_ad(config, ad_set_id, "Carousel Ad Creative", object_story_spec, "Carousel Ad", task_id)
+
+            logging.info(f"Created carousel ad with ID: {ad.get_id()}")
+            return ad
     except TaskCanceledException:
-        print(f"Task {task_id} has been canceled during carousel ad creation.")
+        logging.warning(f"Task {task_id} has been canceled during carousel ad creation.")
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError) and e.returncode == -signal.SIGTERM:
-            print(f"Task {task_id} process was terminated by signal.")
+            logging.warning(f"Task {task_id} process was terminated by signal.")
         else:
             error_msg = f"Error creating carousel ad: {e}"
-            emit_error(task_id, error_msg)
\ No newline at end of file
+            emit_error(task_id, error_msg)
+
+def _upload_carousel_cards(app, media_files, config, task_id, on_card_done=None):
+    """Uploads all cards concurrently; returns the cards (None for failures) in input order."""
+    cards = [None] * len(media_files)
+    token = get_cancel_token(task_id)
+    executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_CARDS)
+    # Drop queued uploads as soon as the task is canceled
+    drop_queued = lambda: executor.shutdown(wait=False, cancel_futures=True)
+    token.add_callback(drop_queued)
+    try:
+        futures = {
+            executor.submit(upload_carousel_card, app, media_file, config, task_id): index
+            for index, media_file in enumerate(media_files)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                cards[index] = future.result()
+            except TaskCanceledException:
+                raise
+            except Exception as e:
+                logging.error(f"Error uploading carousel card {media_files[index]}: {e}")
+            finally:
+                if on_card_done:
+                    on_card_done(cards[index] is not None)
+        token.raise_if_canceled()
+        return cards
+    finally:
+        token.remove_callback(drop_queued)
+        executor.shutdown(wait=not token.is_canceled(), cancel_futures=token.is_canceled())
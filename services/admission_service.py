@@ -0,0 +1,191 @@
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from threading import Condition
+
+from services.task_manager import on_task_finished
+from services.staging_service import STAGING_DISK_ROOT, staging_stats
+
+# Per-deployment limits (environment variables)
+MAX_INFLIGHT_BYTES = int(os.environ.get("ADMISSION_MAX_INFLIGHT_BYTES", 20 * 1024 ** 3))  # Admitted, not yet finished uploads
+MIN_FREE_DISK_BYTES = int(os.environ.get("ADMISSION_MIN_FREE_DISK_BYTES", 5 * 1024 ** 3))  # Kept free on the staging disk
+MAX_ACTIVE_TASKS = int(os.environ.get("ADMISSION_MAX_ACTIVE_TASKS", 8))
+MAX_QUEUED_MEDIA = int(os.environ.get("ADMISSION_MAX_QUEUED_MEDIA", 2000))  # Media files of admitted tasks
+QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", 16))  # Requests parked waiting for capacity; 0 rejects at once
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 30))  # Seconds a parked request waits
+RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 15))  # Base Retry-After seconds
+
+class AdmissionRejected(Exception):
+    """Raised when a submission cannot be admitted; carries what the 429 response needs."""
+
+    def __init__(self, reason, retry_after, queue_position=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.queue_position = queue_position
+
+class AdmissionTicket:
+    """Capacity held by one admitted submission until its task finishes."""
+    __slots__ = ("controller", "bytes", "media", "task_id", "released")
+
+    def __init__(self, controller, request_bytes):
+        self.controller = controller
+        self.bytes = request_bytes
+        self.media = 0
+        self.task_id = None
+        self.released = False
+
+    def bind(self, task_id, media_count=0):
+        """Ties the ticket to its task: capacity is released when the task finishes."""
+        self.task_id = task_id
+        self.hold(media_count)
+        on_task_finished(task_id, self.release)
+
+    def hold(self, media_count=0):
+        """Records the media the ticket covers without tying it to a task; the caller releases it."""
+        self.controller.set_media(self, media_count)
+
+    def release(self):
+        """Returns the ticket's capacity (safe to call more than once)."""
+        self.controller.release(self)
+
+class AdmissionController:
+    """
+    Admits submissions while in-flight bytes, free staging disk, active tasks
+    and queued media are within limits. Others are parked in a bounded FIFO
+    for up to `queue_timeout` seconds, or rejected straight away.
+    """
+
+    def __init__(self, max_inflight_bytes=MAX_INFLIGHT_BYTES, min_free_disk_bytes=MIN_FREE_DISK_BYTES,
+                 max_active_tasks=MAX_ACTIVE_TASKS, max_queued_media=MAX_QUEUED_MEDIA,
+                 queue_size=QUEUE_SIZE, queue_timeout=QUEUE_TIMEOUT, staging_dir=STAGING_DISK_ROOT):
+        self.max_inflight_bytes = max_inflight_bytes
+        self.min_free_disk_bytes = min_free_disk_bytes
+        self.max_active_tasks = max_active_tasks
+        self.max_queued_media = max_queued_media
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.staging_dir = staging_dir
+        os.makedirs(staging_dir, exist_ok=True)
+
+        self.inflight_bytes = 0
+        self.queued_media = 0
+        self.active = set()
+        self.waiting = deque()
+        self.counters = {"admitted": 0, "parked": 0, "rejected": 0, "timed_out": 0}
+        self._condition = Condition()
+
+    def _blocker(self, request_bytes):
+        """Returns why a request of this size cannot start now, or None if it can."""
+        if len(self.active) >= self.max_active_tasks:
+            return "too many active tasks"
+        if self.queued_media >= self.max_queued_media:
+            return "too many queued media files"
+        if self.active and self.inflight_bytes + request_bytes > self.max_inflight_bytes:
+            return "too many bytes in flight"
+        free = shutil.disk_usage(self.staging_dir).free
+        if free - request_bytes < self.min_free_disk_bytes:
+            return "staging disk is full"
+        return None
+
+    def admit(self, request_bytes):
+        """
+        Admits a submission of `request_bytes`, parking it if capacity frees up soon.
+
+        Returns:
+            AdmissionTicket: Capacity to hold until the task finishes.
+
+        Raises:
+            AdmissionRejected: If the request cannot be admitted.
+        """
+        request_bytes = request_bytes or 0
+        with self._condition:
+            reason = self._blocker(request_bytes)
+            if reason is None and self.waiting:
+                reason = "queued behind earlier requests"  # Keep FIFO order even when this one would fit
+            if reason is None:
+                return self._grant(request_bytes)
+
+            if len(self.waiting) >= self.queue_size:
+                self.counters["rejected"] += 1
+                raise AdmissionRejected(reason, self._retry_after(len(self.waiting)), len(self.waiting) + 1)
+
+            # Park in FIFO order; only the head of the queue may take freed capacity
+            marker = object()
+            self.waiting.append(marker)
+            self.counters["parked"] += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while True:
+                    if self.waiting[0] is marker:
+                        reason = self._blocker(request_bytes)
+                        if reason is None:
+                            return self._grant(request_bytes)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        position = self.waiting.index(marker) + 1
+                        self.counters["timed_out"] += 1
+                        raise AdmissionRejected(reason or "queued behind earlier requests",
+                                                self._retry_after(position), position)
+                    self._condition.wait(min(remaining, 1.0))  # Also re-checks disk space periodically
+            finally:
+                self.waiting.remove(marker)
+                self._condition.notify_all()
+
+    def _grant(self, request_bytes):
+        ticket = AdmissionTicket(self, request_bytes)
+        self.active.add(ticket)
+        self.inflight_bytes += request_bytes
+        self.counters["admitted"] += 1
+        return ticket
+
+    def _retry_after(self, position):
+        return RETRY_AFTER * (1 + position)
+
+    def set_media(self, ticket, media_count):
+        with self._condition:
+            if ticket in self.active:
+                self.queued_media += media_count - ticket.media
+                ticket.media = media_count
+
+    def release(self, ticket):
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.active.discard(ticket)
+            self.inflight_bytes -= ticket.bytes
+            self.queued_media -= ticket.media
+            self._condition.notify_all()
+
+    def metrics(self):
+        """Returns current usage, limits and counters."""
+        with self._condition:
+            disk = shutil.disk_usage(self.staging_dir)
+            return {
+                "active_tasks": len(self.active),
+                "inflight_bytes": self.inflight_bytes,
+                "queued_media": self.queued_media,
+                "waiting_requests": len(self.waiting),
+                "staging_disk_free_bytes": disk.free,
+                "staging": staging_stats(),
+                "limits": {
+                    "max_active_tasks": self.max_active_tasks,
+                    "max_inflight_bytes": self.max_inflight_bytes,
+                    "max_queued_media": self.max_queued_media,
+                    "min_free_disk_bytes": self.min_free_disk_bytes,
+                    "queue_size": self.queue_size,
+                    "queue_timeout": self.queue_timeout,
+                },
+                **self.counters,
+            }
+
+admission_controller = AdmissionController()
+
+def admit_submission(request_bytes):
+    """Admits a submission through the process-wide controller (see `AdmissionController.admit`)."""
+    ticket = admission_controller.admit(request_bytes)
+    logging.info(f"Admitted submission of {request_bytes or 0} bytes.")
+    return ticket
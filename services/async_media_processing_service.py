@@ -0,0 +1,387 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+
+# Utilities & Services
+from utils.get_socket import get_socketio
+from utils.async_graph_client import AsyncGraphClient
+from services.task_manager import check_cancellation, get_cancel_token, record_created_object, TaskCanceledException, cleanup_task_pid
+from services.file_service import clean_temp_files
+from services.media_processing_service import group_media_by_ad_set
+from services.adset_services import build_ad_set_params
+from services.upload_service import convert_webp_to_jpeg, use_graph_thumbnails, pick_thumbnail, DEFAULT_THUMBNAIL_TIME
+from services.retry_service import call_with_retry_async, release_retry_budget
+from services.probe_service import preflight_media
+from services.transcode_service import transcode_media, upload_path
+from services.progress_service import set_phase, add_ad_set, record_media, add_uploaded_bytes
+from services.timing_service import timed_stage, record_stage
+from utils.logging_config import bind_log_context
+from services.ad_service import (
+    IMAGE_FILE_EXTENSIONS,
+    CAROUSEL_IMAGE_EXTENSIONS,
+    CAROUSEL_VIDEO_EXTENSIONS,
+    MIN_CAROUSEL_CARDS,
+    build_image_object_story_spec,
+    build_video_object_story_spec,
+    build_carousel_card,
+    build_carousel_object_story_spec,
+    build_creative_params,
+    build_ad_params,
+    get_ad_name,
+)
+
+# Concurrency limits for the event-loop pipeline (these replace worker threads)
+MAX_CONCURRENT_UPLOADS = 20
+MAX_CONCURRENT_WRITES = 50
+
+async def process_media_async(app, task_id, campaign_id, folders, config, total_media, temp_dir, emit=None,
+                              max_uploads=MAX_CONCURRENT_UPLOADS, max_writes=MAX_CONCURRENT_WRITES, cpu_executor=None):
+    """
+    Asyncio variant of `process_media`: every upload, poll and create for the
+    task stays in flight on one event loop, bounded by semaphores.
+
+    Args:
+        app (Flask): The Flask app, used for the default Socket.IO emitter.
+        task_id (str): Unique identifier for the task.
+        campaign_id (str): The campaign ID associated with the media.
+        folders (list): List of folders containing media.
+        config (dict): Configuration details for the campaign.
+        total_media (int): Total number of media files to process.
+        temp_dir (str): Path to the temporary directory storing uploaded files.
+        emit (callable, optional): `emit(event, data)` function or coroutine
+            function; defaults to the Flask-SocketIO instance.
+        max_uploads (int): Maximum concurrent media uploads.
+        max_writes (int): Maximum concurrent Graph object creations.
+        cpu_executor (Executor, optional): Pool for CPU-bound work such as image
+            conversion; defaults to the loop's thread pool.
+    """
+    emit = emit or _flask_emitter(app)
+    bind_log_context(task_id=task_id, ad_account_id=config.get("ad_account_id"))  # Scoped to this coroutine's task
+
+    if total_media == 0:
+        await _emit(emit, 'progress', {'task_id': task_id, 'progress': 100, 'step': "No media found"})
+        await _emit(emit, 'task_complete', {'task_id': task_id})
+        set_phase(task_id, "complete", total=0)
+        cleanup_task_pid(task_id)
+        await asyncio.to_thread(clean_temp_files, temp_dir)
+        return
+
+    # Canceling the task cancels this coroutine, interrupting every pending await
+    token = get_cancel_token(task_id)
+    loop = asyncio.get_running_loop()
+    current_task = asyncio.current_task()
+    on_cancel = lambda: loop.call_soon_threadsafe(current_task.cancel)
+    token.add_callback(on_cancel)
+
+    try:
+        await _emit(emit, 'progress', {'task_id': task_id, 'progress': 0, 'step': f"0/{total_media}"})
+
+        async with AsyncGraphClient(config['access_token']) as client:
+            pipeline = _AsyncMediaPipeline(client, config, task_id, emit, total_media, max_uploads, max_writes, cpu_executor)
+            groups = await asyncio.to_thread(lambda: list(group_media_by_ad_set(folders, temp_dir)))
+
+            # Probe every file before anything is uploaded; rejected media never leaves the box
+            if config.get("preflight", True):
+                set_phase(task_id, "preflight")
+                groups, report = await asyncio.to_thread(preflight_media, task_id, groups, config, temp_dir)
+                if report["rejected"] or report["flagged"]:
+                    await _emit(emit, 'preflight', {'task_id': task_id, **report})
+                pipeline.total_media = sum(len(media) for _, media in groups)
+            if config.get("transcode"):
+                set_phase(task_id, "transcoding")
+                report = await asyncio.to_thread(transcode_media, task_id, groups, config, temp_dir)
+                await _emit(emit, 'transcode_report', {'task_id': task_id, **report})
+            set_phase(task_id, "uploading", total=pipeline.total_media)
+            await asyncio.gather(*(
+                pipeline.process_ad_set(campaign_id, ad_set_name, media) for ad_set_name, media in groups
+            ))
+
+        await _emit(emit, 'progress', {'task_id': task_id, 'progress': 100, 'step': f"{total_media}/{total_media}"})
+        await _emit(emit, 'task_complete', {'task_id': task_id})
+        set_phase(task_id, "complete")
+
+    except asyncio.CancelledError:
+        if not token.is_canceled():
+            raise
+        logging.warning(f"Task {task_id} has been canceled during media processing.")
+        set_phase(task_id, "canceled")
+    except TaskCanceledException:
+        logging.warning(f"Task {task_id} has been canceled during media processing.")
+        set_phase(task_id, "canceled")
+    except Exception as e:
+        logging.error(f"Error in processing media: {e}")
+        await _emit(emit, 'error', {'task_id': task_id, 'message': str(e)})
+        set_phase(task_id, "failed", error=str(e))
+    finally:
+        token.remove_callback(on_cancel)
+        cleanup_task_pid(task_id)
+        release_retry_budget(task_id)
+        await asyncio.to_thread(clean_temp_files, temp_dir)
+
+class _AsyncMediaPipeline:
+    """Per-task state shared by the ad set coroutines of `process_media_async`."""
+
+    def __init__(self, client, config, task_id, emit, total_media, max_uploads, max_writes, cpu_executor=None):
+        self.client = client
+        self.cpu_executor = cpu_executor
+        self.config = config
+        self.ad_account_id = config['ad_account_id']
+        self.task_id = task_id
+        self.emit = emit
+        self.total_media = total_media
+        self.upload_semaphore = asyncio.Semaphore(max_uploads)
+        self.write_semaphore = asyncio.Semaphore(max_writes)
+        self.processed = 0
+        self.last_emit_time = 0.0
+
+    async def process_ad_set(self, campaign_id, ad_set_name, media_files):
+        """Creates an ad set and all of its ads concurrently."""
+        check_cancellation(self.task_id)
+        try:
+            params = build_ad_set_params(campaign_id, ad_set_name, self.config)
+            async with self.write_semaphore:
+                with timed_stage("ad_set", task_id=self.task_id):
+                    ad_set_id = await self._retry(self.client.create_ad_set, params,
+                                                  idempotent=False, description=f"Ad set {ad_set_name}")
+            logging.info(f"Created ad set with ID: {ad_set_id}")
+            record_created_object(self.task_id, "adset", ad_set_id, name=ad_set_name, campaign_id=campaign_id)
+            add_ad_set(self.task_id, ad_set_id, ad_set_name, len(media_files))
+        except Exception as e:
+            await self._error(f"Error creating ad set: {e}")
+            return
+
+        if self.config["ad_format"] == 'Single image or video':
+            await asyncio.gather(*(self._process_single_ad(ad_set_id, media_file) for media_file in media_files))
+        elif self.config["ad_format"] == 'Carousel':
+            await self._create_carousel_ad(ad_set_id, media_files)
+
+    async def _process_single_ad(self, ad_set_id, media_file):
+        ad_id = None
+        try:
+            ad_id = await self._create_single_ad(ad_set_id, media_file)
+        except (asyncio.CancelledError, TaskCanceledException):
+            raise
+        except Exception as e:
+            await self._error(f"Error creating ad: {e}")
+        finally:
+            await self._advance(ad_set_id, bool(ad_id))
+
+    async def _create_single_ad(self, ad_set_id, media_file):
+        check_cancellation(self.task_id)
+        if media_file.lower().endswith(IMAGE_FILE_EXTENSIONS):
+            image_hash = await self._upload_image(media_file)
+            if not image_hash:
+                logging.error(f"Failed to upload image: {media_file}")
+                return
+            object_story_spec = build_image_object_story_spec(self.config, image_hash)
+        else:
+            video_id, image_hash = await self._upload_video(media_file)
+            if not video_id or not image_hash:
+                logging.error(f"Failed to upload video: {media_file}")
+                return
+            object_story_spec = build_video_object_story_spec(self.config, video_id, image_hash)
+
+        ad_id = await self._create_creative_and_ad(ad_set_id, "Creative Name", object_story_spec, get_ad_name(media_file))
+        logging.info(f"Created ad with ID: {ad_id}", extra={"hot_path": "ad_created"})
+        return ad_id
+
+    async def _create_carousel_ad(self, ad_set_id, media_files):
+        try:
+            check_cancellation(self.task_id)
+            media_files = [
+                f for f in media_files
+                if f.lower().endswith(CAROUSEL_VIDEO_EXTENSIONS + CAROUSEL_IMAGE_EXTENSIONS)
+            ]
+            # gather() keeps results in card order
+            uploads = await asyncio.gather(*(self._upload_card_and_advance(ad_set_id, f) for f in media_files))
+
+            failed = [f for f, card in zip(media_files, uploads) if card is None]
+            if failed:
+                policy = self.config.get('carousel_failure_policy', 'fail_ad')
+                if policy != 'drop_card' or len(media_files) - len(failed) < MIN_CAROUSEL_CARDS:
+                    await self._error(f"Carousel ad skipped: {len(failed)} card(s) failed to upload")
+                    return
+                logging.warning(f"Dropping {len(failed)} failed card(s) from carousel: {failed}")
+            carousel_cards = [card for card in uploads if card is not None]
+
+            object_story_spec = build_carousel_object_story_spec(self.config, carousel_cards)
+            ad_id = await self._create_creative_and_ad(ad_set_id, "Carousel Ad Creative", object_story_spec, "Carousel Ad")
+            logging.info(f"Created carousel ad with ID: {ad_id}")
+        except (asyncio.CancelledError, TaskCanceledException):
+            raise
+        except Exception as e:
+            await self._error(f"Error creating carousel ad: {e}")
+
+    async def _upload_card_and_advance(self, ad_set_id, media_file):
+        """Uploads one card, counting it towards progress; returns None if it failed."""
+        card = None
+        try:
+            card = await self._upload_card(media_file)
+            return card
+        except (asyncio.CancelledError, TaskCanceledException):
+            raise
+        except Exception as e:
+            logging.error(f"Error uploading carousel card {media_file}: {e}")
+            return None
+        finally:
+            await self._advance(ad_set_id, card is not None)
+
+    async def _upload_card(self, media_file):
+        if media_file.lower().endswith(CAROUSEL_VIDEO_EXTENSIONS):
+            video_id, image_hash = await self._upload_video(media_file)
+            if not video_id or not image_hash:
+                return None
+            return build_carousel_card(self.config, image_hash, video_id)
+
+        image_hash = await self._upload_image(media_file)
+        return build_carousel_card(self.config, image_hash) if image_hash else None
+
+    async def _upload_image(self, image_file):
+        # Convert WebP to JPEG if necessary (Pillow work stays off the loop)
+        if image_file.lower().endswith(".webp"):
+            loop = asyncio.get_running_loop()
+            image_file = await loop.run_in_executor(self.cpu_executor, convert_webp_to_jpeg, image_file)
+
+        async with self.upload_semaphore:
+            with timed_stage("image_upload", os.path.getsize(image_file), task_id=self.task_id):
+                image_hash = await self._retry(self.client.upload_image, image_file, description=f"Image upload for {image_file}")
+        if image_hash:
+            add_uploaded_bytes(self.task_id, os.path.getsize(image_file))
+        return image_hash
+
+    async def _upload_video(self, video_file):
+        video_file = upload_path(self.config, video_file)
+        async with self.upload_semaphore:
+            with timed_stage("video_upload", os.path.getsize(video_file), task_id=self.task_id):
+                video_id = await self._upload_video_chunks(video_file)
+        if not video_id:
+            return None, None
+        add_uploaded_bytes(self.task_id, os.path.getsize(video_file))
+
+        # Processing waits don't hold an upload slot
+        started = time.monotonic()
+        ready = await self.client.wait_for_video(video_id)
+        if not ready:
+            logging.warning(f"Video {video_id} failed to process in time.")
+            return None, None
+        record_stage("video_processing", time.monotonic() - started, task_id=self.task_id)
+
+        # Graph's generated thumbnail needs no local work; ffmpeg is the fallback
+        if use_graph_thumbnails(self.config):
+            try:
+                thumbnails = await self._retry(self.client.get_video_thumbnails, video_id,
+                                               description=f"Thumbnails of {video_id}")
+                thumbnail_url = pick_thumbnail(thumbnails)
+                if thumbnail_url:
+                    return video_id, thumbnail_url
+            except (asyncio.CancelledError, TaskCanceledException):
+                raise
+            except Exception as e:
+                logging.warning(f"Fetching Graph thumbnail for video {video_id} failed: {e}")
+
+        thumbnail_path = await extract_thumbnail_async(video_file, self.config.get('thumbnail_time') or DEFAULT_THUMBNAIL_TIME)
+        thumbnail_hash = await self._upload_image(thumbnail_path) if thumbnail_path else None
+        return video_id, thumbnail_hash
+
+    async def _upload_video_chunks(self, video_file):
+        """
+        Runs Graph's chunked video upload with each request retried on its own,
+        so a failed chunk is resent from Graph's offset instead of restarting
+        the upload from byte 0.
+        """
+        start = await self._retry(self.client.start_video_upload, os.path.getsize(video_file),
+                                  description=f"Video upload start for {video_file}")
+        upload_session_id = start["upload_session_id"]
+        start_offset = int(start["start_offset"])
+        end_offset = int(start["end_offset"])
+
+        while start_offset < end_offset:
+            check_cancellation(self.task_id)
+            offsets = await self._retry(
+                self.client.transfer_video_chunk, upload_session_id, video_file, start_offset, end_offset - start_offset,
+                description=f"Video chunk at offset {start_offset} of {video_file}",
+            )
+            start_offset = int(offsets["start_offset"])
+            end_offset = int(offsets["end_offset"])
+
+        await self._retry(self.client.finish_video_upload, upload_session_id,
+                          description=f"Video upload finish for {video_file}")
+        return start.get("video_id")
+
+    async def _create_creative_and_ad(self, ad_set_id, creative_name, object_story_spec, ad_name):
+        async with self.write_semaphore:
+            with timed_stage("creative", task_id=self.task_id):
+                creative_id = await self._retry(
+                    self.client.create_ad_creative, build_creative_params(creative_name, object_story_spec),
+                    idempotent=False, description=f"Creative for {ad_name}",
+                )
+            with timed_stage("ad", task_id=self.task_id):
+                ad_id = await self._retry(
+                    self.client.create_ad, build_ad_params(ad_name, ad_set_id, creative_id),
+                    idempotent=False, description=f"Ad {ad_name}",
+                )
+        record_created_object(self.task_id, "ad", ad_id, name=ad_name, ad_set_id=ad_set_id)
+        return ad_id
+
+    async def _retry(self, func, *args, idempotent=True, description=None):
+        """Calls an ad-account-scoped client method under the retry engine."""
+        return await call_with_retry_async(
+            func, self.ad_account_id, *args, task_id=self.task_id, ad_account_id=self.ad_account_id,
+            idempotent=idempotent, description=description,
+        )
+
+    async def _advance(self, ad_set_id=None, success=True):
+        """Counts a processed file and emits progress at most every 0.5 seconds."""
+        record_media(self.task_id, ad_set_id, success)
+        self.processed += 1
+        now = time.monotonic()
+        if now - self.last_emit_time >= 0.5 or self.processed == self.total_media:
+            self.last_emit_time = now
+            progress = int((self.processed / self.total_media) * 100)
+            await _emit(self.emit, 'progress', {
+                'task_id': self.task_id, 'progress': progress, 'step': f"{self.processed}/{self.total_media}"
+            })
+
+    async def _error(self, message):
+        logging.error(message)
+        await _emit(self.emit, 'error', {'task_id': self.task_id, 'message': message})
+
+async def extract_thumbnail_async(video_path, frame_time=DEFAULT_THUMBNAIL_TIME):
+    """Extracts a thumbnail frame with FFmpeg without blocking the event loop."""
+    thumbnail_path = video_path + ".thumbnail.jpg"  # Appended, so a staged "<name>_thumbnail.jpg" link is never written through
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-i', video_path,
+        '-ss', frame_time, '-vframes', '1',
+        '-preset', 'ultrafast', '-threads', '4',
+        '-update', '1', thumbnail_path,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        returncode = await process.wait()
+    except asyncio.CancelledError:
+        # Task canceled: don't leave ffmpeg running
+        if process.returncode is None:
+            process.kill()
+        raise
+
+    if returncode != 0 or not os.path.exists(thumbnail_path):
+        logging.error(f"FFmpeg failed to generate a thumbnail for {video_path}.")
+        return None
+    return thumbnail_path
+
+def _flask_emitter(app):
+    def emit(event, data):
+        with app.app_context():
+            get_socketio().emit(event, data)
+    return emit
+
+async def _emit(emit, event, data):
+    """Calls a sync or async emitter, logging (not raising) delivery failures."""
+    try:
+        result = emit(event, data)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logging.error(f"Failed to emit {event} via socket: {e}")
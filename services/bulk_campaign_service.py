@@ -0,0 +1,228 @@
+import csv
+import io
+import json
+import logging
+from pathlib import Path
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor
+
+# Utilities & Services
+from utils.get_socket import get_socketio
+from services.task_manager import add_task, cleanup_task_pid
+from services.retry_service import release_retry_budget
+from services.progress_service import start_progress, set_phase
+from services.campaign_service import create_campaign, find_campaign_by_id, get_campaign_budget_optimization
+from services.media_processing_service import process_ad_set_groups
+from services.file_service import clean_temp_files, get_media_index, MEDIA_EXTENSIONS
+from services.upload_service import UploadCache
+from utils.facebook_client import get_api_for_config
+
+# Campaigns processed at once in a bulk run; ad-level parallelism is per campaign
+MAX_PARALLEL_CAMPAIGNS = 4
+
+# CSV columns that describe structure rather than config overrides
+CSV_STRUCTURE_COLUMNS = {"campaign_name", "task_id", "ad_set_name", "media"}
+
+class ManifestError(ValueError):
+    """Raised when a bulk manifest is malformed or references missing media."""
+    pass
+
+def parse_manifest(content, filename=None):
+    """
+    Parses a bulk manifest in JSON or CSV format.
+
+    JSON format:
+        {"campaigns": [{"campaign_name": "...", "task_id": "...", <config overrides>,
+                        "ad_sets": [{"name": "...", "media": ["folder/a.jpg", ...]}]}]}
+
+    CSV format: one row per media file with `campaign_name`, `ad_set_name` and
+    `media` columns, an optional `task_id` column, and any other column used as
+    a config override (first non-empty value per campaign wins).
+
+    Args:
+        content (str): Manifest text.
+        filename (str, optional): Original file name, used to detect CSV.
+
+    Returns:
+        list: Campaign specs, each a dict with `overrides` and `ad_sets`
+              (a list of (ad_set_name, [relative media paths])).
+
+    Raises:
+        ManifestError: If the manifest cannot be parsed.
+    """
+    content = content.strip()
+    is_csv = (filename or "").lower().endswith(".csv") or not content.startswith(("{", "["))
+    campaigns = _parse_csv_manifest(content) if is_csv else _parse_json_manifest(content)
+    if not campaigns:
+        raise ManifestError("Manifest does not describe any campaigns")
+    return campaigns
+
+def _parse_json_manifest(content):
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise ManifestError(f"Invalid JSON manifest: {e}")
+
+    entries = data.get("campaigns", []) if isinstance(data, dict) else data
+    campaigns = []
+    for entry in entries:
+        overrides = {k: v for k, v in entry.items() if k != "ad_sets"}
+        ad_sets = [(ad_set["name"], list(ad_set.get("media", []))) for ad_set in entry.get("ad_sets", [])]
+        if not overrides.get("campaign_name") and not overrides.get("campaign_id"):
+            raise ManifestError("Every campaign needs a campaign_name or campaign_id")
+        campaigns.append({"overrides": overrides, "ad_sets": ad_sets})
+    return campaigns
+
+def _parse_csv_manifest(content):
+    reader = csv.DictReader(io.StringIO(content))
+    missing = {"campaign_name", "ad_set_name", "media"} - set(reader.fieldnames or [])
+    if missing:
+        raise ManifestError(f"CSV manifest is missing columns: {', '.join(sorted(missing))}")
+
+    campaigns = {}  # Keyed by (task_id, campaign_name), in first-seen order
+    for row in reader:
+        key = (row.get("task_id") or "", row["campaign_name"])
+        campaign = campaigns.setdefault(key, {"overrides": {"campaign_name": row["campaign_name"]}, "ad_sets": {}})
+        if row.get("task_id"):
+            campaign["overrides"]["task_id"] = row["task_id"]
+        for column, value in row.items():
+            if column not in CSV_STRUCTURE_COLUMNS and value and column not in campaign["overrides"]:
+                campaign["overrides"][column] = _csv_value(value)
+        campaign["ad_sets"].setdefault(row["ad_set_name"], []).append(row["media"])
+
+    return [
+        {"overrides": c["overrides"], "ad_sets": list(c["ad_sets"].items())}
+        for c in campaigns.values()
+    ]
+
+def _csv_value(value):
+    """Turns CSV 'true'/'false' cells into booleans so flags like is_cbo behave."""
+    lowered = value.strip().lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    return value
+
+def resolve_campaign_media(campaigns, temp_dir):
+    """
+    Maps manifest media references onto the staged media bundle.
+
+    Args:
+        campaigns (list): Campaign specs from `parse_manifest`.
+        temp_dir (str or Path): Directory the media bundle was saved to.
+
+    Returns:
+        list: The same specs with `ad_sets` holding absolute file paths.
+
+    Raises:
+        ManifestError: If a referenced file is missing or not a supported media type.
+    """
+    media_index = get_media_index(temp_dir)
+    resolved = []
+    for campaign in campaigns:
+        ad_sets = []
+        for ad_set_name, media in campaign["ad_sets"]:
+            files = []
+            for reference in media:
+                reference = reference.strip().lstrip("/")
+                if Path(reference).suffix.lower() not in MEDIA_EXTENSIONS:
+                    raise ManifestError(f"Unsupported media type: '{reference}'")
+                # Only indexed files count, which also rules out paths escaping the bundle
+                entry = media_index.get(Path(reference).as_posix())
+                if entry is None:
+                    raise ManifestError(f"Media '{reference}' not found in the uploaded bundle")
+                files.append(entry.path)
+            ad_sets.append((ad_set_name, files))
+        resolved.append({**campaign, "ad_sets": ad_sets})
+    return resolved
+
+def build_campaign_configs(base_config, campaigns, bulk_task_id):
+    """
+    Derives one config per manifest campaign from the shared, already-processed config.
+
+    Every campaign gets its own task ID (from the manifest or derived from
+    `bulk_task_id`) and all of them share one UploadCache, so media used by
+    several campaigns in the same account is uploaded once.
+
+    Returns:
+        list: (config, ad_sets) pairs.
+    """
+    upload_cache = UploadCache()
+    configs = []
+    for index, campaign in enumerate(campaigns):
+        config = {**base_config, **campaign["overrides"], "upload_folder": [], "upload_cache": upload_cache}
+        config["task_id"] = campaign["overrides"].get("task_id") or f"{bulk_task_id}-{index + 1}"
+        configs.append((config, campaign["ad_sets"]))
+    return configs
+
+def process_bulk_campaigns(app, bulk_task_id, campaign_configs, temp_dir, ticket=None):
+    """
+    Creates every campaign of a bulk run and processes their media together.
+
+    Each campaign reports progress under its own task ID; a final
+    `bulk_complete` event summarizes the run. The shared media bundle is
+    deleted once all campaigns have finished.
+
+    Args:
+        app (Flask): The Flask application.
+        bulk_task_id (str): Identifier of the whole bulk run.
+        campaign_configs (list): (config, ad_sets) pairs from `build_campaign_configs`.
+        temp_dir (str or Path): Directory holding the staged media bundle.
+        ticket (AdmissionTicket, optional): Admission capacity, released once all campaigns have finished.
+    """
+    with app.app_context():
+        try:
+            with ThreadPoolExecutor(max_workers=MAX_PARALLEL_CAMPAIGNS) as executor:
+                futures = [
+                    executor.submit(_process_bulk_campaign, app, config, ad_sets, temp_dir)
+                    for config, ad_sets in campaign_configs
+                ]
+                results = [future.result() for future in futures]
+
+            get_socketio().emit('bulk_complete', {'task_id': bulk_task_id, 'campaigns': results})
+        except Exception as e:
+            logging.error(f"Error in bulk campaign processing: {e}")
+            get_socketio().emit('error', {'task_id': bulk_task_id, 'message': str(e)})
+        finally:
+            clean_temp_files(temp_dir)
+            if ticket is not None:
+                ticket.release()
+
+def _process_bulk_campaign(app, config, ad_sets, temp_dir):
+    task_id = config["task_id"]
+    started = False
+    error = "Campaign processing did not start"
+    with app.app_context():
+        try:
+            add_task(task_id)
+            start_progress(task_id)
+
+            campaign_id = config.get("campaign_id")
+            if campaign_id:
+                campaign_id = find_campaign_by_id(campaign_id, config["ad_account_id"], get_api_for_config(config))
+                if not campaign_id:
+                    error = "Campaign ID not found"
+                    return {"task_id": task_id, "error": error}
+                existing = get_campaign_budget_optimization(config) or {}
+                config['is_existing_cbo'] = existing.get('is_campaign_budget_optimization', False)
+            else:
+                campaign_id, _ = create_campaign(config)
+                if not campaign_id:
+                    error = "Failed to create campaign"
+                    return {"task_id": task_id, "error": error}
+
+            total_media = sum(len(media) for _, media in ad_sets)
+            started = True  # process_ad_set_groups finishes the task on every path
+            process_ad_set_groups(app, task_id, campaign_id, ad_sets, config, total_media, temp_dir, clean_up=False)
+            return {"task_id": task_id, "campaign_id": campaign_id}
+
+        except Exception as e:
+            logging.error(f"Error processing bulk campaign {task_id}: {e}")
+            get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
+            error = str(e)
+            return {"task_id": task_id, "error": error}
+        finally:
+            if not started:
+                set_phase(task_id, "failed", error=error)
+                cleanup_task_pid(task_id)  # Otherwise it would stay tracked as running
+                release_retry_budget(task_id)
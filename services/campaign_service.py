@@ -3,8 +3,8 @@ import json
 from datetime import datetime, timedelta
 
 from utils.error_handler import emit_error  
-from services.task_manager import check_cancellation
-from utils.facebook_client import FacebookAdsClient
+from services.task_manager import check_cancellation, record_created_object
+from utils.facebook_client import FacebookAdsClient, get_api_for_config
 from utils.json_parser import parse_custom_audiences
 from utils.validators import validate_json_payload
 
@@ -12,6 +12,25 @@ from utils.validators import validate_json_payload
 from facebook_business.adobjects.adaccount import AdAccount
 from facebook_business.adobjects.campaign import Campaign
 
+def build_campaign_params(data):
+    """Builds the Graph parameters for a new campaign from the task config."""
+    # Define basic campaign parameters
+    campaign_params = {
+        "name": data["campaign_name"],
+        "objective": data["objective"],
+        "special_ad_categories": ["NONE"],  # Modify this based on actual categories if necessary
+        "buying_type": data["buying_type"],
+    }
+
+    # Handle budget allocation if the campaign is set to 'AUCTION'
+    if data["buying_type"] == "AUCTION":
+        budget_value_cents = int(float(data["budget_value"]) * 100)  # Convert to cents
+        if data["is_cbo"]:
+            campaign_params["daily_budget"] = budget_value_cents if data["budget_optimization"] == "DAILY_BUDGET" else None
+            campaign_params["lifetime_budget"] = budget_value_cents if data["budget_optimization"] == "LIFETIME_BUDGET" else None
+            campaign_params["bid_strategy"] = data.get("bid_strategy", "LOWEST_COST_WITHOUT_CAP")
+    return campaign_params
+
 def create_campaign(data):
     """
     Creates a Facebook Ads campaign.
@@ -38,26 +57,12 @@ def create_campaign(data):
 
     try:
         client = FacebookAdsClient(data["app_id"], data["app_secret"], data["access_token"])
-
-        # Define basic campaign parameters
-        campaign_params = {
-            "name": data["campaign_name"],
-            "objective": data["objective"],
-            "special_ad_categories": ["NONE"],  # Modify this based on actual categories if necessary
-            "buying_type": data["buying_type"],
-        }
-
-        # Handle budget allocation if the campaign is set to 'AUCTION'
-        if data["buying_type"] == "AUCTION":
-            budget_value_cents = int(float(data["budget_value"]) * 100)  # Convert to cents
-            if data["is_cbo"]:
-                campaign_params["daily_budget"] = budget_value_cents if data["budget_optimization"] == "DAILY_BUDGET" else None
-                campaign_params["lifetime_budget"] = budget_value_cents if data["budget_optimization"] == "LIFETIME_BUDGET" else None
-                campaign_params["bid_strategy"] = data.get("bid_strategy", "LOWEST_COST_WITHOUT_CAP")
+        campaign_params = build_campaign_params(data)
 
         # Create the campaign in the Facebook Ads API
-        campaign = AdAccount(data["ad_account_id"]).create_campaign(fields=[AdAccount.Field.id], params=campaign_params)
+        campaign = AdAccount(data["ad_account_id"], api=client.api).create_campaign(fields=[AdAccount.Field.id], params=campaign_params)
         logging.info(f"Successfully created campaign with ID: {campaign['id']}")
+        record_created_object(data["task_id"], "campaign", campaign["id"], name=data["campaign_name"])
         return campaign["id"], campaign
 
     except Exception as e:
@@ -74,13 +79,14 @@ def get_campaign_budget_optimization(data):
     Args:
         data (dict): Campaign details, including:
             - campaign_id (str): The ID of the campaign.
+            - app_id, app_secret, access_token (str, optional): Credentials for the Graph API.
 
     Returns:
         dict: Campaign details including name, status, budget, and objective.
         None: If an error occurs.
     """
     try:
-        campaign = Campaign(data["campaign_id"]).api_get(fields=[
+        campaign = Campaign(data["campaign_id"], api=get_api_for_config(data)).api_get(fields=[
             Campaign.Field.name,
             Campaign.Field.effective_status,
             Campaign.Field.daily_budget,
@@ -105,35 +111,37 @@ def get_campaign_budget_optimization(data):
         return None
 
 
-def is_campaign_budget_optimized(campaign_id, ad_account_id):
+def is_campaign_budget_optimized(campaign_id, ad_account_id, credentials=None):
     """
     Checks if a given campaign has budget optimization enabled.
 
     Args:
         campaign_id (str): The ID of the campaign.
         ad_account_id (str): The Ad Account ID.
+        credentials (dict, optional): `app_id`, `app_secret` and `access_token` for the Graph API.
 
     Returns:
         bool: True if budget optimization is enabled, False otherwise.
     """
-    budget_optimization_info = get_campaign_budget_optimization({"campaign_id": campaign_id})
+    budget_optimization_info = get_campaign_budget_optimization({"campaign_id": campaign_id, **(credentials or {})})
     return budget_optimization_info.get("is_campaign_budget_optimization", False) if budget_optimization_info else False
 
 
-def find_campaign_by_id(campaign_id, ad_account_id):
+def find_campaign_by_id(campaign_id, ad_account_id, api):
     """
     Finds and returns a campaign ID if it exists.
 
     Args:
         campaign_id (str): The ID of the campaign.
         ad_account_id (str): The Ad Account ID.
+        api (FacebookAdsApi): The pooled API for the account's credentials.
 
     Returns:
         str: Campaign ID if found.
         None: If the campaign is not found or an error occurs.
     """
     try:
-        campaigns = AdAccount(ad_account_id).get_campaigns(
+        campaigns = AdAccount(ad_account_id, api=api).get_campaigns(
             fields=['name'],
             params={'filtering': [{'field': 'id', 'operator': 'EQUAL', 'value': campaign_id}]}
         )
@@ -146,9 +154,12 @@ def find_campaign_by_id(campaign_id, ad_account_id):
         logging.error(f"Error finding campaign by ID {campaign_id}: {e}")
         return None
 
+_timezone_cache = {}  # Maps ad account IDs to their timezone name
+
 def get_ad_account_timezone(ad_account_id, app_id, app_secret, access_token):
     """
     Fetches the timezone of a given Facebook Ad Account.
+    Successful lookups are cached per ad account for the life of the process.
 
     Args:
         ad_account_id (str): The Facebook Ad Account ID (e.g., "act_123456789").
@@ -159,22 +170,46 @@ def get_ad_account_timezone(ad_account_id, app_id, app_secret, access_token):
     Returns:
         str: Timezone name (e.g., "America/Los_Angeles") if successful, else None.
     """
+    if ad_account_id in _timezone_cache:
+        return _timezone_cache[ad_account_id]
+
     try:
-        # Initialize the Facebook Ads API before making any API calls
+        # Get the pooled Facebook Ads API for these credentials
         client = FacebookAdsClient(app_id, app_secret, access_token)
 
         # Retrieve the ad account details
-        ad_account = AdAccount(ad_account_id).api_get(fields=[AdAccount.Field.timezone_name])
+        ad_account = AdAccount(ad_account_id, api=client.api).api_get(fields=[AdAccount.Field.timezone_name])
 
         timezone_name = ad_account.get('timezone_name')
         logging.info(f"Fetched timezone for Ad Account {ad_account_id}: {timezone_name}")
 
+        if timezone_name:
+            _timezone_cache[ad_account_id] = timezone_name
+
         return timezone_name
 
     except Exception as e:
         logging.error(f"Error fetching timezone for Ad Account {ad_account_id}: {e}")
         return None  # Return None in case of failure
     
+# Config keys holding credentials; they are never logged
+SECRET_CONFIG_KEYS = ("access_token", "app_secret")
+
+def summarize_config(config):
+    """
+    Returns a config as it may be logged: credentials masked, uploaded files
+    reduced to a count and non-JSON values (caches, clients) left out.
+    """
+    summary = {}
+    for key, value in config.items():
+        if key in SECRET_CONFIG_KEYS:
+            summary[key] = "[REDACTED]" if value else value
+        elif key == "upload_folder":
+            summary["uploaded_files"] = len(value or [])
+        elif value is None or isinstance(value, (str, int, float, bool, list, dict)):
+            summary[key] = value
+    return summary
+
 def process_campaign_config(request):
     """
     Extracts and processes campaign configuration from request.
@@ -186,91 +221,109 @@ def process_campaign_config(request):
         dict: Processed campaign configuration.
     """
     try:
-        # Parse JSON fields
-        flexible_spec = json.loads(request.form.get("interests", "[]"))
-        custom_audiences = parse_custom_audiences(request.form.get("custom_audiences", "[]"))
-
-        # Receive the JavaScript objects directly
-        if request.is_json:
-            platforms = request.json.get('platforms', '{}')
-        else:
-            platforms = request.form.get('platforms', '{}')
-        
-        if request.is_json:
-            placements = request.json.get('placements', '{}')
-        else:
-            placements = request.form.get('placements', '{}')
-        
         # Validate platforms and placements JSON
         platforms, placements, error_response = validate_json_payload()
         if error_response:
             return error_response
-        
-        ad_account_id = request.form.get("ad_account_id")
-        app_id = request.form.get("app_id")
-        app_secret = request.form.get("app_secret")
-        access_token = request.form.get("access_token")
-        ad_account_timezone = get_ad_account_timezone(ad_account_id, app_id, app_secret, access_token)
-
-        # Extract fields with defaults
-        config = {
-            "upload_folder": request.files.getlist('uploadFolders'),
-            "campaign_name": request.form.get("campaign_name", ""),
-            "campaign_id": request.form.get("campaign_id", ""),
-            "task_id": request.form.get("task_id", ""),
-            "ad_account_id": ad_account_id,
-            "pixel_id": request.form.get("pixel_id", ""),
-            "facebook_page_id": request.form.get("facebook_page_id", ""),
-            "app_id": app_id,
-            "app_secret": app_secret,
-            "access_token": access_token,
-            "headline": request.form.get("headline", ""),
-            "link": request.form.get("destination_url", ""),
-            'utm_parameters': request.form.get('url_parameters', '?utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}'),
-            "ad_format": request.form.get("ad_format", "Single image or video"),
-            "objective": request.form.get("objective", "OUTCOME_SALES"),
-            "campaign_budget_optimization": request.form.get('campaign_budget_optimization', 'AD_SET_BUDGET_OPTIMIZATION'),
-            "budget_value": request.form.get("campaign_budget_value", ""),
-            "buying_type": request.form.get("buying_type", "AUCTION"),
-            'bid_strategy': request.form.get('campaign_bid_strategy', 'LOWEST_COST_WITHOUT_CAP'),
-            "object_store_url": request.form.get("object_store_url", ""),
-            "bid_amount": request.form.get("bid_amount", "0.0"),
-            "is_cbo": request.form.get("isCBO", "false").lower() == "true",
-            "custom_audiences": custom_audiences,
-            "flexible_spec": flexible_spec,
-            "geo_locations": request.form.get("location", ""),
-            "age_range": request.form.get("age_range", ""),
-            'age_range_max': request.form.get('age_range_max', '65'),
-            'optimization_goal': request.form.get('performance_goal', 'OFFSITE_CONVERSIONS'),
-            'event_type': request.form.get('event_type', 'PURCHASE'),
-            'attribution_setting': request.form.get('attribution_setting', '7d_click'),
-            'instagram_actor_id': request.form.get('instagram_account', ''),
-            'ad_creative_primary_text': request.form.get('ad_creative_primary_text', ''),
-            "ad_creative_headline": request.form.get("ad_creative_headline", ""),
-            "ad_creative_description": request.form.get("ad_creative_description", ""),
-            'call_to_action': request.form.get('call_to_action', 'SHOP_NOW'),
-            "destination_url": request.form.get("destination_url", ""),
-            "app_events": request.form.get(
-                "app_events",
-                (datetime.now() + timedelta(days=1))
-                .replace(hour=4, minute=0, second=0, microsecond=0)
-                .strftime("%Y-%m-%dT%H:%M:%S"),
-            ),  # Default to tomorrow at 4 AM if not provided
-            'language_customizations': request.form.get('language_customizations', 'en'),
-            'url_parameters': request.form.get('url_parameters', '?utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}'),
-            'gender': request.form.get('gender', 'All'),
-            'ad_set_budget_optimization': request.form.get('ad_set_budget_optimization', 'DAILY_BUDGET'),
-            "ad_set_budget_value": request.form.get("ad_set_budget_value", ""),
-            'ad_set_bid_strategy': request.form.get('ad_set_bid_strategy', 'LOWEST_COST_WITHOUT_CAP'),
-            "ad_set_end_time": request.form.get("ad_set_end_time", ""),
-            "platforms": platforms,
-            "placements": placements,
-            "ad_account_timezone": ad_account_timezone,
-        }
 
-        logging.info(f"Processed campaign config: {config}")
+        config = build_campaign_config(request.form, request.files.getlist('uploadFolders'), platforms, placements)
+        logging.info(f"Processed campaign config: {summarize_config(config)}")
         return config
 
     except Exception as e:
         logging.error(f"Error processing campaign config: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def build_campaign_config(form, upload_folder, platforms, placements):
+    """
+    Builds a campaign configuration from form fields, applying the defaults
+    of /create_campaign. Shared by the HTTP route and the CLI runner.
+
+    Args:
+        form (Mapping): Form field names to string values.
+        upload_folder (list): Uploaded file objects (empty when media is local).
+        platforms (dict): Validated platforms.
+        placements (dict): Validated placements.
+
+    Returns:
+        dict: Processed campaign configuration.
+    """
+    # Parse JSON fields
+    flexible_spec = json.loads(form.get("interests", "[]"))
+    custom_audiences = parse_custom_audiences(form.get("custom_audiences", "[]"))
+
+    ad_account_id = form.get("ad_account_id")
+    app_id = form.get("app_id")
+    app_secret = form.get("app_secret")
+    access_token = form.get("access_token")
+    ad_account_timezone = get_ad_account_timezone(ad_account_id, app_id, app_secret, access_token)
+
+    # Extract fields with defaults
+    config = {
+        "upload_folder": upload_folder,
+        "campaign_name": form.get("campaign_name", ""),
+        "campaign_id": form.get("campaign_id", ""),
+        "task_id": form.get("task_id", ""),
+        "ad_account_id": ad_account_id,
+        "pixel_id": form.get("pixel_id", ""),
+        "facebook_page_id": form.get("facebook_page_id", ""),
+        "app_id": app_id,
+        "app_secret": app_secret,
+        "access_token": access_token,
+        "headline": form.get("headline", ""),
+        "link": form.get("destination_url", ""),
+        'utm_parameters': form.get('url_parameters', '?utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}'),
+        "ad_format": form.get("ad_format", "Single image or video"),
+        "objective": form.get("objective", "OUTCOME_SALES"),
+        "campaign_budget_optimization": form.get('campaign_budget_optimization', 'AD_SET_BUDGET_OPTIMIZATION'),
+        "budget_value": form.get("campaign_budget_value", ""),
+        "buying_type": form.get("buying_type", "AUCTION"),
+        'bid_strategy': form.get('campaign_bid_strategy', 'LOWEST_COST_WITHOUT_CAP'),
+        "object_store_url": form.get("object_store_url", ""),
+        "bid_amount": form.get("bid_amount", "0.0"),
+        "is_cbo": form.get("isCBO", "false").lower() == "true",
+        "custom_audiences": custom_audiences,
+        "flexible_spec": flexible_spec,
+        "geo_locations": form.get("location", ""),
+        "age_range": form.get("age_range", ""),
+        'age_range_max': form.get('age_range_max', '65'),
+        'optimization_goal': form.get('performance_goal', 'OFFSITE_CONVERSIONS'),
+        'event_type': form.get('event_type', 'PURCHASE'),
+        'attribution_setting': form.get('attribution_setting', '7d_click'),
+        'instagram_actor_id': form.get('instagram_account', ''),
+        'ad_creative_primary_text': form.get('ad_creative_primary_text', ''),
+        "ad_creative_headline": form.get("ad_creative_headline", ""),
+        "ad_creative_description": form.get("ad_creative_description", ""),
+        'call_to_action': form.get('call_to_action', 'SHOP_NOW'),
+        "destination_url": form.get("destination_url", ""),
+        "app_events": form.get(
+            "app_events",
+            (datetime.now() + timedelta(days=1))
+            .replace(hour=4, minute=0, second=0, microsecond=0)
+            .strftime("%Y-%m-%dT%H:%M:%S"),
+        ),  # Default to tomorrow at 4 AM if not provided
+        'language_customizations': form.get('language_customizations', 'en'),
+        'url_parameters': form.get('url_parameters', '?utm_source=Facebook&utm_medium={{adset.name}}&utm_campaign={{campaign.name}}&utm_content={{ad.name}}'),
+        'gender': form.get('gender', 'All'),
+        'ad_set_budget_optimization': form.get('ad_set_budget_optimization', 'DAILY_BUDGET'),
+        "ad_set_budget_value": form.get("ad_set_budget_value", ""),
+        'ad_set_bid_strategy': form.get('ad_set_bid_strategy', 'LOWEST_COST_WITHOUT_CAP'),
+        "ad_set_end_time": form.get("ad_set_end_time", ""),
+        "platforms": platforms,
+        "placements": placements,
+        "ad_account_timezone": ad_account_timezone,
+        "sync_mode": form.get("sync_mode", "false").lower() == "true",
+        "pause_removed": form.get("pause_removed", "false").lower() == "true",
+        "preflight": form.get("preflight", "true").lower() == "true",
+        "preflight_strict": form.get("preflight_strict", "false").lower() == "true",
+        "media_limits": json.loads(form.get("media_limits", "{}")),
+        "transcode": form.get("transcode", "false").lower() == "true",
+        "transcode_profile": form.get("transcode_profile", "1080p"),
+        "transcode_overrides": json.loads(form.get("transcode_overrides", "{}")),
+        "carousel_failure_policy": form.get("carousel_failure_policy", "fail_ad"),
+        "thumbnail_source": form.get("thumbnail_source", "ffmpeg"),
+        "thumbnail_time": form.get("thumbnail_time", ""),
+        "dry_run": form.get("dry_run", "false").lower() == "true",
+    }
+
+    return config
\ No newline at end of file
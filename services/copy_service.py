@@ -0,0 +1,241 @@
+import itertools
+import logging
+from threading import Lock
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor
+
+# Facebook Ads SDK
+from facebook_business.adobjects.ad import Ad
+from facebook_business.adobjects.adset import AdSet
+from facebook_business.adobjects.campaign import Campaign
+
+# Utilities & Services
+from utils.get_socket import get_socketio
+from utils.facebook_client import get_api_for_config
+from services.task_manager import check_cancellation, cleanup_task_pid, record_created_object
+from services.retry_service import call_with_retry, release_retry_budget
+from utils.logging_config import task_log_context
+
+# Graph copies at most this many child objects in one synchronous deep copy
+DEEP_COPY_SYNC_LIMIT = 3
+
+# Concurrent child copies when a large tree is copied piecewise
+MAX_PARALLEL_COPIES = 10
+
+OBJECT_TYPES = ("campaign", "adset")
+
+# Maps the `/copies` response field to the kind of object it names
+COPIED_ID_TYPES = {"copied_adset_id": "ad_set", "copied_ad_id": "ad"}
+
+def exceeds_sync_limit(object_type, object_id, config, limit=DEEP_COPY_SYNC_LIMIT):
+    """
+    Returns True if a deep copy would duplicate more than `limit` ad sets and ads.
+
+    Reading stops as soon as the limit is passed, so this costs at most
+    `limit + 2` small Graph reads however large the tree is.
+    """
+    api = get_api_for_config(config)
+    page = {"limit": limit + 1}
+    if object_type == "adset":
+        return _count_up_to(AdSet(object_id, api=api).get_ads(fields=[Ad.Field.id], params=page), limit + 1) > limit
+
+    ad_sets = list(itertools.islice(Campaign(object_id, api=api).get_ad_sets(fields=[AdSet.Field.id], params=page), limit + 1))
+    seen = len(ad_sets)
+    for ad_set in ad_sets:
+        if seen > limit:
+            break
+        ads = AdSet(ad_set.get_id(), api=api).get_ads(fields=[Ad.Field.id], params=page)
+        seen += _count_up_to(ads, limit + 1 - seen)
+    return seen > limit
+
+def _count_up_to(cursor, most):
+    """Counts a Graph cursor's items, reading no further than `most`."""
+    return sum(1 for _ in itertools.islice(cursor, most))
+
+def is_large_copy(object_type, object_id, deep_copy, config):
+    """Returns True if the copy exceeds what Graph will deep-copy in a single call."""
+    return bool(deep_copy) and exceeds_sync_limit(object_type, object_id, config)
+
+def copy_object(task_id, config, object_type, object_id, deep_copy=True, overrides=None, campaign_id=None, on_progress=None,
+                large=None):
+    """
+    Duplicates a campaign or ad set server-side with Graph's `/copies` edge.
+
+    Small trees are copied in one call. Larger ones are copied piecewise: the
+    parent shallowly, then each child concurrently into the new parent.
+
+    Args:
+        task_id (str): Task used for cancellation and retries.
+        config (dict): Credentials and `ad_account_id`.
+        object_type (str): "campaign" or "adset".
+        object_id (str): ID of the object to copy.
+        deep_copy (bool): Also copy ad sets/ads below the object.
+        overrides (dict, optional): `name`, `daily_budget`, `lifetime_budget`
+            (currency units), `start_time`, `end_time` and `targeting` (a
+            delta merged into each copied ad set's targeting; None removes a key).
+        campaign_id (str, optional): Destination campaign for an ad set copy.
+        on_progress (callable, optional): Called with (done, total) as children are copied.
+        large (bool, optional): Result of `is_large_copy`, if the caller already checked.
+
+    Returns:
+        dict: `copied_id`, `object_type`, `ad_set_ids` and `ad_ids` of the new objects.
+    """
+    overrides = overrides or {}
+    api = get_api_for_config(config)
+    context = _CopyContext(task_id, config, api, on_progress)
+
+    if object_type == "campaign":
+        if large is None:
+            large = is_large_copy(object_type, object_id, deep_copy, config)
+        if large:
+            copied_id = context.copy(Campaign(object_id, api=api), {"deep_copy": False}, "copied_campaign_id")
+            ad_sets = list(Campaign(object_id, api=api).get_ad_sets(fields=[AdSet.Field.id]))
+            context.total = len(ad_sets)
+            context.map_parallel(lambda ad_set: context.copy_ad_set_tree(ad_set.get_id(), copied_id), ad_sets)
+        else:
+            copied_id = context.copy(Campaign(object_id, api=api), {"deep_copy": deep_copy}, "copied_campaign_id")
+        record_created_object(task_id, "campaign", copied_id)
+        _apply_overrides(context, Campaign(copied_id, api=api), overrides, include_schedule=False)
+        ad_set_overrides = {k: v for k, v in overrides.items() if k not in ("name", "daily_budget", "lifetime_budget")}
+        context.map_parallel(lambda ad_set_id: _apply_overrides(context, AdSet(ad_set_id, api=api), ad_set_overrides), context.ad_set_ids)
+
+    elif object_type == "adset":
+        copied_id = context.copy_ad_set_tree(object_id, campaign_id, deep_copy=deep_copy)
+        _apply_overrides(context, AdSet(copied_id, api=api), overrides)
+
+    else:
+        raise ValueError(f"Unsupported object type: {object_type}")
+
+    return {
+        "object_type": object_type,
+        "copied_id": copied_id,
+        "ad_set_ids": context.ad_set_ids,
+        "ad_ids": context.ad_ids,
+    }
+
+@task_log_context
+def run_copy_task(app, task_id, config, object_type, object_id, deep_copy, overrides, campaign_id=None):
+    """
+    Runs a large copy (see `is_large_copy`) as a background task, emitting
+    progress and a final `copy_complete` event with the new object IDs.
+    """
+    with app.app_context():
+        def on_progress(done, total):
+            progress = int((done / total) * 100) if total else 100
+            get_socketio().emit('progress', {'task_id': task_id, 'progress': progress, 'step': f"{done}/{total}"})
+
+        try:
+            result = copy_object(task_id, config, object_type, object_id, deep_copy, overrides, campaign_id, on_progress,
+                                 large=True)
+            get_socketio().emit('copy_complete', {'task_id': task_id, **result})
+        except Exception as e:
+            logging.error(f"Error copying {object_type} {object_id}: {e}")
+            get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
+        finally:
+            cleanup_task_pid(task_id)
+            release_retry_budget(task_id)
+
+class _CopyContext:
+    """Collects new object IDs and progress while a copy runs."""
+
+    def __init__(self, task_id, config, api, on_progress):
+        self.task_id = task_id
+        self.ad_account_id = config["ad_account_id"]
+        self.api = api
+        self.on_progress = on_progress
+        self.ad_set_ids = []
+        self.ad_ids = []
+        self.done = 0
+        self.total = 0
+        self._lock = Lock()  # Children are copied from several threads
+
+    def copy(self, source, params, id_field):
+        """Calls `/copies` on an object and returns the new object's ID."""
+        check_cancellation(self.task_id)
+        params = {"status_option": "PAUSED", **params}
+        response = call_with_retry(
+            source.create_copy, params=params, task_id=self.task_id, ad_account_id=self.ad_account_id,
+            idempotent=False, description=f"Copy of {source.get_id()}",
+        )
+        copied_id = response.get(id_field)
+
+        # Deep copies list every object they created
+        for entry in response.get("ad_object_ids") or []:
+            self._record(entry.get("ad_object_type"), entry.get("copied_id"))
+        self._record(COPIED_ID_TYPES.get(id_field), copied_id)
+        return copied_id
+
+    def _record(self, object_type, object_id):
+        ids = {"ad_set": self.ad_set_ids, "ad": self.ad_ids}.get(object_type)
+        if ids is None or not object_id:
+            return
+        with self._lock:
+            if object_id in ids:
+                return
+            ids.append(object_id)
+        record_created_object(self.task_id, "adset" if object_type == "ad_set" else object_type, object_id)
+
+    def copy_ad_set_tree(self, ad_set_id, campaign_id=None, deep_copy=True):
+        """Copies an ad set (and its ads) into `campaign_id`, splitting large trees."""
+        params = {"campaign_id": campaign_id} if campaign_id else {}
+        ads = list(AdSet(ad_set_id, api=self.api).get_ads(fields=[Ad.Field.id])) if deep_copy else []
+
+        if len(ads) <= DEEP_COPY_SYNC_LIMIT:
+            copied_id = self.copy(AdSet(ad_set_id, api=self.api), {**params, "deep_copy": deep_copy}, "copied_adset_id")
+        else:
+            copied_id = self.copy(AdSet(ad_set_id, api=self.api), {**params, "deep_copy": False}, "copied_adset_id")
+            self.map_parallel(
+                lambda ad: self.copy(Ad(ad.get_id(), api=self.api), {"adset_id": copied_id}, "copied_ad_id"),
+                ads,
+            )
+
+        with self._lock:
+            self.done += 1
+            done = self.done
+        if self.on_progress:
+            self.on_progress(done, self.total or 1)
+        return copied_id
+
+    def map_parallel(self, func, items):
+        """Runs `func` over `items` concurrently and returns the results in order."""
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_COPIES) as executor:
+            return list(executor.map(func, items))
+
+def _apply_overrides(context, copied, overrides, include_schedule=True):
+    """Updates a copied campaign or ad set with the requested overrides."""
+    params = {}
+    if overrides.get("name"):
+        params["name"] = overrides["name"]
+    for budget_field in ("daily_budget", "lifetime_budget"):
+        if overrides.get(budget_field) not in (None, ""):
+            params[budget_field] = int(float(overrides[budget_field]) * 100)  # Convert to cents
+    if include_schedule:
+        for time_field in ("start_time", "end_time"):
+            if overrides.get(time_field):
+                params[time_field] = overrides[time_field]
+        if overrides.get("targeting") and isinstance(copied, AdSet):
+            params["targeting"] = _merge_targeting(context, copied, overrides["targeting"])
+
+    if not params:
+        return
+    check_cancellation(context.task_id)
+    call_with_retry(
+        copied.api_update, params=params, task_id=context.task_id, ad_account_id=context.ad_account_id,
+        description=f"Overrides for {copied.get_id()}",
+    )
+
+def _merge_targeting(context, ad_set, delta):
+    """Returns the ad set's current targeting with `delta` applied (None removes a key)."""
+    current = call_with_retry(
+        ad_set.api_get, fields=[AdSet.Field.targeting], task_id=context.task_id,
+        ad_account_id=context.ad_account_id, description=f"Targeting of {ad_set.get_id()}",
+    )
+    targeting = current.get(AdSet.Field.targeting) or {}
+    targeting = targeting.export_all_data() if hasattr(targeting, "export_all_data") else dict(targeting)
+    for key, value in delta.items():
+        if value is None:
+            targeting.pop(key, None)
+        else:
+            targeting[key] = value
+    return targeting
@@ -1,14 +1,195 @@
 import logging
-import shutil
 from pathlib import Path
 import glob
+import hashlib
 import os
+from threading import Lock
+
+from services.staging_service import is_staging_dir, stage_file, release_staging_dir, link_file
+from services.watchdog_service import blocking
 
 # Supported file extensions
 VIDEO_EXTENSIONS = {".mp4", ".mov", ".avi"}
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
 MEDIA_EXTENSIONS = VIDEO_EXTENSIONS.union(IMAGE_EXTENSIONS)
 
+# Read size used when hashing media files
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+# File names never treated as media
+IGNORED_FILE_NAMES = {".ds_store", "thumbs.db"}
+
+media_indexes = {}  # Maps staging directories to their MediaIndex
+_indexes_lock = Lock()
+
+def media_kind(file_name):
+    """Returns "image", "video" or None for a file name, based on its extension."""
+    suffix = os.path.splitext(file_name)[1].lower()
+    if suffix in IMAGE_EXTENSIONS:
+        return "image"
+    if suffix in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+class MediaEntry:
+    """One media file in a MediaIndex."""
+    __slots__ = ("path", "relative_path", "kind", "size", "digest")
+
+    def __init__(self, path, relative_path, kind, size, digest=None):
+        self.path = path
+        self.relative_path = relative_path
+        self.kind = kind
+        self.size = size
+        self.digest = digest
+
+class MediaIndex:
+    """
+    In-memory index of a staged media tree.
+
+    Built once, either while uploads are saved (`save_uploaded_files`) or
+    with a single `os.scandir` walk (`scan`), so counting, grouping and
+    digest lookups never touch the file system again.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.entries = {}  # Relative POSIX path -> MediaEntry
+        self._directories = set()  # Relative POSIX paths of every directory below root
+        self._lock = Lock()
+
+    @classmethod
+    def scan(cls, root):
+        """Indexes an existing directory tree in one pass."""
+        index = cls(root)
+        stack = [""]
+        while stack:
+            relative_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(index.root, relative_dir)) as it:
+                    for item in it:
+                        relative = f"{relative_dir}/{item.name}" if relative_dir else item.name
+                        if item.is_dir(follow_symlinks=False):
+                            index.add_directory(relative)
+                            stack.append(relative)
+                        elif item.is_file() and media_kind(item.name):
+                            index.add_file(relative, item.stat().st_size)
+            except FileNotFoundError:
+                logging.warning(f"Directory not found: {os.path.join(index.root, relative_dir)}")
+        return index
+
+    def add_directory(self, relative_dir):
+        """Records a directory (and its parents) below the root."""
+        parts = relative_dir.split("/")
+        for depth in range(1, len(parts) + 1):
+            self._directories.add("/".join(parts[:depth]))
+
+    def add_file(self, relative_path, size, digest=None):
+        """
+        Records a staged file; files that are not media only register their folder.
+
+        Returns:
+            MediaEntry: The new entry, or None for non-media files.
+        """
+        relative_path = relative_path.replace(os.sep, "/")
+        parent = relative_path.rpartition("/")[0]
+        if parent:
+            self.add_directory(parent)
+
+        name = relative_path.rpartition("/")[2]
+        kind = media_kind(name)
+        if kind is None or name.lower() in IGNORED_FILE_NAMES:
+            return None
+        entry = MediaEntry(os.path.join(self.root, relative_path), relative_path, kind, size, digest)
+        with self._lock:
+            self.entries[relative_path] = entry
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, path):
+        """Returns the entry for an absolute or root-relative path, or None."""
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self.root)
+        return self.entries.get(path.replace(os.sep, "/"))
+
+    def files(self, kind=None):
+        """Returns the absolute paths of indexed media, optionally of one kind, in path order."""
+        return [e.path for _, e in sorted(self.entries.items()) if kind is None or e.kind == kind]
+
+    def folders(self):
+        """Returns the absolute paths of the top-level folders (like `get_subfolders`)."""
+        return [os.path.join(self.root, d) for d in sorted(self._directories) if "/" not in d]
+
+    def digest(self, path):
+        """Returns a file's content digest, hashing it only if it was not hashed on save."""
+        entry = self.get(path)
+        if entry is None:
+            return file_digest(path)
+        if entry.digest is None:
+            entry.digest = file_digest(entry.path)
+        return entry.digest
+
+    def groups(self, folders=None):
+        """
+        Groups media into ad sets following the folder layout.
+
+        A top-level folder with subfolders yields one group per non-empty
+        subfolder (with all media below it); a folder without subfolders is a
+        single group.
+
+        Args:
+            folders (list, optional): Top-level folders to include (names or
+                absolute paths); defaults to all of them.
+
+        Yields:
+            tuple: (folder_path, ad_set_name, media_files) for each non-empty group.
+        """
+        if folders is None:
+            tops = [d for d in sorted(self._directories) if "/" not in d]
+        else:
+            tops = [os.path.relpath(os.path.join(self.root, f), self.root).replace(os.sep, "/") for f in folders]
+
+        # One pass over the entries, bucketed by group key
+        nested = {top for top in tops if any(d.startswith(f"{top}/") for d in self._directories)}
+        buckets = {}
+        for relative_path, entry in sorted(self.entries.items()):
+            parts = relative_path.split("/")
+            if len(parts) < 2:
+                continue
+            if parts[0] in nested:
+                if len(parts) >= 3:
+                    buckets.setdefault(f"{parts[0]}/{parts[1]}", []).append(entry.path)
+            else:
+                buckets.setdefault(parts[0], []).append(entry.path)
+
+        for top in tops:
+            if top in nested:
+                subfolders = sorted(d for d in self._directories if d.rpartition("/")[0] == top)
+                keys = [d for d in subfolders if d in buckets]
+            else:
+                keys = [top] if top in buckets else []
+            for key in keys:
+                yield os.path.join(self.root, key), key.rpartition("/")[2], buckets[key]
+
+def get_media_index(directory):
+    """
+    Returns the MediaIndex of a staging directory, scanning it once if it
+    was not indexed while being saved.
+    """
+    key = os.path.abspath(directory)
+    index = media_indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = media_indexes.get(key)
+            if index is None:
+                index = media_indexes[key] = MediaIndex.scan(key)
+    return index
+
+def drop_media_index(directory):
+    """Forgets the index of a staging directory."""
+    media_indexes.pop(os.path.abspath(directory), None)
+
 def get_files(directory, extensions):
     """Recursively finds all files with the given extensions in a directory."""
     directory = Path(directory)
@@ -35,6 +216,15 @@ def get_all_files(directory):
     """Wrapper for retrieving both image and video files."""
     return get_files(directory, MEDIA_EXTENSIONS)
 
+@blocking
+def file_digest(path):
+    """Returns the SHA-256 hex digest of a file's contents, read in chunks (off the hub under eventlet)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def get_total_media_count(directory):
     """
     Returns the total number of media files (images & videos) in a directory,
@@ -51,21 +241,25 @@ def get_total_media_count(directory):
         logging.warning(f"Directory does not exist: {directory}")
         return 0
 
-    media_files = get_files(directory, MEDIA_EXTENSIONS)
-    logging.info(f"Total media files found in {directory}: {len(media_files)}")
+    total_media = len(get_media_index(directory))
+    logging.info(f"Total media files found in {directory}: {total_media}")
 
-    return len(media_files)
+    return total_media
 
 def clean_temp_files(directory):
-    """Deletes the specified directory and its contents."""
-    directory = Path(directory)
-    if not directory.exists():
-        logging.warning(f"Attempted to delete non-existent directory: {directory}")
-        return False
+    """
+    Releases a staging directory; its contents are deleted in the background.
 
+    Staged files shared with other tasks are kept until the last task using
+    them is done (see `services.staging_service`).
+    """
+    directory = Path(directory)
+    drop_media_index(directory)
     try:
-        shutil.rmtree(directory)
-        logging.info(f"Successfully deleted directory: {directory}")
+        if not release_staging_dir(directory):
+            logging.warning(f"Attempted to delete non-existent directory: {directory}")
+            return False
+        logging.info(f"Scheduled deletion of directory: {directory}")
         return True
     except Exception as e:
         logging.error(f"Error deleting directory {directory}: {e}")
@@ -75,21 +269,28 @@ def save_uploaded_files(upload_folder, destination):
     """
     Saves uploaded files to a specified directory while preserving folder structure.
 
+    Each file is hashed as it is written and added to the directory's
+    MediaIndex, so later counting, grouping and sync diffs need no rescan.
+    In a directory from `create_staging_dir`, files are staged in RAM or on
+    disk by size and shared with other tasks uploading the same content.
+
     Args:
         upload_folder (list): List of uploaded file objects.
         destination (str or Path): The destination directory.
 
     Returns:
-        None
+        MediaIndex: Index of the saved media.
     """
     destination = Path(destination)
     destination.mkdir(parents=True, exist_ok=True)
+    index = MediaIndex(destination)
+    staged = is_staging_dir(destination)
 
     logging.info(f"Saving uploaded files to: {destination}")
 
     for file in upload_folder:
         file_name = Path(file.filename).name
-        if file_name.startswith('.') or file_name.lower() in [".ds_store", "thumbs.db"]:
+        if file_name.startswith('.') or file_name.lower() in IGNORED_FILE_NAMES:
             continue  # Skip hidden files
         parent_folder = Path(file.filename).parent  # Get subfolder name if any
         
@@ -98,9 +299,78 @@ def save_uploaded_files(upload_folder, destination):
         file_dest_dir.mkdir(parents=True, exist_ok=True)
 
         file_path = file_dest_dir / file_name
-        file.save(str(file_path))
+        if staged:
+            size, digest = stage_file(file.stream, file_path, file.content_length or None)
+        else:
+            size, digest = _save_and_hash(file, file_path)
+        index.add_file(file_path.relative_to(destination).as_posix(), size, digest)
+
+        logging.debug(f"File saved: {file_path}", extra={"hot_path": "file_saved"})
+
+    with _indexes_lock:
+        media_indexes[index.root] = index
+    return index
+
+def stage_config_uploads(config, destination):
+    """
+    Saves a task config's uploaded files (see `save_uploaded_files`) and
+    drops the `FileStorage` objects from the config, which otherwise live
+    as long as the task does.
+
+    Returns:
+        MediaIndex: Index of the saved media.
+    """
+    uploads, config["upload_folder"] = config.get("upload_folder") or [], []
+    return save_uploaded_files(uploads, destination)
+
+def link_local_tree(source, destination):
+    """
+    Stages a local media tree without copying it: every media file is linked
+    into `destination` (see `staging_service.link_file`) and indexed, so the
+    pipeline runs against the source files while writing only to staging.
+    The tree is placed under a folder named after `source`, as a browser
+    folder upload would be, so ad sets are grouped the same way.
+
+    Args:
+        source (str or Path): Directory holding the media, read only.
+        destination (str or Path): Staging directory, e.g. from `create_staging_dir`.
+
+    Returns:
+        tuple: (MediaIndex of the staged tree, counts of each link method used).
+    """
+    source = Path(source).resolve()
+    destination = Path(destination)
+    index = MediaIndex(destination)
+    methods = {}
+
+    for root, dirs, files in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))  # Skip hidden folders
+        relative_dir = Path(root).relative_to(source)
+        for file_name in sorted(files):
+            if file_name.startswith('.') or file_name.lower() in IGNORED_FILE_NAMES or not media_kind(file_name):
+                continue
+            source_path = Path(root) / file_name
+            file_path = destination / source.name / relative_dir / file_name
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            method = link_file(source_path, file_path)
+            methods[method] = methods.get(method, 0) + 1
+            index.add_file(file_path.relative_to(destination).as_posix(), source_path.stat().st_size)
+
+    logging.info(f"Linked {len(index)} media files from {source} into {destination}: {methods}")
+    with _indexes_lock:
+        media_indexes[index.root] = index
+    return index, methods
 
-        logging.info(f"File saved: {file_path}")
+def _save_and_hash(file, file_path):
+    """Streams an uploaded file to disk, returning its size and SHA-256 digest."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, "wb") as out:
+        for chunk in iter(lambda: file.stream.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
 
 def get_subfolders(directory):
     """
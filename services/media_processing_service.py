@@ -1,20 +1,49 @@
 import logging
 import time
-import os
-
-# External Libraries
-from tqdm import tqdm
 
 # Concurrency tools
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Utilities & Services
 from utils.get_socket import get_socketio
-from services.task_manager import check_cancellation, TaskCanceledException, cleanup_task_pid
-from services.file_service import has_subfolders, get_all_files, clean_temp_files
+from services.task_manager import check_cancellation, get_cancel_token, TaskCanceledException, cleanup_task_pid
+from services.file_service import get_media_index, clean_temp_files
 from services.adset_services import create_ad_set
 from services.ad_service import create_ad, create_carousel_ad
+from services.retry_service import release_retry_budget
+from services.probe_service import preflight_media
+from services.transcode_service import transcode_media
+from services.progress_service import set_phase, add_ad_set, record_media
+from utils.logging_config import task_log_context
+
+def group_media_by_ad_set(folders, temp_dir):
+    """
+    Groups media files into ad sets following the uploaded folder layout.
+
+    A folder with subfolders yields one ad set per non-empty subfolder;
+    a folder without subfolders becomes a single ad set.
+
+    Args:
+        folders (list): List of folders containing media.
+        temp_dir (str): Path to the temporary directory storing uploaded files.
+
+    Yields:
+        tuple: (ad_set_name, media_files) for each non-empty group.
+    """
+    for _, ad_set_name, media in group_media_by_folder(folders, temp_dir):
+        yield ad_set_name, media
 
+def group_media_by_folder(folders, temp_dir):
+    """
+    Same grouping as `group_media_by_ad_set`, also yielding the path of the
+    folder each group came from. Served from the staging directory's MediaIndex.
+
+    Yields:
+        tuple: (folder_path, ad_set_name, media_files) for each non-empty group.
+    """
+    yield from get_media_index(temp_dir).groups(folders)
+
+@task_log_context
 def process_media(app, task_id, campaign_id, folders, config, total_media, temp_dir):
     """
     Processes media files for an ad campaign by creating appropriate ad sets and ads.
@@ -27,82 +56,124 @@ def process_media(app, task_id, campaign_id, folders, config, total_media, temp_
         total_media (int): Total number of media files to process.
         temp_dir (str): Path to the temporary directory storing uploaded files.
     """
+    process_ad_set_groups(app, task_id, campaign_id, group_media_by_ad_set(folders, temp_dir), config, total_media, temp_dir)
+
+def process_ad_set_groups(app, task_id, campaign_id, groups, config, total_media, temp_dir, clean_up=True):
+    """
+    Creates one ad set per group and its ads.
+
+    Args:
+        task_id (str): Unique identifier for the task.
+        campaign_id (str): The campaign ID associated with the media.
+        groups (iterable): (ad_set_name, media_files) pairs, or
+            (ad_set_name, media_files, ad_set_id) to add ads to an existing ad set.
+        config (dict): Configuration details for the campaign.
+        total_media (int): Total number of media files to process.
+        temp_dir (str): Path to the temporary directory storing uploaded files.
+        clean_up (bool): Delete `temp_dir` when done; False when it is shared with other tasks.
+
+    Returns:
+        list: One entry per processed group with `ad_set_name`, `ad_set_id`, its
+              `media` and `ads` (media file -> ad ID; every card of a carousel
+              maps to the carousel ad).
+    """
+    results = []
+
+    # Probe every file before anything is uploaded, then optionally shrink the videos
+    if total_media and (config.get("preflight", True) or config.get("transcode")):
+        with app.app_context():
+            try:
+                groups = list(groups)
+                if config.get("preflight", True):
+                    set_phase(task_id, "preflight")
+                    groups, report = preflight_media(task_id, groups, config, temp_dir)
+                    if report["rejected"] or report["flagged"]:
+                        get_socketio().emit('preflight', {'task_id': task_id, **report})
+                    total_media = sum(len(media) for _, media, *_ in groups)
+                if config.get("transcode"):
+                    set_phase(task_id, "transcoding")
+                    report = transcode_media(task_id, groups, config, temp_dir)
+                    get_socketio().emit('transcode_report', {'task_id': task_id, **report})
+            except TaskCanceledException:
+                logging.warning(f"Task {task_id} has been canceled before uploading.")
+                set_phase(task_id, "canceled")
+                _finish_task(task_id, temp_dir, clean_up)
+                return results
+            except Exception as e:
+                # e.g. an unreadable video while transcoding, or a full transcode cache
+                logging.error(f"Error preparing media for task {task_id}: {e}")
+                get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
+                set_phase(task_id, "failed", error=str(e))
+                _finish_task(task_id, temp_dir, clean_up)
+                return results
+
     # Initialize progress tracking safely
     if total_media == 0:
         get_socketio().emit('progress', {'task_id': task_id, 'progress': 100, 'step': "No media found"})
         get_socketio().emit('task_complete', {'task_id': task_id})
-        return
+        set_phase(task_id, "complete", total=0)
+        _finish_task(task_id, temp_dir, clean_up)
+        return results
 
     # Manually push the app context inside the background thread
     with app.app_context():  
         try:
             # Initialize progress tracking
+            set_phase(task_id, "uploading", total=total_media)
             get_socketio().emit('progress', {'task_id': task_id, 'progress': 0, 'step': f"0/{total_media}"})
 
-            # Display progress bar for CLI/debugging purposes
-            with tqdm(total=total_media, desc="Processing media") as pbar:
-
-                # Iterate through each media folder
-                for folder in folders:
-                    check_cancellation(task_id)  # Check if task was canceled
-                    folder_path = os.path.join(temp_dir, folder)
-
-                    # If the folder contains subfolders, process them separately
-                    if has_subfolders(folder_path):
-                        for subfolder in os.listdir(folder_path):
-                            subfolder_path = os.path.join(folder_path, subfolder)
-                            if os.path.isdir(subfolder_path):
-                                media = get_all_files(subfolder_path)
-                                if not media:
-                                    continue
-
-                                # Create an ad set for the subfolder
-                                ad_set_name = os.path.basename(subfolder)
-                                ad_set = create_ad_set(campaign_id, ad_set_name, config, task_id)
-
-                                if not ad_set:
-                                    continue
-
-                                # Process ads based on format
-                                if config["ad_format"] == 'Single image or video':
-                                    _process_single_ads(app, task_id, ad_set.get_id(), media, config, pbar, total_media)
-                                elif config["ad_format"] == 'Carousel':
-                                    create_carousel_ad(app, ad_set.get_id(), media, config, task_id)
-
-                    # If no subfolders, process the folder directly
-                    else:
-                        media = get_all_files(folder_path)
-                        if not media:
-                            continue
-
-                        # Create an ad set for the folder
-                        ad_set_name = os.path.basename(folder)
-                        ad_set = create_ad_set(campaign_id, ad_set_name, config, task_id)
-                        if not ad_set:
-                            continue
-
-                        # Process ads based on format
-                        if config["ad_format"] == 'Single image or video':
-                            _process_single_ads(app, task_id, ad_set.get_id(), media, config, pbar, total_media)
-                        elif config["ad_format"] == 'Carousel':
-                            create_carousel_ad(app, ad_set.get_id(), media, config, task_id)
+            # Create one ad set per media folder (or per subfolder)
+            for ad_set_name, media, *existing in groups:
+                check_cancellation(task_id)  # Check if task was canceled
+
+                ad_set_id = existing[0] if existing else None
+                if not ad_set_id:
+                    ad_set = create_ad_set(campaign_id, ad_set_name, config, task_id)
+                    if not ad_set:
+                        continue
+                    ad_set_id = ad_set.get_id()
+
+                result = {"ad_set_name": ad_set_name, "ad_set_id": ad_set_id, "media": media, "ads": {}}
+                results.append(result)
+                add_ad_set(task_id, ad_set_id, ad_set_name, len(media))
+
+                # Process ads based on format
+                if config["ad_format"] == 'Single image or video':
+                    _process_single_ads(app, task_id, ad_set_id, media, config, total_media, created=result["ads"])
+                elif config["ad_format"] == 'Carousel':
+                    used_media = []
+                    ad = create_carousel_ad(app, ad_set_id, media, config, task_id,
+                                            on_card_done=_progress_tracker(task_id, total_media, ad_set_id),
+                                            used_media=used_media)
+                    if ad:
+                        result["ads"] = {media_file: ad.get_id() for media_file in used_media}
 
             # Task complete: Notify via socket
             get_socketio().emit('progress', {'task_id': task_id, 'progress': 100, 'step': f"{total_media}/{total_media}"})
             get_socketio().emit('task_complete', {'task_id': task_id})
+            set_phase(task_id, "complete")
 
         except TaskCanceledException:
             logging.warning(f"Task {task_id} has been canceled during media processing.")
+            set_phase(task_id, "canceled")
         except Exception as e:
             logging.error(f"Error in processing media: {e}")
             get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
+            set_phase(task_id, "failed", error=str(e))
         finally:
-            # Clean up process PIDs and temporary files
-            cleanup_task_pid(task_id)
-            clean_temp_files(temp_dir)
-        
+            _finish_task(task_id, temp_dir, clean_up)
 
-def _process_single_ads(app, task_id, ad_set_id, media_files, config, pbar, total_media):
+    return results
+
+def _finish_task(task_id, temp_dir, clean_up):
+    """Clean up process PIDs, retry budget and temporary files once a task is done."""
+    cleanup_task_pid(task_id)
+    release_retry_budget(task_id)
+    if clean_up:
+        clean_temp_files(temp_dir)
+
+
+def _process_single_ads(app, task_id, ad_set_id, media_files, config, total_media, created=None):
     """
     Processes media files as single ads using multithreading.
 
@@ -111,35 +182,67 @@ def _process_single_ads(app, task_id, ad_set_id, media_files, config, pbar, tota
         ad_set_id (str): The ad set ID for the campaign.
         media_files (list): List of media files to process.
         config (dict): Campaign configuration.
-        pbar (tqdm): Progress bar object.
         total_media (int): Total number of media files.
+        created (dict, optional): Filled with media file -> ad ID as ads are
+            created, so callers keep them even if the task is canceled midway.
+
+    Returns:
+        dict: Media file -> ID of the ad created for it.
     """
+    created = {} if created is None else created
+    token = get_cancel_token(task_id)
     with app.app_context():
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_file = {executor.submit(create_ad, app, ad_set_id, file, config, task_id): file for file in media_files}
-            
-            # Track the last update time for emitting progress
-            last_emit_time = time.time()
+        executor = ThreadPoolExecutor(max_workers=10)
+        # Drop jobs that are still queued as soon as the task is canceled
+        drop_queued = lambda: executor.shutdown(wait=False, cancel_futures=True)
+        token.add_callback(drop_queued)
+        try:
+            future_to_file = {executor.submit(_run_if_active, token, create_ad, app, ad_set_id, file, config, task_id): file for file in media_files}
+            advance = _progress_tracker(task_id, total_media, ad_set_id)
 
             for future in as_completed(future_to_file):
                 check_cancellation(task_id)  # Check if task was canceled
                 file = future_to_file[future]
+                success = False
                 try:
-                    future.result()  # Process file
+                    ad = future.result()  # Process file
+                    if ad:
+                        created[file] = ad.get_id()
+                        success = True
                 except TaskCanceledException:
                     logging.warning(f"Task {task_id} has been canceled during processing media {file}.")
-                    return
+                    return created
                 except Exception as e:
                     logging.error(f"Error processing media {file}: {e}")
                     get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
                 finally:
-                    pbar.update(1)
-
-                    # Emit progress update every 0.5 seconds (or if it's the last file)
-                    current_time = time.time()
-                    if current_time - last_emit_time >= 0.5 or pbar.n == total_media:
-                        progress = int((pbar.n / total_media) * 100)
-                        get_socketio().emit('progress', {'task_id': task_id, 'progress': progress, 'step': f"{pbar.n}/{total_media}"})
-                        last_emit_time = current_time  # Update last emit time
-                        time.sleep(0.1)  # Allow event loop time to process emissions
+                    advance(success)
+        finally:
+            token.remove_callback(drop_queued)
+            # On cancel, don't wait for queued jobs; running ones exit at their next check
+            executor.shutdown(wait=not token.is_canceled(), cancel_futures=token.is_canceled())
+    return created
+
+def _progress_tracker(task_id, total_media, ad_set_id=None):
+    """
+    Returns a callback that counts one processed file (in the task's pollable
+    progress, too) and emits progress at most every 0.5 seconds (and for the
+    last file). The callback takes whether the file succeeded.
+    """
+    last_emit_time = [time.time()]
+
+    def advance(success=True):
+        processed = record_media(task_id, ad_set_id, success)
+        current_time = time.time()
+        if current_time - last_emit_time[0] >= 0.5 or processed == total_media:
+            progress = int((processed / total_media) * 100)
+            get_socketio().emit('progress', {'task_id': task_id, 'progress': progress, 'step': f"{processed}/{total_media}"})
+            last_emit_time[0] = current_time  # Update last emit time
+            time.sleep(0.1)  # Allow event loop time to process emissions
+    return advance
+
+def _run_if_active(token, func, *args):
+    """Runs a queued job unless its task was canceled while it waited."""
+    token.raise_if_canceled()
+    return func(*args)
 
@@ -0,0 +1,178 @@
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+from services.task_manager import get_task_state, task_states
+
+# tracemalloc frames kept per allocation; 0 disables per-task attribution (it costs CPU and memory)
+TRACE_FRAMES = int(os.environ.get("MEMORY_TRACE_FRAMES", 0))
+
+# Lines kept in each phase's diff
+TOP_ALLOCATIONS = 15
+
+# Leak check: how often it runs, how many idle baselines it compares and the growth it flags
+CHECK_INTERVAL = float(os.environ.get("MEMORY_CHECK_INTERVAL", 300))
+BASELINE_WINDOW = int(os.environ.get("MEMORY_BASELINE_WINDOW", 5))
+LEAK_GROWTH_BYTES = int(os.environ.get("MEMORY_LEAK_GROWTH_BYTES", 200 * 1024 * 1024))
+
+baselines = deque(maxlen=50)  # (time, RSS bytes, finished tasks so far) sampled while no task runs
+leak_status = {"suspected": False, "growth_bytes": 0, "checked_at": None}
+finished_count = [0]
+_checker = None
+_checker_lock = threading.Lock()
+
+class TaskMemory:
+    """Memory observed at a task's phase boundaries, plus the snapshot the next diff starts from."""
+    __slots__ = ("snapshot", "phases", "started_rss")
+
+    def __init__(self):
+        self.snapshot = None
+        self.phases = []  # One entry per phase boundary, see `mark_phase`
+        self.started_rss = None
+
+def current_rss():
+    """Returns this process's resident set size in bytes (0 where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def tracing_enabled():
+    return TRACE_FRAMES > 0
+
+def running_tasks():
+    """Counts tasks that have started (have a progress record); bare states left behind do not count."""
+    return sum(1 for state in list(task_states.values()) if state.progress is not None)
+
+def _start_tracing():
+    if tracing_enabled() and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+
+def mark_phase(task_id, phase, final=False):
+    """
+    Records a task's memory at a phase boundary.
+
+    Always records RSS. With tracing enabled, also takes a tracemalloc
+    snapshot and keeps the top allocations grown since the previous
+    boundary; only the latest snapshot is held, and none once the task ends.
+
+    tracemalloc is process-wide: other tasks running at the same time show
+    up in the diff too, so each entry notes how many tasks were running.
+
+    Args:
+        task_id (str): The task.
+        phase (str): The phase being entered.
+        final (bool): True when the task has finished.
+    """
+    state = get_task_state(task_id)
+    if state is None:
+        return
+    memory = state.memory
+    if memory is None:
+        memory = state.memory = TaskMemory()
+        memory.started_rss = current_rss()
+    start_memory_checker()
+
+    entry = {
+        "phase": phase,
+        "at": int(time.time()),
+        "rss_bytes": current_rss(),
+        "running_tasks": running_tasks(),
+    }
+    entry["rss_growth_bytes"] = entry["rss_bytes"] - memory.started_rss
+
+    _start_tracing()
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if memory.snapshot is not None:
+            stats = snapshot.compare_to(memory.snapshot, "lineno")
+            entry["traced_growth_bytes"] = sum(stat.size_diff for stat in stats)
+            entry["top"] = [
+                {"where": str(stat.traceback), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in stats[:TOP_ALLOCATIONS]
+            ]
+        memory.snapshot = None if final else snapshot
+
+    memory.phases.append(entry)
+    if final:
+        finished_count[0] += 1
+
+def get_task_memory(task_id):
+    """
+    Returns a task's memory record: RSS at each phase boundary and, with
+    tracing enabled, the top allocation diffs between boundaries.
+
+    Returns:
+        dict: The record, or None if the task is not tracked.
+    """
+    state = get_task_state(task_id)
+    if state is None:
+        return None
+    memory = state.memory
+    return {
+        "task_id": task_id,
+        "tracing": tracemalloc.is_tracing(),
+        "trace_frames": TRACE_FRAMES,
+        "started_rss_bytes": memory.started_rss if memory else None,
+        "phases": list(memory.phases) if memory else [],
+        "process": get_leak_status(),
+    }
+
+def get_leak_status():
+    """Returns the process's RSS, its idle baselines and whether they point to a leak."""
+    return {
+        "rss_bytes": current_rss(),
+        "finished_tasks": finished_count[0],
+        "baselines": [{"at": int(at), "rss_bytes": rss, "finished_tasks": done} for at, rss, done in baselines],
+        **leak_status,
+    }
+
+def check_baseline():
+    """
+    Samples RSS as a baseline when no task is running and at least one has
+    finished since the last sample, and flags a suspected leak when the last
+    BASELINE_WINDOW baselines only ever rose, by LEAK_GROWTH_BYTES or more.
+    """
+    leak_status["checked_at"] = int(time.time())
+    if running_tasks() or (baselines and baselines[-1][2] == finished_count[0]):
+        return
+    if not baselines and not finished_count[0]:
+        return
+    baselines.append((time.time(), current_rss(), finished_count[0]))
+
+    window = list(baselines)[-BASELINE_WINDOW:]
+    if len(window) < BASELINE_WINDOW:
+        return
+    rising = all(later[1] > earlier[1] for earlier, later in zip(window, window[1:]))
+    growth = window[-1][1] - window[0][1]
+    suspected = rising and growth >= LEAK_GROWTH_BYTES
+    if suspected and not leak_status["suspected"]:
+        logging.warning(
+            f"Possible memory leak: idle RSS rose over the last {BASELINE_WINDOW} baselines "
+            f"by {growth / 1024 / 1024:.0f} MB (now {window[-1][1] / 1024 / 1024:.0f} MB)."
+        )
+    leak_status["suspected"] = suspected
+    leak_status["growth_bytes"] = growth
+
+def start_memory_checker():
+    """Starts the background baseline check once per process."""
+    global _checker
+    with _checker_lock:
+        if _checker is None or not _checker.is_alive():
+            _checker = threading.Thread(target=_run_checker, name="memory-checker", daemon=True)
+            _checker.start()
+
+def _run_checker():
+    while True:
+        time.sleep(CHECK_INTERVAL)
+        try:
+            check_baseline()
+        except Exception as e:
+            logging.error(f"Memory baseline check failed: {e}")
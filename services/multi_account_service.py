@@ -0,0 +1,153 @@
+import json
+import logging
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor
+
+# Utilities & Services
+from utils.get_socket import get_socketio
+from services.task_manager import add_task, cancel_task, get_cancel_token, cleanup_task_pid
+from services.campaign_service import create_campaign, get_ad_account_timezone
+from services.media_processing_service import process_ad_set_groups
+from services.file_service import clean_temp_files
+from services.progress_service import start_progress, set_phase
+from services.retry_service import release_retry_budget
+from services.upload_service import UploadCache
+from utils.logging_config import task_log_context
+
+# Accounts processed at once in a fan-out task
+MAX_PARALLEL_ACCOUNTS = 5
+
+def parse_ad_account_ids(value, primary_ad_account_id=None):
+    """
+    Parses the `ad_account_ids` form field (JSON list or comma-separated).
+
+    The primary account (the one in `ad_account_id`) is always first, since
+    assets are uploaded there and copied to the others.
+
+    Args:
+        value (str): Raw field value.
+        primary_ad_account_id (str, optional): The request's `ad_account_id`.
+
+    Returns:
+        list: Unique ad account IDs, primary first.
+    """
+    if not value:
+        return [primary_ad_account_id] if primary_ad_account_id else []
+
+    try:
+        ids = json.loads(value)
+        if not isinstance(ids, list):
+            ids = [ids]
+    except json.JSONDecodeError:
+        ids = value.split(",")
+
+    ordered = [primary_ad_account_id] if primary_ad_account_id else []
+    for ad_account_id in ids:
+        ad_account_id = str(ad_account_id).strip()
+        if ad_account_id and not ad_account_id.startswith("act_"):
+            ad_account_id = f"act_{ad_account_id}"
+        if ad_account_id and ad_account_id not in ordered:
+            ordered.append(ad_account_id)
+    return ordered
+
+def build_account_configs(config, ad_account_ids):
+    """
+    Derives one config per target account from the processed request config.
+
+    Every account gets its own sub-task ID (`<task_id>-<account>`) and
+    timezone. All of them share one UploadCache and name the first account as
+    `source_ad_account_id`, so each asset is uploaded once and copied
+    server-side to the other accounts.
+
+    Returns:
+        list: Per-account configs, primary account first.
+    """
+    upload_cache = UploadCache()
+    source_ad_account_id = ad_account_ids[0]
+    configs = []
+    for ad_account_id in ad_account_ids:
+        account_config = {
+            **config,
+            "ad_account_id": ad_account_id,
+            "task_id": f"{config['task_id']}-{ad_account_id}",
+            "source_ad_account_id": source_ad_account_id,
+            "upload_cache": upload_cache,
+            "upload_folder": [],
+        }
+        if ad_account_id != config["ad_account_id"]:
+            account_config["ad_account_timezone"] = get_ad_account_timezone(
+                ad_account_id, config["app_id"], config["app_secret"], config["access_token"]
+            )
+        configs.append(account_config)
+    return configs
+
+@task_log_context
+def process_multi_account_media(app, task_id, account_configs, groups, total_media, temp_dir):
+    """
+    Creates a campaign with the same ad sets and ads in every target account.
+
+    Each account reports progress under its own sub-task ID; canceling the
+    parent task cancels every sub-task. A `multi_account_complete` event
+    summarizes the results, and the staged media is deleted at the end.
+
+    Args:
+        app (Flask): The Flask application.
+        task_id (str): The parent task ID.
+        account_configs (list): Configs from `build_account_configs`.
+        groups (list): (ad_set_name, media_files) pairs shared by all accounts.
+        total_media (int): Number of media files per account.
+        temp_dir (str or Path): Directory holding the staged media.
+    """
+    parent_token = get_cancel_token(task_id)
+    for account_config in account_configs:
+        add_task(account_config["task_id"])
+        start_progress(account_config["task_id"])
+        parent_token.add_callback(lambda child=account_config["task_id"]: cancel_task(child))
+
+    with app.app_context():
+        try:
+            set_phase(task_id, "uploading", total=total_media * len(account_configs))
+            with ThreadPoolExecutor(max_workers=MAX_PARALLEL_ACCOUNTS) as executor:
+                futures = [
+                    executor.submit(_process_account, app, account_config, groups, total_media, temp_dir)
+                    for account_config in account_configs
+                ]
+                results = [future.result() for future in futures]
+
+            get_socketio().emit('multi_account_complete', {'task_id': task_id, 'accounts': results})
+            set_phase(task_id, "canceled" if parent_token.is_canceled() else "complete")
+        except Exception as e:
+            logging.error(f"Error in multi-account processing: {e}")
+            get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
+            set_phase(task_id, "failed", error=str(e))
+        finally:
+            cleanup_task_pid(task_id)
+            clean_temp_files(temp_dir)
+
+def _process_account(app, config, groups, total_media, temp_dir):
+    task_id = config["task_id"]
+    ad_account_id = config["ad_account_id"]
+    started = False
+    error = "Campaign processing did not start"
+    with app.app_context():
+        try:
+            campaign_id, _ = create_campaign(config)
+            if not campaign_id:
+                error = "Failed to create campaign"
+                return {"ad_account_id": ad_account_id, "task_id": task_id, "error": error}
+
+            started = True  # process_ad_set_groups finishes the sub-task on every path
+            process_ad_set_groups(app, task_id, campaign_id, groups, config, total_media, temp_dir, clean_up=False)
+            return {"ad_account_id": ad_account_id, "task_id": task_id, "campaign_id": campaign_id}
+
+        except Exception as e:
+            logging.error(f"Error processing ad account {ad_account_id}: {e}")
+            get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
+            error = str(e)
+            return {"ad_account_id": ad_account_id, "task_id": task_id, "error": error}
+        finally:
+            if not started:
+                set_phase(task_id, "failed", error=error)
+                cleanup_task_pid(task_id)  # Otherwise it would stay tracked as running
+                release_retry_budget(task_id)
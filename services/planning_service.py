@@ -0,0 +1,230 @@
+import math
+import time
+
+# Utilities & Services
+from services.campaign_service import build_campaign_params
+from services.adset_services import build_ad_set_params
+from services.ad_service import (
+    IMAGE_FILE_EXTENSIONS,
+    CAROUSEL_IMAGE_EXTENSIONS,
+    CAROUSEL_VIDEO_EXTENSIONS,
+    build_image_object_story_spec,
+    build_video_object_story_spec,
+    build_carousel_card,
+    build_carousel_object_story_spec,
+    build_creative_params,
+    get_ad_name,
+)
+from services.file_service import get_media_index
+from services.media_processing_service import group_media_by_folder
+from services.probe_service import preflight_media
+from services.sync_service import load_sync_manifest, plan_sync
+from services.upload_service import use_graph_thumbnails
+from services.retry_service import get_circuit_breaker
+from services.timing_service import estimate_stage, get_stage_timings
+
+# Placeholders used where Graph would return IDs
+PLANNED_CAMPAIGN_ID = "<campaign_id>"
+PLANNED_IMAGE_HASH = "<image_hash>"
+PLANNED_VIDEO_ID = "<video_id>"
+
+# Worker threads creating a single ad set's ads (see `_process_single_ads`)
+AD_WORKERS = 10
+
+# Graph picks the chunk size of resumable video uploads; this is a typical one
+ESTIMATED_VIDEO_CHUNK_BYTES = 10 * 1024 * 1024
+
+# Video status polls start 5 seconds apart and back off to 30 (see `poll_video_status`)
+FIRST_POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 30
+
+def estimate_video_polls(processing_seconds):
+    """Returns how many status polls a video processing wait of this length takes."""
+    polls, waited, interval = 1, 0, FIRST_POLL_INTERVAL
+    while waited < processing_seconds:
+        waited += interval
+        interval = min(MAX_POLL_INTERVAL, interval + 5)
+        polls += 1
+    return polls
+
+def plan_campaign(config, temp_dir, campaign_id=None, accounts=1):
+    """
+    Plans a /create_campaign task without writing anything to Graph.
+
+    Groups the staged media as the real run would, applies preflight and (in
+    sync mode) the campaign's sync manifest, builds every campaign, ad set and
+    creative payload, and estimates the Graph calls, upload bytes, video
+    processing waits and wall-clock time from recorded stage timings.
+
+    Args:
+        config (dict): Output of `process_campaign_config`.
+        temp_dir (Path): Staging directory holding the upload.
+        campaign_id (str, optional): Existing campaign the ads would go into.
+        accounts (int): Number of ad accounts the task fans out to.
+
+    Returns:
+        dict: `campaign`, `ad_sets` (each with its params and `ads`), `skipped`
+              media, `errors` and an `estimate`.
+    """
+    plan = {"campaign": None, "ad_sets": [], "skipped": [], "errors": []}
+    media_index = get_media_index(temp_dir)
+
+    if campaign_id:
+        plan["campaign"] = {"id": campaign_id, "existing": True}
+    else:
+        try:
+            plan["campaign"] = {"existing": False, "params": build_campaign_params(config)}
+        except (KeyError, ValueError, TypeError) as e:
+            plan["errors"].append(f"Campaign parameters are invalid: {e}")
+            plan["campaign"] = {"existing": False, "params": None}
+
+    # Same grouping, sync diff and preflight as the real run
+    folder_groups = list(group_media_by_folder(media_index.folders(), temp_dir))
+    if config.get("sync_mode") and campaign_id:
+        manifest = load_sync_manifest(config["ad_account_id"], campaign_id)
+        sync = plan_sync(manifest, folder_groups, temp_dir, config["ad_format"])
+        groups = sync["groups"]
+        plan["sync"] = {key: sync[key] if isinstance(sync[key], int) else len(sync[key])
+                        for key in ("added", "changed", "unchanged", "removed")}
+    else:
+        groups = [(ad_set_name, media, None) for _, ad_set_name, media in folder_groups]
+
+    if config.get("preflight", True):
+        # No task ID: a dry run is never tracked as a running task
+        groups, report = preflight_media(None, groups, config, temp_dir)
+        plan["skipped"] = report["rejected"]
+        plan["flagged"] = report["flagged"]
+
+    for ad_set_name, media, existing_ad_set_id in groups:
+        ad_set = {"name": ad_set_name, "existing_id": existing_ad_set_id, "ads": []}
+        if not existing_ad_set_id:
+            try:
+                ad_set["params"] = build_ad_set_params(campaign_id or PLANNED_CAMPAIGN_ID, ad_set_name, config)
+            except (KeyError, ValueError, TypeError) as e:
+                plan["errors"].append(f"Ad set {ad_set_name} parameters are invalid: {e}")
+                ad_set["params"] = None
+        ad_set["ads"] = _plan_ads(config, media, media_index)
+        plan["ad_sets"].append(ad_set)
+
+    plan["estimate"] = estimate_cost(plan, config, accounts)
+    return plan
+
+def _plan_ads(config, media_files, media_index):
+    """Builds the creative payloads of one ad set, with the media each ad uploads."""
+    thumbnail = PLANNED_IMAGE_HASH if not use_graph_thumbnails(config) else "https://<graph_thumbnail_url>"
+
+    def describe(media_file):
+        entry = media_index.get(media_file)
+        is_video = not media_file.lower().endswith(IMAGE_FILE_EXTENSIONS)
+        return {"file": entry.relative_path if entry else media_file, "kind": "video" if is_video else "image",
+                "bytes": entry.size if entry else 0}
+
+    if config["ad_format"] == 'Carousel':
+        media_files = [f for f in media_files if f.lower().endswith(CAROUSEL_VIDEO_EXTENSIONS + CAROUSEL_IMAGE_EXTENSIONS)]
+        cards = [
+            build_carousel_card(config, thumbnail, PLANNED_VIDEO_ID) if f.lower().endswith(CAROUSEL_VIDEO_EXTENSIONS)
+            else build_carousel_card(config, PLANNED_IMAGE_HASH)
+            for f in media_files
+        ]
+        spec = build_carousel_object_story_spec(config, cards)
+        return [{
+            "name": "Carousel Ad",
+            "media": [describe(f) for f in media_files],
+            "creative": build_creative_params("Carousel Ad Creative", spec),
+        }] if media_files else []
+
+    ads = []
+    for media_file in media_files:
+        if media_file.lower().endswith(IMAGE_FILE_EXTENSIONS):
+            spec = build_image_object_story_spec(config, PLANNED_IMAGE_HASH)
+        else:
+            spec = build_video_object_story_spec(config, PLANNED_VIDEO_ID, thumbnail)
+        ads.append({
+            "name": get_ad_name(media_file),
+            "media": [describe(media_file)],
+            "creative": build_creative_params("Creative Name", spec),
+        })
+    return ads
+
+def estimate_cost(plan, config, accounts=1):
+    """
+    Estimates the Graph calls, upload bytes, video waits and wall-clock time of a plan.
+
+    Ad sets are created one after another and each ad set's ads run on
+    `AD_WORKERS` threads, as in the threaded pipeline. Stage durations come
+    from `timing_service` (recorded averages, or defaults until observed).
+    If the account's circuit breaker is open, its remaining cooldown is added.
+
+    Returns:
+        dict: Call counts by kind, bytes, video count and estimated seconds.
+    """
+    calls = {"campaign": 0, "ad_set": 0, "image_upload": 0, "video_upload": 0, "video_status": 0,
+             "thumbnail": 0, "creative": 0, "ad": 0}
+    upload_bytes = 0
+    videos = 0
+    graph_thumbnails = use_graph_thumbnails(config)
+    processing = estimate_stage("video_processing")
+    polls = estimate_video_polls(processing)
+
+    if not plan["campaign"].get("existing"):
+        calls["campaign"] += 1
+    seconds = estimate_stage("ad_set") if calls["campaign"] else 0.0  # A campaign create costs about as much as an ad set
+
+    for ad_set in plan["ad_sets"]:
+        if not ad_set["existing_id"]:
+            calls["ad_set"] += 1
+            seconds += estimate_stage("ad_set")
+
+        ad_seconds = []
+        for ad in ad_set["ads"]:
+            calls["creative"] += 1
+            calls["ad"] += 1
+            media_seconds = []
+            for media in ad["media"]:
+                upload_bytes += media["bytes"]
+                if media["kind"] == "image":
+                    calls["image_upload"] += 1
+                    media_seconds.append(estimate_stage("image_upload", media["bytes"]))
+                    continue
+                videos += 1
+                calls["video_upload"] += 2 + max(1, math.ceil(media["bytes"] / ESTIMATED_VIDEO_CHUNK_BYTES))
+                calls["video_status"] += polls
+                calls["thumbnail"] += 1  # A Graph read, or a frame uploaded as an image
+                media_seconds.append(
+                    estimate_stage("video_upload", media["bytes"]) + processing + estimate_stage("thumbnail")
+                )
+            # Carousel cards upload in parallel; an ad waits for its slowest card
+            upload_time = max(media_seconds) if config["ad_format"] == 'Carousel' else sum(media_seconds)
+            ad_seconds.append(upload_time + estimate_stage("creative") + estimate_stage("ad"))
+
+        if ad_seconds:
+            # Ads share AD_WORKERS threads, but none finishes sooner than its own chain
+            seconds += max(sum(ad_seconds) / AD_WORKERS, max(ad_seconds))
+
+    # An account that is currently failing fast adds its remaining cooldown
+    breaker = get_circuit_breaker(config["ad_account_id"])
+    cooldown = 0.0
+    if breaker.opened_at is not None:
+        cooldown = max(0.0, breaker.cooldown - (time.monotonic() - breaker.opened_at))
+    seconds += cooldown
+
+    total_calls = sum(calls.values())
+    return {
+        "graph_calls": total_calls * accounts,
+        "graph_calls_by_kind": {kind: count * accounts for kind, count in calls.items()},
+        "graph_writes": (calls["campaign"] + calls["ad_set"] + calls["creative"] + calls["ad"]) * accounts,
+        "upload_bytes": upload_bytes * accounts,
+        "videos": videos * accounts,
+        "video_processing_seconds_each": round(processing, 1),
+        "ad_sets": len(plan["ad_sets"]),
+        "ads": sum(len(ad_set["ads"]) for ad_set in plan["ad_sets"]) * accounts,
+        "graph_thumbnails": graph_thumbnails,
+        "estimated_seconds": round(seconds, 1),  # Accounts run in parallel
+        "rate_limit": {
+            "circuit_open": breaker.opened_at is not None,
+            "cooldown_seconds": round(cooldown, 1),
+            "consecutive_failures": breaker.failures,
+        },
+        "stage_timings": get_stage_timings(),
+        "estimated_at": int(time.time()),
+    }
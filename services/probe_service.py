@@ -0,0 +1,276 @@
+import json
+import logging
+import subprocess
+from collections import OrderedDict
+from threading import Lock
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor
+
+# External libraries
+from PIL import Image
+
+# Utilities & Services
+from services.task_manager import get_cancel_token, TaskCanceledException
+from services.file_service import get_media_index, media_kind
+
+# Files probed at once during preflight (video probes are ffprobe subprocesses)
+MAX_PARALLEL_PROBES = 8
+
+# Video probe results kept, keyed by content digest
+MAX_CACHED_PROBES = 10000
+
+# Hard limits: Graph rejects media outside these, so it is never uploaded
+MEDIA_LIMITS = {
+    "image": {"max_bytes": 30 * 1024 * 1024},
+    "video": {"max_bytes": 4 * 1024 * 1024 * 1024, "min_duration": 1, "max_duration": 241 * 60},
+}
+
+# Recommended limits: media outside them is flagged (or rejected in strict mode)
+RECOMMENDED_LIMITS = {
+    "image": {"min_width": 600, "min_height": 600},
+    "video": {"min_width": 120, "min_height": 120},
+}
+
+# Extra recommended limits per selected placement (keys of config['placements'])
+FEED_ASPECT = {"min_aspect": 0.8, "max_aspect": 1.91}  # 4:5 to 1.91:1
+VERTICAL_ASPECT = {"min_aspect": 0.5625, "max_aspect": 1.91}  # 9:16 to 1.91:1
+PLACEMENT_LIMITS = {
+    "profile_feed": {"image": FEED_ASPECT, "video": FEED_ASPECT},
+    "instagram_feeds": {"image": FEED_ASPECT, "video": FEED_ASPECT},
+    "marketplace": {"image": FEED_ASPECT, "video": FEED_ASPECT},
+    "right_column": {"image": {"min_aspect": 1.0, "max_aspect": 1.91}},
+    "stories": {"video": {**VERTICAL_ASPECT, "max_duration": 60}},
+    "instagram_stories": {"video": {**VERTICAL_ASPECT, "max_duration": 60}},
+    "reels": {"video": {**VERTICAL_ASPECT, "max_duration": 90}},
+    "facebook_reels": {"video": {**VERTICAL_ASPECT, "max_duration": 90}},
+    "instagram_reels": {"video": {**VERTICAL_ASPECT, "max_duration": 90}},
+    "in_stream": {"video": {"min_duration": 5, "max_duration": 600}},
+}
+
+# Carousel cards should be square
+CAROUSEL_LIMITS = {"image": {"min_aspect": 0.99, "max_aspect": 1.01}, "video": {"min_aspect": 0.99, "max_aspect": 1.01}}
+
+_video_probes = OrderedDict()  # Maps content digests to video probe results
+_video_probes_lock = Lock()
+
+def probe_image(image_file):
+    """
+    Reads an image's dimensions and format from its header only.
+
+    Pillow's `Image.open` is lazy: pixel data is never decoded here.
+
+    Returns:
+        dict: `width`, `height` and `format`.
+    """
+    with Image.open(image_file) as img:
+        width, height = img.size
+        return {"width": width, "height": height, "format": img.format}
+
+def probe_video(video_file, task_id=None):
+    """
+    Reads a video's container metadata with ffprobe (no frames are decoded).
+
+    Returns:
+        dict: `width`, `height`, `duration` (seconds), `codec` and `format`.
+
+    Raises:
+        ValueError: If ffprobe cannot read the file.
+    """
+    command = [
+        'ffprobe', '-v', 'error', '-print_format', 'json',
+        '-show_format', '-show_streams', '-select_streams', 'v:0', video_file,
+    ]
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        logging.warning("ffprobe is not installed; skipping video metadata checks.")
+        return {}
+
+    # Register the process so canceling the task kills it immediately
+    token = get_cancel_token(task_id) if task_id else None
+    if token:
+        token.register_process(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        if token:
+            token.unregister_process(process)
+
+    if token:
+        token.raise_if_canceled()
+    if process.returncode != 0:
+        raise ValueError(f"ffprobe could not read {video_file}: {stderr.decode(errors='replace').strip()}")
+
+    data = json.loads(stdout or b"{}")
+    stream = (data.get("streams") or [{}])[0]
+    width, height = stream.get("width"), stream.get("height")
+
+    # Phone footage is often stored landscape with a rotation flag
+    rotation = stream.get("tags", {}).get("rotate") or next(
+        (side.get("rotation") for side in stream.get("side_data_list", []) if "rotation" in side), 0
+    )
+    if width and height and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+
+    duration = stream.get("duration") or data.get("format", {}).get("duration")
+    return {
+        "width": width,
+        "height": height,
+        "duration": float(duration) if duration else None,
+        "codec": stream.get("codec_name"),
+        "format": data.get("format", {}).get("format_name"),
+    }
+
+def probe_media(media_file, temp_dir=None, task_id=None):
+    """
+    Probes a media file without reading its content.
+
+    Video probes are cached by content digest (taken from the staging
+    directory's MediaIndex), so the same video is probed once across tasks.
+
+    Args:
+        media_file (str): Path to the file.
+        temp_dir (str, optional): Staging directory the file belongs to.
+        task_id (str, optional): Task used to cancel a running ffprobe.
+
+    Returns:
+        dict: `kind`, `size`, `width`, `height`, `aspect` and, for videos,
+              `duration` and `codec`.
+    """
+    kind = media_kind(media_file)
+    entry = get_media_index(temp_dir).get(media_file) if temp_dir else None
+    size = entry.size if entry else None
+    if size is None:
+        with open(media_file, "rb") as f:
+            size = f.seek(0, 2)
+
+    if kind == "video":
+        digest = get_media_index(temp_dir).digest(media_file) if temp_dir else None
+        probe = _video_probes.get(digest) if digest else None
+        if probe is None:
+            probe = probe_video(media_file, task_id)
+            if digest and probe:
+                with _video_probes_lock:
+                    _video_probes[digest] = probe
+                    while len(_video_probes) > MAX_CACHED_PROBES:
+                        _video_probes.popitem(last=False)
+    else:
+        probe = probe_image(media_file)
+
+    width, height = probe.get("width"), probe.get("height")
+    return {
+        **probe,
+        "kind": kind,
+        "size": size,
+        "aspect": round(width / height, 4) if width and height else None,
+    }
+
+def get_media_limits(config):
+    """
+    Derives the recommended limits for a task from its selected placements.
+
+    Every selected placement's limits apply, so the strictest bound wins.
+    `config['media_limits']` ({"image": {...}, "video": {...}}) overrides the result.
+
+    Returns:
+        dict: Recommended limits per media kind.
+    """
+    limits = {kind: dict(values) for kind, values in RECOMMENDED_LIMITS.items()}
+    placements = config.get("placements") or {}
+    sources = [PLACEMENT_LIMITS[name] for name, selected in placements.items() if selected and name in PLACEMENT_LIMITS]
+    if config.get("ad_format") == 'Carousel':
+        sources.append(CAROUSEL_LIMITS)
+
+    for source in sources:
+        for kind, bounds in source.items():
+            for key, value in bounds.items():
+                current = limits[kind].get(key)
+                if current is None:
+                    limits[kind][key] = value
+                elif key.startswith("min_"):
+                    limits[kind][key] = max(current, value)
+                else:
+                    limits[kind][key] = min(current, value)
+
+    for kind, overrides in (config.get("media_limits") or {}).items():
+        limits.setdefault(kind, {}).update(overrides)
+    return limits
+
+def check_media(probe, limits):
+    """
+    Checks a probe result against a set of limits.
+
+    Returns:
+        list: Human-readable violations (empty if the media is within limits).
+    """
+    problems = []
+    checks = [
+        ("size", "max_bytes", lambda v, l: v > l, "file is {v} bytes, limit is {l}"),
+        ("width", "min_width", lambda v, l: v < l, "width {v}px is below {l}px"),
+        ("height", "min_height", lambda v, l: v < l, "height {v}px is below {l}px"),
+        ("aspect", "min_aspect", lambda v, l: v < l, "aspect ratio {v} is below {l}"),
+        ("aspect", "max_aspect", lambda v, l: v > l, "aspect ratio {v} is above {l}"),
+        ("duration", "min_duration", lambda v, l: v < l, "duration {v:.1f}s is below {l}s"),
+        ("duration", "max_duration", lambda v, l: v > l, "duration {v:.1f}s is above {l}s"),
+    ]
+    for field, limit_key, violates, message in checks:
+        value, limit = probe.get(field), limits.get(limit_key)
+        if value is not None and limit is not None and violates(value, limit):
+            problems.append(message.format(v=value, l=limit))
+    return problems
+
+def preflight_media(task_id, groups, config, temp_dir=None):
+    """
+    Probes every file of a task before anything is uploaded.
+
+    Media breaking a hard limit (or any limit with `preflight_strict`) is
+    removed from its group; media outside the placement recommendations is
+    flagged.
+
+    Args:
+        task_id (str): The task the media belongs to, or None when planning (nothing to cancel).
+        groups (iterable): (ad_set_name, media_files[, ad_set_id]) tuples.
+        config (dict): Task config with `placements`, `ad_format` and optional
+            `media_limits` / `preflight_strict`.
+        temp_dir (str, optional): Staging directory, for cached sizes and digests.
+
+    Returns:
+        tuple: (groups without rejected media, report dict with `rejected` and `flagged`).
+    """
+    groups = [tuple(group) for group in groups]
+    recommended = get_media_limits(config)
+    strict = config.get("preflight_strict", False)
+
+    def check(media_file):
+        try:
+            probe = probe_media(media_file, temp_dir, task_id)
+        except TaskCanceledException:
+            raise  # Stops the task rather than rejecting the file
+        except Exception as e:
+            return media_file, [f"could not be read: {e}"], []
+        kind = probe["kind"]
+        return media_file, check_media(probe, MEDIA_LIMITS.get(kind, {})), check_media(probe, recommended.get(kind, {}))
+
+    all_files = [media_file for _, media, *_ in groups for media_file in media]
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_PROBES) as executor:
+        inspected = list(executor.map(check, all_files))
+
+    report = {"rejected": [], "flagged": []}
+    rejected = set()
+    for media_file, errors, warnings in inspected:
+        if errors or (strict and warnings):
+            rejected.add(media_file)
+            report["rejected"].append({"file": media_file, "problems": errors + warnings})
+        elif warnings:
+            report["flagged"].append({"file": media_file, "problems": warnings})
+
+    if report["rejected"] or report["flagged"]:
+        logging.warning(f"Preflight for task {task_id}: {len(report['rejected'])} rejected, {len(report['flagged'])} flagged.")
+
+    kept = []
+    for ad_set_name, media, *rest in groups:
+        media = [media_file for media_file in media if media_file not in rejected]
+        if media:
+            kept.append((ad_set_name, media, *rest))
+    return kept, report
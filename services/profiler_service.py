@@ -0,0 +1,165 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from services.watchdog_service import eventlet_patched, offload
+
+# Bounds for one profile
+MAX_SECONDS = 60
+DEFAULT_HZ = 100
+MAX_HZ = 250
+
+# Stacks whose innermost frame is in one of these modules are threads waiting, not running
+IDLE_MODULES = ("threading.py", "queue.py", "selectors.py", "selector_events.py", "base_events.py",
+                os.sep + "hubs" + os.sep, "tpool.py", "socket.py", "ssl.py")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_profile_lock = threading.Lock()
+_task_frames = {}  # Code objects -> whether they have a `task_id` or `self` local
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+def _native(module):
+    """Returns the unpatched standard module (`threading`, `time`) even under eventlet."""
+    if eventlet_patched():
+        from eventlet import patcher
+        return patcher.original(module)
+    return sys.modules[module]
+
+def _thread_names():
+    names = {}
+    for thread in _native("threading").enumerate():
+        if thread.ident is not None:
+            names[thread.ident] = thread.name
+    return names
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename})"
+
+def _task_of(frame):
+    """Finds the task a stack works for from a `task_id` (or `self.task_id`) local, innermost first."""
+    while frame is not None:
+        code = frame.f_code
+        has_task = _task_frames.get(code)
+        if has_task is None:
+            # Only project code is inspected, so library frames never pay for `f_locals`
+            has_task = _task_frames[code] = (
+                code.co_filename.startswith(PROJECT_ROOT) and "site-packages" not in code.co_filename
+                and ("task_id" in code.co_varnames or "self" in code.co_varnames)
+            )
+        if has_task:
+            local_vars = frame.f_locals
+            task_id = local_vars.get("task_id")
+            if task_id is None and "self" in local_vars:
+                task_id = getattr(local_vars["self"], "task_id", None)
+            if isinstance(task_id, str) and task_id:
+                return task_id
+        frame = frame.f_back
+    return None
+
+def _is_idle(frame):
+    filename = frame.f_code.co_filename
+    return any(marker in filename for marker in IDLE_MODULES)
+
+def _sample(seconds, interval, include_idle):
+    """Samples every thread's stack for `seconds`; runs on a native thread."""
+    sleep = _native("time").sleep
+    own_ident = _native("threading").get_ident()
+
+    stacks = Counter()
+    tasks = Counter()
+    samples = 0
+    names = _thread_names()
+    deadline = time.monotonic() + seconds
+    next_names = time.monotonic() + 1.0
+
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        if started >= next_names:
+            names = _thread_names()  # Threads come and go; refresh their names once a second
+            next_names = started + 1.0
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or (not include_idle and _is_idle(frame)):
+                continue
+            task_id = _task_of(frame)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            root = f"task {task_id}" if task_id else names.get(ident, f"thread-{ident}")
+            stacks[(root, *stack)] += 1
+            tasks[task_id or "(no task)"] += 1
+        samples += 1
+        # Keep the requested rate; a slow walk just lowers it
+        sleep(max(interval - (time.monotonic() - started), 0.001))
+
+    return stacks, tasks, samples
+
+def profile_workers(seconds=10, hz=DEFAULT_HZ, top=30, include_idle=False):
+    """
+    Runs a statistical sampler over every thread of this worker for `seconds`.
+
+    Sampling happens on a native thread. Under eventlet, the hub thread's
+    stack is whichever greenlet is running, which is where a green worker
+    spends its CPU. Each stack is attributed to the task whose `task_id`
+    (or `self.task_id`) is found in its frames.
+
+    Args:
+        seconds (float): Sampling duration, at most MAX_SECONDS.
+        hz (int): Samples per second, at most MAX_HZ.
+        top (int): Number of functions in the summaries.
+        include_idle (bool): Keep threads blocked in waits, locks and the hub.
+
+    Returns:
+        dict: `collapsed` stacks (flamegraph format, one "a;b;c count" per
+              line), `top_self` and `top_total` functions, samples `by_task`.
+
+    Raises:
+        ProfilerBusy: If another profile is running in this worker.
+    """
+    seconds = min(max(float(seconds), 0.1), MAX_SECONDS)
+    hz = min(max(int(hz), 1), MAX_HZ)
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker.")
+    try:
+        started = time.time()
+        stacks, tasks, samples = offload(_sample, seconds, 1.0 / hz, include_idle)
+    finally:
+        _profile_lock.release()
+
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in stacks.items():
+        frames = stack[1:]
+        if frames:
+            self_counts[frames[-1]] += count
+        for label in set(frames):
+            total_counts[label] += count
+    stack_samples = sum(stacks.values()) or 1
+
+    def summary(counts):
+        return [{"function": label, "samples": count, "percent": round(100.0 * count / stack_samples, 1)}
+                for label, count in counts.most_common(top)]
+
+    return {
+        "pid": os.getpid(),
+        "started_at": int(started),
+        "seconds": seconds,
+        "hz": hz,
+        "samples": samples,
+        "stack_samples": sum(stacks.values()),
+        "collapsed": "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()),
+        "top_self": summary(self_counts),
+        "top_total": summary(total_counts),
+        "by_task": dict(tasks.most_common()),
+    }
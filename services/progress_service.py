@@ -0,0 +1,203 @@
+import time
+from threading import Condition, Lock
+
+from services.task_manager import get_task_state, ensure_task_state
+from services.memory_service import mark_phase
+
+# Longest `?wait=` a poller may ask for, in seconds
+MAX_WAIT = 30
+
+# Phases a task moves through; the last three are final
+PHASES = ("queued", "staging", "preflight", "transcoding", "uploading", "complete", "failed", "canceled")
+FINAL_PHASES = ("complete", "failed", "canceled")
+
+class TaskProgress:
+    """
+    Live progress of one task.
+
+    Every update is a few integer operations plus a `notify_all` on the
+    task's own condition, so reporting progress stays O(1) however many
+    pollers are waiting. `version` increases on every change and is the
+    snapshot's ETag. The record lives on the task's TaskState, so it is
+    kept and evicted together with the rest of the task.
+    """
+    __slots__ = ("task_id", "phase", "total", "done", "failed", "bytes_uploaded", "ad_sets", "stages",
+                 "started_at", "uploading_since", "updated_at", "updated_monotonic", "version", "error",
+                 "condition")
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.phase = "queued"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.bytes_uploaded = 0
+        self.ad_sets = {}  # Ad set ID -> [name, total, done, failed]
+        self.stages = {}  # Stage name -> [count, seconds], see `services.timing_service`
+        self.started_at = self.updated_at = time.time()
+        self.updated_monotonic = time.monotonic()
+        self.uploading_since = None
+        self.version = 0
+        self.error = None
+        self.condition = Condition(Lock())
+
+    def _changed(self):
+        self.version += 1
+        self.updated_at = time.time()
+        self.updated_monotonic = time.monotonic()
+        self.condition.notify_all()
+
+    def snapshot(self):
+        """Returns a compact, JSON-ready view of the task."""
+        with self.condition:
+            pending = max(self.total - self.done - self.failed, 0)
+            eta = None
+            if self.phase == "uploading" and self.uploading_since and (self.done + self.failed):
+                rate = (self.done + self.failed) / max(time.time() - self.uploading_since, 1e-6)
+                eta = round(pending / rate, 1)
+            return {
+                "task_id": self.task_id,
+                "phase": self.phase,
+                "version": self.version,
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "pending": pending,
+                "bytes_uploaded": self.bytes_uploaded,
+                "eta_seconds": eta,
+                "elapsed_seconds": round(time.time() - self.started_at, 1),
+                "error": self.error,
+                "ad_sets": [
+                    {"id": ad_set_id, "name": name, "done": done, "failed": failed,
+                     "pending": max(total - done - failed, 0)}
+                    for ad_set_id, (name, total, done, failed) in self.ad_sets.items()
+                ],
+                "stages": {stage: {"count": count, "seconds": round(seconds, 1)}
+                           for stage, (count, seconds) in self.stages.items()},
+            }
+
+_start_lock = Lock()
+
+def start_progress(task_id, phase="staging"):
+    """
+    Starts tracking a task's progress (resetting any earlier run with the same ID).
+
+    Returns:
+        TaskProgress: The task's progress record.
+    """
+    progress = TaskProgress(task_id)
+    progress.phase = phase
+    state = ensure_task_state(task_id)
+    with _start_lock:
+        previous, state.progress = state.progress, progress
+    if previous is not None:
+        with previous.condition:
+            previous._changed()  # Wake pollers of the old run; they will see the new record
+    mark_phase(task_id, phase)
+    return progress
+
+def get_progress(task_id):
+    """Returns a task's TaskProgress, or None if it is not tracked."""
+    state = get_task_state(task_id)
+    return state.progress if state else None
+
+def _update(task_id):
+    state = get_task_state(task_id)
+    if state is None:
+        return TaskProgress(task_id)  # Untracked task: the update is dropped rather than registering it
+    progress = state.progress
+    if progress is None:
+        with _start_lock:
+            progress = state.progress
+            if progress is None:
+                progress = state.progress = TaskProgress(task_id)
+    return progress
+
+def set_phase(task_id, phase, total=None, error=None):
+    """
+    Moves a task to another phase.
+
+    Args:
+        task_id (str): The task.
+        phase (str): One of PHASES.
+        total (int, optional): Number of media files the task will process.
+        error (str, optional): Why the task failed.
+    """
+    progress = _update(task_id)
+    with progress.condition:
+        progress.phase = phase
+        if total is not None:
+            progress.total = total
+        if error is not None:
+            progress.error = error
+        if phase == "uploading" and progress.uploading_since is None:
+            progress.uploading_since = time.time()
+        progress._changed()
+    mark_phase(task_id, phase, final=phase in FINAL_PHASES)  # Phase boundaries are memory checkpoints
+
+def add_ad_set(task_id, ad_set_id, name, total):
+    """Registers an ad set and the number of media files it will receive."""
+    progress = _update(task_id)
+    with progress.condition:
+        progress.ad_sets[str(ad_set_id)] = [name, total, 0, 0]
+        progress._changed()
+
+def record_media(task_id, ad_set_id=None, success=True):
+    """
+    Counts one processed media file of a task (and of its ad set, if given).
+
+    Returns:
+        int: Media files processed so far, successful or not.
+    """
+    progress = _update(task_id)
+    with progress.condition:
+        ad_set = progress.ad_sets.get(str(ad_set_id)) if ad_set_id else None
+        if success:
+            progress.done += 1
+            if ad_set:
+                ad_set[2] += 1
+        else:
+            progress.failed += 1
+            if ad_set:
+                ad_set[3] += 1
+        progress._changed()
+        return progress.done + progress.failed
+
+def count_stage(task_id, stage, seconds):
+    """Counts one completed stage (e.g. "video_upload") of a task and the time it took."""
+    progress = get_progress(task_id)
+    if progress is None:
+        return
+    with progress.condition:
+        counter = progress.stages.get(stage)
+        if counter is None:
+            counter = progress.stages[stage] = [0, 0.0]
+        counter[0] += 1
+        counter[1] += seconds
+        progress._changed()
+
+def add_uploaded_bytes(task_id, size):
+    """Adds to the number of bytes a task has sent to Graph."""
+    progress = get_progress(task_id)
+    if progress is None or not size:
+        return
+    with progress.condition:
+        progress.bytes_uploaded += size
+        progress._changed()
+
+def wait_for_change(task_id, version, timeout):
+    """
+    Blocks until a task's progress moves past `version`, it finishes, or `timeout` expires.
+
+    Returns:
+        TaskProgress: The current record, or None if the task is not tracked.
+    """
+    progress = get_progress(task_id)
+    if progress is None:
+        return None
+    timeout = min(max(timeout, 0), MAX_WAIT)
+    with progress.condition:
+        progress.condition.wait_for(
+            lambda: progress.version != version or progress.phase in FINAL_PHASES, timeout
+        )
+    return get_progress(task_id) or progress
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import random
+import time
+from threading import Lock
+
+import requests
+
+from services.task_manager import get_cancel_token, TaskCanceledException
+
+# Graph error codes that indicate a temporary condition worth retrying
+TRANSIENT_ERROR_CODES = {1, 2, 4, 17, 32, 80004, 613}
+# Subset of the above that are rate limits and need a longer backoff
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 80004, 613}
+
+# Backoff settings
+MAX_ATTEMPTS = 5
+BASE_DELAY = 1.0  # seconds
+RATE_LIMIT_BASE_DELAY = 10.0  # seconds
+MAX_DELAY = 60.0  # seconds
+
+# Retries allowed across a whole task before failures are surfaced immediately
+TASK_RETRY_BUDGET = 200
+
+# Circuit breaker settings (per ad account)
+BREAKER_FAILURE_THRESHOLD = 5  # consecutive failures before opening
+BREAKER_COOLDOWN = 60.0  # seconds before a trial call is allowed
+
+# Error classes
+TRANSIENT = "transient"
+RATE_LIMITED = "rate_limited"
+AMBIGUOUS = "ambiguous"  # Request may have reached Graph (e.g. connection reset mid-response)
+PERMANENT = "permanent"
+
+class CircuitOpenError(Exception):
+    """Raised when calls to an ad account are suspended by its circuit breaker."""
+    pass
+
+def _graph_error_code(error):
+    """Returns the Graph error code for SDK and async client errors, if any."""
+    api_error_code = getattr(error, "api_error_code", None)
+    if callable(api_error_code):
+        return api_error_code()
+    return getattr(error, "code", None)
+
+def _http_status(error):
+    http_status = getattr(error, "http_status", None)
+    if callable(http_status):
+        return http_status()
+    return getattr(error, "status", None)
+
+def classify_error(error):
+    """
+    Classifies an exception from a Graph call.
+
+    Args:
+        error (Exception): The raised exception.
+
+    Returns:
+        str: One of TRANSIENT, RATE_LIMITED, AMBIGUOUS or PERMANENT.
+    """
+    code = _graph_error_code(error)
+    if code in RATE_LIMIT_ERROR_CODES:
+        return RATE_LIMITED
+    if code in TRANSIENT_ERROR_CODES:
+        return TRANSIENT
+
+    status = _http_status(error)
+    if code is None and status is not None and status >= 500:
+        return TRANSIENT
+
+    # Failed before the request was sent: always safe to retry
+    if isinstance(error, (requests.exceptions.ConnectTimeout, ConnectionRefusedError)):
+        return TRANSIENT
+    # Connection dropped or timed out after sending: the write may have happened
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          ConnectionResetError, asyncio.TimeoutError)):
+        return AMBIGUOUS
+    if type(error).__module__.startswith("aiohttp") and type(error).__name__ in (
+        "ClientConnectorError", "ServerDisconnectedError", "ClientOSError", "ServerTimeoutError",
+    ):
+        return TRANSIENT if type(error).__name__ == "ClientConnectorError" else AMBIGUOUS
+
+    return PERMANENT
+
+def should_retry(error_class, idempotent):
+    """Returns True if an error of this class may be retried for the operation."""
+    if error_class in (TRANSIENT, RATE_LIMITED):
+        return True
+    # A repeated create after an ambiguous failure could duplicate the object
+    return error_class == AMBIGUOUS and idempotent
+
+def backoff_delay(attempt, error_class):
+    """Exponential backoff with full jitter for the given (zero-based) attempt."""
+    base = RATE_LIMIT_BASE_DELAY if error_class == RATE_LIMITED else BASE_DELAY
+    return random.uniform(0, min(MAX_DELAY, base * (2 ** attempt)))
+
+class RetryBudget:
+    """Caps the total number of retries a single task may spend."""
+    __slots__ = ("remaining", "_lock")
+
+    def __init__(self, retries=TASK_RETRY_BUDGET):
+        self.remaining = retries
+        self._lock = Lock()
+
+    def try_spend(self):
+        """Consumes one retry; returns False once the budget is exhausted."""
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+class CircuitBreaker:
+    """
+    Per-ad-account breaker: after repeated consecutive failures, calls fail
+    fast for a cooldown period, then a single trial call decides whether the
+    account is healthy again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = Lock()
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: If the breaker is open or a trial call is already running.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_in_flight:
+                raise CircuitOpenError(f"Circuit open for ad account {self.name}; skipping call")
+            self.trial_in_flight = True  # Half-open: let one call through
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Ends a trial call that was abandoned (canceled) without judging the account."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.warning(f"Opening circuit for ad account {self.name} after {self.failures} failures.")
+                self.opened_at = time.monotonic()
+
+retry_budgets = {}  # Maps task IDs to their RetryBudget
+circuit_breakers = {}  # Maps ad account IDs to their CircuitBreaker
+_breakers_lock = Lock()
+
+def get_retry_budget(task_id):
+    """Returns the retry budget for a task, creating it on first use."""
+    budget = retry_budgets.get(task_id)
+    if budget is None:
+        budget = retry_budgets.setdefault(task_id, RetryBudget())
+    return budget
+
+def release_retry_budget(task_id):
+    """Drops a finished task's retry budget."""
+    retry_budgets.pop(task_id, None)
+
+def get_circuit_breaker(ad_account_id):
+    """Returns the circuit breaker for an ad account, creating it on first use."""
+    with _breakers_lock:
+        breaker = circuit_breakers.get(ad_account_id)
+        if breaker is None:
+            breaker = circuit_breakers[ad_account_id] = CircuitBreaker(ad_account_id)
+        return breaker
+
+def _should_give_up(error, attempt, idempotent, task_id, breaker, description):
+    """Records the failure and decides whether to surface it; returns (give_up, error_class)."""
+    error_class = classify_error(error)
+    if error_class == PERMANENT:
+        # Graph answered deliberately, so the account itself is reachable
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+    if (not should_retry(error_class, idempotent) or attempt + 1 >= MAX_ATTEMPTS
+            or not get_retry_budget(task_id).try_spend()):
+        return True, error_class
+
+    logging.warning(f"{description} failed ({error_class}: {error}); retry {attempt + 1}/{MAX_ATTEMPTS - 1}")
+    return False, error_class
+
+def call_with_retry(func, *args, task_id, ad_account_id, idempotent=True, description=None, **kwargs):
+    """
+    Calls a blocking Graph operation, retrying transient failures.
+
+    Retries use exponential backoff with full jitter, are charged against the
+    task's retry budget and sleep on the task's cancellation token, so a
+    cancel interrupts the wait. Non-idempotent operations (creates) are not
+    retried after ambiguous network failures.
+
+    Args:
+        func (callable): The operation to call.
+        task_id (str): Task the call belongs to.
+        ad_account_id (str): Ad account used for circuit breaking.
+        idempotent (bool): Whether repeating the call is always safe.
+        description (str, optional): Label used in log messages.
+
+    Returns:
+        The return value of `func`.
+
+    Raises:
+        CircuitOpenError: If the account's circuit is open.
+        TaskCanceledException: If the task is canceled while backing off.
+    """
+    description = description or getattr(func, "__name__", "Graph call")
+    breaker = get_circuit_breaker(ad_account_id)
+    token = get_cancel_token(task_id)
+
+    attempt = 0
+    while True:
+        token.raise_if_canceled()
+        breaker.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except TaskCanceledException:
+            breaker.release_trial()  # Not a Graph failure: no retry, and the breaker's state is left alone
+            raise
+        except Exception as e:
+            give_up, error_class = _should_give_up(e, attempt, idempotent, task_id, breaker, description)
+            if give_up:
+                raise
+            if token.wait(backoff_delay(attempt, error_class)):
+                token.raise_if_canceled()
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+async def call_with_retry_async(func, *args, task_id, ad_account_id, idempotent=True, description=None, **kwargs):
+    """Asyncio counterpart of `call_with_retry` for coroutine functions."""
+    description = description or getattr(func, "__name__", "Graph call")
+    breaker = get_circuit_breaker(ad_account_id)
+    token = get_cancel_token(task_id)
+
+    attempt = 0
+    while True:
+        token.raise_if_canceled()
+        breaker.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except (asyncio.CancelledError, TaskCanceledException):
+            breaker.release_trial()  # Not a Graph failure: no retry, and the breaker's state is left alone
+            raise
+        except Exception as e:
+            give_up, error_class = _should_give_up(e, attempt, idempotent, task_id, breaker, description)
+            if give_up:
+                raise
+            await asyncio.sleep(backoff_delay(attempt, error_class))
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
@@ -0,0 +1,368 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from queue import Queue, Empty
+from threading import Lock
+
+from services.watchdog_service import blocking
+
+# Staging roots: small files go to the RAM-backed area (tmpfs), everything else to disk
+_DEFAULT_RAM_ROOT = "/dev/shm/fb_ads_staging" if os.path.isdir("/dev/shm") else None
+STAGING_RAM_ROOT = os.environ.get("STAGING_RAM_ROOT", _DEFAULT_RAM_ROOT)  # Empty disables the RAM area
+STAGING_DISK_ROOT = os.environ.get("STAGING_DISK_ROOT", os.path.join(tempfile.gettempdir(), "fb_ads_staging"))
+
+# RAM area budget for this process, and the largest file it accepts
+RAM_QUOTA_BYTES = int(os.environ.get("STAGING_RAM_QUOTA_BYTES", 512 * 1024 * 1024))
+MAX_RAM_FILE_BYTES = int(os.environ.get("STAGING_MAX_RAM_FILE_BYTES", 16 * 1024 * 1024))
+
+# Free space always left on the tmpfs, which other workers and the OS share
+MIN_RAM_FREE_BYTES = int(os.environ.get("STAGING_MIN_RAM_FREE_BYTES", 256 * 1024 * 1024))
+
+# Background janitor: how often it sweeps, and how old unreferenced leftovers must be
+JANITOR_INTERVAL = float(os.environ.get("STAGING_JANITOR_INTERVAL", 60))
+ORPHAN_MAX_AGE = float(os.environ.get("STAGING_ORPHAN_MAX_AGE", 6 * 3600))
+
+# Read size while streaming uploads
+CHUNK_SIZE = 1024 * 1024
+
+# Linux ioctl that clones a file's extents (a reflink)
+FICLONE = 0x40049409
+
+# Each process stages under its own namespace so workers never sweep each other's files
+NAMESPACE = str(os.getpid())
+
+class Blob:
+    """One staged file's content, shared by every staging directory that holds it."""
+    __slots__ = ("digest", "path", "size", "in_ram", "refs")
+
+    def __init__(self, digest, path, size, in_ram):
+        self.digest = digest
+        self.path = path
+        self.size = size
+        self.in_ram = in_ram
+        self.refs = 0
+
+blobs = {}  # Maps content digests to their Blob
+staging_dirs = {}  # Maps staging directories to the digests of the blobs they link to
+ram_bytes = 0  # Bytes of this process's blobs held in the RAM area
+_staging_lock = Lock()
+
+_trash = Queue()  # Paths waiting to be deleted by the janitor
+_janitor = None
+_janitor_lock = Lock()
+
+def _root(in_ram):
+    return Path(STAGING_RAM_ROOT if in_ram else STAGING_DISK_ROOT) / NAMESPACE
+
+def create_staging_dir():
+    """
+    Creates an empty staging directory for one upload and starts the janitor.
+
+    Returns:
+        Path: The new directory (always on disk; its files link to staged blobs).
+    """
+    start_janitor()
+    directory = _root(False) / "dirs" / uuid.uuid4().hex
+    directory.mkdir(parents=True)
+    with _staging_lock:
+        staging_dirs[str(directory)] = []
+    return directory
+
+def stage_file(stream, file_path, size_hint=None):
+    """
+    Writes an uploaded stream into staging and links it at `file_path`.
+
+    Small files (up to `MAX_RAM_FILE_BYTES`) go to the RAM area while it has
+    quota and free space; larger ones spill to disk. Content is stored once
+    per digest, so a file uploaded by several tasks is kept once and its
+    space is reclaimed when the last staging directory using it is released.
+
+    Args:
+        stream: Readable binary stream (e.g. `FileStorage.stream`).
+        file_path (Path): Where the file should appear, inside a staging directory.
+        size_hint (int, optional): Expected size, used to skip the RAM area early.
+
+    Returns:
+        tuple: (size in bytes, SHA-256 hex digest).
+    """
+    digest = hashlib.sha256()
+    head = b""
+    in_ram = False
+    # Read just past the RAM limit to learn which area the file belongs to
+    if size_hint is None or size_hint <= MAX_RAM_FILE_BYTES:
+        head = stream.read(MAX_RAM_FILE_BYTES + 1)
+        in_ram = len(head) <= MAX_RAM_FILE_BYTES and _reserve_ram(len(head))
+
+    partial = _root(in_ram) / "blobs" / f".{uuid.uuid4().hex}.part"
+    partial.parent.mkdir(parents=True, exist_ok=True)
+    size = 0
+    try:
+        with open(partial, "wb") as out:
+            for chunk in _chunks(head, stream, in_ram):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        if in_ram:
+            _release_ram(len(head))
+        partial.unlink(missing_ok=True)
+        raise
+
+    blob = _add_blob(digest.hexdigest(), partial, size, in_ram)
+    os.symlink(blob.path, file_path)
+    with _staging_lock:
+        staging_dirs.setdefault(str(_staging_dir_of(file_path)), []).append(blob.digest)
+    return size, blob.digest
+
+def link_file(source, file_path):
+    """
+    Makes a local file appear at `file_path` without copying its bytes: a
+    hardlink, else a reflink (copy-on-write clone), else a symlink. The
+    source is only ever read; files derived from it (thumbnails, conversions)
+    are written next to the link, inside the staging directory.
+
+    Returns:
+        str: "hardlink", "reflink" or "symlink".
+    """
+    source = os.path.abspath(source)
+    try:
+        os.link(source, file_path)
+        return "hardlink"
+    except OSError:
+        pass
+    if _reflink(source, file_path):
+        return "reflink"
+    os.symlink(source, file_path)
+    return "symlink"
+
+def _reflink(source, file_path):
+    """Clones a file with the FICLONE ioctl (Btrfs, XFS, overlay on those); False where unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, "rb") as src, open(file_path, "xb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return True
+            except OSError:
+                pass
+        os.unlink(file_path)
+    except OSError:
+        pass
+    return False
+
+def _chunks(head, stream, in_ram):
+    if head:
+        yield head
+    if not in_ram:
+        yield from iter(lambda: stream.read(CHUNK_SIZE), b"")
+
+def _reserve_ram(size):
+    """Claims RAM quota for a file, or returns False if it must spill to disk."""
+    global ram_bytes
+    if not STAGING_RAM_ROOT:
+        return False
+    with _staging_lock:
+        if ram_bytes + size > RAM_QUOTA_BYTES:
+            return False
+        try:
+            os.makedirs(STAGING_RAM_ROOT, exist_ok=True)
+            if shutil.disk_usage(STAGING_RAM_ROOT).free - size < MIN_RAM_FREE_BYTES:
+                return False
+        except OSError:
+            return False
+        ram_bytes += size
+        return True
+
+def _release_ram(size):
+    global ram_bytes
+    with _staging_lock:
+        ram_bytes -= size
+
+def _add_blob(digest, partial, size, in_ram):
+    """Publishes a written file as the blob for `digest`, reusing an existing one."""
+    with _staging_lock:
+        blob = blobs.get(digest)
+        if blob is None:
+            path = _root(in_ram) / "blobs" / digest
+            os.chmod(partial, 0o444)  # Shared by tasks and addressed by content: never written again
+            os.replace(partial, path)
+            blob = blobs[digest] = Blob(digest, str(path), size, in_ram)
+            duplicate = False
+        else:
+            duplicate = True
+        blob.refs += 1
+    if duplicate:
+        partial.unlink(missing_ok=True)
+        if in_ram:
+            _release_ram(size)
+    return blob
+
+def _staging_dir_of(file_path):
+    """Returns the staging directory a path belongs to."""
+    dirs_root = _root(False) / "dirs"
+    relative = Path(file_path).relative_to(dirs_root)
+    return dirs_root / relative.parts[0]
+
+def is_staging_dir(directory):
+    """Returns True if `directory` was created by `create_staging_dir` and not yet released."""
+    with _staging_lock:
+        return str(Path(directory)) in staging_dirs
+
+def release_staging_dir(directory):
+    """
+    Releases a staging directory: drops its blob references and hands the
+    directory to the janitor, so the caller never waits on a large delete.
+
+    Directories not created by `create_staging_dir` are deleted in the background too.
+
+    Returns:
+        bool: False if the directory does not exist.
+    """
+    global ram_bytes
+    directory = Path(directory)
+    freed = []
+    with _staging_lock:
+        for digest in staging_dirs.pop(str(directory), []):
+            blob = blobs.get(digest)
+            if blob is None:
+                continue
+            blob.refs -= 1
+            if blob.refs <= 0:
+                del blobs[digest]
+                if blob.in_ram:
+                    ram_bytes -= blob.size
+                # Move it aside now so a new upload of the same content gets a fresh blob
+                trash_path = f"{blob.path}.{uuid.uuid4().hex}.trash"
+                try:
+                    os.replace(blob.path, trash_path)
+                    freed.append(trash_path)
+                except FileNotFoundError:
+                    pass
+
+    if not directory.exists():
+        return False
+
+    # Renaming is instant; the tree and unreferenced blobs are deleted later
+    trash_dir = directory.with_name(f".trash-{directory.name}")
+    try:
+        os.replace(directory, trash_dir)
+    except OSError:
+        trash_dir = directory
+    _trash.put(str(trash_dir))
+    for path in freed:
+        _trash.put(path)
+    start_janitor()
+    return True
+
+def flush_deletes():
+    """Deletes everything waiting for the janitor now, e.g. before a short-lived process exits."""
+    while True:
+        try:
+            path = _trash.get_nowait()
+        except Empty:
+            return
+        _delete(path)
+
+def staging_stats():
+    """Returns RAM area usage and blob counts for this process."""
+    with _staging_lock:
+        return {
+            "ram_bytes": ram_bytes,
+            "ram_quota_bytes": RAM_QUOTA_BYTES,
+            "blobs": len(blobs),
+            "ram_blobs": sum(1 for blob in blobs.values() if blob.in_ram),
+            "staging_dirs": len(staging_dirs),
+            "pending_deletes": _trash.qsize(),
+        }
+
+def start_janitor():
+    """Starts the background janitor thread once per process."""
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None or not _janitor.is_alive():
+            _janitor = threading.Thread(target=_run_janitor, name="staging-janitor", daemon=True)
+            _janitor.start()
+
+def _run_janitor():
+    next_sweep = 0
+    while True:
+        try:
+            path = _trash.get(timeout=JANITOR_INTERVAL)
+            _delete(path)
+        except Empty:
+            pass
+        if time.monotonic() >= next_sweep:
+            try:
+                sweep_orphans()
+            except Exception as e:
+                logging.error(f"Staging sweep failed: {e}")
+            next_sweep = time.monotonic() + JANITOR_INTERVAL
+
+@blocking
+def _delete(path):
+    """Deletes a file or tree; large trees take a while, so this runs off the hub."""
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        logging.debug(f"Deleted staged path: {path}", extra={"hot_path": "staging_delete"})
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.error(f"Error deleting staged path {path}: {e}")
+
+def sweep_orphans(max_age=ORPHAN_MAX_AGE):
+    """
+    Deletes staging leftovers nobody references: namespaces of processes that
+    no longer run (e.g. after a crash), and this process's directories and
+    blobs that are unreferenced and older than `max_age` seconds.
+    """
+    cutoff = time.time() - max_age
+    for root in {STAGING_RAM_ROOT, STAGING_DISK_ROOT} - {None, ""}:
+        try:
+            namespaces = list(os.scandir(root))
+        except FileNotFoundError:
+            continue
+        for namespace in namespaces:
+            if namespace.name == NAMESPACE:
+                _sweep_own(Path(namespace.path), cutoff)
+            elif namespace.name.isdigit() and not _process_alive(int(namespace.name)):
+                logging.info(f"Removing staging files of exited process {namespace.name}.")
+                _delete(namespace.path)
+
+def _sweep_own(namespace, cutoff):
+    with _staging_lock:
+        live_dirs = set(staging_dirs)
+        live_blobs = {blob.path for blob in blobs.values()}
+    for kind, live in (("dirs", live_dirs), ("blobs", live_blobs)):
+        try:
+            entries = list(os.scandir(namespace / kind))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.path in live:
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    _delete(entry.path)
+            except FileNotFoundError:
+                pass
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
@@ -0,0 +1,173 @@
+import logging
+import uuid
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor
+
+# Facebook Ads SDK
+from facebook_business.adobjects.ad import Ad
+from facebook_business.adobjects.adset import AdSet
+from facebook_business.adobjects.campaign import Campaign
+
+# Utilities & Services
+from utils.facebook_client import get_api_for_config
+from services.task_manager import add_task, get_cancel_token, get_task_state, cleanup_task_pid, TaskCanceledException
+from services.retry_service import (
+    call_with_retry, release_retry_budget, get_retry_budget, get_circuit_breaker,
+    classify_error, should_retry, backoff_delay, MAX_ATTEMPTS, RATE_LIMITED, TRANSIENT,
+)
+
+VALID_STATUSES = ("ACTIVE", "PAUSED")
+
+# Graph accepts at most 50 requests in one batch call
+BATCH_SIZE = 50
+
+# Batch calls in flight at once; kept low since every request in a batch counts against the rate limit
+MAX_PARALLEL_BATCHES = 4
+
+OBJECT_CLASSES = {"campaign": Campaign, "adset": AdSet, "ad": Ad}
+
+# Parents are activated first so children start delivering as soon as they flip;
+# pausing goes the other way round so the whole tree stops at once.
+TYPE_ORDER = ("campaign", "adset", "ad")
+
+def update_object_statuses(task_id, config, objects, status, operation_id=None):
+    """
+    Sets the status of many campaigns, ad sets and ads with batched Graph requests.
+
+    Object types are updated one tier at a time (see `TYPE_ORDER`); within a
+    tier, objects are sent in batches of `BATCH_SIZE`, up to
+    `MAX_PARALLEL_BATCHES` at a time. Each batch call goes through the retry
+    engine and the ad account's circuit breaker; objects that fail with a
+    transient or rate-limit error are retried in a later round with backoff.
+
+    Args:
+        task_id (str): Task that created the objects.
+        config (dict): Credentials and `ad_account_id`.
+        objects (list): Object records from `get_created_objects`.
+        status (str): "ACTIVE" or "PAUSED".
+        operation_id (str, optional): New task ID to register for the call,
+            so the update can be canceled with `cancel_task`. Without one, the
+            update runs on a detached token and registers no task, keeping
+            routine toggles out of the finished-task record.
+
+    Returns:
+        list: One result per object with `id`, `type`, `success` and, on failure, `error`.
+
+    Raises:
+        ValueError: If the status is not supported or `operation_id` belongs to a known task.
+        TaskCanceledException: If `operation_id` is canceled.
+    """
+    if status not in VALID_STATUSES:
+        raise ValueError(f"Unsupported status: {status}")
+
+    registered = operation_id is not None
+    if registered:
+        if get_task_state(operation_id) is not None:
+            raise ValueError(f"operation_id {operation_id} is already in use")
+        add_task(operation_id)
+    else:
+        operation_id = f"{task_id}-status-{uuid.uuid4().hex[:8]}"  # Only keys the retry budget
+
+    ad_account_id = config["ad_account_id"]
+    api = get_api_for_config(config)
+    token = get_cancel_token(operation_id)
+    results = {}
+
+    # A tier finishes (retries included) before the next one starts
+    order = TYPE_ORDER if status == "ACTIVE" else tuple(reversed(TYPE_ORDER))
+    try:
+        for object_type in order:
+            tier = [obj for obj in objects if obj["type"] == object_type]
+            if tier:
+                _update_tier(api, operation_id, token, ad_account_id, tier, status, results)
+    finally:
+        if registered:
+            cleanup_task_pid(operation_id)
+        release_retry_budget(operation_id)
+
+    return [results[obj["id"]] for obj in objects]
+
+def _update_tier(api, operation_id, token, ad_account_id, pending, status, results):
+    """Updates objects of one type in parallel batches, retrying failed ones in later rounds."""
+    attempt = 0
+    while pending:
+        token.raise_if_canceled()
+        batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_BATCHES) as executor:
+            rounds = list(executor.map(
+                lambda batch: _execute_batch(api, operation_id, ad_account_id, batch, status, results),
+                batches,
+            ))
+
+        pending = [obj for retry, _ in rounds for obj in retry]
+        rate_limited = any(limited for _, limited in rounds)
+        if not pending:
+            return
+        if attempt + 1 >= MAX_ATTEMPTS or not get_retry_budget(operation_id).try_spend():
+            logging.warning(f"Giving up on {len(pending)} status updates ({operation_id}).")
+            return
+
+        error_class = RATE_LIMITED if rate_limited else TRANSIENT
+        if rate_limited:
+            get_circuit_breaker(ad_account_id).record_failure()
+        logging.warning(f"Retrying {len(pending)} status updates ({operation_id}, {error_class}).")
+        if token.wait(backoff_delay(attempt, error_class)):
+            token.raise_if_canceled()
+        attempt += 1
+
+def _execute_batch(api, operation_id, ad_account_id, objects, status, results):
+    """
+    Sends one batch of status updates.
+
+    Returns:
+        tuple: (objects to retry, whether any of them hit a rate limit).
+    """
+    retry = []
+    rate_limited = [False]
+
+    def on_success(obj):
+        def callback(response):
+            results[obj["id"]] = {"id": obj["id"], "type": obj["type"], "success": True}
+        return callback
+
+    def on_failure(obj):
+        def callback(response):
+            error = response.error()
+            error_class = classify_error(error)
+            results[obj["id"]] = {"id": obj["id"], "type": obj["type"], "success": False, "error": str(error)}
+            if should_retry(error_class, idempotent=True):
+                rate_limited[0] = rate_limited[0] or error_class == RATE_LIMITED
+                retry.append(obj)
+        return callback
+
+    batch = api.new_batch()
+    for obj in objects:
+        results.pop(obj["id"], None)  # Drop the failure from an earlier round
+        OBJECT_CLASSES[obj["type"]](obj["id"], api=api).api_update(
+            params={"status": status}, batch=batch, success=on_success(obj), failure=on_failure(obj),
+        )
+
+    # Setting a status is idempotent, so the whole batch can be resent safely
+    try:
+        unanswered = call_with_retry(
+            batch.execute, task_id=operation_id, ad_account_id=ad_account_id,
+            description=f"Status batch of {len(objects)}",
+        )
+    except TaskCanceledException:
+        raise
+    except Exception as e:
+        logging.error(f"Status batch failed: {e}")
+        for obj in objects:
+            results[obj["id"]] = {"id": obj["id"], "type": obj["type"], "success": False, "error": str(e)}
+        return [], False
+
+    # Requests Graph returned no response for are retried as well
+    if unanswered is not None:
+        for obj in objects:
+            if obj["id"] not in results:
+                results[obj["id"]] = {"id": obj["id"], "type": obj["type"], "success": False,
+                                      "error": "No response from Graph"}
+                retry.append(obj)
+
+    return retry, rate_limited[0]
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor
+
+# Utilities & Services
+from utils.get_socket import get_socketio
+from services.task_manager import check_cancellation, cleanup_task_pid, TaskCanceledException
+from services.file_service import get_media_index, clean_temp_files
+from services.media_processing_service import group_media_by_folder, process_ad_set_groups
+from services.status_service import update_object_statuses
+from services.progress_service import set_phase
+from utils.logging_config import task_log_context
+
+# Where sync manifests are kept between runs (one JSON file per campaign)
+SYNC_MANIFEST_DIR = Path(os.environ.get("SYNC_MANIFEST_DIR", "sync_manifests"))
+
+# Files hashed at once while planning a sync
+MAX_PARALLEL_DIGESTS = 8
+
+_campaign_locks = {}  # Maps campaign IDs to the lock serializing their syncs
+_campaign_locks_lock = Lock()
+
+def manifest_path(ad_account_id, campaign_id):
+    """
+    Returns the path of a campaign's sync manifest.
+
+    Raises:
+        ValueError: If either ID is not numeric (`act_` aside), so a request
+            can never point the path outside SYNC_MANIFEST_DIR.
+    """
+    if not (str(ad_account_id).removeprefix("act_").isdecimal() and str(campaign_id).isdecimal()):
+        raise ValueError(f"Invalid ad account or campaign ID: {ad_account_id!r}, {campaign_id!r}")
+    return SYNC_MANIFEST_DIR / f"{ad_account_id}_{campaign_id}.json"
+
+def load_sync_manifest(ad_account_id, campaign_id):
+    """
+    Loads the sync manifest of a campaign.
+
+    The manifest maps each synced folder (relative to the upload root) to its
+    ad set and each file in it to its content digest and ad:
+
+        {"campaign_id": "...", "ad_sets": {"<folder>": {"ad_set_id": "...", "name": "...",
+            "files": {"<folder>/<file>": {"digest": "...", "ad_id": "..."}}}}}
+
+    Returns:
+        dict: The manifest, or an empty one if the campaign was never synced.
+    """
+    path = manifest_path(ad_account_id, campaign_id)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"campaign_id": campaign_id, "ad_account_id": ad_account_id, "ad_sets": {}}
+
+def save_sync_manifest(manifest):
+    """Writes a sync manifest atomically, so a crash never leaves a half-written file."""
+    path = manifest_path(manifest["ad_account_id"], manifest["campaign_id"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest["updated_at"] = int(time.time())
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def plan_sync(manifest, folder_groups, temp_dir, ad_format):
+    """
+    Diffs an upload against a campaign's sync manifest.
+
+    Single ads are created only for new or changed files. A carousel is one ad
+    per folder, so any change in a folder recreates that folder's carousel.
+
+    Args:
+        manifest (dict): Manifest from `load_sync_manifest`.
+        folder_groups (iterable): (folder_path, ad_set_name, media_files) from `group_media_by_folder`.
+        temp_dir (str or Path): Upload root that relative paths are taken from.
+        ad_format (str): "Single image or video" or "Carousel".
+
+    Returns:
+        dict: `groups` ((ad_set_name, files_to_create, existing_ad_set_id) tuples),
+              `folders` (folder key per file to create), `digests` (by relative path),
+              `replaced` (relative path -> ad ID superseded once the new ad exists),
+              `removed` (relative path -> ad ID of files no longer uploaded) and
+              `added`, `changed` and `unchanged` counts.
+    """
+    temp_dir = Path(temp_dir)
+    folder_groups = list(folder_groups)
+    relative = lambda path: Path(path).relative_to(temp_dir).as_posix()
+
+    # Uploads are hashed while saved; anything else is hashed here, in parallel
+    media_index = get_media_index(temp_dir)
+    all_files = [media_file for _, _, media in folder_groups for media_file in media]
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DIGESTS) as executor:
+        digests = dict(zip(map(relative, all_files), executor.map(media_index.digest, all_files)))
+
+    plan = {"groups": [], "folders": {}, "digests": digests, "replaced": {}, "removed": {},
+            "added": 0, "changed": 0, "unchanged": 0}
+    seen = set()
+
+    for folder_path, ad_set_name, media in folder_groups:
+        folder_key = relative(folder_path)
+        entry = manifest["ad_sets"].get(folder_key, {})
+        known = entry.get("files", {})
+
+        new, changed = [], []
+        for media_file in media:
+            rel = relative(media_file)
+            seen.add(rel)
+            if rel not in known:
+                new.append(media_file)
+            elif known[rel]["digest"] != digests[rel]:
+                changed.append(media_file)
+        plan["added"] += len(new)
+        plan["changed"] += len(changed)
+
+        removed_here = [rel for rel in known if rel not in {relative(m) for m in media}]
+        if ad_format == 'Carousel':
+            to_create = list(media) if (new or changed or removed_here) else []
+            replaced = known if to_create else {}
+        else:
+            to_create = new + changed
+            replaced = {relative(m): known[relative(m)] for m in changed}
+
+        plan["unchanged"] += len(media) - len(new) - len(changed)
+        plan["replaced"].update({rel: info["ad_id"] for rel, info in replaced.items()})
+        if to_create:
+            plan["groups"].append((ad_set_name, to_create, entry.get("ad_set_id")))
+            plan["folders"].update({media_file: folder_key for media_file in to_create})
+
+    for entry in manifest["ad_sets"].values():
+        for rel, info in entry.get("files", {}).items():
+            if rel not in seen:
+                plan["removed"][rel] = info["ad_id"]
+    return plan
+
+@task_log_context
+def process_sync_media(app, task_id, campaign_id, folders, config, total_media, temp_dir):
+    """
+    Media runner for sync mode: creates ads only for files that are new or
+    changed since the campaign's last sync, then updates its manifest.
+
+    With `pause_removed`, ads whose media is no longer uploaded, and ads
+    replaced by a changed file, are paused. Emits `sync_complete` with a summary.
+    Takes the same arguments as `process_media`; `total_media` is replaced by
+    the number of files that actually need an ad.
+    """
+    with _campaign_lock(campaign_id), app.app_context():
+        results = None
+        try:
+            check_cancellation(task_id)
+            manifest = load_sync_manifest(config["ad_account_id"], campaign_id)
+            plan = plan_sync(manifest, group_media_by_folder(folders, temp_dir), temp_dir, config["ad_format"])
+            logging.info(
+                f"Sync plan for campaign {campaign_id}: {plan['added']} added, {plan['changed']} changed, "
+                f"{plan['unchanged']} unchanged, {len(plan['removed'])} removed."
+            )
+
+            to_create = sum(len(media) for _, media, _ in plan["groups"])
+            results = process_ad_set_groups(app, task_id, campaign_id, plan["groups"], config, to_create, temp_dir, clean_up=False)
+            created = _apply_results(manifest, plan, results, temp_dir)
+
+            paused = []
+            stale = {rel: ad_id for rel, ad_id in plan["replaced"].items() if rel in created}
+            if config.get("pause_removed"):
+                paused = _pause_ads(task_id, config, {**stale, **plan["removed"]})
+            for entry in manifest["ad_sets"].values():
+                for rel in plan["removed"]:
+                    # Keep removed files whose ad could not be paused, so the next sync retries
+                    if rel in entry["files"] and (not config.get("pause_removed") or plan["removed"][rel] in paused):
+                        del entry["files"][rel]
+            save_sync_manifest(manifest)
+
+            get_socketio().emit('sync_complete', {
+                'task_id': task_id,
+                'campaign_id': campaign_id,
+                'added': plan["added"],
+                'changed': plan["changed"],
+                'unchanged': plan["unchanged"],
+                'removed': len(plan["removed"]),
+                'created_ads': len(set(created.values())),
+                'paused_ads': len(paused),
+            })
+
+        except TaskCanceledException:
+            logging.warning(f"Task {task_id} has been canceled during sync.")
+            set_phase(task_id, "canceled")
+        except Exception as e:
+            logging.error(f"Error syncing media for campaign {campaign_id}: {e}")
+            get_socketio().emit('error', {'task_id': task_id, 'message': str(e)})
+            set_phase(task_id, "failed", error=str(e))
+        finally:
+            if results is None:
+                cleanup_task_pid(task_id)  # process_ad_set_groups cleans up once it has run
+            clean_temp_files(temp_dir)
+
+def _apply_results(manifest, plan, results, temp_dir):
+    """Records created ad sets and ads in the manifest; returns relative path -> new ad ID."""
+    created = {}
+    for result in results:
+        folder_key = plan["folders"][result["media"][0]]
+        entry = manifest["ad_sets"].setdefault(folder_key, {"files": {}})
+        entry["ad_set_id"] = result["ad_set_id"]
+        entry["name"] = result["ad_set_name"]
+        for media_file, ad_id in result["ads"].items():
+            rel = Path(media_file).relative_to(temp_dir).as_posix()
+            entry["files"][rel] = {"digest": plan["digests"][rel], "ad_id": ad_id}
+            created[rel] = ad_id
+    return created
+
+def _pause_ads(task_id, config, ads):
+    """Pauses the given ads (relative path -> ad ID); returns the IDs that were paused."""
+    ad_ids = sorted(set(ads.values()))
+    if not ad_ids:
+        return []
+    results = update_object_statuses(task_id, config, [{"id": ad_id, "type": "ad"} for ad_id in ad_ids], "PAUSED")
+    for result in results:
+        if not result["success"]:
+            logging.warning(f"Could not pause ad {result['id']}: {result.get('error')}")
+    return [result["id"] for result in results if result["success"]]
+
+def _campaign_lock(campaign_id):
+    """Returns the lock that keeps two syncs of one campaign from racing on its manifest."""
+    with _campaign_locks_lock:
+        return _campaign_locks.setdefault(campaign_id, Lock())
@@ -1,19 +1,203 @@
 import os
 import signal
 import logging
-from threading import Lock
+import time
+from collections import OrderedDict
+from threading import Lock, Event
 from utils.error_handler import emit_error  
 
-# Global storage for task tracking
-upload_tasks = {}  # Tracks active upload tasks
-tasks_lock = Lock()  # Thread-safe lock for shared resources
-canceled_tasks = set()  # Set of canceled task IDs
-process_pids = {}  # Maps task IDs to process PIDs
+# Finished tasks whose state (created objects, last progress) is remembered, least recently used evicted first
+MAX_FINISHED_TASKS = int(os.environ.get("MAX_FINISHED_TASKS", 1000))
+
+# Running tasks with no activity for this long are assumed abandoned and retired
+STALE_TASK_SECONDS = float(os.environ.get("STALE_TASK_SECONDS", 6 * 3600))
+STALE_SWEEP_INTERVAL = 60.0
+
+# Task IDs canceled before their task started, remembered until it does (oldest forgotten first)
+MAX_PENDING_CANCELS = 1000
+
+# Writers lock one of several stripes picked by task ID, so unrelated tasks never contend; reads take no lock
+LOCK_STRIPES = 16
 
 class TaskCanceledException(Exception):
     """Custom exception raised when a task is canceled."""
     pass
 
+class CancellationToken:
+    """
+    Per-task cancellation flag shared by every worker of a task.
+
+    Checking the token is lock-free (a single `Event.is_set()`), so it can be
+    polled from chunk loops and worker threads as often as needed. Canceling
+    wakes anything blocked in `wait()`, kills registered subprocesses and runs
+    registered callbacks (e.g. closing HTTP sessions).
+    """
+    __slots__ = ("task_id", "_event", "_lock", "_processes", "_callbacks")
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self._event = Event()
+        self._lock = Lock()  # Only guards registration, never the hot-path check
+        self._processes = []
+        self._callbacks = []
+
+    def is_canceled(self):
+        """Returns True once the task has been canceled."""
+        return self._event.is_set()
+
+    def raise_if_canceled(self):
+        """
+        Raises:
+            TaskCanceledException: If the task has been canceled.
+        """
+        if self._event.is_set():
+            raise TaskCanceledException(f"Task {self.task_id} has been canceled")
+
+    def wait(self, timeout):
+        """
+        Sleeps for up to `timeout` seconds, waking early on cancellation.
+
+        Returns:
+            bool: True if the task was canceled while waiting.
+        """
+        return self._event.wait(timeout)
+
+    def register_process(self, process):
+        """Tracks a `subprocess.Popen` so it is killed when the task is canceled."""
+        with self._lock:
+            self._processes.append(process)
+        if self._event.is_set():
+            _kill_process(process, self.task_id)
+
+    def unregister_process(self, process):
+        """Stops tracking a subprocess once it has exited."""
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def add_callback(self, callback):
+        """Registers a callable invoked (once) when the task is canceled."""
+        with self._lock:
+            self._callbacks.append(callback)
+        if self._event.is_set():
+            _run_callback(callback, self.task_id)
+
+    def remove_callback(self, callback):
+        """Removes a previously registered cancellation callback."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self):
+        """Marks the task as canceled, kills its subprocesses and runs callbacks."""
+        self._event.set()
+        with self._lock:
+            processes, self._processes = self._processes, []
+            callbacks, self._callbacks = self._callbacks, []
+        for process in processes:
+            _kill_process(process, self.task_id)
+        for callback in callbacks:
+            _run_callback(callback, self.task_id)
+
+def _kill_process(process, task_id):
+    """Kills a subprocess belonging to a canceled task, ignoring already-exited ones."""
+    try:
+        if process.poll() is None:
+            process.kill()
+            logging.info(f"Killed process {process.pid} for task {task_id}.")
+    except (ProcessLookupError, OSError):
+        pass
+
+def _run_callback(callback, task_id):
+    """Runs a cancellation callback without letting its failure abort the cancel."""
+    try:
+        callback()
+    except Exception as e:
+        logging.warning(f"Cancellation callback failed for task {task_id}: {e}")
+
+class TaskState:
+    """
+    Everything tracked for one task: its cancellation token, subprocess PIDs,
+    finish callbacks, the Graph objects it created, its progress record and
+    its memory record.
+    """
+    __slots__ = ("task_id", "token", "active", "pids", "finish_callbacks", "created", "progress", "memory",
+                 "started_at", "finished_at")
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.token = CancellationToken(task_id)
+        self.active = True
+        self.pids = []
+        self.finish_callbacks = []
+        self.created = []  # Object records, see `record_created_object`
+        self.progress = None  # TaskProgress, see `services.progress_service`
+        self.memory = None  # TaskMemory, see `services.memory_service`
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def last_activity(self):
+        progress = self.progress
+        if progress is not None:
+            return max(self.started_at, progress.updated_monotonic)
+        return self.started_at
+
+task_states = {}  # Maps running task IDs to their TaskState
+finished_tasks = OrderedDict()  # Finished task IDs -> TaskState, least recently used first
+pending_cancels = OrderedDict()  # Task IDs canceled before `add_task`, oldest first
+_stripe_locks = [Lock() for _ in range(LOCK_STRIPES)]
+_finished_lock = Lock()
+_last_stale_sweep = [0.0]
+
+def _lock_for(task_id):
+    return _stripe_locks[hash(task_id) % LOCK_STRIPES]
+
+def get_task_state(task_id):
+    """
+    Returns a task's TaskState, running or recently finished, or None.
+
+    Looking up a running task takes no lock.
+    """
+    state = task_states.get(task_id)
+    if state is not None:
+        return state
+    with _finished_lock:
+        state = finished_tasks.get(task_id)
+        if state is not None:
+            finished_tasks.move_to_end(task_id)
+        return state
+
+def ensure_task_state(task_id):
+    """Returns the running TaskState of a task, creating it if needed."""
+    state = task_states.get(task_id)
+    if state is None:
+        with _lock_for(task_id):
+            state = task_states.get(task_id)
+            if state is None:
+                state = task_states[task_id] = TaskState(task_id)
+    return state
+
+def get_cancel_token(task_id):
+    """
+    Returns the cancellation token for a task.
+
+    Looking up a token never registers a task: a task that is not tracked
+    gets a detached token (already canceled if the ID was canceled early).
+
+    Args:
+        task_id (str): Unique identifier for the task.
+
+    Returns:
+        CancellationToken: The task's token.
+    """
+    state = task_states.get(task_id) or get_task_state(task_id)
+    if state is not None:
+        return state.token
+    token = CancellationToken(task_id)
+    if task_id in pending_cancels:
+        token.cancel()
+    return token
+
 def add_task(task_id):
     """
     Adds a task to the upload tracking list.
@@ -21,71 +205,82 @@ def add_task(task_id):
     Args:
         task_id (str): Unique identifier for the task.
     """
-    with tasks_lock:
-        if task_id in upload_tasks:
+    with _lock_for(task_id):
+        if task_id in task_states:
             logging.warning(f"Task {task_id} already exists.")
-        else:
-            upload_tasks[task_id] = True
-            process_pids[task_id] = []
-            logging.info(f"Task {task_id} added successfully.")
+            return
+        state = task_states[task_id] = TaskState(task_id)
+    with _finished_lock:
+        finished_tasks.pop(task_id, None)  # A rerun replaces the old record
+        canceled_early = pending_cancels.pop(task_id, None) is not None
+    if canceled_early:
+        logging.info(f"Task {task_id} was canceled before it started.")
+        state.active = False
+        state.token.cancel()
+    logging.info(f"Task {task_id} added successfully.")
+    _sweep_stale_tasks()
 
 def check_cancellation(task_id):
     """
     Checks if a task has been marked for cancellation.
     If the task is canceled, it raises a `TaskCanceledException` to halt execution.
 
+    The check is lock-free and does not consume the cancellation, so every
+    worker thread of the task observes it.
+
     Args:
         task_id (str): The unique identifier of the task.
 
     Raises:
         TaskCanceledException: If the task has been canceled.
     """
-    with tasks_lock:
-        if task_id in canceled_tasks:
-            logging.info(f"Task {task_id} has been canceled. Raising exception.")
-            canceled_tasks.remove(task_id)  # Remove from cancellation set
-            raise TaskCanceledException(f"Task {task_id} has been canceled")
+    state = task_states.get(task_id)
+    if state is not None and state.token.is_canceled():
+        raise TaskCanceledException(f"Task {task_id} has been canceled")
 
 def cancel_task(task_id):
     """
     Cancels an active task by marking it as canceled and terminating its associated processes.
 
+    An unknown task ID gets a not-found error, but is remembered (up to
+    MAX_PENDING_CANCELS of them), so a task canceled just before it starts
+    is canceled as soon as it does.
+
     Args:
         task_id (str): The unique identifier of the task to cancel.
 
     Returns:
-        dict: Response message indicating the task cancellation status.
+        dict: Response message indicating the task cancellation status;
+              `error` and `not_found` if the task is not running.
     """
     try:
         logging.info(f"Received request to cancel task: {task_id}")
 
-        with tasks_lock:
-            if task_id in canceled_tasks:
+        state = task_states.get(task_id)
+        if state is None:
+            return _cancel_unknown_task(task_id)
+        with _lock_for(task_id):
+            if state.token.is_canceled():
                 logging.info(f"Task {task_id} was already canceled.")
                 return {"message": f"Task {task_id} was already canceled."}
 
-            # Mark task as canceled
-            canceled_tasks.add(task_id)
-
-            # If the task exists in the upload queue, mark it as stopped
-            if task_id in upload_tasks:
-                upload_tasks[task_id] = False  # Stop processing
-
-                # Terminate any associated processes
-                for pid in process_pids.get(task_id, []):
-                    try:
-                        os.kill(pid, signal.SIGTERM)  # Send termination signal
-                        logging.info(f"Terminated process {pid} for task {task_id}.")
-                    except ProcessLookupError:
-                        logging.warning(f"Process {pid} for task {task_id} not found. It may have already exited.")
-
-                # Remove task from active process tracking
-                process_pids.pop(task_id, None)
-                logging.info(f"Task {task_id} successfully marked for cancellation.")
+            # Mark the task as stopped and terminate any associated processes
+            state.active = False
+            pids, state.pids = state.pids, []
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGTERM)  # Send termination signal
+                    logging.info(f"Terminated process {pid} for task {task_id}.")
+                except ProcessLookupError:
+                    logging.warning(f"Process {pid} for task {task_id} not found. It may have already exited.")
+            logging.info(f"Task {task_id} successfully marked for cancellation.")
 
             # Notify the frontend via SocketIO that the task was canceled
             # emit_error(f"Task {task_id} has been canceled.", task_id)
 
+        # Wake sleepers, kill subprocesses and close sessions outside the lock
+        state.token.cancel()
+
         return {"message": f"Task {task_id} has been canceled."}
 
     except Exception as e:
@@ -93,32 +288,135 @@ def cancel_task(task_id):
         emit_error(f"Error canceling task {task_id}: {e}", task_id)
         return {"error": "Failed to cancel task due to internal error."}
 
+def _cancel_unknown_task(task_id):
+    """Answers a cancel for a task that is not running, remembering the ID in case it is about to start."""
+    with _finished_lock:
+        if task_id in finished_tasks:
+            return {"message": f"Task {task_id} has already finished."}
+        pending_cancels[task_id] = time.monotonic()
+        pending_cancels.move_to_end(task_id)
+        while len(pending_cancels) > MAX_PENDING_CANCELS:
+            pending_cancels.popitem(last=False)
+    logging.warning(f"Cancel requested for unknown task {task_id}.")
+    return {"error": f"Task {task_id} not found.", "not_found": True}
+
 def cleanup_task_pid(task_id):
     """
-    Removes process PIDs of a completed task.
-    If the associated PIDs are no longer active, the task is removed from `process_pids`.
-    
+    Retires a completed task once none of its processes are still running.
+
+    Its state moves to the bounded record of finished tasks (so its created
+    objects and final progress stay queryable) and its finish callbacks run.
+
     Args:
         task_id (str): The unique identifier of the task.
     """
-    with tasks_lock:
-        if task_id not in process_pids:
+    with _lock_for(task_id):
+        state = task_states.get(task_id)
+        if state is None:
             logging.warning(f"Task {task_id} not found in process tracking.")
             return
 
         active_pids = []
-        for pid in process_pids[task_id]:
+        for pid in state.pids:
             try:
                 os.kill(pid, 0)  # Check if process is still running (no signal sent)
                 active_pids.append(pid)  # Keep running PIDs
             except OSError:
                 logging.info(f"Process {pid} for task {task_id} has completed and will be removed.")
+        state.pids = active_pids
+        if active_pids:
+            return
+
+        del task_states[task_id]
+        callbacks, state.finish_callbacks = state.finish_callbacks, []
+    _retire(state)
+    logging.info(f"Task {task_id} has been fully completed and removed from tracking.")
+
+    # Run finish callbacks outside the lock; they may take other locks
+    for callback in callbacks:
+        _run_callback(callback, task_id)
+
+def _retire(state):
+    """Moves a task's state to the finished-task record, evicting the least recently used."""
+    state.active = False
+    state.finished_at = time.monotonic()
+    state.pids = []
+    with _finished_lock:
+        finished_tasks[state.task_id] = state
+        finished_tasks.move_to_end(state.task_id)
+        while len(finished_tasks) > MAX_FINISHED_TASKS:
+            finished_tasks.popitem(last=False)
+
+def _sweep_stale_tasks():
+    """Retires running tasks with no activity for STALE_TASK_SECONDS (e.g. cleanup was skipped)."""
+    now = time.monotonic()
+    if now - _last_stale_sweep[0] < STALE_SWEEP_INTERVAL:
+        return
+    _last_stale_sweep[0] = now
+    for task_id, state in list(task_states.items()):
+        if now - state.last_activity() > STALE_TASK_SECONDS and not state.pids:
+            logging.warning(f"Task {task_id} has been inactive for {STALE_TASK_SECONDS:.0f}s; retiring it.")
+            cleanup_task_pid(task_id)
+
+def on_task_finished(task_id, callback):
+    """
+    Registers a callable run once a task has been fully cleaned up
+    (see `cleanup_task_pid`), e.g. to release capacity the task held.
+
+    If the task is not running, the callback runs immediately.
+
+    Args:
+        task_id (str): The task to watch.
+        callback (callable): Called with no arguments.
+    """
+    with _lock_for(task_id):
+        state = task_states.get(task_id)
+        if state is not None:
+            state.finish_callbacks.append(callback)
+            return
+    _run_callback(callback, task_id)
+
+def record_created_object(task_id, object_type, object_id, **details):
+    """
+    Records a Graph object created by a task so it can be acted on later
+    (e.g. activated in bulk), even after the task has finished.
+
+    Args:
+        task_id (str): The task that created the object.
+        object_type (str): "campaign", "adset" or "ad".
+        object_id (str): The new object's ID.
+        **details: Extra fields to keep, such as `name` or `ad_set_id`.
+    """
+    if not object_id:
+        return
+    state = get_task_state(task_id) or ensure_task_state(task_id)
+    state.created.append({"id": str(object_id), "type": object_type, **details})  # list.append is atomic
+
+def get_created_objects(task_id, object_types=None, ids=None, ad_set_ids=None):
+    """
+    Returns the objects a task created, optionally filtered.
+
+    Args:
+        task_id (str): The task to look up.
+        object_types (list, optional): Keep only these types ("campaign", "adset", "ad").
+        ids (list, optional): Keep only these object IDs.
+        ad_set_ids (list, optional): Keep only ad sets with these IDs and ads inside them.
+
+    Returns:
+        list: Matching object records, in creation order.
+    """
+    state = get_task_state(task_id)
+    objects = list(state.created) if state else []
 
-        if not active_pids:
-            # If no active PIDs remain, remove task from tracking
-            process_pids.pop(task_id, None)
-            upload_tasks.pop(task_id, None)
-            logging.info(f"Task {task_id} has been fully completed and removed from tracking.")
-        else:
-            # Update with only active PIDs
-            process_pids[task_id] = active_pids
+    if object_types:
+        objects = [o for o in objects if o["type"] in object_types]
+    if ids:
+        ids = {str(i) for i in ids}
+        objects = [o for o in objects if o["id"] in ids]
+    if ad_set_ids:
+        ad_set_ids = {str(i) for i in ad_set_ids}
+        objects = [
+            o for o in objects
+            if (o["type"] == "adset" and o["id"] in ad_set_ids) or o.get("ad_set_id") in ad_set_ids
+        ]
+    return objects
@@ -0,0 +1,82 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from services.progress_service import count_stage
+from utils.logging_config import log_context
+
+# Weight of the newest sample in the moving averages
+SMOOTHING = 0.2
+
+# Used until a stage has been observed (seconds; uploads also assume a throughput)
+DEFAULT_STAGE_SECONDS = {
+    "ad_set": 1.5,
+    "creative": 1.0,
+    "ad": 1.0,
+    "image_upload": 1.5,
+    "video_upload": 10.0,
+    "video_processing": 60.0,
+    "thumbnail": 1.0,
+}
+DEFAULT_BYTES_PER_SECOND = 5_000_000
+
+stage_timings = {}  # Maps stage names to {"seconds", "bytes_per_second", "samples"}
+_timings_lock = Lock()
+
+def record_stage(stage, seconds, size=None, task_id=None):
+    """
+    Folds one observed duration (and, for transfers, its size) into the
+    stage's moving averages.
+
+    Args:
+        stage (str): Stage name, e.g. "ad_set" or "video_upload".
+        seconds (float): How long the stage took.
+        size (int, optional): Bytes transferred, for upload stages.
+        task_id (str, optional): Task whose per-stage counters should count it too.
+    """
+    if task_id:
+        count_stage(task_id, stage, seconds)
+    with _timings_lock:
+        timing = stage_timings.get(stage)
+        if timing is None:
+            timing = stage_timings[stage] = {"seconds": seconds, "bytes_per_second": None, "samples": 0}
+        else:
+            timing["seconds"] += SMOOTHING * (seconds - timing["seconds"])
+        if size and seconds > 0:
+            rate = size / seconds
+            previous = timing["bytes_per_second"]
+            timing["bytes_per_second"] = rate if previous is None else previous + SMOOTHING * (rate - previous)
+        timing["samples"] += 1
+
+@contextmanager
+def timed_stage(stage, size=None, task_id=None):
+    """
+    Records how long the block takes as a sample of `stage`; failed blocks are not recorded.
+    Records logged inside the block are tagged with the stage.
+    """
+    started = time.monotonic()
+    with log_context(stage=stage, task_id=task_id):
+        yield
+    record_stage(stage, time.monotonic() - started, size, task_id)
+
+def estimate_stage(stage, size=None):
+    """
+    Estimates how long a stage will take, from recorded timings or defaults.
+
+    Transfers with a known `size` use the observed throughput.
+
+    Returns:
+        float: Estimated seconds.
+    """
+    timing = stage_timings.get(stage)
+    if size:
+        rate = (timing or {}).get("bytes_per_second") or DEFAULT_BYTES_PER_SECOND
+        return size / rate
+    if timing:
+        return timing["seconds"]
+    return DEFAULT_STAGE_SECONDS.get(stage, 1.0)
+
+def get_stage_timings():
+    """Returns a copy of the recorded timings, with each stage's sample count."""
+    with _timings_lock:
+        return {stage: dict(timing) for stage, timing in stage_timings.items()}
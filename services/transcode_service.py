@@ -0,0 +1,328 @@
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from threading import Lock
+
+# Concurrency tools
+from concurrent.futures import ThreadPoolExecutor
+
+# Utilities & Services
+from services.task_manager import get_cancel_token, check_cancellation, on_task_finished
+from services.file_service import get_media_index, media_kind
+from services.probe_service import probe_media
+
+# Transcoded outputs, named by source digest and profile so reruns reuse them
+TRANSCODE_CACHE_DIR = Path(os.environ.get("TRANSCODE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "fb_ads_transcodes")))
+
+# Disk the cache may use; least recently used outputs beyond it are deleted, unless a running task needs them
+TRANSCODE_CACHE_MAX_BYTES = int(os.environ.get("TRANSCODE_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+
+# Cache entries remembered in memory, and how old a partial output must be to count as abandoned (seconds)
+MAX_CACHED_OUTPUTS = 10000
+STALE_PARTIAL_SECONDS = 3600
+
+# ffmpeg processes run at once; each one already uses several cores
+MAX_PARALLEL_TRANSCODES = max(1, (os.cpu_count() or 2) // 2)
+
+# Uplink speed used to estimate the upload time a smaller file saves
+UPLOAD_BYTES_PER_SECOND = float(os.environ.get("UPLOAD_MBPS", "50")) * 1_000_000 / 8
+
+# Target profiles: the shorter side is capped at `max_short_side` and files
+# already under `max_bitrate` (bits/s) in an MP4/H.264 container are left alone
+TRANSCODE_PROFILES = {
+    "1080p": {"max_short_side": 1080, "crf": 23, "preset": "veryfast", "max_bitrate": 8_000_000, "audio_bitrate": "128k"},
+    "720p": {"max_short_side": 720, "crf": 24, "preset": "veryfast", "max_bitrate": 5_000_000, "audio_bitrate": "128k"},
+    "4k": {"max_short_side": 2160, "crf": 22, "preset": "fast", "max_bitrate": 35_000_000, "audio_bitrate": "192k"},
+}
+DEFAULT_PROFILE = "1080p"
+
+_outputs = OrderedDict()  # Maps (digest, profile) to the transcoded file, or "" when the original was smaller; LRU
+_in_use = Counter()  # Cached outputs -> running tasks that will upload them
+_transcoding = {}  # Maps (digest, profile) to [lock, waiters], so one transcode per key runs at a time
+_outputs_lock = Lock()
+
+def get_transcode_profile(config):
+    """Returns the task's profile: a name from TRANSCODE_PROFILES, optionally with overrides."""
+    profile = dict(TRANSCODE_PROFILES.get(config.get("transcode_profile") or DEFAULT_PROFILE, TRANSCODE_PROFILES[DEFAULT_PROFILE]))
+    profile.update(config.get("transcode_overrides") or {})
+    return profile
+
+def is_within_budget(probe, profile):
+    """Returns True if a probed video already meets the profile and needs no transcode."""
+    width, height, duration = probe.get("width"), probe.get("height"), probe.get("duration")
+    if not (width and height and duration):
+        return True  # Nothing to judge by; upload as is
+    bitrate = probe["size"] * 8 / duration
+    return (
+        min(width, height) <= profile["max_short_side"]
+        and bitrate <= profile["max_bitrate"]
+        and probe.get("codec") == "h264"
+        and "mp4" in (probe.get("format") or "")
+    )
+
+def build_ffmpeg_command(source, output, profile):
+    """Builds the ffmpeg command that re-encodes `source` to a faststart H.264 MP4."""
+    short_side = profile["max_short_side"]
+    scale = (
+        f"scale=w='if(gt(iw,ih),-2,min({short_side},iw))'"
+        f":h='if(gt(iw,ih),min({short_side},ih),-2)'"
+    )
+    return [
+        'ffmpeg', '-y', '-v', 'error', '-i', source,
+        '-vf', scale,
+        '-c:v', 'libx264', '-preset', profile["preset"], '-crf', str(profile["crf"]),
+        '-maxrate', str(profile["max_bitrate"]), '-bufsize', str(profile["max_bitrate"] * 2),
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', profile["audio_bitrate"],
+        '-movflags', '+faststart',
+        output,
+    ]
+
+def transcode_video(source, output, profile, task_id=None):
+    """
+    Runs ffmpeg for one file, killing it if the task is canceled.
+
+    Returns:
+        bool: True if the output was written.
+    """
+    command = build_ffmpeg_command(source, output, profile)
+    # Unique per run, so a failed or canceled run never touches another's partial file
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(output) or ".", prefix=f"{Path(output).stem}.", suffix=".part.mp4")
+    os.close(fd)
+    command[-1] = partial
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        os.remove(partial)
+        logging.warning("ffmpeg is not installed; skipping transcoding.")
+        return False
+
+    token = get_cancel_token(task_id) if task_id else None
+    if token:
+        token.register_process(process)
+    try:
+        _, stderr = process.communicate()
+    finally:
+        if token:
+            token.unregister_process(process)
+
+    if process.returncode != 0:
+        if os.path.exists(partial):
+            os.remove(partial)
+        if token:
+            token.raise_if_canceled()
+        logging.error(f"ffmpeg failed for {source}: {stderr.decode(errors='replace').strip()}")
+        return False
+
+    os.replace(partial, output)  # Only complete outputs are ever visible in the cache
+    return True
+
+def _remember(key, output):
+    with _outputs_lock:
+        _outputs[key] = output
+        _outputs.move_to_end(key)
+        while len(_outputs) > MAX_CACHED_OUTPUTS:
+            _outputs.popitem(last=False)
+
+@contextmanager
+def _transcode_slot(key, task_id):
+    """
+    Holds the per-key lock while a file is looked up and transcoded, so a
+    second task (or folder) with the same video waits for the first output
+    instead of running ffmpeg on it too. Waiting still notices cancellation.
+    """
+    with _outputs_lock:
+        slot = _transcoding.setdefault(key, [Lock(), 0])
+        slot[1] += 1
+    try:
+        while not slot[0].acquire(timeout=1):
+            check_cancellation(task_id)
+        try:
+            yield
+        finally:
+            slot[0].release()
+    finally:
+        with _outputs_lock:
+            slot[1] -= 1
+            if not slot[1]:
+                del _transcoding[key]
+
+def _release(outputs):
+    """Drops a finished task's hold on its cached outputs."""
+    with _outputs_lock:
+        for output in outputs:
+            _in_use[output] -= 1
+            if _in_use[output] <= 0:
+                del _in_use[output]
+
+def enforce_cache_quota(max_bytes=TRANSCODE_CACHE_MAX_BYTES):
+    """
+    Deletes the least recently used outputs until the cache fits in
+    `max_bytes`, skipping outputs a running task will still upload. Partial
+    outputs abandoned by a crash are deleted too.
+
+    Returns:
+        int: Bytes freed.
+    """
+    now = time.time()
+    entries = []
+    total = 0
+    try:
+        scan = os.scandir(TRANSCODE_CACHE_DIR)
+    except FileNotFoundError:
+        return 0
+    with scan:
+        for entry in scan:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if ".part" in entry.name:
+                if now - stat.st_mtime > STALE_PARTIAL_SECONDS:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+                continue
+            entries.append((stat.st_mtime, entry.path, stat.st_size))  # mtime is refreshed on every cache hit
+            total += stat.st_size
+
+    freed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        with _outputs_lock:
+            if _in_use.get(path):
+                continue
+            for key in [key for key, output in _outputs.items() if output == path]:
+                del _outputs[key]
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        total -= size
+        freed += size
+    if freed:
+        logging.info(f"Transcode cache over quota; deleted {freed / 1024 / 1024:.0f} MB of least recently used outputs.")
+    return freed
+
+def transcode_media(task_id, groups, config, temp_dir=None):
+    """
+    Shrinks a task's videos before upload, in parallel.
+
+    Files already within the profile's budget are skipped. When the output
+    is not smaller than the original, the original is kept. Outputs are cached
+    by source digest, so the same video is transcoded once across tasks, and
+    held until the task finishes; the cache is kept within
+    TRANSCODE_CACHE_MAX_BYTES by evicting the least recently used. The
+    chosen files are recorded in `config['transcoded']` (source -> file to
+    upload), which the upload paths read.
+
+    Args:
+        task_id (str): Task used for cancellation.
+        groups (list): (ad_set_name, media_files[, ad_set_id]) tuples.
+        config (dict): Task config; `transcode_profile` / `transcode_overrides` select the profile.
+        temp_dir (str, optional): Staging directory, for cached digests.
+
+    Returns:
+        dict: Report with `files`, `transcoded`, `bytes_before`, `bytes_after`,
+              `bytes_saved`, `transcode_seconds` and `upload_seconds_saved` (estimated).
+    """
+    profile = get_transcode_profile(config)
+    profile_key = hashlib.sha1(repr(sorted(profile.items())).encode()).hexdigest()[:12]
+    videos = [f for _, media, *_ in groups for f in media if media_kind(f) == "video"]
+    media_index = get_media_index(temp_dir) if temp_dir else None
+    TRANSCODE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    held = []  # Cached outputs this task uses, protected from eviction until it finishes
+
+    def hold(output):
+        """Marks a cached output as in use; False if it has been evicted. Call with `_outputs_lock` held."""
+        if not os.path.exists(output):
+            return False
+        _in_use[output] += 1
+        held.append(output)
+        try:
+            os.utime(output)  # Recently used
+        except OSError:
+            pass
+        return True
+
+    def shrink(source):
+        check_cancellation(task_id)
+        original_size = os.path.getsize(source)
+        probe = probe_media(source, temp_dir, task_id)
+        if is_within_budget(probe, profile):
+            return source, original_size, original_size, 0.0
+
+        digest = media_index.digest(source) if media_index else None
+        key = (digest, profile_key)
+        with _transcode_slot(key, task_id) if digest else nullcontext():
+            with _outputs_lock:
+                cached = _outputs.get(key) if digest else None
+                if cached:
+                    _outputs.move_to_end(key)
+                    cached = cached if hold(cached) else None
+            if cached == "":
+                return source, original_size, original_size, 0.0  # Transcoding did not help last time
+            if cached:
+                return cached, original_size, os.path.getsize(cached), 0.0
+
+            name = digest or f"{Path(source).stem}-{uuid.uuid4().hex[:12]}"  # Without a digest the output is never reused
+            output = str(TRANSCODE_CACHE_DIR / f"{name}_{profile_key}.mp4")
+            started = time.monotonic()
+            with _outputs_lock:
+                reusable = digest and hold(output)  # Left by an earlier run of the server
+            if not reusable:
+                if not transcode_video(source, output, profile, task_id):
+                    return source, original_size, original_size, time.monotonic() - started
+                with _outputs_lock:
+                    hold(output)
+            elapsed = time.monotonic() - started
+
+            # Keep whichever file is smaller
+            chosen = output if os.path.getsize(output) < original_size else source
+            if chosen == source:
+                with _outputs_lock:
+                    _in_use[output] -= 1
+                    held.remove(output)
+                    if _in_use[output] <= 0:
+                        del _in_use[output]
+                        os.remove(output)
+            if digest:
+                _remember(key, output if chosen == output else "")
+            if not reusable:
+                enforce_cache_quota()
+            return chosen, original_size, os.path.getsize(chosen), elapsed
+
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_TRANSCODES) as executor:
+            results = list(executor.map(shrink, videos))
+    finally:
+        on_task_finished(task_id, lambda: _release(held))  # Runs at once if the task is not tracked
+
+    transcoded = config.setdefault("transcoded", {})
+    report = {"files": len(videos), "transcoded": 0, "bytes_before": 0, "bytes_after": 0, "transcode_seconds": 0.0}
+    for source, (chosen, before, after, seconds) in zip(videos, results):
+        if chosen != source:
+            transcoded[source] = chosen
+            report["transcoded"] += 1
+        report["bytes_before"] += before
+        report["bytes_after"] += after
+        report["transcode_seconds"] += seconds
+
+    report["bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+    report["upload_seconds_saved"] = round(report["bytes_saved"] / UPLOAD_BYTES_PER_SECOND, 1)
+    report["transcode_seconds"] = round(report["transcode_seconds"], 1)
+    logging.info(f"Transcoding for task {task_id}: {report}")
+    return report
+
+def upload_path(config, media_file):
+    """Returns the file to upload for `media_file` (its transcoded output, if any)."""
+    return (config.get("transcoded") or {}).get(media_file, media_file)
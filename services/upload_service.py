@@ -3,30 +3,112 @@ import time
 import os
 import requests
 import subprocess
+from concurrent.futures import Future
+from threading import Event, Lock, Thread
 
 # Facebook Ads SDK
-from facebook_business.adobjects.advideo import AdVideo
 from facebook_business.adobjects.adimage import AdImage
 
 # External libraries
 from PIL import Image
 
 #utils and services
-from utils.error_handler import emit_error
-from services.task_manager import check_cancellation
+from utils.error_handler import emit_error, GraphAPIError
+from utils.facebook_client import get_api_for_config
+from services.task_manager import check_cancellation, get_cancel_token, TaskCanceledException
+from services.retry_service import call_with_retry
+from services.transcode_service import upload_path
+from services.progress_service import add_uploaded_bytes
+from services.timing_service import timed_stage, record_stage
+from services.watchdog_service import blocking
+from utils.logging_config import task_log_context
 
+GRAPH_VIDEO_URL = "https://graph-video.facebook.com/v19.0"
+REQUEST_TIMEOUT = (10, 120)  # (connect, read) seconds for Graph video requests
 
-def extract_thumbnail(video_path):
-    """Extracts the first frame (or closest keyframe) of a video using FFmpeg."""
+# Where video thumbnails come from: frames Graph generated while processing the
+# video (no extra work), or a frame extracted locally with ffmpeg and uploaded.
+# ffmpeg stays the default so existing ads keep the thumbnails they always had.
+THUMBNAIL_SOURCES = ("graph", "ffmpeg")
+DEFAULT_THUMBNAIL_SOURCE = "ffmpeg"
+DEFAULT_THUMBNAIL_TIME = "00:00:01.000"
+
+
+class UploadCache:
+    """
+    Shares upload results between tasks that reference the same staged file.
+
+    Keys are (ad_account_id, kind, path). Concurrent requests for the same key
+    wait for the first upload instead of sending the bytes again; failed
+    uploads are not cached so a later request can retry them. If the first
+    upload's task is canceled, waiters from other tasks upload it themselves.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._futures = {}
+
+    def get_or_upload(self, key, upload):
+        while True:
+            with self._lock:
+                future = self._futures.get(key)
+                owner = future is None
+                if owner:
+                    future = self._futures[key] = Future()
+            if owner:
+                break
+            try:
+                return future.result()
+            except TaskCanceledException:
+                continue  # The owner's task was canceled, not ours: take over the upload
+
+        try:
+            result = upload()
+        except BaseException as e:
+            with self._lock:
+                self._futures.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        if not result or result == (None, None):
+            with self._lock:
+                self._futures.pop(key, None)
+        future.set_result(result)
+        return result
+
+def _cached(config, kind, media_file, upload):
+    """Runs `upload` through the config's UploadCache, if the task has one."""
+    cache = config.get('upload_cache')
+    if cache is None:
+        return upload()
+    return cache.get_or_upload((config['ad_account_id'], kind, os.path.realpath(media_file)), upload)
+
+def extract_thumbnail(video_path, task_id=None, frame_time=DEFAULT_THUMBNAIL_TIME):
+    """Extracts the frame at `frame_time` (or closest keyframe) of a video using FFmpeg."""
     try:
-        thumbnail_path = os.path.splitext(video_path)[0] + "_thumbnail.jpg"
+        thumbnail_path = video_path + ".thumbnail.jpg"  # Appended, so a staged "<name>_thumbnail.jpg" link is never written through
         command = [
             'ffmpeg', '-i', video_path, 
-            '-ss', '00:00:01.000', '-vframes', '1', 
+            '-ss', frame_time, '-vframes', '1', 
             '-preset', 'ultrafast', '-threads', '4', 
             '-update', '1', thumbnail_path
         ]
-        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # Register the process so canceling the task kills it immediately
+        token = get_cancel_token(task_id) if task_id else None
+        if token:
+            token.register_process(process)
+        try:
+            returncode = process.wait()
+        finally:
+            if token:
+                token.unregister_process(process)
+
+        if token:
+            token.raise_if_canceled()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
 
         if os.path.exists(thumbnail_path):
             return thumbnail_path
@@ -38,79 +120,404 @@ def extract_thumbnail(video_path):
         logging.error(f"FFmpeg error: {e}")
         return None
 
+@blocking
 def convert_webp_to_jpeg(webp_file):
-    jpeg_file = os.path.splitext(webp_file)[0] + ".jpg"
+    """Decodes a WebP image and saves it as JPEG next to it (CPU-bound; runs off the hub)."""
+    # A distinct name, so a staged "<name>.jpg" (possibly a link to a source file) is never overwritten
+    jpeg_file = webp_file + ".jpg"
     with Image.open(webp_file) as img:
         img.convert("RGB").save(jpeg_file, "JPEG")
     return jpeg_file
 
-def poll_video_status(video_id, access_token, timeout=600, poll_interval=5):
+def poll_video_status(video_id, access_token, timeout=600, poll_interval=5, task_id=None):
     session = requests.Session()
-    status_url = f"https://graph-video.facebook.com/v19.0/{video_id}"
+    status_url = f"{GRAPH_VIDEO_URL}/{video_id}"
     params = {"fields": "status", "access_token": access_token}
 
+    # Canceling the task interrupts the request in flight, closes the session and wakes the sleep below
+    token = get_cancel_token(task_id) if task_id else None
+    if token:
+        token.add_callback(session.close)
+
     start_time = time.time()
 
+    try:
+        return _poll_video_status(session, video_id, status_url, params, start_time, timeout, poll_interval, token)
+    finally:
+        if token:
+            token.remove_callback(session.close)
+        session.close()
+
+def _poll_video_status(session, video_id, status_url, params, start_time, timeout, poll_interval, token):
     while time.time() - start_time < timeout:
+        if token:
+            token.raise_if_canceled()
         try:
-            response = session.get(status_url, params=params).json()
+            response = _run_cancelable(token, session.get, status_url, params=params, timeout=REQUEST_TIMEOUT).json()
             status = response.get("status", {}).get("video_status", "unknown")
 
             if status == "ready":
-                print(f"✅ Video {video_id} is ready for use!")
+                logging.info(f"Video {video_id} is ready for use.", extra={"hot_path": "video_ready"})
                 return True
             elif status in ["processing", "uploading"]:
-                print(f"⏳ Video {video_id} still processing... Retrying in {poll_interval} seconds.")
+                logging.debug(f"Video {video_id} still processing; polling again in {poll_interval} seconds.",
+                              extra={"hot_path": "video_poll"})
             else:
-                print(f"Unexpected video status: {status}")
+                logging.warning(f"Unexpected status for video {video_id}: {status}")
                 return False
 
         except Exception as e:
+            if token and token.is_canceled():
+                raise TaskCanceledException(f"Task {token.task_id} has been canceled")
             logging.error(f"Error polling video status: {e}")
 
-        time.sleep(poll_interval)
+        if token:
+            if token.wait(poll_interval):
+                token.raise_if_canceled()
+        else:
+            time.sleep(poll_interval)
         poll_interval = min(30, poll_interval + 5)  
 
-    print(f"⚠️ Video {video_id} did not finish processing within {timeout} seconds.")
+    logging.warning(f"Video {video_id} did not finish processing within {timeout} seconds.")
     return False
 
+def _run_cancelable(token, func, *args, **kwargs):
+    """
+    Runs a blocking HTTP call so that canceling the task interrupts it.
+
+    Closing a session does not abort a request already on the wire, which
+    can block for the whole read timeout. The call therefore runs on a
+    helper thread while this one waits for it or for the cancel, whichever
+    comes first. A canceled call is abandoned: the helper thread ends by
+    itself within REQUEST_TIMEOUT.
+
+    Raises:
+        TaskCanceledException: If the task is canceled before the call returns.
+    """
+    if token is None:
+        return func(*args, **kwargs)
+    token.raise_if_canceled()
+
+    done = Event()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    token.add_callback(done.set)
+    try:
+        Thread(target=run, name=f"graph-request-{token.task_id}", daemon=True).start()
+        done.wait()
+    finally:
+        token.remove_callback(done.set)
+
+    token.raise_if_canceled()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+def _post_graph(session, url, data, files=None, token=None):
+    """
+    Posts to the Graph API and returns the JSON body, raising GraphAPIError on errors.
+
+    With a cancellation token, a cancel interrupts the request (see `_run_cancelable`).
+    """
+    response = _run_cancelable(token, session.post, url, data=data, files=files, timeout=REQUEST_TIMEOUT)
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if response.status_code >= 400 or "error" in body:
+        raise GraphAPIError.from_response(response.status_code, body)
+    return body
+
+def upload_video_file(video_file, task_id, config):
+    """
+    Uploads a video to the ad account using Graph's resumable (chunked) upload.
+
+    The task's cancellation token is checked before every chunk and
+    interrupts the request in flight (see `_run_cancelable`), so a cancel
+    takes effect at once rather than after the chunk or its read timeout.
+    A chunk that fails transiently is retried from its own offset, so the
+    upload resumes instead of starting over.
+
+    Args:
+        video_file (str): Path to the video file.
+        task_id (str): Unique task identifier.
+        config (dict): Campaign configuration with `ad_account_id` and `access_token`.
+
+    Returns:
+        str: The uploaded video ID, or None if Graph did not return one.
+
+    Raises:
+        TaskCanceledException: If the task is canceled mid-upload.
+    """
+    token = get_cancel_token(task_id)
+    ad_account_id = config['ad_account_id']
+    upload_url = f"{GRAPH_VIDEO_URL}/{ad_account_id}/advideos"
+    access_token = config['access_token']
+    file_size = os.path.getsize(video_file)
+
+    session = requests.Session()
+    token.add_callback(session.close)
+    try:
+        token.raise_if_canceled()
+        start = call_with_retry(_post_graph, session, upload_url, {
+            "access_token": access_token,
+            "upload_phase": "start",
+            "file_size": file_size,
+        }, token=token, task_id=task_id, ad_account_id=ad_account_id, description=f"Video upload start for {video_file}")
+        upload_session_id = start["upload_session_id"]
+        video_id = start.get("video_id")
+        start_offset = int(start["start_offset"])
+        end_offset = int(start["end_offset"])
+
+        with open(video_file, "rb") as f:
+            while start_offset < end_offset:
+                token.raise_if_canceled()
+                f.seek(start_offset)
+                chunk = f.read(end_offset - start_offset)
+
+                offsets = call_with_retry(_post_graph, session, upload_url, {
+                    "access_token": access_token,
+                    "upload_phase": "transfer",
+                    "upload_session_id": upload_session_id,
+                    "start_offset": start_offset,
+                }, files={"video_file_chunk": (os.path.basename(video_file), chunk)}, token=token,
+                    task_id=task_id, ad_account_id=ad_account_id,
+                    description=f"Video chunk at offset {start_offset} of {video_file}")
+                add_uploaded_bytes(task_id, len(chunk))
+                start_offset = int(offsets["start_offset"])
+                end_offset = int(offsets["end_offset"])
+
+        token.raise_if_canceled()
+        call_with_retry(_post_graph, session, upload_url, {
+            "access_token": access_token,
+            "upload_phase": "finish",
+            "upload_session_id": upload_session_id,
+        }, token=token, task_id=task_id, ad_account_id=ad_account_id, description=f"Video upload finish for {video_file}")
+        return video_id
+
+    except requests.RequestException:
+        # A cancel closes the session, which surfaces as a connection error
+        token.raise_if_canceled()
+        raise
+    finally:
+        token.remove_callback(session.close)
+        session.close()
+
+def _source_config(config):
+    """
+    Returns the config of the fan-out source account when assets for this
+    account should be copied from it instead of uploaded, else None.
+    """
+    source_account = config.get('source_ad_account_id')
+    if not source_account or source_account == config['ad_account_id']:
+        return None
+    return {**config, 'ad_account_id': source_account}
+
+def copy_image_to_account(image_hash, source_ad_account_id, task_id, config):
+    """
+    Copies an image server-side from another ad account with Graph's `copy_from`.
+
+    Args:
+        image_hash (str): Hash of the image in the source account.
+        source_ad_account_id (str): Ad account the image was uploaded to.
+        task_id (str): Unique task identifier.
+        config (dict): Configuration of the target account.
+
+    Returns:
+        str: The image hash in the target account, or None.
+    """
+    response = call_with_retry(
+        get_api_for_config(config).call, 'POST', (config['ad_account_id'], 'adimages'),
+        params={'copy_from': {'source_account_id': source_ad_account_id.replace('act_', ''), 'hash': image_hash}},
+        task_id=task_id, ad_account_id=config['ad_account_id'], description=f"Image copy of {image_hash}",
+    )
+    images = response.json().get('images', {})
+    return next(iter(images.values()), {}).get('hash')
+
+def copy_video_to_account(video_id, task_id, config):
+    """
+    Re-creates a processed video in another ad account from its hosted source URL,
+    so Graph fetches the file itself instead of us uploading it again.
+
+    Returns:
+        str: The video ID in the target account once it is ready, or None.
+    """
+    api = get_api_for_config(config)
+    ad_account_id = config['ad_account_id']
+
+    source = call_with_retry(
+        api.call, 'GET', (video_id,), params={'fields': 'source'},
+        task_id=task_id, ad_account_id=ad_account_id, description=f"Video source for {video_id}",
+    ).json().get('source')
+    if not source:
+        return None
+
+    response = call_with_retry(
+        api.call, 'POST', (ad_account_id, 'advideos'), params={'file_url': source},
+        task_id=task_id, ad_account_id=ad_account_id, idempotent=False, description=f"Video copy of {video_id}",
+    )
+    new_video_id = response.json().get('id')
+    if new_video_id and poll_video_status(new_video_id, config['access_token'], task_id=task_id):
+        return new_video_id
+    return None
+
+def is_thumbnail_url(thumbnail):
+    """Returns True for a Graph-hosted thumbnail URL, False for an uploaded image hash."""
+    return bool(thumbnail) and thumbnail.startswith(("http://", "https://"))
+
+def use_graph_thumbnails(config):
+    """Returns True if the task opted into video thumbnails from Graph instead of ffmpeg."""
+    return (config.get('thumbnail_source') or DEFAULT_THUMBNAIL_SOURCE) == 'graph' and not config.get('thumbnail_time')
+
+def pick_thumbnail(thumbnails):
+    """Returns the URI of the preferred thumbnail in a Graph `thumbnails` list, else the first."""
+    preferred = next((t for t in thumbnails if t.get('is_preferred')), None)
+    chosen = preferred or (thumbnails[0] if thumbnails else {})
+    return chosen.get('uri')
+
+def fetch_graph_thumbnail(video_id, task_id, config):
+    """
+    Fetches the thumbnail Graph generated for a processed video.
+
+    Returns:
+        str: The thumbnail URL, or None if Graph has none.
+    """
+    response = call_with_retry(
+        get_api_for_config(config).call, 'GET', (video_id, 'thumbnails'), params={'fields': 'uri,is_preferred'},
+        task_id=task_id, ad_account_id=config['ad_account_id'], description=f"Thumbnails of {video_id}",
+    )
+    return pick_thumbnail(response.json().get('data', []))
+
+def get_video_thumbnail(app, video_id, video_file, task_id, config):
+    """
+    Returns the thumbnail for a processed video: Graph's own when enabled and
+    available, otherwise a locally extracted frame uploaded as an image.
+
+    Returns:
+        str: A thumbnail URL or image hash, or None.
+    """
+    if use_graph_thumbnails(config):
+        try:
+            thumbnail_url = fetch_graph_thumbnail(video_id, task_id, config)
+            if thumbnail_url:
+                return thumbnail_url
+            logging.info(f"No Graph thumbnail for video {video_id}; extracting one with ffmpeg.")
+        except TaskCanceledException:
+            raise
+        except Exception as e:
+            logging.warning(f"Fetching Graph thumbnail for video {video_id} failed: {e}")
+
+    thumbnail_path = extract_thumbnail(video_file, task_id, config.get('thumbnail_time') or DEFAULT_THUMBNAIL_TIME)
+    if thumbnail_path:
+        return upload_image(app, thumbnail_path, task_id, config)
+    return None
+
+@task_log_context
 def upload_video(app, video_file, task_id, config):
     """Uploads a video, extracts its first frame as a thumbnail, and uploads the thumbnail."""
+    video_file = upload_path(config, video_file)  # Transcoded output, when the task shrank it
+    return _cached(config, 'video', video_file, lambda: _upload_or_copy_video(app, video_file, task_id, config))
+
+def _upload_or_copy_video(app, video_file, task_id, config):
+    """Uploads a video, or copies it from the fan-out source account when there is one."""
+    source_config = _source_config(config)
+    if source_config is None:
+        return _upload_video(app, video_file, task_id, config)
+
+    # Upload once to the source account (cached), then copy it over
+    source_video_id, source_thumbnail_hash = upload_video(app, video_file, task_id, source_config)
+    if not source_video_id:
+        return None, None
+
+    with app.app_context():
+        try:
+            video_id = copy_video_to_account(source_video_id, task_id, config)
+            if is_thumbnail_url(source_thumbnail_hash):
+                thumbnail_hash = source_thumbnail_hash  # Hosted by Graph; usable from any account
+            else:
+                thumbnail_hash = source_thumbnail_hash and copy_image_to_account(
+                    source_thumbnail_hash, source_config['ad_account_id'], task_id, config
+                )
+            if video_id and thumbnail_hash:
+                return video_id, thumbnail_hash
+        except TaskCanceledException:
+            raise
+        except Exception as e:
+            logging.warning(f"Copying video {source_video_id} to {config['ad_account_id']} failed: {e}")
+
+    logging.info(f"Falling back to a direct upload of {video_file} to {config['ad_account_id']}")
+    return _upload_video(app, video_file, task_id, config)
+
+def _upload_video(app, video_file, task_id, config):
 
     with app.app_context():  
         try:
             check_cancellation(task_id)
-            video = AdVideo(parent_id=config['ad_account_id'])
-            video[AdVideo.Field.filepath] = video_file
-            video.remote_create()
-            video_id = video.get_id()
+            with timed_stage("video_upload", os.path.getsize(video_file), task_id=task_id):
+                video_id = upload_video_file(video_file, task_id, config)
 
             if not video_id:
-                print("Failed to upload video")
+                logging.error(f"Failed to upload video {video_file}")
                 return None, None
 
-            print(f"⏳ Video {video_id} uploaded. Waiting for processing to complete...")
+            logging.info(f"Video {video_id} uploaded; waiting for processing.", extra={"hot_path": "video_uploaded"})
 
             # Polling for video processing completion
-            success = poll_video_status(video_id, config['access_token'])
-
-            # Extract and upload the thumbnail
-            thumbnail_hash = None
-            thumbnail_path = extract_thumbnail(video_file)
-            if thumbnail_path:
-                thumbnail_hash = upload_image(app, thumbnail_path, task_id, config)
+            started = time.monotonic()
+            success = poll_video_status(video_id, config['access_token'], task_id=task_id)
 
             if success:
-                print(f"✅ Video {video_id} is fully processed and ready to use.")
+                record_stage("video_processing", time.monotonic() - started, task_id=task_id)
+                logging.debug(f"Video {video_id} is processed.", extra={"hot_path": "video_processed"})
+                # Graph's generated thumbnail (or an ffmpeg frame as fallback)
+                with timed_stage("thumbnail", task_id=task_id):
+                    thumbnail_hash = get_video_thumbnail(app, video_id, video_file, task_id, config)
                 return video_id, thumbnail_hash
             else:
-                print(f"⚠️ Video {video_id} failed to process in time.")
+                logging.warning(f"Video {video_id} failed to process in time.")
                 return None, None
+        except TaskCanceledException:
+            raise
         except Exception as e:
             emit_error(f"Error uploading video: {e}")
             return None, None
     
+@task_log_context
 def upload_image(app, image_file, task_id, config):
+    return _cached(config, 'image', image_file, lambda: _upload_or_copy_image(app, image_file, task_id, config))
+
+def _upload_or_copy_image(app, image_file, task_id, config):
+    """Uploads an image, or copies it from the fan-out source account when there is one."""
+    source_config = _source_config(config)
+    if source_config is None:
+        return _upload_image(app, image_file, task_id, config)
+
+    # Upload once to the source account (cached), then copy it over
+    source_hash = upload_image(app, image_file, task_id, source_config)
+    if not source_hash:
+        return None
+
+    with app.app_context():
+        try:
+            image_hash = copy_image_to_account(source_hash, source_config['ad_account_id'], task_id, config)
+            if image_hash:
+                return image_hash
+        except TaskCanceledException:
+            raise
+        except Exception as e:
+            logging.warning(f"Copying image {source_hash} to {config['ad_account_id']} failed: {e}")
+
+    return _upload_image(app, image_file, task_id, config)
+
+def _upload_image(app, image_file, task_id, config):
     with app.app_context():  
 
         check_cancellation(task_id)
@@ -119,15 +526,18 @@ def upload_image(app, image_file, task_id, config):
         if image_file.lower().endswith(".webp"):
             try:
                 image_file = convert_webp_to_jpeg(image_file)
-                logging.info(f"Converted WebP to JPEG: {image_file}")
+                logging.debug(f"Converted WebP to JPEG: {image_file}", extra={"hot_path": "webp_convert"})
             except Exception as e:
                 emit_error(f"Error converting WebP to JPEG: {e}")
                 return None
 
         try:
-            image = AdImage(parent_id=config['ad_account_id'])
+            image = AdImage(parent_id=config['ad_account_id'], api=get_api_for_config(config))
             image[AdImage.Field.filename] = image_file
-            image.remote_create()
+            # Re-uploading an image is idempotent (same bytes, same hash)
+            with timed_stage("image_upload", os.path.getsize(image_file), task_id=task_id):
+                call_with_retry(image.remote_create, task_id=task_id, ad_account_id=config['ad_account_id'],
+                                description=f"Image upload for {image_file}")
 
             # Correct way to get the hash value
             image_hash = image.get(AdImage.Field.hash)
@@ -136,9 +546,12 @@ def upload_image(app, image_file, task_id, config):
                 logging.error("Error: Response does not contain image hash!")
                 return None
 
-            logging.info(f"Uploaded image with hash: {image_hash}")
+            logging.info(f"Uploaded image with hash: {image_hash}", extra={"hot_path": "image_uploaded"})
+            add_uploaded_bytes(task_id, os.path.getsize(image_file))
             return image_hash
 
+        except TaskCanceledException:
+            raise
         except Exception as e:
             emit_error(f"Error uploading image: {e}")
             return None
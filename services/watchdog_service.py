@@ -0,0 +1,198 @@
+import functools
+import logging
+import os
+import sys
+import time
+import traceback
+from collections import Counter, deque
+
+# A hub that has not run the heartbeat for this long is reported as stalled (seconds)
+STALL_THRESHOLD = float(os.environ.get("HUB_STALL_THRESHOLD", 0.5))
+
+# How often the heartbeat runs on the hub, and how often the monitor thread checks it
+HEARTBEAT_INTERVAL = 0.1
+MONITOR_INTERVAL = 0.05
+
+# Stack samples kept per stall, and stalls kept for `/admin/watchdog`
+MAX_SAMPLES_PER_STALL = 20
+MAX_STALLS = 200
+
+# Frames from these paths are library code; the culprit is the innermost frame outside them
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIBRARY_MARKERS = ("site-packages", "dist-packages", os.sep + "lib" + os.sep + "python")
+
+recent_stalls = deque(maxlen=MAX_STALLS)  # Newest last
+stall_totals = {"stalls": 0, "stalled_seconds": 0.0, "worst_seconds": 0.0}
+stalls_by_culprit = Counter()
+
+_beat = (0, 0.0)  # Heartbeat sequence number and monotonic time; replaced (atomically) only on the hub
+_samples = deque()  # (beat sequence, stack) pairs taken by the monitor thread during stalls
+_started = [False]
+
+def eventlet_patched():
+    """Returns True if eventlet has monkey-patched threads in this process."""
+    if "eventlet" not in sys.modules:
+        return False
+    from eventlet import patcher
+    return patcher.is_monkey_patched("thread")
+
+def offload(func, *args, **kwargs):
+    """
+    Runs a blocking call without holding the eventlet hub.
+
+    Under eventlet the call runs on a native thread from `eventlet.tpool`
+    while the calling greenlet yields; elsewhere (the ASGI server, a native
+    thread, or a tpool thread already) it simply runs in place.
+
+    Returns:
+        The call's result; its exceptions propagate unchanged.
+    """
+    if not eventlet_patched():
+        return func(*args, **kwargs)
+    from eventlet import tpool
+    return tpool.execute(func, *args, **kwargs)
+
+def blocking(func):
+    """Decorates a helper known to hold the hub (CPU work, disk-heavy calls) so it runs through `offload`."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return offload(func, *args, **kwargs)
+    return wrapper
+
+def start_hub_watchdog():
+    """
+    Starts watching the eventlet hub for stalls (once per process).
+
+    A heartbeat greenlet wakes every HEARTBEAT_INTERVAL. A native monitor
+    thread samples the hub thread's stack while the heartbeat is overdue;
+    once the hub runs again, the heartbeat logs the stall with those
+    samples and the function that held the hub.
+
+    Returns:
+        bool: False if eventlet is not in use (nothing to watch).
+    """
+    if _started[0]:
+        return True
+    if not eventlet_patched():
+        logging.info("Eventlet is not patched; hub watchdog not started.")
+        return False
+
+    import eventlet
+    from eventlet import patcher
+    native_threading = patcher.original("threading")
+    native_time = patcher.original("time")
+
+    global _beat
+    _started[0] = True
+    hub_thread_id = native_threading.get_ident()
+    _beat = (0, time.monotonic())
+    eventlet.spawn(_run_heartbeat, eventlet.sleep)
+    monitor = native_threading.Thread(
+        target=_run_monitor, args=(hub_thread_id, native_time.sleep), name="hub-watchdog", daemon=True
+    )
+    monitor.start()
+    logging.info(f"Hub watchdog started (stall threshold {STALL_THRESHOLD}s).")
+    return True
+
+def _run_heartbeat(sleep):
+    global _beat
+    while True:
+        before = time.monotonic()
+        sleep(HEARTBEAT_INTERVAL)
+        now = time.monotonic()
+        sequence = _beat[0]
+        _beat = (sequence + 1, now)
+        stalled = now - before - HEARTBEAT_INTERVAL
+        if stalled >= STALL_THRESHOLD:
+            try:
+                _report_stall(sequence, stalled)
+            except Exception as e:
+                logging.error(f"Hub watchdog failed to report a stall: {e}")
+        else:
+            _drop_samples(sequence)
+
+def _run_monitor(hub_thread_id, sleep):
+    """Native thread: samples the hub's stack while its heartbeat is overdue. Never logs or locks."""
+    sampled_sequence, sampled = None, 0
+    while True:
+        sleep(MONITOR_INTERVAL)
+        sequence, last_beat = _beat
+        if time.monotonic() - last_beat < HEARTBEAT_INTERVAL + STALL_THRESHOLD:
+            continue
+        if sequence != sampled_sequence:
+            sampled_sequence, sampled = sequence, 0
+        if sampled >= MAX_SAMPLES_PER_STALL:
+            continue
+        frame = sys._current_frames().get(hub_thread_id)
+        if frame is not None:
+            _samples.append((sequence, traceback.extract_stack(frame)))
+            sampled += 1
+        del frame
+
+def _drop_samples(sequence):
+    while _samples and _samples[0][0] <= sequence:
+        _samples.popleft()
+
+def _take_samples(sequence):
+    taken = []
+    while _samples and _samples[0][0] <= sequence:
+        beat, stack = _samples.popleft()
+        if beat == sequence:
+            taken.append(stack)
+    return taken
+
+def _is_project_frame(frame):
+    return frame.filename.startswith(PROJECT_ROOT) and not any(m in frame.filename for m in LIBRARY_MARKERS)
+
+def _format_frame(frame):
+    filename = os.path.relpath(frame.filename, PROJECT_ROOT) if _is_project_frame(frame) else frame.filename
+    return f"{filename}:{frame.lineno} {frame.name}"
+
+def _culprit(stack):
+    """Returns the innermost project frame of a stack (the code that made the blocking call)."""
+    for frame in reversed(stack):
+        if _is_project_frame(frame):
+            return _format_frame(frame)
+    return _format_frame(stack[-1]) if stack else "unknown"
+
+def _report_stall(sequence, seconds):
+    stacks = _take_samples(sequence)
+    counts = Counter(tuple(_format_frame(frame) for frame in stack) for stack in stacks)
+    top_stack = list(counts.most_common(1)[0][0]) if counts else []
+    culprit = Counter(_culprit(stack) for stack in stacks).most_common(1)[0][0] if stacks else "unknown"
+
+    stall = {
+        "at": int(time.time()),
+        "seconds": round(seconds, 3),
+        "culprit": culprit,
+        "blocking_call": top_stack[-1] if top_stack else None,
+        "samples": len(stacks),
+        "stack": top_stack,
+    }
+    recent_stalls.append(stall)
+    stall_totals["stalls"] += 1
+    stall_totals["stalled_seconds"] += seconds
+    stall_totals["worst_seconds"] = max(stall_totals["worst_seconds"], seconds)
+    stalls_by_culprit[culprit] += 1
+
+    logging.warning(
+        f"Eventlet hub blocked for {seconds:.2f}s by {culprit}"
+        + ("\n  " + "\n  ".join(top_stack) if top_stack else " (no stack sample)")
+    )
+
+def get_watchdog_report(limit=20):
+    """
+    Returns hub stall totals, the functions that stalled it most and the latest stalls.
+
+    Args:
+        limit (int): Number of recent stalls to include (0 for none).
+    """
+    return {
+        "running": _started[0],
+        "threshold_seconds": STALL_THRESHOLD,
+        "stalls": stall_totals["stalls"],
+        "stalled_seconds": round(stall_totals["stalled_seconds"], 3),
+        "worst_seconds": round(stall_totals["worst_seconds"], 3),
+        "top_culprits": [{"culprit": c, "stalls": n} for c, n in stalls_by_culprit.most_common(10)],
+        "recent": list(recent_stalls)[-limit:][::-1] if limit > 0 else [],
+    }
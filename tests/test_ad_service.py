@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from services import ad_service
+
+class FakeAd:
+    def __init__(self, cards):
+        self.cards = cards
+
+    def get_id(self):
+        return "ad-1"
+
+@pytest.fixture
+def carousel(monkeypatch):
+    """Fakes card uploads (later files finish first) and ad creation; returns the failing files and emitted errors."""
+    failing, errors = set(), []
+    lock = threading.Lock()
+    running = [0, 0]  # Current and peak concurrent uploads
+
+    def upload_card(app, media_file, config, task_id):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05 / (1 + int(media_file[1])))
+        with lock:
+            running[0] -= 1
+        if media_file in failing:
+            raise RuntimeError("upload failed")
+        return {"link": media_file}
+
+    def create_creative_and_ad(config, ad_set_id, creative_name, object_story_spec, ad_name, task_id):
+        return FakeAd(object_story_spec["link_data"]["child_attachments"])
+
+    monkeypatch.setattr(ad_service, "upload_carousel_card", upload_card)
+    monkeypatch.setattr(ad_service, "_create_creative_and_ad", create_creative_and_ad)
+    monkeypatch.setattr(ad_service, "emit_error", lambda *args: errors.append(args))
+    return failing, errors, running
+
+FILES = ["m0.jpg", "m1.jpg", "m2.mp4", "m3.png"]
+
+def test_cards_keep_the_order_of_the_media(carousel):
+    _, _, running = carousel
+    used, done = [], []
+    ad = ad_service.create_carousel_ad(None, "s1", FILES + ["m4.webp"], {"ad_format": "Carousel"}, "t",
+                                       on_card_done=done.append, used_media=used)
+    assert [card["link"] for card in ad.cards] == FILES  # The unsupported WebP is left out
+    assert used == FILES
+    assert done == [True] * 4
+    assert running[1] > 1  # Uploaded concurrently
+
+def test_failed_card_skips_the_ad_by_default(carousel):
+    failing, errors, _ = carousel
+    failing.add("m1.jpg")
+    done = []
+    assert ad_service.create_carousel_ad(None, "s1", FILES, {"ad_format": "Carousel"}, "t", on_card_done=done.append) is None
+    assert len(errors) == 1
+    assert sorted(done) == [False, True, True, True]
+
+def test_failed_cards_can_be_dropped(carousel):
+    failing, _, _ = carousel
+    failing.add("m1.jpg")
+    used = []
+    ad = ad_service.create_carousel_ad(None, "s1", FILES, {"ad_format": "Carousel", "carousel_failure_policy": "drop_card"},
+                                       "t", used_media=used)
+    assert [card["link"] for card in ad.cards] == ["m0.jpg", "m2.mp4", "m3.png"]
+    assert used == ["m0.jpg", "m2.mp4", "m3.png"]
+
+def test_too_few_cards_left_skips_the_ad(carousel):
+    failing, errors, _ = carousel
+    failing.update({"m0.jpg", "m1.jpg", "m2.mp4"})
+    config = {"ad_format": "Carousel", "carousel_failure_policy": "drop_card"}
+    assert ad_service.create_carousel_ad(None, "s1", FILES, config, "t") is None
+    assert errors
+
+def test_thumbnail_fields():
+    assert ad_service.thumbnail_fields("https://scontent.example/t.jpg") == {"image_url": "https://scontent.example/t.jpg"}
+    assert ad_service.thumbnail_fields("abc123") == {"image_hash": "abc123"}
+    assert ad_service.thumbnail_fields("https://x", url_field="picture") == {"picture": "https://x"}
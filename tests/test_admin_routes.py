@@ -0,0 +1,37 @@
+import pytest
+from flask import Flask
+
+from routes.admin_routes import admin_bp
+from utils import validators
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(validators, "ADMIN_TOKEN", "secret")
+    app = Flask(__name__)
+    app.register_blueprint(admin_bp, url_prefix="/admin")
+    return app.test_client()
+
+AUTH = {"Authorization": "Bearer secret"}
+
+def test_admin_routes_are_disabled_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(validators, "ADMIN_TOKEN", None)
+    assert client.get("/admin/watchdog", headers=AUTH).status_code == 403
+
+def test_watchdog_requires_the_admin_token(client):
+    assert client.get("/admin/watchdog").status_code == 401
+    assert client.get("/admin/watchdog", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+def test_watchdog_report(client):
+    response = client.get("/admin/watchdog?limit=0", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json["recent"] == []
+    assert "top_culprits" in response.json
+
+def test_profile_requires_the_admin_token(client):
+    assert client.post("/admin/profile?seconds=0.1").status_code == 401
+
+def test_profile_as_collapsed_stacks(client):
+    response = client.post("/admin/profile?seconds=0.1&format=collapsed&idle=true", headers=AUTH)
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert response.get_data(as_text=True).strip()
@@ -0,0 +1,103 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+from services.admission_service import AdmissionController, AdmissionRejected
+from services.task_manager import add_task, cleanup_task_pid
+
+def controller(tmp_path, **limits):
+    settings = {"max_inflight_bytes": 1000, "min_free_disk_bytes": 0, "max_active_tasks": 2,
+                "max_queued_media": 100, "queue_size": 4, "queue_timeout": 5, "staging_dir": str(tmp_path)}
+    return AdmissionController(**{**settings, **limits})
+
+def admit_in_thread(admission, request_bytes, admitted):
+    def run():
+        try:
+            admitted.append((request_bytes, admission.admit(request_bytes)))
+        except AdmissionRejected as e:
+            admitted.append((request_bytes, e))
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+def test_rejects_at_once_without_a_queue(tmp_path):
+    admission = controller(tmp_path, max_active_tasks=1, queue_size=0)
+    admission.admit(10)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit(10)
+    assert rejected.value.reason == "too many active tasks"
+    assert rejected.value.queue_position == 1
+    assert rejected.value.retry_after > 0
+    assert admission.metrics()["rejected"] == 1
+
+def test_bytes_in_flight_are_limited_once_something_runs(tmp_path):
+    admission = controller(tmp_path, queue_size=0)
+    big = admission.admit(5000)  # Alone, even an oversized request is admitted
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit(10)
+    assert rejected.value.reason == "too many bytes in flight"
+    big.release()
+    admission.admit(10)
+
+def test_staging_disk_must_keep_free_space(tmp_path):
+    admission = controller(tmp_path, min_free_disk_bytes=10 ** 18, queue_size=0)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit(1)
+    assert rejected.value.reason == "staging disk is full"
+
+def test_parked_requests_are_admitted_in_arrival_order(tmp_path):
+    admission = controller(tmp_path, max_active_tasks=1)
+    first = admission.admit(10)
+    admitted = []
+    threads = [admit_in_thread(admission, 20, admitted)]
+    wait_until(lambda: len(admission.waiting) == 1)
+    threads.append(admit_in_thread(admission, 30, admitted))
+    wait_until(lambda: len(admission.waiting) == 2)
+
+    first.release()
+    wait_until(lambda: len(admitted) == 1)
+    assert admitted[0][0] == 20
+    admitted[0][1].release()
+    for thread in threads:
+        thread.join(5)
+    assert [request_bytes for request_bytes, _ in admitted] == [20, 30]
+    assert admission.metrics()["parked"] == 2
+
+def test_parked_request_times_out_with_its_position(tmp_path):
+    admission = controller(tmp_path, max_active_tasks=1, queue_timeout=0.1)
+    admission.admit(10)
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit(10)
+    assert rejected.value.queue_position == 1
+    assert admission.metrics()["timed_out"] == 1
+    assert not admission.waiting
+
+def test_capacity_is_released_when_the_task_finishes(tmp_path):
+    admission = controller(tmp_path)
+    task_id = f"test-{uuid.uuid4().hex}"
+    add_task(task_id)
+    ticket = admission.admit(100)
+    ticket.bind(task_id, media_count=7)
+    assert (admission.inflight_bytes, admission.queued_media) == (100, 7)
+
+    cleanup_task_pid(task_id)
+    assert (admission.inflight_bytes, admission.queued_media, len(admission.active)) == (0, 0, 0)
+    ticket.release()  # Releasing twice is harmless
+    assert admission.inflight_bytes == 0
+
+def test_held_capacity_stays_until_released(tmp_path):
+    admission = controller(tmp_path)
+    ticket = admission.admit(100)
+    ticket.hold(media_count=7)  # e.g. a bulk run, which is not a task itself
+    assert (admission.inflight_bytes, admission.queued_media) == (100, 7)
+
+    ticket.release()
+    assert (admission.inflight_bytes, admission.queued_media, len(admission.active)) == (0, 0, 0)
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import asgi
+
+class FakeServer:
+    def __init__(self):
+        self.emitted = []
+
+    async def emit(self, event, data=None, **kwargs):
+        self.emitted.append((event, data))
+
+def test_emit_before_startup_is_dropped():
+    server = FakeServer()
+    bridge = asgi.AsyncSocketIOBridge(server)
+    assert bridge.emit("progress", {"progress": 1}) is None
+    assert server.emitted == []
+
+def test_emit_from_a_worker_thread_runs_on_the_server_loop():
+    server = FakeServer()
+    bridge = asgi.AsyncSocketIOBridge(server)
+
+    async def main():
+        bridge.loop = asyncio.get_running_loop()
+        results = []
+        worker = threading.Thread(target=lambda: results.append(bridge.emit("progress", {"progress": 50})))
+        worker.start()
+        await asyncio.to_thread(worker.join)
+        await asyncio.wrap_future(results[0])
+
+    asyncio.run(main())
+    assert server.emitted == [("progress", {"progress": 50})]
+
+def test_emit_on_the_loop_schedules_a_task():
+    server = FakeServer()
+    bridge = asgi.AsyncSocketIOBridge(server)
+
+    async def main():
+        bridge.loop = asyncio.get_running_loop()
+        await bridge.emit("task_complete", {"task_id": "t"})
+
+    asyncio.run(main())
+    assert server.emitted == [("task_complete", {"task_id": "t"})]
@@ -0,0 +1,60 @@
+import asyncio
+
+from utils.async_graph_client import AsyncGraphClient, encode_params
+from utils.error_handler import GraphAPIError
+
+def test_encode_params():
+    encoded = encode_params({
+        "name": "Ad set", "budget": 500, "active": True, "paused": False,
+        "targeting": {"geo_locations": {"countries": ["US"]}}, "ids": [1, 2], "skip": None,
+    })
+    assert encoded == {
+        "name": "Ad set", "budget": "500", "active": "true", "paused": "false",
+        "targeting": '{"geo_locations": {"countries": ["US"]}}', "ids": "[1, 2]",
+    }
+    assert encode_params(None) == {}
+
+def test_graph_error_from_response():
+    error = GraphAPIError.from_response(400, {"error": {"message": "Bad", "code": 100, "error_subcode": 33}})
+    assert (str(error), error.code, error.subcode, error.status) == ("Bad", 100, 33, 400)
+
+    error = GraphAPIError.from_response(502, "not json")
+    assert error.code is None and error.status == 502
+
+def test_upload_video_follows_the_offsets_graph_returns(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"x" * 25)
+    client = AsyncGraphClient("token")
+    calls = []
+
+    async def start(ad_account_id, file_size):
+        calls.append(("start", file_size))
+        return {"upload_session_id": "s1", "video_id": "v1", "start_offset": "0", "end_offset": "10"}
+
+    async def transfer(ad_account_id, session_id, video_file, start_offset, length):
+        calls.append(("transfer", start_offset, length))
+        end = min(start_offset + length + 10, 25)
+        return {"start_offset": str(start_offset + length), "end_offset": str(end)}
+
+    async def finish(ad_account_id, session_id):
+        calls.append(("finish", session_id))
+        return {"success": True}
+
+    client.start_video_upload = start
+    client.transfer_video_chunk = transfer
+    client.finish_video_upload = finish
+
+    assert asyncio.run(client.upload_video("act_1", str(video))) == "v1"
+    assert calls == [
+        ("start", 25), ("transfer", 0, 10), ("transfer", 10, 10), ("transfer", 20, 5), ("finish", "s1"),
+    ]
+
+def test_wait_for_video_stops_on_unexpected_status():
+    client = AsyncGraphClient("token")
+    statuses = iter(["processing", "error"])
+
+    async def status(video_id):
+        return next(statuses)
+
+    client.get_video_status = status
+    assert asyncio.run(client.wait_for_video("v1", timeout=5, poll_interval=0)) is False
@@ -0,0 +1,113 @@
+import contextlib
+import uuid
+
+import pytest
+
+from services import bulk_campaign_service
+from services.bulk_campaign_service import (
+    ManifestError, build_campaign_configs, parse_manifest, resolve_campaign_media,
+)
+from services.admission_service import AdmissionController
+from services.progress_service import get_progress
+from services.task_manager import task_states
+
+class FakeApp:
+    def app_context(self):
+        return contextlib.nullcontext()
+
+class FakeSocketIO:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, data=None, **kwargs):
+        self.events.append((event, data))
+
+def test_parse_json_manifest():
+    campaigns = parse_manifest("""
+        {"campaigns": [{"campaign_name": "Spring", "daily_budget": 100,
+                        "ad_sets": [{"name": "Set A", "media": ["a/1.jpg", "a/2.mp4"]}]}]}
+    """)
+    assert campaigns == [{
+        "overrides": {"campaign_name": "Spring", "daily_budget": 100},
+        "ad_sets": [("Set A", ["a/1.jpg", "a/2.mp4"])],
+    }]
+
+def test_parse_csv_manifest_groups_rows():
+    campaigns = parse_manifest(
+        "campaign_name,ad_set_name,media,is_cbo,task_id\n"
+        "Spring,Set A,a/1.jpg,true,\n"
+        "Spring,Set A,a/2.jpg,,\n"
+        "Spring,Set B,b/1.jpg,,\n"
+        "Summer,Set C,c/1.jpg,false,job-2\n",
+        filename="manifest.csv",
+    )
+    assert campaigns == [
+        {"overrides": {"campaign_name": "Spring", "is_cbo": True},
+         "ad_sets": [("Set A", ["a/1.jpg", "a/2.jpg"]), ("Set B", ["b/1.jpg"])]},
+        {"overrides": {"campaign_name": "Summer", "task_id": "job-2", "is_cbo": False},
+         "ad_sets": [("Set C", ["c/1.jpg"])]},
+    ]
+
+@pytest.mark.parametrize("content, filename", [
+    ("{not json", None),
+    ('{"campaigns": []}', None),
+    ('{"campaigns": [{"ad_sets": []}]}', None),
+    ("campaign_name,media\nSpring,a.jpg\n", "manifest.csv"),
+])
+def test_malformed_manifests_are_rejected(content, filename):
+    with pytest.raises(ManifestError):
+        parse_manifest(content, filename)
+
+def test_resolve_campaign_media(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "1.jpg").write_bytes(b"jpg")
+    campaigns = [{"overrides": {}, "ad_sets": [("Set A", ["/a/1.jpg"])]}]
+    resolved = resolve_campaign_media(campaigns, tmp_path)
+    assert resolved[0]["ad_sets"] == [("Set A", [str(tmp_path / "a" / "1.jpg")])]
+
+@pytest.mark.parametrize("reference", ["a/missing.jpg", "../outside.jpg", "a/notes.txt"])
+def test_resolve_rejects_unknown_media(tmp_path, reference):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "1.jpg").write_bytes(b"jpg")
+    with pytest.raises(ManifestError):
+        resolve_campaign_media([{"overrides": {}, "ad_sets": [("Set A", [reference])]}], tmp_path)
+
+def test_campaigns_share_one_upload_cache():
+    campaigns = [
+        {"overrides": {"campaign_name": "Spring", "task_id": "own-id"}, "ad_sets": []},
+        {"overrides": {"campaign_name": "Summer"}, "ad_sets": []},
+    ]
+    (first, _), (second, _) = build_campaign_configs({"ad_account_id": "act_1"}, campaigns, "bulk")
+    assert (first["task_id"], second["task_id"]) == ("own-id", "bulk-2")
+    assert first["upload_cache"] is second["upload_cache"]
+    assert first["ad_account_id"] == "act_1"
+
+@pytest.mark.parametrize("campaign_id, error", [(None, "Failed to create campaign"), ("123", "Campaign ID not found")])
+def test_campaigns_that_never_start_are_finished_as_failed(monkeypatch, campaign_id, error):
+    monkeypatch.setattr(bulk_campaign_service, "create_campaign", lambda config: (None, None))
+    monkeypatch.setattr(bulk_campaign_service, "find_campaign_by_id", lambda *args: None)
+    monkeypatch.setattr(bulk_campaign_service, "get_api_for_config", lambda config: None)
+    task_id = f"test-{uuid.uuid4().hex}"
+    config = {"task_id": task_id, "ad_account_id": "act_1", "campaign_id": campaign_id}
+
+    result = bulk_campaign_service._process_bulk_campaign(FakeApp(), config, [], "/tmp")
+    assert result == {"task_id": task_id, "error": error}
+    assert task_id not in task_states
+    assert get_progress(task_id).snapshot()["phase"] == "failed"
+
+def test_bulk_run_releases_its_admission_ticket(tmp_path, monkeypatch):
+    socketio = FakeSocketIO()
+    monkeypatch.setattr(bulk_campaign_service, "get_socketio", lambda: socketio)
+    monkeypatch.setattr(bulk_campaign_service, "_process_bulk_campaign",
+                        lambda app, config, ad_sets, temp_dir: {"task_id": config["task_id"]})
+    admission = AdmissionController(min_free_disk_bytes=0, staging_dir=str(tmp_path))
+    ticket = admission.admit(100)
+    ticket.hold(2)
+    staging = tmp_path / "bundle"
+    staging.mkdir()
+
+    bulk_campaign_service.process_bulk_campaigns(
+        FakeApp(), "bulk", [({"task_id": "bulk-1"}, [("Set A", ["a.jpg", "b.jpg"])])], staging, ticket)
+    assert socketio.events == [("bulk_complete", {"task_id": "bulk", "campaigns": [{"task_id": "bulk-1"}]})]
+    assert (admission.inflight_bytes, admission.queued_media, len(admission.active)) == (0, 0, 0)
+    assert not staging.exists()
@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+
+from cli import TerminalProgress, _describe_results, _json_field, load_form, write_result
+
+def write_config(tmp_path, data):
+    path = tmp_path / "campaign.json"
+    path.write_text(json.dumps(data))
+    return path
+
+def test_load_form_renders_fields_as_the_route_receives_them(tmp_path, monkeypatch):
+    monkeypatch.setenv("FB_ACCESS_TOKEN", "from-env")
+    monkeypatch.setenv("FB_APP_ID", "env-app")
+    path = write_config(tmp_path, {
+        "campaign_name": "Spring", "daily_budget": 50, "dry_run": True, "app_id": "config-app",
+        "platforms": {"facebook": True}, "ad_set_name": None,
+    })
+    form = load_form(path)
+    assert form["daily_budget"] == "50" and form["dry_run"] == "true"
+    assert json.loads(form["platforms"]) == {"facebook": True}
+    assert "ad_set_name" not in form
+    assert form["access_token"] == "from-env" and form["app_id"] == "config-app"
+
+def test_load_form_requires_an_object(tmp_path):
+    with pytest.raises(ValueError):
+        load_form(write_config(tmp_path, ["not", "an", "object"]))
+
+def test_json_field():
+    assert _json_field({}, "placements") == {}
+    assert _json_field({"placements": '{"feeds": true}'}, "placements") == {"feeds": True}
+    with pytest.raises(ValueError):
+        _json_field({"placements": "[1]"}, "placements")
+
+def test_results_are_described_relative_to_the_source(tmp_path):
+    staged = tmp_path / "creatives"
+    results = [{
+        "ad_set_name": "spring", "ad_set_id": "1",
+        "media": [str(staged / "spring/a.jpg"), str(staged / "spring/b.mp4")],
+        "ads": {str(staged / "spring/a.jpg"): "ad-1"},
+    }]
+    assert _describe_results(results, staged) == [
+        {"ad_set_name": "spring", "ad_set_id": "1", "ads": {"spring/a.jpg": "ad-1"}, "without_ad": ["spring/b.mp4"]},
+    ]
+
+def test_piped_progress_writes_one_line_per_ten_percent():
+    stream = io.StringIO()
+    progress = TerminalProgress(stream)
+    for percent in (0, 3, 9, 10, 15, 100):
+        progress.emit('progress', {'progress': percent, 'step': 'uploading'}, room='task')
+    progress.emit('error', {'message': 'boom'})
+    progress.emit('task_complete', {})
+    assert stream.getvalue().splitlines() == [
+        "0% uploading", "10% uploading", "100% uploading", "error: boom", "done",
+    ]
+
+def test_interactive_progress_ends_the_bar_before_a_message():
+    class Tty(io.StringIO):
+        def isatty(self):
+            return True
+
+    stream = Tty()
+    progress = TerminalProgress(stream)
+    progress.emit('progress', {'progress': 50, 'step': 'x'})
+    progress.emit('error', {'message': 'boom'})
+    assert stream.getvalue() == f"\r[{'#' * 15}{' ' * 15}]  50% x\nerror: boom\n"
+
+def test_write_result_replaces_the_file(tmp_path):
+    path = tmp_path / "result.json"
+    path.write_text("old")
+    write_result(path, {"status": "complete"})
+    assert json.loads(path.read_text()) == {"status": "complete"}
+    assert list(tmp_path.iterdir()) == [path]
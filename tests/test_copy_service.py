@@ -0,0 +1,99 @@
+import uuid
+
+import pytest
+
+from services import copy_service
+from services.task_manager import add_task, cleanup_task_pid, get_created_objects
+
+TREE = {}  # Object ID -> child IDs
+READS = []  # Child IDs read from cursors, in order
+
+class FakeObject:
+    class Field:
+        id = "id"
+        targeting = "targeting"
+
+    copied_field = None
+
+    def __init__(self, object_id, api=None):
+        self.object_id = object_id
+
+    def get_id(self):
+        return self.object_id
+
+    def _children(self, child_class):
+        for child_id in TREE.get(self.object_id, []):
+            READS.append(child_id)
+            yield child_class(child_id)
+
+    def create_copy(self, params=None):
+        return {self.copied_field: f"{self.object_id}-copy"}
+
+class FakeAd(FakeObject):
+    copied_field = "copied_ad_id"
+
+class FakeAdSet(FakeObject):
+    copied_field = "copied_adset_id"
+
+    def get_ads(self, fields=None, params=None):
+        return self._children(FakeAd)
+
+class FakeCampaign(FakeObject):
+    copied_field = "copied_campaign_id"
+
+    def get_ad_sets(self, fields=None, params=None):
+        return self._children(FakeAdSet)
+
+@pytest.fixture(autouse=True)
+def fake_graph(monkeypatch):
+    monkeypatch.setattr(copy_service, "Ad", FakeAd)
+    monkeypatch.setattr(copy_service, "AdSet", FakeAdSet)
+    monkeypatch.setattr(copy_service, "Campaign", FakeCampaign)
+    TREE.clear()
+    READS.clear()
+
+@pytest.fixture
+def task_id():
+    task_id = f"test-{uuid.uuid4().hex}"
+    add_task(task_id)
+    yield task_id
+    cleanup_task_pid(task_id)
+
+CONFIG = {"ad_account_id": "act_1"}
+
+def test_small_ad_set_is_within_the_sync_limit():
+    TREE["s1"] = ["a1", "a2", "a3"]
+    assert not copy_service.exceeds_sync_limit("adset", "s1", CONFIG, limit=3)
+
+def test_large_ad_set_stops_reading_past_the_limit():
+    TREE["s1"] = [f"a{i}" for i in range(1000)]
+    assert copy_service.exceeds_sync_limit("adset", "s1", CONFIG, limit=3)
+    assert len(READS) == 4
+
+def test_campaign_counts_ad_sets_and_ads():
+    TREE["c1"] = ["s1", "s2"]
+    TREE["s1"] = ["a1"]
+    TREE["s2"] = [f"a{i}" for i in range(1000)]
+    assert copy_service.exceeds_sync_limit("campaign", "c1", CONFIG, limit=3)
+    assert len(READS) <= 3 + 2
+
+    TREE["s2"] = []
+    assert not copy_service.exceeds_sync_limit("campaign", "c1", CONFIG, limit=3)
+
+def test_shallow_copy_is_never_large():
+    TREE["c1"] = [f"s{i}" for i in range(10)]
+    assert not copy_service.is_large_copy("campaign", "c1", False, CONFIG)
+    assert READS == []
+
+def test_large_ad_set_is_copied_piecewise(task_id):
+    TREE["s1"] = [f"a{i}" for i in range(5)]
+    result = copy_service.copy_object(task_id, CONFIG, "adset", "s1", campaign_id="c2")
+
+    assert result["copied_id"] == "s1-copy"
+    assert result["ad_set_ids"] == ["s1-copy"]
+    assert sorted(result["ad_ids"]) == sorted(f"a{i}-copy" for i in range(5))
+    assert len(get_created_objects(task_id, object_types=["ad"])) == 5
+
+def test_unsupported_object_type(task_id):
+    with pytest.raises(ValueError):
+        copy_service.copy_object(task_id, CONFIG, "ad", "a1")
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+import pytest
+
+from utils import facebook_client
+
+class FakeRequests:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeSession:
+    def __init__(self):
+        self.requests = FakeRequests()
+
+class FakeApi:
+    def __init__(self, access_token):
+        self.access_token = access_token
+        self._session = FakeSession()
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(facebook_client, "_api_pool", OrderedDict())
+    monkeypatch.setattr(facebook_client, "_build_api", lambda app_id, app_secret, token: FakeApi(token))
+    monkeypatch.setattr(facebook_client, "MAX_POOLED_APIS", 2)
+    return facebook_client._api_pool
+
+def test_same_credentials_share_one_api(pool):
+    first = facebook_client.get_api("app", "secret", "token-a")
+    assert facebook_client.get_api("app", "secret", "token-a") is first
+    assert facebook_client.get_api("app", "secret", "token-b") is not first
+
+def test_least_recently_used_api_is_evicted_and_closed(pool):
+    a = facebook_client.get_api("app", "secret", "token-a")
+    b = facebook_client.get_api("app", "secret", "token-b")
+    facebook_client.get_api("app", "secret", "token-a")  # a is now the most recently used
+    facebook_client.get_api("app", "secret", "token-c")
+
+    assert list(pool) == [("app", "token-a"), ("app", "token-c")]
+    assert b._session.requests.closed
+    assert not a._session.requests.closed
+
+def test_config_without_token_has_no_api(pool):
+    assert facebook_client.get_api_for_config({"app_id": "app"}) is None
+    api = facebook_client.get_api_for_config({"app_id": "app", "app_secret": "s", "access_token": "t"})
+    assert api.access_token == "t"
+
+def test_pooled_apis_never_become_the_sdk_default(pool, monkeypatch):
+    installed = []
+    monkeypatch.setattr(facebook_client.FacebookAdsApi, "set_default_api", installed.append, raising=False)
+    facebook_client.get_api("app", "secret", "token-a")
+    assert installed == []
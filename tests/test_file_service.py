@@ -0,0 +1,104 @@
+import hashlib
+import io
+import os
+
+from services import file_service
+from services.file_service import (
+    MediaIndex, get_media_index, get_total_media_count, link_local_tree, media_kind, save_uploaded_files,
+)
+
+class FakeUpload:
+    """Stands in for werkzeug's FileStorage."""
+
+    def __init__(self, filename, content):
+        self.filename = filename
+        self.stream = io.BytesIO(content)
+        self.content_length = len(content)
+
+def stage(root, relative_paths):
+    for relative_path in relative_paths:
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(relative_path.encode())
+    return root
+
+def test_media_kind():
+    assert media_kind("a.JPG") == "image"
+    assert media_kind("b.mov") == "video"
+    assert media_kind("notes.txt") is None
+
+def test_scan_indexes_media_only(tmp_path):
+    stage(tmp_path, ["spring/a.jpg", "spring/notes.txt", "spring/empty/.keep", "b.mp4"])
+    index = MediaIndex.scan(tmp_path)
+    assert len(index) == 2
+    assert index.files("video") == [str(tmp_path / "b.mp4")]
+    assert index.folders() == [str(tmp_path / "spring")]
+    assert index.get(str(tmp_path / "spring/a.jpg")).kind == "image"
+    assert index.get("spring/a.jpg") is index.get(str(tmp_path / "spring" / "a.jpg"))
+
+def test_groups_follow_the_folder_layout(tmp_path):
+    stage(tmp_path, [
+        "flat/1.jpg", "flat/2.jpg",
+        "nested/x/1.jpg", "nested/y/2.mp4", "nested/y/deeper/3.jpg", "nested/loose.jpg",
+        "nested/empty/readme.txt",
+        "root.jpg",
+    ])
+    groups = [(name, sorted(os.path.relpath(f, tmp_path) for f in media))
+              for _, name, media in MediaIndex.scan(tmp_path).groups()]
+    assert groups == [
+        ("flat", ["flat/1.jpg", "flat/2.jpg"]),
+        ("x", ["nested/x/1.jpg"]),
+        ("y", ["nested/y/2.mp4", "nested/y/deeper/3.jpg"]),
+    ]
+
+def test_groups_of_selected_folders(tmp_path):
+    stage(tmp_path, ["a/1.jpg", "b/2.jpg"])
+    index = MediaIndex.scan(tmp_path)
+    assert [name for _, name, _ in index.groups(["b"])] == ["b"]
+    assert [name for _, name, _ in index.groups([str(tmp_path / "a")])] == ["a"]
+
+def test_digest_is_computed_once(tmp_path, monkeypatch):
+    stage(tmp_path, ["a/1.jpg"])
+    calls = []
+    real_digest = file_service.file_digest
+    monkeypatch.setattr(file_service, "file_digest", lambda path: calls.append(path) or real_digest(path))
+    index = MediaIndex.scan(tmp_path)
+    path = str(tmp_path / "a/1.jpg")
+
+    assert index.digest(path) == hashlib.sha256(b"a/1.jpg").hexdigest()
+    assert index.digest(path) == index.digest("a/1.jpg")
+    assert len(calls) == 1
+
+def test_saved_uploads_are_indexed_with_their_digests(tmp_path, monkeypatch):
+    uploads = [
+        FakeUpload("campaign/set/a.jpg", b"image"),
+        FakeUpload("campaign/set/.DS_Store", b"junk"),
+        FakeUpload("campaign/set/._a.jpg", b"junk"),
+    ]
+    index = save_uploaded_files(uploads, tmp_path / "upload")
+
+    assert len(index) == 1
+    entry = index.get("campaign/set/a.jpg")
+    assert entry.size == 5 and entry.digest == hashlib.sha256(b"image").hexdigest()
+    assert (tmp_path / "upload/campaign/set/a.jpg").read_bytes() == b"image"
+
+    # Later lookups are served from the saved index, without walking the tree again
+    def rescan(cls, root):
+        raise AssertionError("rescanned")
+
+    monkeypatch.setattr(MediaIndex, "scan", classmethod(rescan))
+    assert get_media_index(tmp_path / "upload") is index
+    assert get_total_media_count(tmp_path / "upload") == 1
+
+def test_link_local_tree_nests_under_the_source_name(tmp_path):
+    source = stage(tmp_path / "creatives", ["spring/a.jpg", "spring/.hidden.jpg", ".cache/b.jpg", "notes.txt", "c.mp4"])
+    staging = tmp_path / "staging"
+    staging.mkdir()
+
+    index, methods = link_local_tree(source, staging)
+    assert sorted(index.files()) == [str(staging / "creatives/c.mp4"), str(staging / "creatives/spring/a.jpg")]
+    assert index.folders() == [str(staging / "creatives")]
+    assert sum(methods.values()) == 2
+    assert (staging / "creatives/spring/a.jpg").read_bytes() == b"spring/a.jpg"
+    assert get_media_index(staging) is index
+    assert sorted(p.name for p in source.rglob("*")) == sorted([".cache", ".hidden.jpg", "a.jpg", "b.jpg", "c.mp4", "notes.txt", "spring"])
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import json
+import logging
+
+import pytest
+
+from utils import logging_config
+from utils.logging_config import (
+    ContextFilter, JsonFormatter, bind_log_context, configure_logging, log_context, redact, task_log_context,
+)
+
+def make_record(msg="hello", level=logging.INFO, **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, None, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+def context_of(record):
+    return {key: getattr(record, key, None) for key in logging_config.CONTEXT_FIELDS}
+
+def test_redact_masks_tokens_and_secrets():
+    text = redact("GET /act_1?access_token=EAAB123&fields=id app_secret: 'abc' Authorization: Bearer s3cr3t.x")
+    assert "EAAB123" not in text and "abc" not in text and "s3cr3t" not in text
+    assert "access_token=[REDACTED]&fields=id" in text
+    assert redact("token EAA" + "x" * 30) == "token [REDACTED]"
+
+def test_context_fields_are_added_and_nested():
+    context_filter = ContextFilter()
+    with log_context(task_id="t1", ad_account_id=None):
+        with log_context(stage="upload"):
+            record = make_record()
+            context_filter.filter(record)
+    assert context_of(record) == {"task_id": "t1", "ad_account_id": None, "stage": "upload"}
+
+    outside = make_record()
+    context_filter.filter(outside)
+    assert context_of(outside)["task_id"] is None
+
+def test_task_log_context_reads_task_id_and_config():
+    seen = []
+
+    @task_log_context
+    def work(task_id, config, other=None):
+        record = make_record()
+        ContextFilter().filter(record)
+        seen.append(context_of(record))
+
+    work("t1", {"ad_account_id": "act_1"})
+    work(config={"ad_account_id": "act_2"}, task_id="t2")
+    assert seen == [
+        {"task_id": "t1", "ad_account_id": "act_1", "stage": None},
+        {"task_id": "t2", "ad_account_id": "act_2", "stage": None},
+    ]
+
+def test_bind_log_context_is_scoped_to_the_asyncio_task():
+    async def tagged(task_id):
+        bind_log_context(task_id=task_id)
+        await asyncio.sleep(0)
+        record = make_record()
+        ContextFilter().filter(record)
+        return record.task_id
+
+    async def main():
+        return await asyncio.gather(tagged("a"), tagged("b"))
+
+    assert asyncio.run(main()) == ["a", "b"]
+    record = make_record()
+    ContextFilter().filter(record)
+    assert getattr(record, "task_id", None) is None
+
+def test_hot_path_records_are_sampled_per_second(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_config.time, "monotonic", lambda: now[0])
+    context_filter = ContextFilter(per_second=2)
+
+    passed = [context_filter.filter(make_record(hot_path="file_saved")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert context_filter.filter(make_record(level=logging.WARNING, hot_path="file_saved"))
+    assert context_filter.filter(make_record(hot_path="other"))
+    assert context_filter.filter(make_record())
+
+    now[0] = 101.0
+    record = make_record(hot_path="file_saved")
+    assert context_filter.filter(record)
+    assert record.suppressed == 3
+
+def test_json_formatter_writes_one_redacted_line():
+    record = make_record("token=EAA" + "x" * 30, task_id="t1", stage="upload")
+    record.exc_text = "Traceback: access_token=abc"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["level"] == "INFO" and entry["task_id"] == "t1" and entry["stage"] == "upload"
+    assert "ad_account_id" not in entry
+    assert "EAA" not in entry["msg"] and entry["exc"] == "Traceback: access_token=[REDACTED]"
+
+@pytest.fixture
+def restore_root():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    logging_config._listener.stop()
+    logging_config._listener = None
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+def test_configure_logging_writes_json_lines_from_the_writer_thread(restore_root):
+    stream = io.StringIO()
+    configure_logging(level="INFO", stream=stream)
+    with log_context(task_id="t1"):
+        logging.info("created ad %s", 42)
+    logging.debug("not shown")
+    logging_config._listener.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line["msg"], line.get("task_id")) for line in lines] == [("created ad 42", "t1")]
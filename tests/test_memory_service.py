@@ -0,0 +1,100 @@
+import tracemalloc
+import uuid
+from collections import deque
+
+import pytest
+
+from services import memory_service
+from services.memory_service import check_baseline, get_task_memory, mark_phase, running_tasks
+from services.progress_service import start_progress
+from services.task_manager import add_task, cleanup_task_pid, get_task_state
+
+@pytest.fixture(autouse=True)
+def process_state(monkeypatch):
+    rss = [1000]
+    monkeypatch.setattr(memory_service, "baselines", deque(maxlen=50))
+    monkeypatch.setattr(memory_service, "leak_status", {"suspected": False, "growth_bytes": 0, "checked_at": None})
+    monkeypatch.setattr(memory_service, "finished_count", [0])
+    monkeypatch.setattr(memory_service, "start_memory_checker", lambda: None)
+    monkeypatch.setattr(memory_service, "current_rss", lambda: rss[0])
+    monkeypatch.setattr(memory_service, "BASELINE_WINDOW", 3)
+    monkeypatch.setattr(memory_service, "LEAK_GROWTH_BYTES", 100)
+    return rss
+
+@pytest.fixture
+def task_id():
+    task_id = f"test-{uuid.uuid4().hex}"
+    add_task(task_id)
+    yield task_id
+    cleanup_task_pid(task_id)
+
+def test_only_started_tasks_count_as_running(task_id):
+    before = running_tasks()
+    other = f"test-{uuid.uuid4().hex}"
+    add_task(other)
+    try:
+        assert running_tasks() == before
+        start_progress(other)
+        assert running_tasks() == before + 1
+    finally:
+        cleanup_task_pid(other)
+
+def test_phases_record_rss_growth(task_id, process_state):
+    mark_phase(task_id, "staging")
+    process_state[0] = 1500
+    mark_phase(task_id, "complete", final=True)
+
+    memory = get_task_memory(task_id)
+    assert memory["started_rss_bytes"] == 1000
+    assert [(p["phase"], p["rss_bytes"], p["rss_growth_bytes"]) for p in memory["phases"]] == [
+        ("staging", 1000, 0), ("complete", 1500, 500)]
+    assert memory["process"]["finished_tasks"] == 1
+
+def test_untracked_tasks_are_ignored():
+    task_id = f"test-{uuid.uuid4().hex}"
+    mark_phase(task_id, "staging")
+    assert get_task_memory(task_id) is None
+
+def test_tracing_diffs_phases_and_drops_the_last_snapshot(task_id, monkeypatch):
+    was_tracing = tracemalloc.is_tracing()
+    monkeypatch.setattr(memory_service, "TRACE_FRAMES", 1)
+    try:
+        mark_phase(task_id, "staging")
+        kept = [bytearray(1024) for _ in range(100)]
+        mark_phase(task_id, "complete", final=True)
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    first, last = get_task_memory(task_id)["phases"]
+    assert "top" not in first
+    assert last["traced_growth_bytes"] >= 100 * 1024 and last["top"]
+    assert get_task_state(task_id).memory.snapshot is None
+    del kept
+
+def test_baselines_wait_for_idle_and_a_finished_task(process_state, monkeypatch):
+    check_baseline()
+    assert not memory_service.baselines
+
+    memory_service.finished_count[0] = 1
+    monkeypatch.setattr(memory_service, "running_tasks", lambda: 1)
+    check_baseline()
+    assert not memory_service.baselines
+
+    monkeypatch.setattr(memory_service, "running_tasks", lambda: 0)
+    check_baseline()
+    check_baseline()
+    assert len(memory_service.baselines) == 1
+
+def test_steadily_rising_idle_rss_flags_a_leak(process_state, monkeypatch):
+    monkeypatch.setattr(memory_service, "running_tasks", lambda: 0)
+    for rss in (1000, 1060, 1120):
+        memory_service.finished_count[0] += 1
+        process_state[0] = rss
+        check_baseline()
+    assert memory_service.leak_status["suspected"] and memory_service.leak_status["growth_bytes"] == 120
+
+    memory_service.finished_count[0] += 1
+    process_state[0] = 1100
+    check_baseline()
+    assert not memory_service.leak_status["suspected"]
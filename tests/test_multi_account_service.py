@@ -0,0 +1,87 @@
+import contextlib
+import uuid
+
+import pytest
+
+from services import multi_account_service, upload_service
+from services.multi_account_service import build_account_configs, parse_ad_account_ids
+from services.progress_service import get_progress, start_progress
+from services.task_manager import add_task, task_states
+from services.upload_service import UploadCache
+
+class FakeApp:
+    def app_context(self):
+        return contextlib.nullcontext()
+
+class FakeSocketIO:
+    def emit(self, event, data=None, **kwargs):
+        pass
+
+def test_parse_ad_account_ids_puts_the_primary_first():
+    assert parse_ad_account_ids('["2", "act_3", "act_1"]', "act_1") == ["act_1", "act_2", "act_3"]
+    assert parse_ad_account_ids("2, 3,,2", "act_1") == ["act_1", "act_2", "act_3"]
+    assert parse_ad_account_ids("", "act_1") == ["act_1"]
+    assert parse_ad_account_ids(None) == []
+
+def test_build_account_configs(monkeypatch):
+    monkeypatch.setattr(multi_account_service, "get_ad_account_timezone", lambda ad_account_id, *credentials: f"tz-{ad_account_id}")
+    config = {"task_id": "t", "ad_account_id": "act_1", "ad_account_timezone": "tz-own",
+              "app_id": "app", "app_secret": "secret", "access_token": "token"}
+    primary, other = build_account_configs(config, ["act_1", "act_2"])
+
+    assert (primary["task_id"], other["task_id"]) == ("t-act_1", "t-act_2")
+    assert primary["ad_account_timezone"] == "tz-own"
+    assert other["ad_account_timezone"] == "tz-act_2"
+    assert primary["source_ad_account_id"] == other["source_ad_account_id"] == "act_1"
+    assert primary["upload_cache"] is other["upload_cache"]
+
+def test_images_are_uploaded_once_and_copied_to_other_accounts(monkeypatch):
+    uploads, copies = [], []
+
+    def fake_upload(app, image_file, task_id, config):
+        uploads.append(config["ad_account_id"])
+        return "source-hash"
+
+    def fake_copy(image_hash, source_ad_account_id, task_id, config):
+        copies.append((image_hash, source_ad_account_id, config["ad_account_id"]))
+        return f"hash-{config['ad_account_id']}"
+
+    monkeypatch.setattr(upload_service, "_upload_image", fake_upload)
+    monkeypatch.setattr(upload_service, "copy_image_to_account", fake_copy)
+    cache = UploadCache()
+    for ad_account_id in ("act_1", "act_2", "act_3"):
+        config = {"ad_account_id": ad_account_id, "source_ad_account_id": "act_1", "upload_cache": cache}
+        assert upload_service.upload_image(FakeApp(), "/media/a.jpg", "t", config) in (
+            "source-hash", f"hash-{ad_account_id}")
+
+    assert uploads == ["act_1"]
+    assert copies == [("source-hash", "act_1", "act_2"), ("source-hash", "act_1", "act_3")]
+
+def test_failed_copy_falls_back_to_an_upload(monkeypatch):
+    uploads = []
+
+    def fake_upload(app, image_file, task_id, config):
+        uploads.append(config["ad_account_id"])
+        return f"uploaded-{config['ad_account_id']}"
+
+    def fail_copy(*args):
+        raise RuntimeError("copy_from not permitted")
+
+    monkeypatch.setattr(upload_service, "_upload_image", fake_upload)
+    monkeypatch.setattr(upload_service, "copy_image_to_account", fail_copy)
+    config = {"ad_account_id": "act_2", "source_ad_account_id": "act_1", "upload_cache": UploadCache()}
+    assert upload_service.upload_image(FakeApp(), "/media/a.jpg", "t", config) == "uploaded-act_2"
+    assert uploads == ["act_1", "act_2"]
+
+@pytest.mark.parametrize("create", [lambda config: (None, None), lambda config: 1 / 0])
+def test_accounts_that_never_start_are_finished_as_failed(monkeypatch, create):
+    monkeypatch.setattr(multi_account_service, "create_campaign", create)
+    monkeypatch.setattr(multi_account_service, "get_socketio", FakeSocketIO)
+    task_id = f"test-{uuid.uuid4().hex}"
+    add_task(task_id)
+    start_progress(task_id)
+
+    result = multi_account_service._process_account(FakeApp(), {"task_id": task_id, "ad_account_id": "act_2"}, [], 0, "/tmp")
+    assert "error" in result
+    assert task_id not in task_states
+    assert get_progress(task_id).snapshot()["phase"] == "failed"
@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+
+from services import planning_service
+from services.planning_service import estimate_cost, estimate_video_polls, plan_campaign
+from services.retry_service import get_circuit_breaker
+from services.task_manager import task_states
+
+def test_estimate_video_polls_follows_the_poll_backoff():
+    assert estimate_video_polls(0) == 1
+    assert estimate_video_polls(5) == 2
+    assert estimate_video_polls(15) == 3
+    assert estimate_video_polls(60) == 6  # Polls at 0, 5, 15, 30, 50 and 75 seconds
+
+def new_config(**overrides):
+    return {"ad_account_id": f"act_{uuid.uuid4().hex}", "ad_format": "Single image or video", **overrides}
+
+def ad(*media):
+    return {"media": [{"kind": kind, "bytes": size} for kind, size in media]}
+
+def test_estimate_counts_graph_calls():
+    plan = {
+        "campaign": {"existing": False},
+        "ad_sets": [{"existing_id": None, "ads": [ad(("image", 1000)), ad(("video", 25 * 1024 * 1024))]},
+                    {"existing_id": "s2", "ads": []}],
+    }
+    estimate = estimate_cost(plan, new_config(), accounts=2)
+    by_kind = estimate["graph_calls_by_kind"]
+    polls = estimate_video_polls(estimate["video_processing_seconds_each"])
+
+    assert by_kind == {"campaign": 2, "ad_set": 2, "image_upload": 2, "video_upload": 2 * (2 + 3),
+                       "video_status": 2 * polls, "thumbnail": 2, "creative": 4, "ad": 4}
+    assert estimate["graph_calls"] == sum(by_kind.values())
+    assert estimate["graph_writes"] == 12
+    assert estimate["upload_bytes"] == 2 * (1000 + 25 * 1024 * 1024)
+    assert (estimate["videos"], estimate["ads"], estimate["ad_sets"]) == (2, 4, 2)
+    assert estimate["estimated_seconds"] > 0
+
+def test_carousel_waits_for_its_slowest_card():
+    plan = {"campaign": {"existing": True}, "ad_sets": [{"existing_id": "s1", "ads": [ad(("image", 50 * 1024 * 1024), ("image", 50 * 1024 * 1024))]}]}
+    single = estimate_cost(plan, new_config())["estimated_seconds"]
+    carousel = estimate_cost(plan, new_config(ad_format="Carousel"))["estimated_seconds"]
+    assert carousel < single
+
+def test_open_circuit_adds_its_cooldown():
+    config = new_config()
+    breaker = get_circuit_breaker(config["ad_account_id"])
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    estimate = estimate_cost({"campaign": {"existing": True}, "ad_sets": []}, config)
+    assert estimate["rate_limit"]["circuit_open"]
+    assert estimate["estimated_seconds"] == pytest.approx(breaker.cooldown, abs=1)
+
+def test_plan_campaign_builds_payloads_without_tracking_a_task(tmp_path, monkeypatch):
+    for relative_path in ("spring/a.jpg", "spring/b.mp4", "summer/c.png"):
+        (tmp_path / relative_path).parent.mkdir(exist_ok=True)
+        (tmp_path / relative_path).write_bytes(b"x" * 10)
+    monkeypatch.setattr(planning_service, "build_ad_set_params",
+                        lambda campaign_id, name, config: {"name": name, "campaign_id": campaign_id})
+    running = set(task_states)
+
+    plan = plan_campaign(new_config(preflight=False), tmp_path, campaign_id="c1")
+
+    assert plan["campaign"] == {"id": "c1", "existing": True}
+    assert [(s["name"], s["params"]["campaign_id"], len(s["ads"])) for s in plan["ad_sets"]] == [
+        ("spring", "c1", 2), ("summer", "c1", 1)]
+    assert plan["ad_sets"][0]["ads"][1]["media"] == [{"file": "spring/b.mp4", "kind": "video", "bytes": 10}]
+    assert plan["estimate"]["graph_calls_by_kind"]["campaign"] == 0
+    assert set(task_states) == running
@@ -0,0 +1,78 @@
+import pytest
+from PIL import Image
+
+from services import probe_service
+from services.probe_service import check_media, get_media_limits, preflight_media, probe_media
+from services.task_manager import TaskCanceledException
+
+def test_placement_limits_take_the_strictest_bound():
+    limits = get_media_limits({"placements": {"profile_feed": True, "stories": True, "reels": True, "marketplace": False}})
+    assert limits["video"]["min_aspect"] == 0.8
+    assert limits["video"]["max_duration"] == 60
+    assert limits["image"] == {"min_width": 600, "min_height": 600, "min_aspect": 0.8, "max_aspect": 1.91}
+
+def test_carousel_and_explicit_limits():
+    limits = get_media_limits({"ad_format": "Carousel", "media_limits": {"image": {"min_width": 1080}}})
+    assert limits["image"]["min_aspect"] == 0.99
+    assert limits["image"]["min_width"] == 1080
+
+def test_check_media():
+    probe = {"size": 10, "width": 500, "height": 1000, "aspect": 0.5, "duration": 70.0}
+    assert check_media(probe, {"min_width": 600, "min_aspect": 0.8, "max_duration": 60, "max_bytes": 100}) == [
+        "width 500px is below 600px", "aspect ratio 0.5 is below 0.8", "duration 70.0s is above 60s",
+    ]
+    assert check_media({"width": None}, {"min_width": 600}) == []
+
+def test_probe_image_reads_the_header(tmp_path):
+    image_file = tmp_path / "a.png"
+    Image.new("RGB", (800, 600)).save(image_file)
+    probe = probe_media(str(image_file))
+    assert (probe["kind"], probe["width"], probe["height"], probe["aspect"], probe["format"]) == (
+        "image", 800, 600, 1.3333, "PNG")
+
+def test_video_probes_are_cached_by_content(tmp_path, monkeypatch):
+    for name in ("a.mp4", "b.mp4"):
+        (tmp_path / name).write_bytes(b"same video")
+    calls = []
+
+    def fake_probe_video(video_file, task_id=None):
+        calls.append(video_file)
+        return {"width": 1080, "height": 1920, "duration": 10.0}
+
+    monkeypatch.setattr(probe_service, "probe_video", fake_probe_video)
+    first = probe_media(str(tmp_path / "a.mp4"), tmp_path)
+    second = probe_media(str(tmp_path / "b.mp4"), tmp_path)
+    assert first["aspect"] == second["aspect"] == 0.5625
+    assert len(calls) == 1
+
+def test_preflight_drops_rejected_media_and_flags_the_rest(monkeypatch):
+    probes = {
+        "ok.jpg": {"kind": "image", "size": 1, "width": 1080, "height": 1080, "aspect": 1.0},
+        "small.jpg": {"kind": "image", "size": 1, "width": 300, "height": 300, "aspect": 1.0},
+        "huge.jpg": {"kind": "image", "size": 10 ** 9, "width": 1080, "height": 1080, "aspect": 1.0},
+    }
+
+    def fake_probe_media(media_file, temp_dir=None, task_id=None):
+        if media_file not in probes:
+            raise OSError("truncated file")
+        return probes[media_file]
+
+    monkeypatch.setattr(probe_service, "probe_media", fake_probe_media)
+    groups = [("Set A", ["ok.jpg", "small.jpg", "huge.jpg"], "existing-id"), ("Set B", ["broken.jpg"])]
+
+    kept, report = preflight_media(None, groups, {})
+    assert kept == [("Set A", ["ok.jpg", "small.jpg"], "existing-id")]
+    assert [r["file"] for r in report["rejected"]] == ["huge.jpg", "broken.jpg"]
+    assert [r["file"] for r in report["flagged"]] == ["small.jpg"]
+
+    kept, report = preflight_media(None, groups, {"preflight_strict": True})
+    assert kept == [("Set A", ["ok.jpg"], "existing-id")]
+    assert report["flagged"] == []
+
+def test_cancel_during_preflight_stops_the_task(monkeypatch):
+    def canceled_probe(media_file, temp_dir, task_id):
+        raise TaskCanceledException(f"Task {task_id} has been canceled")
+
+    monkeypatch.setattr(probe_service, "probe_media", canceled_probe)
+    with pytest.raises(TaskCanceledException):
+        preflight_media("t", [("Set A", ["/media/a.jpg"])], {})
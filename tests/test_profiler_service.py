@@ -0,0 +1,47 @@
+import sys
+import threading
+
+import pytest
+
+from services import profiler_service
+from services.profiler_service import ProfilerBusy, profile_workers
+
+def spin(task_id, stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+class Worker:
+    def __init__(self, task_id):
+        self.task_id = task_id
+
+    def frame(self):
+        return sys._getframe()
+
+@pytest.fixture
+def busy_task():
+    stop = threading.Event()
+    thread = threading.Thread(target=spin, args=("task-busy", stop), name="busy-worker")
+    thread.start()
+    yield "task-busy"
+    stop.set()
+    thread.join(5)
+
+def test_samples_are_attributed_to_the_running_task(busy_task):
+    result = profile_workers(seconds=0.3, hz=100, top=5)
+    assert result["samples"] > 0
+    assert result["by_task"].get(busy_task, 0) > 0
+    spinning = [line for line in result["collapsed"].splitlines() if line.startswith(f"task {busy_task};")]
+    assert spinning and "spin (tests/test_profiler_service.py)" in spinning[0]
+    assert any(entry["function"].startswith("spin ") for entry in result["top_total"])
+
+def test_task_is_found_through_self():
+    assert profiler_service._task_of(Worker("task-7").frame()) == "task-7"
+
+def test_only_one_profile_runs_at_a_time():
+    with profiler_service._profile_lock:
+        with pytest.raises(ProfilerBusy):
+            profile_workers(seconds=0.1)
+
+def test_duration_and_rate_are_bounded():
+    result = profile_workers(seconds=0, hz=10 ** 6, top=1)
+    assert (result["seconds"], result["hz"]) == (0.1, profiler_service.MAX_HZ)
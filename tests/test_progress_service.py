@@ -0,0 +1,65 @@
+import threading
+import uuid
+
+import pytest
+
+from services.progress_service import (
+    add_ad_set, get_progress, record_media, set_phase, start_progress, wait_for_change,
+)
+from services.task_manager import add_task, cleanup_task_pid, task_states
+
+@pytest.fixture
+def task_id():
+    task_id = f"test-{uuid.uuid4().hex}"
+    add_task(task_id)
+    start_progress(task_id)
+    yield task_id
+    cleanup_task_pid(task_id)
+
+def test_snapshot_counts_overall_and_per_ad_set(task_id):
+    set_phase(task_id, "uploading", total=5)
+    add_ad_set(task_id, 101, "Set A", 3)
+    record_media(task_id, 101)
+    record_media(task_id, 101, success=False)
+    assert record_media(task_id) == 3
+
+    snapshot = get_progress(task_id).snapshot()
+    assert (snapshot["phase"], snapshot["total"], snapshot["done"], snapshot["failed"], snapshot["pending"]) == (
+        "uploading", 5, 2, 1, 2)
+    assert snapshot["ad_sets"] == [{"id": "101", "name": "Set A", "done": 1, "failed": 1, "pending": 1}]
+    assert snapshot["eta_seconds"] is not None
+
+def test_every_change_bumps_the_version(task_id):
+    progress = get_progress(task_id)
+    before = progress.version
+    record_media(task_id)
+    set_phase(task_id, "complete")
+    assert progress.version == before + 2
+
+def test_updates_for_untracked_tasks_are_dropped():
+    task_id = f"test-{uuid.uuid4().hex}"
+    set_phase(task_id, "uploading", total=1)
+    record_media(task_id)
+    assert task_id not in task_states
+    assert get_progress(task_id) is None
+    assert wait_for_change(task_id, 0, 1) is None
+
+def test_wait_for_change_wakes_on_an_update(task_id):
+    version = get_progress(task_id).version
+    threading.Timer(0.05, record_media, args=(task_id,)).start()
+    progress = wait_for_change(task_id, version, 5)
+    assert progress.version > version and progress.done == 1
+
+def test_wait_for_change_times_out_without_an_update(task_id):
+    version = get_progress(task_id).version
+    assert wait_for_change(task_id, version, 0.05).version == version
+
+def test_wait_for_change_returns_at_once_for_a_finished_task(task_id):
+    set_phase(task_id, "complete")
+    version = get_progress(task_id).version
+    assert wait_for_change(task_id, version, 30).phase == "complete"
+
+def test_restarting_a_task_wakes_pollers_of_the_old_run(task_id):
+    old = get_progress(task_id)
+    threading.Timer(0.05, start_progress, args=(task_id,)).start()
+    assert wait_for_change(task_id, old.version, 5) is not old
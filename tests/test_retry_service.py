@@ -0,0 +1,158 @@
+import asyncio
+import uuid
+
+import pytest
+
+from services import retry_service
+from services.async_media_processing_service import _AsyncMediaPipeline
+from services.retry_service import (
+    AMBIGUOUS, PERMANENT, RATE_LIMITED, TRANSIENT, CircuitBreaker, CircuitOpenError, RetryBudget,
+    backoff_delay, call_with_retry, call_with_retry_async, classify_error, should_retry,
+)
+from services.task_manager import TaskCanceledException
+from utils.error_handler import GraphAPIError
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(retry_service, "backoff_delay", lambda attempt, error_class: 0)
+
+def new_id(prefix):
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+def failing(errors, result="ok"):
+    """Returns a callable raising each of `errors` in turn, then returning `result`."""
+    errors = list(errors)
+    calls = []
+
+    def func(*args):
+        calls.append(args)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    func.calls = calls
+    return func
+
+def test_classify_error():
+    assert classify_error(GraphAPIError("limit", code=17, status=400)) == RATE_LIMITED
+    assert classify_error(GraphAPIError("unknown", code=2, status=500)) == TRANSIENT
+    assert classify_error(GraphAPIError("server", status=503)) == TRANSIENT
+    assert classify_error(GraphAPIError("invalid", code=100, status=400)) == PERMANENT
+    assert classify_error(ConnectionRefusedError()) == TRANSIENT
+    assert classify_error(ConnectionResetError()) == AMBIGUOUS
+    assert classify_error(ValueError("bad")) == PERMANENT
+
+def test_should_retry():
+    assert should_retry(TRANSIENT, idempotent=False)
+    assert should_retry(RATE_LIMITED, idempotent=False)
+    assert should_retry(AMBIGUOUS, idempotent=True)
+    assert not should_retry(AMBIGUOUS, idempotent=False)
+    assert not should_retry(PERMANENT, idempotent=True)
+
+def test_backoff_is_jittered_and_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, TRANSIENT) <= min(retry_service.MAX_DELAY, retry_service.BASE_DELAY * 2 ** attempt)
+        assert backoff_delay(attempt, RATE_LIMITED) <= retry_service.MAX_DELAY
+
+def test_retry_budget_runs_out():
+    budget = RetryBudget(2)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+
+def test_transient_failures_are_retried():
+    func = failing([GraphAPIError("busy", code=2), ConnectionRefusedError()])
+    assert call_with_retry(func, "a", task_id=new_id("task"), ad_account_id=new_id("act")) == "ok"
+    assert len(func.calls) == 3
+
+def test_permanent_failure_is_raised_at_once():
+    func = failing([GraphAPIError("invalid", code=100, status=400)])
+    with pytest.raises(GraphAPIError):
+        call_with_retry(func, task_id=new_id("task"), ad_account_id=new_id("act"))
+    assert len(func.calls) == 1
+
+def test_ambiguous_failure_of_a_create_is_not_retried():
+    func = failing([ConnectionResetError()])
+    with pytest.raises(ConnectionResetError):
+        call_with_retry(func, task_id=new_id("task"), ad_account_id=new_id("act"), idempotent=False)
+    assert len(func.calls) == 1
+
+def test_gives_up_after_max_attempts():
+    func = failing([GraphAPIError("busy", code=2)] * retry_service.MAX_ATTEMPTS)
+    with pytest.raises(GraphAPIError):
+        call_with_retry(func, task_id=new_id("task"), ad_account_id=new_id("act"))
+    assert len(func.calls) == retry_service.MAX_ATTEMPTS
+
+def test_cancellation_is_not_retried():
+    func = failing([TaskCanceledException("canceled")])
+    ad_account_id = new_id("act")
+    with pytest.raises(TaskCanceledException):
+        call_with_retry(func, task_id=new_id("task"), ad_account_id=ad_account_id)
+    assert len(func.calls) == 1
+    assert retry_service.get_circuit_breaker(ad_account_id).failures == 0
+
+def test_circuit_opens_after_repeated_failures_and_recovers(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(retry_service.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("act", failure_threshold=2, cooldown=10)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    now[0] += 11
+    breaker.before_call()  # Trial call
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Only one trial at a time
+    breaker.record_success()
+    breaker.before_call()
+
+def sync_canceled_call(task_id, ad_account_id):
+    call_with_retry(failing([TaskCanceledException("canceled")]), task_id=task_id, ad_account_id=ad_account_id)
+
+def async_canceled_call(task_id, ad_account_id):
+    async def func():
+        raise asyncio.CancelledError()
+    asyncio.run(call_with_retry_async(func, task_id=task_id, ad_account_id=ad_account_id))
+
+@pytest.mark.parametrize("canceled_call", [sync_canceled_call, async_canceled_call])
+def test_canceled_trial_call_releases_the_half_open_circuit(monkeypatch, canceled_call):
+    now = [100.0]
+    monkeypatch.setattr(retry_service.time, "monotonic", lambda: now[0])
+    ad_account_id = new_id("act")
+    breaker = retry_service.get_circuit_breaker(ad_account_id)
+    breaker.failure_threshold, breaker.cooldown = 1, 10
+    breaker.record_failure()
+    now[0] += 11
+
+    with pytest.raises((TaskCanceledException, asyncio.CancelledError)):
+        canceled_call(new_id("task"), ad_account_id)
+    assert not breaker.trial_in_flight and breaker.failures == 1
+    call_with_retry(failing([]), task_id=new_id("task"), ad_account_id=ad_account_id)  # The next trial runs
+    assert breaker.opened_at is None
+
+def test_video_chunks_are_retried_one_at_a_time(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"x" * 20)
+    sent = []
+
+    class Client:
+        async def start_video_upload(self, ad_account_id, file_size):
+            return {"upload_session_id": "s1", "video_id": "v1", "start_offset": "0", "end_offset": "10"}
+
+        async def transfer_video_chunk(self, ad_account_id, session_id, video_file, start_offset, length):
+            sent.append(start_offset)
+            if sent.count(10) == 1 and start_offset == 10:
+                raise GraphAPIError("busy", code=2)
+            return {"start_offset": str(start_offset + length), "end_offset": "20"}
+
+        async def finish_video_upload(self, ad_account_id, session_id):
+            return {"success": True}
+
+    async def main():
+        pipeline = _AsyncMediaPipeline(Client(), {"ad_account_id": new_id("act")}, new_id("task"),
+                                       None, 1, max_uploads=1, max_writes=1)
+        return await pipeline._upload_video_chunks(str(video))
+
+    assert asyncio.run(main()) == "v1"
+    assert sent == [0, 10, 10]  # The failed chunk is resent, not the whole file
@@ -0,0 +1,104 @@
+import io
+import os
+import stat
+import subprocess
+import sys
+from queue import Queue
+
+import pytest
+
+from services import staging_service
+from services.staging_service import (
+    create_staging_dir, flush_deletes, link_file, release_staging_dir, stage_file, staging_stats, sweep_orphans,
+)
+
+@pytest.fixture(autouse=True)
+def staging(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging_service, "STAGING_RAM_ROOT", str(tmp_path / "ram"))
+    monkeypatch.setattr(staging_service, "STAGING_DISK_ROOT", str(tmp_path / "disk"))
+    monkeypatch.setattr(staging_service, "MAX_RAM_FILE_BYTES", 100)
+    monkeypatch.setattr(staging_service, "RAM_QUOTA_BYTES", 150)
+    monkeypatch.setattr(staging_service, "MIN_RAM_FREE_BYTES", 0)
+    monkeypatch.setattr(staging_service, "blobs", {})
+    monkeypatch.setattr(staging_service, "staging_dirs", {})
+    monkeypatch.setattr(staging_service, "ram_bytes", 0)
+    monkeypatch.setattr(staging_service, "_trash", Queue())
+    monkeypatch.setattr(staging_service, "start_janitor", lambda: None)  # Deletes run through flush_deletes
+    return tmp_path
+
+def stage(directory, name, content):
+    return stage_file(io.BytesIO(content), directory / name, len(content))
+
+def test_small_files_go_to_ram_and_large_ones_to_disk(staging):
+    directory = create_staging_dir()
+    stage(directory, "small.jpg", b"s" * 80)
+    stage(directory, "large.mp4", b"l" * 500)
+
+    small, large = (staging_service.blobs[d] for d in staging_service.staging_dirs[str(directory)])
+    assert small.in_ram and small.path.startswith(str(staging / "ram"))
+    assert not large.in_ram and large.path.startswith(str(staging / "disk"))
+    assert (directory / "small.jpg").read_bytes() == b"s" * 80
+    assert staging_stats()["ram_bytes"] == 80
+
+def test_ram_quota_spills_to_disk():
+    directory = create_staging_dir()
+    stage(directory, "a.jpg", b"a" * 80)
+    stage(directory, "b.jpg", b"b" * 80)  # Would exceed the 150 byte quota
+    a, b = (staging_service.blobs[d] for d in staging_service.staging_dirs[str(directory)])
+    assert a.in_ram and not b.in_ram
+    assert staging_service.ram_bytes == 80
+
+def test_blobs_are_read_only():
+    directory = create_staging_dir()
+    stage(directory, "a.jpg", b"a")
+    blob, = staging_service.blobs.values()
+    assert not os.stat(blob.path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+def test_shared_content_is_kept_until_the_last_directory_is_released():
+    first, second = create_staging_dir(), create_staging_dir()
+    size, digest = stage(first, "a.jpg", b"same")
+    assert stage(second, "b.jpg", b"same") == (size, digest)
+    blob = staging_service.blobs[digest]
+    assert blob.refs == 2 and staging_service.ram_bytes == 4  # Stored once
+
+    assert release_staging_dir(first)
+    flush_deletes()
+    assert not first.exists()
+    assert (second / "b.jpg").read_bytes() == b"same"
+
+    assert release_staging_dir(second)
+    flush_deletes()
+    assert not second.exists() and not os.path.exists(blob.path)
+    assert staging_stats()["blobs"] == 0 and staging_service.ram_bytes == 0
+    assert not [p for p in os.listdir(os.path.dirname(blob.path)) if not p.startswith(".")]
+
+def test_releasing_an_unknown_directory(staging):
+    assert not release_staging_dir(staging / "missing")
+
+def test_link_file_prefers_a_hardlink(staging):
+    source = staging / "source.mp4"
+    source.write_bytes(b"video")
+    assert link_file(source, staging / "linked.mp4") == "hardlink"
+    assert os.path.samefile(source, staging / "linked.mp4")
+
+def test_link_file_falls_back_to_a_symlink(staging, monkeypatch):
+    source = staging / "source.mp4"
+    source.write_bytes(b"video")
+
+    def no_hardlinks(*args):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(staging_service.os, "link", no_hardlinks)
+    monkeypatch.setattr(staging_service, "_reflink", lambda source, file_path: False)
+    assert link_file(source, staging / "linked.mp4") == "symlink"
+    assert os.readlink(staging / "linked.mp4") == str(source)
+
+def test_sweep_removes_files_of_exited_processes(staging):
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    leftover = staging / "disk" / exited.stdout.strip()
+    (leftover / "dirs").mkdir(parents=True)
+    live = create_staging_dir()
+
+    sweep_orphans()
+    assert not leftover.exists()
+    assert live.exists()
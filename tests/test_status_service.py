@@ -0,0 +1,123 @@
+import threading
+import uuid
+
+import pytest
+
+from services import status_service
+from services.task_manager import TaskCanceledException, cancel_task, finished_tasks, task_states
+from utils.error_handler import GraphAPIError
+
+class FakeResponse:
+    def __init__(self, error):
+        self._error = error
+
+    def error(self):
+        return self._error
+
+class FakeBatch:
+    def __init__(self, api):
+        self.api = api
+        self.requests = []
+
+    def add(self, object_id, success, failure):
+        self.requests.append((object_id, success, failure))
+
+    def execute(self):
+        with self.api.lock:
+            self.api.batches.append([object_id for object_id, _, _ in self.requests])
+        for object_id, success, failure in self.requests:
+            errors = self.api.errors.get(object_id)
+            if errors:
+                failure(FakeResponse(errors.pop(0)))
+            else:
+                self.api.updated.append(object_id)
+                success(FakeResponse(None))
+        return None
+
+class FakeApi:
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.batches = []
+        self.updated = []
+        self.lock = threading.Lock()
+
+    def new_batch(self):
+        return FakeBatch(self)
+
+class FakeObject:
+    def __init__(self, object_id, api=None):
+        self.object_id = object_id
+
+    def api_update(self, params, batch, success, failure):
+        batch.add(self.object_id, success, failure)
+
+@pytest.fixture
+def api(monkeypatch):
+    api = FakeApi()
+    monkeypatch.setattr(status_service, "get_api_for_config", lambda config: api)
+    monkeypatch.setattr(status_service, "OBJECT_CLASSES", {t: FakeObject for t in ("campaign", "adset", "ad")})
+    monkeypatch.setattr(status_service, "backoff_delay", lambda attempt, error_class: 0)
+    monkeypatch.setattr(status_service, "MAX_PARALLEL_BATCHES", 1)
+    return api
+
+CONFIG = {"ad_account_id": "act_1"}
+OBJECTS = [
+    {"id": "ad1", "type": "ad"},
+    {"id": "c1", "type": "campaign"},
+    {"id": "s1", "type": "adset"},
+]
+
+def test_rejects_unknown_status(api):
+    with pytest.raises(ValueError):
+        status_service.update_object_statuses("t", CONFIG, OBJECTS, "DELETED")
+
+def test_activation_goes_parents_first_and_pausing_children_first(api, monkeypatch):
+    monkeypatch.setattr(status_service, "MAX_PARALLEL_BATCHES", 4)
+    results = status_service.update_object_statuses("t", CONFIG, OBJECTS, "ACTIVE")
+    assert api.batches == [["c1"], ["s1"], ["ad1"]]
+    assert [r["id"] for r in results] == ["ad1", "c1", "s1"]  # Same order as requested
+    assert all(r["success"] for r in results)
+
+    api.batches.clear()
+    status_service.update_object_statuses("t", CONFIG, OBJECTS, "PAUSED")
+    assert api.batches == [["ad1"], ["s1"], ["c1"]]
+
+def test_a_tier_finishes_its_retries_before_the_next_starts(api):
+    api.errors["c1"] = [GraphAPIError("busy", code=2)]
+    status_service.update_object_statuses("t", CONFIG, OBJECTS, "ACTIVE")
+    assert api.batches == [["c1"], ["c1"], ["s1"], ["ad1"]]
+
+def test_transient_failures_are_retried_in_a_later_round(api):
+    objects = [{"id": "ad1", "type": "ad"}, {"id": "ad2", "type": "ad"}]
+    api.errors["ad1"] = [GraphAPIError("busy", code=2)]
+    api.errors["ad2"] = [GraphAPIError("invalid", code=100, status=400)]
+    results = {r["id"]: r for r in status_service.update_object_statuses("t", CONFIG, objects, "ACTIVE")}
+
+    assert api.batches == [["ad1", "ad2"], ["ad1"]]
+    assert results["ad1"]["success"]
+    assert not results["ad2"]["success"] and results["ad2"]["error"] == "invalid"
+
+def test_updates_without_an_operation_id_register_no_task(api):
+    finished = len(finished_tasks)
+    status_service.update_object_statuses("t", CONFIG, OBJECTS, "ACTIVE")
+    assert not [task_id for task_id in task_states if task_id.startswith("t-status-")]
+    assert len(finished_tasks) == finished
+
+def test_operation_id_can_be_canceled(api, monkeypatch):
+    operation_id = f"op-{uuid.uuid4().hex}"
+    api.errors["c1"] = [GraphAPIError("busy", code=2)]
+    canceled = []
+
+    def cancel_after_first_round(*args):
+        if not canceled:
+            canceled.append(cancel_task(operation_id))
+        return 0
+
+    monkeypatch.setattr(status_service, "backoff_delay", cancel_after_first_round)
+    with pytest.raises(TaskCanceledException):
+        status_service.update_object_statuses("t", CONFIG, OBJECTS, "ACTIVE", operation_id=operation_id)
+    assert api.batches == [["c1"]]
+    assert operation_id not in task_states and "message" in canceled[0]
+
+    with pytest.raises(ValueError):  # Reusing a known task ID would replace its record
+        status_service.update_object_statuses("t", CONFIG, OBJECTS, "ACTIVE", operation_id=operation_id)
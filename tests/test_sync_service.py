@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import pytest
+
+from services import sync_service
+from services.file_service import get_media_index
+from services.sync_service import _apply_results, load_sync_manifest, manifest_path, plan_sync, save_sync_manifest
+
+SINGLE = "Single image or video"
+
+def stage(root, files):
+    for relative_path, content in files.items():
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return root
+
+def plan(manifest, root, ad_format=SINGLE):
+    return plan_sync(manifest, get_media_index(root).groups(), root, ad_format)
+
+def synced_manifest(root, ad_format=SINGLE):
+    """Plans a first sync of `root` and records an ad for every file, as a finished task would."""
+    manifest = {"campaign_id": "c1", "ad_account_id": "act_1", "ad_sets": {}}
+    first = plan(manifest, root, ad_format)
+    results = [
+        {"ad_set_name": name, "ad_set_id": f"set-{name}", "media": files,
+         "ads": {f: f"ad-{Path(f).relative_to(root).as_posix()}" for f in files}}
+        for name, files, _ in first["groups"]
+    ]
+    _apply_results(manifest, first, results, root)
+    return manifest
+
+def test_first_sync_creates_everything(tmp_path):
+    root = stage(tmp_path / "run1", {"spring/a.jpg": b"a", "spring/b.jpg": b"b"})
+    result = plan({"ad_sets": {}}, root)
+    assert (result["added"], result["changed"], result["unchanged"]) == (2, 0, 0)
+    assert [(name, existing) for name, _, existing in result["groups"]] == [("spring", None)]
+
+def test_only_new_and_changed_files_are_created(tmp_path):
+    manifest = synced_manifest(stage(tmp_path / "run1", {"spring/a.jpg": b"a", "spring/b.jpg": b"b",
+                                                         "spring/c.jpg": b"c"}))
+    root = stage(tmp_path / "run2", {"spring/a.jpg": b"a", "spring/b.jpg": b"b2", "spring/d.jpg": b"d"})
+    result = plan(manifest, root)
+
+    assert (result["added"], result["changed"], result["unchanged"]) == (1, 1, 1)
+    (name, files, ad_set_id), = result["groups"]
+    assert ad_set_id == "set-spring"  # Ads go into the existing ad set
+    assert sorted(files) == [str(root / "spring/b.jpg"), str(root / "spring/d.jpg")]
+    assert result["replaced"] == {"spring/b.jpg": "ad-spring/b.jpg"}
+    assert result["removed"] == {"spring/c.jpg": "ad-spring/c.jpg"}
+
+def test_unchanged_upload_creates_nothing(tmp_path):
+    files = {"spring/a.jpg": b"a", "summer/b.jpg": b"b"}
+    manifest = synced_manifest(stage(tmp_path / "run1", files))
+    result = plan(manifest, stage(tmp_path / "run2", files))
+    assert result["groups"] == [] and result["removed"] == {}
+    assert result["unchanged"] == 2
+
+def test_carousel_folder_is_recreated_on_any_change(tmp_path):
+    manifest = synced_manifest(stage(tmp_path / "run1", {"spring/a.jpg": b"a", "spring/b.jpg": b"b",
+                                                         "summer/c.jpg": b"c"}), "Carousel")
+    root = stage(tmp_path / "run2", {"spring/a.jpg": b"a", "spring/b.jpg": b"b2", "summer/c.jpg": b"c"})
+    result = plan(manifest, root, "Carousel")
+
+    (name, files, _), = result["groups"]
+    assert name == "spring" and len(files) == 2
+    assert result["replaced"] == {"spring/a.jpg": "ad-spring/a.jpg", "spring/b.jpg": "ad-spring/b.jpg"}
+
+def test_manifest_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync_service, "SYNC_MANIFEST_DIR", tmp_path / "manifests")
+    assert load_sync_manifest("act_1", "123") == {"campaign_id": "123", "ad_account_id": "act_1", "ad_sets": {}}
+
+    manifest = {"campaign_id": "123", "ad_account_id": "act_1",
+                "ad_sets": {"spring": {"ad_set_id": "s1", "files": {"spring/a.jpg": {"digest": "d", "ad_id": "a1"}}}}}
+    save_sync_manifest(manifest)
+    assert load_sync_manifest("act_1", "123") == manifest
+    assert [p.name for p in (tmp_path / "manifests").iterdir()] == ["act_1_123.json"]
+
+@pytest.mark.parametrize("ad_account_id, campaign_id", [("act_1", "../../etc/x"), ("act_1/..", "123"), ("act_", "123")])
+def test_manifest_path_rejects_non_numeric_ids(ad_account_id, campaign_id):
+    with pytest.raises(ValueError):
+        manifest_path(ad_account_id, campaign_id)
@@ -0,0 +1,204 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+from services import task_manager
+from services.task_manager import (
+    CancellationToken, TaskCanceledException, add_task, cancel_task, check_cancellation,
+    cleanup_task_pid, get_cancel_token, get_created_objects, get_task_state, on_task_finished,
+    record_created_object, task_states,
+)
+
+def new_task_id():
+    return f"test-{uuid.uuid4().hex}"
+
+def test_token_is_not_canceled_until_cancel():
+    token = CancellationToken("t")
+    assert not token.is_canceled()
+    token.raise_if_canceled()
+
+    token.cancel()
+    assert token.is_canceled()
+    with pytest.raises(TaskCanceledException):
+        token.raise_if_canceled()
+
+def test_cancel_runs_each_callback_once():
+    token = CancellationToken("t")
+    calls = []
+    token.add_callback(lambda: calls.append("a"))
+    token.add_callback(lambda: calls.append("b"))
+
+    token.cancel()
+    token.cancel()
+    assert calls == ["a", "b"]
+
+def test_callback_added_after_cancel_runs_immediately():
+    token = CancellationToken("t")
+    token.cancel()
+    calls = []
+    token.add_callback(lambda: calls.append(1))
+    assert calls == [1]
+
+def test_removed_callback_is_not_run():
+    token = CancellationToken("t")
+    calls = []
+    callback = lambda: calls.append(1)
+    token.add_callback(callback)
+    token.remove_callback(callback)
+    token.cancel()
+    assert calls == []
+
+def test_failing_callback_does_not_stop_the_others():
+    token = CancellationToken("t")
+    calls = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    token.add_callback(fail)
+    token.add_callback(lambda: calls.append(1))
+    token.cancel()
+    assert calls == [1]
+
+def test_wait_wakes_on_cancel():
+    token = CancellationToken("t")
+    threading.Timer(0.05, token.cancel).start()
+    start = time.monotonic()
+    assert token.wait(5) is True
+    assert time.monotonic() - start < 2
+
+def test_wait_times_out_without_cancel():
+    assert CancellationToken("t").wait(0.01) is False
+
+def test_registered_process_is_killed_on_cancel():
+    class FakeProcess:
+        pid = 1
+        killed = False
+
+        def poll(self):
+            return None
+
+        def kill(self):
+            self.killed = True
+
+    token = CancellationToken("t")
+    process = FakeProcess()
+    token.register_process(process)
+    token.cancel()
+    assert process.killed
+
+def test_cancellation_is_seen_by_every_check():
+    task_id = new_task_id()
+    add_task(task_id)
+    try:
+        check_cancellation(task_id)
+        assert cancel_task(task_id) == {"message": f"Task {task_id} has been canceled."}
+        for _ in range(3):  # Checking does not consume the cancellation
+            with pytest.raises(TaskCanceledException):
+                check_cancellation(task_id)
+        assert get_cancel_token(task_id).is_canceled()
+    finally:
+        cleanup_task_pid(task_id)
+
+def test_cancel_wakes_a_waiting_worker():
+    task_id = new_task_id()
+    add_task(task_id)
+    try:
+        token = get_cancel_token(task_id)
+        woke = []
+        worker = threading.Thread(target=lambda: woke.append(token.wait(5)))
+        worker.start()
+        cancel_task(task_id)
+        worker.join(2)
+        assert woke == [True]
+    finally:
+        cleanup_task_pid(task_id)
+
+def test_cancel_of_an_unknown_task_registers_nothing():
+    task_id = new_task_id()
+    response = cancel_task(task_id)
+    assert response["not_found"] and "error" in response
+    assert task_id not in task_states
+    assert get_task_state(task_id) is None
+
+def test_task_canceled_before_it_starts_starts_canceled():
+    task_id = new_task_id()
+    cancel_task(task_id)
+    assert get_cancel_token(task_id).is_canceled()  # Workers looking early see it too
+    add_task(task_id)
+    try:
+        with pytest.raises(TaskCanceledException):
+            check_cancellation(task_id)
+    finally:
+        cleanup_task_pid(task_id)
+    assert task_id not in task_manager.pending_cancels
+
+def test_pending_cancels_are_bounded(monkeypatch):
+    monkeypatch.setattr(task_manager, "pending_cancels", OrderedDict())
+    monkeypatch.setattr(task_manager, "MAX_PENDING_CANCELS", 3)
+    task_ids = [new_task_id() for _ in range(5)]
+    for task_id in task_ids:
+        cancel_task(task_id)
+    assert list(task_manager.pending_cancels) == task_ids[2:]
+
+def test_finished_tasks_stay_queryable_up_to_a_bound(monkeypatch):
+    monkeypatch.setattr(task_manager, "finished_tasks", OrderedDict())
+    monkeypatch.setattr(task_manager, "MAX_FINISHED_TASKS", 2)
+    task_ids = [new_task_id() for _ in range(3)]
+    for task_id in task_ids:
+        add_task(task_id)
+        record_created_object(task_id, "ad", 1, name="Ad", ad_set_id="s1")
+        cleanup_task_pid(task_id)
+
+    assert get_task_state(task_ids[0]) is None
+    assert [o["id"] for o in get_created_objects(task_ids[2])] == ["1"]
+    assert cancel_task(task_ids[2]) == {"message": f"Task {task_ids[2]} has already finished."}
+    assert task_ids[2] not in task_manager.pending_cancels
+
+def test_created_objects_filters():
+    task_id = new_task_id()
+    add_task(task_id)
+    try:
+        record_created_object(task_id, "campaign", "c1")
+        record_created_object(task_id, "adset", "s1", name="Set")
+        record_created_object(task_id, "ad", "a1", ad_set_id="s1")
+        record_created_object(task_id, "ad", "a2", ad_set_id="s2")
+        record_created_object(task_id, "ad", None)
+
+        assert [o["id"] for o in get_created_objects(task_id)] == ["c1", "s1", "a1", "a2"]
+        assert [o["id"] for o in get_created_objects(task_id, object_types=["ad"])] == ["a1", "a2"]
+        assert [o["id"] for o in get_created_objects(task_id, ad_set_ids=["s1"])] == ["s1", "a1"]
+        assert [o["id"] for o in get_created_objects(task_id, ids=["a2", "c1"])] == ["c1", "a2"]
+    finally:
+        cleanup_task_pid(task_id)
+
+def test_finish_callbacks_run_once_the_task_is_cleaned_up():
+    task_id = new_task_id()
+    calls = []
+    add_task(task_id)
+    on_task_finished(task_id, lambda: calls.append("finished"))
+    assert calls == []
+    cleanup_task_pid(task_id)
+    assert calls == ["finished"]
+
+    on_task_finished(task_id, lambda: calls.append("late"))  # Not running any more: runs at once
+    assert calls == ["finished", "late"]
+
+def test_stale_tasks_are_retired(monkeypatch):
+    task_id = new_task_id()
+    add_task(task_id)
+    get_task_state(task_id).started_at -= 10
+    monkeypatch.setattr(task_manager, "STALE_TASK_SECONDS", 5)
+    monkeypatch.setattr(task_manager, "_last_stale_sweep", [0.0])
+
+    other = new_task_id()
+    add_task(other)  # Adding a task runs the sweep
+    try:
+        assert task_id not in task_states
+        assert get_task_state(task_id).finished_at is not None
+        assert other in task_states
+    finally:
+        cleanup_task_pid(other)
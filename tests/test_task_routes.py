@@ -0,0 +1,71 @@
+import uuid
+
+import pytest
+from flask import Flask
+
+from routes.task_routes import task_bp
+from services.progress_service import record_media, set_phase, start_progress
+from services.task_manager import add_task, cleanup_task_pid
+from utils import validators
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(task_bp, url_prefix="/tasks")
+    return app.test_client()
+
+@pytest.fixture
+def task_id():
+    task_id = f"test-{uuid.uuid4().hex}"
+    add_task(task_id)
+    start_progress(task_id)
+    yield task_id
+    cleanup_task_pid(task_id)
+
+def test_status_of_an_unknown_task(client):
+    assert client.get(f"/tasks/test-{uuid.uuid4().hex}").status_code == 404
+
+def test_status_snapshot_and_etag(client, task_id):
+    set_phase(task_id, "uploading", total=2)
+    response = client.get(f"/tasks/{task_id}")
+    assert response.status_code == 200
+    assert response.json["phase"] == "uploading" and response.json["pending"] == 2
+    etag = response.headers["ETag"]
+
+    unchanged = client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+
+    record_media(task_id)
+    changed = client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json["done"] == 1
+    assert changed.headers["ETag"] != etag
+
+def test_long_poll_times_out_with_not_modified(client, task_id):
+    etag = client.get(f"/tasks/{task_id}").headers["ETag"]
+    response = client.get(f"/tasks/{task_id}?wait=0.1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+def test_cancel_of_an_unknown_task_is_not_found(client):
+    response = client.post("/tasks/cancel_task", json={"task_id": f"test-{uuid.uuid4().hex}"})
+    assert response.status_code == 404
+    assert "not_found" not in response.json
+
+def test_cancel_of_a_running_task(client, task_id):
+    response = client.post("/tasks/cancel_task", json={"task_id": task_id})
+    assert response.status_code == 200
+    assert client.post("/tasks/cancel_task", json={"task_id": task_id}).json == {
+        "message": f"Task {task_id} was already canceled."}
+
+def test_memory_requires_the_admin_token(client, task_id, monkeypatch):
+    monkeypatch.setattr(validators, "ADMIN_TOKEN", "secret")
+    assert client.get(f"/tasks/{task_id}/memory").status_code == 401
+
+def test_memory_record(client, task_id, monkeypatch):
+    monkeypatch.setattr(validators, "ADMIN_TOKEN", "secret")
+    auth = {"Authorization": "Bearer secret"}
+    assert client.get(f"/tasks/test-{uuid.uuid4().hex}/memory", headers=auth).status_code == 404
+
+    response = client.get(f"/tasks/{task_id}/memory", headers=auth)
+    assert response.status_code == 200
+    assert response.json["task_id"] == task_id
+    assert [phase["phase"] for phase in response.json["phases"]] == ["staging"]  # Recorded by start_progress
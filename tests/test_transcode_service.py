@@ -0,0 +1,157 @@
+import os
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+import pytest
+
+from services import transcode_service
+from services.task_manager import add_task, cleanup_task_pid
+from services.transcode_service import (
+    build_ffmpeg_command, enforce_cache_quota, get_transcode_profile, is_within_budget, transcode_media, upload_path,
+)
+
+PROFILE = transcode_service.TRANSCODE_PROFILES["1080p"]
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "transcodes"
+    cache_dir.mkdir()
+    monkeypatch.setattr(transcode_service, "TRANSCODE_CACHE_DIR", cache_dir)
+    monkeypatch.setattr(transcode_service, "_outputs", OrderedDict())
+    monkeypatch.setattr(transcode_service, "_in_use", Counter())
+    monkeypatch.setattr(transcode_service, "probe_media", lambda *args: {
+        "width": 2160, "height": 3840, "duration": 1.0, "size": 1000, "codec": "hevc", "format": "mov"})
+    return cache_dir
+
+def write(path, size, age=0):
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+def test_is_within_budget():
+    small = {"width": 1080, "height": 1920, "duration": 10.0, "size": 5_000_000, "codec": "h264", "format": "mov,mp4,m4a"}
+    assert is_within_budget(small, PROFILE)
+    assert not is_within_budget({**small, "width": 2160, "height": 3840}, PROFILE)
+    assert not is_within_budget({**small, "size": 50_000_000}, PROFILE)
+    assert not is_within_budget({**small, "codec": "hevc"}, PROFILE)
+    assert is_within_budget({"size": 1}, PROFILE)  # Nothing to judge by
+
+def test_profile_overrides():
+    profile = get_transcode_profile({"transcode_profile": "720p", "transcode_overrides": {"crf": 30}})
+    assert (profile["max_short_side"], profile["crf"]) == (720, 30)
+    assert get_transcode_profile({"transcode_profile": "unknown"}) == PROFILE
+
+def test_ffmpeg_command():
+    command = build_ffmpeg_command("in.mov", "out.mp4", PROFILE)
+    assert command[:2] == ["ffmpeg", "-y"] and command[-1] == "out.mp4"
+    assert command[command.index("-crf") + 1] == "23"
+    assert "+faststart" in command
+
+def test_quota_evicts_least_recently_used_outputs_not_in_use(cache):
+    oldest = write(cache / "old.mp4", 100, age=300)
+    in_use = write(cache / "used.mp4", 100, age=200)
+    newest = write(cache / "new.mp4", 100, age=100)
+    stale_partial = write(cache / "x.mp4.part.mp4", 10, age=transcode_service.STALE_PARTIAL_SECONDS + 1)
+    live_partial = write(cache / "y.mp4.part.mp4", 10)
+    transcode_service._in_use[in_use] += 1
+    transcode_service._outputs[("digest", "profile")] = oldest
+
+    assert enforce_cache_quota(250) == 100
+    assert sorted(os.listdir(cache)) == ["new.mp4", "used.mp4", "y.mp4.part.mp4"]
+    assert not transcode_service._outputs
+
+    # The older output is still in use, so the newer one goes
+    assert enforce_cache_quota(50) == 100
+    assert os.path.exists(in_use) and not os.path.exists(newest)
+    assert not os.path.exists(stale_partial) and os.path.exists(live_partial)
+
+def test_outputs_are_shared_and_held_until_the_task_finishes(cache, tmp_path, monkeypatch):
+    staging = tmp_path / "staging"
+    (staging / "set").mkdir(parents=True)
+    source = write(staging / "set" / "a.mov", 1000)
+    transcodes = []
+
+    def fake_transcode(source, output, profile, task_id=None):
+        transcodes.append(source)
+        write(cache / os.path.basename(output), 100)
+        return True
+
+    monkeypatch.setattr(transcode_service, "transcode_video", fake_transcode)
+
+    task_ids = [f"test-{uuid.uuid4().hex}" for _ in range(2)]
+    configs = [{}, {}]
+    for task_id, config in zip(task_ids, configs):
+        add_task(task_id)
+        report = transcode_media(task_id, [("set", [source])], config, staging)
+        assert (report["transcoded"], report["bytes_saved"]) == (1, 900)
+
+    assert transcodes == [source]  # The second task reused the cached output
+    output = upload_path(configs[0], source)
+    assert output != source and upload_path(configs[1], source) == output
+    assert transcode_service._in_use[output] == 2
+
+    for task_id in task_ids:
+        cleanup_task_pid(task_id)
+    assert transcode_service._in_use[output] == 0
+
+def test_the_same_video_is_transcoded_once_at_a_time(cache, tmp_path, monkeypatch):
+    staging = tmp_path / "staging"
+    for folder in ("a", "b"):
+        (staging / folder).mkdir(parents=True)
+    sources = [write(staging / folder / "clip.mov", 1000) for folder in ("a", "b")]  # Same content, same digest
+    transcodes = []
+
+    def slow_transcode(source, output, profile, task_id=None):
+        transcodes.append(source)
+        time.sleep(0.2)
+        write(cache / os.path.basename(output), 100)
+        return True
+
+    monkeypatch.setattr(transcode_service, "transcode_video", slow_transcode)
+    monkeypatch.setattr(transcode_service, "MAX_PARALLEL_TRANSCODES", 2)
+    config = {}
+    report = transcode_media(f"test-{uuid.uuid4().hex}", [("a", sources[:1]), ("b", sources[1:])], config, staging)
+
+    assert len(transcodes) == 1 and report["transcoded"] == 2
+    assert upload_path(config, sources[0]) == upload_path(config, sources[1])
+    assert not transcode_service._transcoding
+
+def test_files_without_a_digest_get_their_own_output(cache, tmp_path, monkeypatch):
+    sources = []
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        sources.append(write(tmp_path / folder / "clip.mov", 1000))
+    outputs = []
+
+    def fake_transcode(source, output, profile, task_id=None):
+        outputs.append(output)
+        write(cache / os.path.basename(output), 100)
+        return True
+
+    monkeypatch.setattr(transcode_service, "transcode_video", fake_transcode)
+    transcode_media(f"test-{uuid.uuid4().hex}", [("set", sources)], {})
+    assert len(set(outputs)) == 2
+
+def test_each_run_writes_its_own_partial_file(cache, monkeypatch):
+    partials = []
+
+    class FailingProcess:
+        returncode = 1
+
+        def __init__(self, command, **kwargs):
+            partials.append(command[-1])
+
+        def communicate(self):
+            return b"", b"boom"
+
+    monkeypatch.setattr(transcode_service.subprocess, "Popen", FailingProcess)
+    other = write(cache / "clip_profile.part.mp4", 10)  # Another run still writing
+    output = str(cache / "clip_profile.mp4")
+    assert not transcode_service.transcode_video("in.mov", output, PROFILE)
+    assert not transcode_service.transcode_video("in.mov", output, PROFILE)
+
+    assert len(set(partials)) == 2 and other not in partials
+    assert all(p.endswith(".part.mp4") and os.path.dirname(p) == str(cache) for p in partials)
+    assert os.listdir(cache) == ["clip_profile.part.mp4"]  # Failed partials removed, the other left alone
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from services import upload_service
+from services.task_manager import TaskCanceledException
+from services.upload_service import (
+    UploadCache, get_video_thumbnail, pick_thumbnail, use_graph_thumbnails,
+)
+
+def test_concurrent_requests_share_one_upload():
+    cache = UploadCache()
+    calls = []
+    release = threading.Event()
+
+    def upload():
+        calls.append(1)
+        release.wait(5)
+        return "hash"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_upload("key", upload))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["hash"] * 4
+    assert len(calls) == 1
+    assert cache.get_or_upload("key", upload) == "hash"
+    assert len(calls) == 1
+
+def test_failed_uploads_are_not_cached():
+    cache = UploadCache()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_upload("key", fail)
+    assert cache.get_or_upload("key", lambda: (None, None)) == (None, None)
+    assert cache.get_or_upload("key", lambda: "hash") == "hash"
+
+def test_waiter_takes_over_when_the_owner_is_canceled():
+    cache = UploadCache()
+    owner_started = threading.Event()
+    cancel_owner = threading.Event()
+
+    def canceled_upload():
+        owner_started.set()
+        cancel_owner.wait(5)
+        raise TaskCanceledException("owner canceled")
+
+    def owner():
+        with pytest.raises(TaskCanceledException):
+            cache.get_or_upload("key", canceled_upload)
+
+    owner_thread = threading.Thread(target=owner)
+    owner_thread.start()
+    owner_started.wait(5)
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_upload("key", lambda: "hash")))
+    waiter.start()
+    time.sleep(0.1)
+    cancel_owner.set()
+    owner_thread.join(5)
+    waiter.join(5)
+
+    assert results == ["hash"]
+
+def test_graph_thumbnails_are_opt_in():
+    assert not use_graph_thumbnails({})
+    assert use_graph_thumbnails({"thumbnail_source": "graph"})
+    assert not use_graph_thumbnails({"thumbnail_source": "graph", "thumbnail_time": "00:00:03"})
+
+def test_pick_thumbnail():
+    thumbnails = [{"uri": "https://a"}, {"uri": "https://b", "is_preferred": True}]
+    assert pick_thumbnail(thumbnails) == "https://b"
+    assert pick_thumbnail(thumbnails[:1]) == "https://a"
+    assert pick_thumbnail([]) is None
+
+@pytest.fixture
+def local_thumbnail(monkeypatch):
+    calls = []
+    monkeypatch.setattr(upload_service, "extract_thumbnail", lambda video_file, task_id, frame_time: calls.append(frame_time) or "thumb.jpg")
+    monkeypatch.setattr(upload_service, "upload_image", lambda app, path, task_id, config: "uploaded-hash")
+    return calls
+
+def test_graph_thumbnail_needs_no_extraction(monkeypatch, local_thumbnail):
+    monkeypatch.setattr(upload_service, "fetch_graph_thumbnail", lambda video_id, task_id, config: "https://graph/t.jpg")
+    assert get_video_thumbnail(None, "v1", "a.mp4", "t", {"thumbnail_source": "graph"}) == "https://graph/t.jpg"
+    assert local_thumbnail == []
+
+def test_falls_back_to_ffmpeg_without_a_graph_thumbnail(monkeypatch, local_thumbnail):
+    def fail(video_id, task_id, config):
+        raise RuntimeError("not ready")
+
+    monkeypatch.setattr(upload_service, "fetch_graph_thumbnail", fail)
+    assert get_video_thumbnail(None, "v1", "a.mp4", "t", {"thumbnail_source": "graph"}) == "uploaded-hash"
+    assert get_video_thumbnail(None, "v1", "a.mp4", "t", {"thumbnail_time": "00:00:03"}) == "uploaded-hash"
+    assert local_thumbnail == [upload_service.DEFAULT_THUMBNAIL_TIME, "00:00:03"]
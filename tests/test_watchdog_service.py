@@ -0,0 +1,66 @@
+import os
+import traceback
+from collections import Counter, deque
+
+import pytest
+
+from services import watchdog_service
+from services.watchdog_service import blocking, get_watchdog_report, offload
+
+def project_frame(name, lineno=1):
+    return traceback.FrameSummary(os.path.join(watchdog_service.PROJECT_ROOT, "services", "x_service.py"), lineno, name)
+
+def library_frame(name):
+    return traceback.FrameSummary("/usr/lib/python3/site-packages/lib/module.py", 1, name)
+
+@pytest.fixture
+def stalls(monkeypatch):
+    monkeypatch.setattr(watchdog_service, "recent_stalls", deque(maxlen=watchdog_service.MAX_STALLS))
+    monkeypatch.setattr(watchdog_service, "stall_totals", {"stalls": 0, "stalled_seconds": 0.0, "worst_seconds": 0.0})
+    monkeypatch.setattr(watchdog_service, "stalls_by_culprit", Counter())
+    monkeypatch.setattr(watchdog_service, "_samples", deque())
+    return watchdog_service._samples
+
+def test_offload_runs_in_place_without_eventlet():
+    assert not watchdog_service.eventlet_patched()
+    assert offload(sum, [1, 2, 3]) == 6
+
+def test_blocking_keeps_the_function_signature():
+    @blocking
+    def resize(width, height=1):
+        """Resizes."""
+        if width < 0:
+            raise ValueError("negative")
+        return width * height
+
+    assert resize.__name__ == "resize" and resize.__doc__ == "Resizes."
+    assert resize(2, height=3) == 6
+    with pytest.raises(ValueError):
+        resize(-1)
+
+def test_stall_is_blamed_on_the_innermost_project_frame(stalls):
+    stack = [project_frame("handler"), project_frame("convert", 42), library_frame("read")]
+    stalls.extend([(1, stack), (1, stack), (2, [project_frame("later")])])
+    watchdog_service._report_stall(1, 0.8)
+
+    stall, = get_watchdog_report()["recent"]
+    assert stall["culprit"] == "services/x_service.py:42 convert"
+    assert stall["blocking_call"].endswith("read")
+    assert stall["samples"] == 2
+    assert list(stalls) == [(2, [project_frame("later")])]  # Samples of later stalls are kept
+
+def test_report_totals_and_limit(stalls):
+    for sequence, seconds in ((1, 0.6), (2, 1.5), (3, 0.7)):
+        stalls.append((sequence, [project_frame(f"call{sequence}")]))
+        watchdog_service._report_stall(sequence, seconds)
+
+    report = get_watchdog_report(limit=2)
+    assert (report["stalls"], report["stalled_seconds"], report["worst_seconds"]) == (3, 2.8, 1.5)
+    assert [s["culprit"].split()[-1] for s in report["recent"]] == ["call3", "call2"]  # Newest first
+    assert len(report["top_culprits"]) == 3
+    assert get_watchdog_report(limit=0)["recent"] == []
+
+def test_stall_without_samples(stalls):
+    watchdog_service._report_stall(7, 0.9)
+    stall, = get_watchdog_report()["recent"]
+    assert (stall["culprit"], stall["blocking_call"], stall["samples"]) == ("unknown", None, 0)
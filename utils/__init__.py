@@ -2,10 +2,12 @@
 
 # Import campaign-related functions
 from .error_handler import (
-    emit_error
+    emit_error,
+    GraphAPIError
 )
 
 # Expose all functions for easier imports
 __all__ = [
-    "emit_error"
+    "emit_error",
+    "GraphAPIError"
 ]
\ No newline at end of file
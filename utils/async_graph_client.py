@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import os
+
+import aiohttp
+
+from utils.error_handler import GraphAPIError
+
+GRAPH_URL = "https://graph.facebook.com"
+GRAPH_VIDEO_URL = "https://graph-video.facebook.com"
+API_VERSION = "v20.0"
+
+# One keep-alive connection pool per client; sized for many in-flight requests
+MAX_CONNECTIONS = 100
+KEEPALIVE_TIMEOUT = 30
+READ_TIMEOUT = 120
+
+def encode_params(params):
+    """
+    Encodes request parameters the way the Graph API expects form fields.
+
+    Dicts and lists are JSON-encoded, booleans become 'true'/'false' and
+    None values are dropped.
+
+    Args:
+        params (dict): Raw parameters.
+
+    Returns:
+        dict: Parameters with string values.
+    """
+    encoded = {}
+    for key, value in (params or {}).items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            encoded[key] = "true" if value else "false"
+        elif isinstance(value, (dict, list)):
+            encoded[key] = json.dumps(value)
+        else:
+            encoded[key] = str(value)
+    return encoded
+
+class AsyncGraphClient:
+    """
+    Minimal asyncio Graph API client covering the endpoints the media pipeline uses.
+
+    A single `aiohttp` session with a keep-alive connection pool is shared by
+    all requests, so thousands of uploads, polls and creates can be in flight
+    on one event loop without a thread each.
+    """
+
+    def __init__(self, access_token, api_version=API_VERSION, max_connections=MAX_CONNECTIONS):
+        self.access_token = access_token
+        self.api_version = api_version
+        self.max_connections = max_connections
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=KEEPALIVE_TIMEOUT)
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=READ_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self):
+        """Closes the underlying HTTP session and its connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _url(self, path, video=False):
+        host = GRAPH_VIDEO_URL if video else GRAPH_URL
+        return f"{host}/{self.api_version}/{path.lstrip('/')}"
+
+    async def request(self, method, path, params=None, data=None, video=False):
+        """
+        Sends a Graph API request and returns the decoded JSON body.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Graph path, e.g. "act_123/adsets".
+            params (dict, optional): Query parameters.
+            data (dict or aiohttp.FormData, optional): Form body.
+            video (bool): Send to the graph-video host.
+
+        Returns:
+            dict: The response body.
+
+        Raises:
+            GraphAPIError: If Graph returns an error.
+        """
+        query = encode_params(params)
+        query["access_token"] = self.access_token
+        if isinstance(data, dict):
+            data = encode_params(data)
+
+        async with self._get_session().request(method, self._url(path, video), params=query, data=data) as response:
+            try:
+                body = await response.json(content_type=None)
+            except (json.JSONDecodeError, aiohttp.ContentTypeError):
+                body = {}
+
+            if response.status >= 400 or "error" in body:
+                raise GraphAPIError.from_response(response.status, body)
+            return body
+
+    async def _create(self, parent_id, edge, params):
+        body = await self.request("POST", f"{parent_id}/{edge}", data=params)
+        return body.get("id")
+
+    async def create_campaign(self, ad_account_id, params):
+        """Creates a campaign and returns its ID."""
+        return await self._create(ad_account_id, "campaigns", params)
+
+    async def create_ad_set(self, ad_account_id, params):
+        """Creates an ad set and returns its ID."""
+        return await self._create(ad_account_id, "adsets", params)
+
+    async def create_ad_creative(self, ad_account_id, params):
+        """Creates an ad creative and returns its ID."""
+        return await self._create(ad_account_id, "adcreatives", params)
+
+    async def create_ad(self, ad_account_id, params):
+        """Creates an ad and returns its ID."""
+        return await self._create(ad_account_id, "ads", params)
+
+    async def upload_image(self, ad_account_id, image_file):
+        """
+        Uploads an image, streaming the file body, and returns its hash.
+
+        Args:
+            ad_account_id (str): The Ad Account ID.
+            image_file (str): Path to the image.
+
+        Returns:
+            str: The image hash, or None if Graph did not return one.
+        """
+        file_name = os.path.basename(image_file)
+        with open(image_file, "rb") as f:
+            form = aiohttp.FormData()
+            form.add_field("filename", f, filename=file_name)
+            body = await self.request("POST", f"{ad_account_id}/adimages", data=form)
+
+        images = body.get("images", {})
+        image = images.get(file_name) or next(iter(images.values()), {})
+        return image.get("hash")
+
+    async def start_video_upload(self, ad_account_id, file_size):
+        """
+        Opens a chunked video upload session.
+
+        Returns:
+            dict: `upload_session_id`, `video_id` and the first chunk's `start_offset` / `end_offset`.
+        """
+        return await self.request("POST", f"{ad_account_id}/advideos",
+                                  data={"upload_phase": "start", "file_size": file_size}, video=True)
+
+    async def transfer_video_chunk(self, ad_account_id, upload_session_id, video_file, start_offset, length):
+        """
+        Sends one chunk of a video upload, read from `video_file` at `start_offset`.
+
+        Returns:
+            dict: The next chunk's `start_offset` and `end_offset` (equal once Graph has everything).
+        """
+        chunk = await asyncio.to_thread(_read_chunk, video_file, start_offset, length)
+        form = aiohttp.FormData()
+        form.add_field("upload_phase", "transfer")
+        form.add_field("upload_session_id", str(upload_session_id))
+        form.add_field("start_offset", str(start_offset))
+        form.add_field("video_file_chunk", chunk, filename=os.path.basename(video_file))
+        return await self.request("POST", f"{ad_account_id}/advideos", data=form, video=True)
+
+    async def finish_video_upload(self, ad_account_id, upload_session_id):
+        """Closes a chunked video upload session once every chunk is sent."""
+        return await self.request("POST", f"{ad_account_id}/advideos",
+                                  data={"upload_phase": "finish", "upload_session_id": upload_session_id}, video=True)
+
+    async def upload_video(self, ad_account_id, video_file):
+        """
+        Uploads a video with Graph's chunked upload phases and returns its ID.
+
+        A failed request fails the whole upload; callers that retry should
+        drive the phases themselves, retrying each chunk on its own.
+
+        Args:
+            ad_account_id (str): The Ad Account ID.
+            video_file (str): Path to the video.
+
+        Returns:
+            str: The video ID.
+        """
+        start = await self.start_video_upload(ad_account_id, os.path.getsize(video_file))
+        upload_session_id = start["upload_session_id"]
+        start_offset = int(start["start_offset"])
+        end_offset = int(start["end_offset"])
+
+        while start_offset < end_offset:
+            offsets = await self.transfer_video_chunk(ad_account_id, upload_session_id, video_file,
+                                                      start_offset, end_offset - start_offset)
+            start_offset = int(offsets["start_offset"])
+            end_offset = int(offsets["end_offset"])
+
+        await self.finish_video_upload(ad_account_id, upload_session_id)
+        return start.get("video_id")
+
+    async def get_video_status(self, video_id):
+        """Returns the processing status of a video (e.g. 'processing', 'ready')."""
+        body = await self.request("GET", str(video_id), params={"fields": "status"}, video=True)
+        return body.get("status", {}).get("video_status", "unknown")
+
+    async def get_video_thumbnails(self, video_id):
+        """Returns the thumbnails Graph generated for a processed video (`uri`, `is_preferred`)."""
+        body = await self.request("GET", f"{video_id}/thumbnails", params={"fields": "uri,is_preferred"})
+        return body.get("data", [])
+
+    async def wait_for_video(self, video_id, timeout=600, poll_interval=5):
+        """
+        Polls a video until it is ready, backing off between polls.
+
+        Returns:
+            bool: True if the video became ready within `timeout` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while loop.time() < deadline:
+            try:
+                status = await self.get_video_status(video_id)
+                if status == "ready":
+                    return True
+                if status not in ("processing", "uploading"):
+                    logging.warning(f"Unexpected video status for {video_id}: {status}")
+                    return False
+            except (GraphAPIError, aiohttp.ClientError) as e:
+                logging.error(f"Error polling video status: {e}")
+
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(30, poll_interval + 5)
+
+        logging.warning(f"Video {video_id} did not finish processing within {timeout} seconds.")
+        return False
+
+def _read_chunk(path, offset, length):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
@@ -5,6 +5,26 @@ import re
 # Flask-related imports
 from flask import current_app
 
+class GraphAPIError(Exception):
+    """Raised when a raw Graph API request responds with an error payload."""
+
+    def __init__(self, message, code=None, subcode=None, status=None):
+        super().__init__(message)
+        self.code = code
+        self.subcode = subcode
+        self.status = status
+
+    @classmethod
+    def from_response(cls, status, body):
+        """Builds the error from an HTTP status and decoded JSON body."""
+        error = body.get("error", {}) if isinstance(body, dict) else {}
+        return cls(
+            error.get("message", f"Graph request failed with HTTP {status}"),
+            code=error.get("code"),
+            subcode=error.get("error_subcode"),
+            status=status,
+        )
+
 def get_socketio():
     """
     Retrieve the SocketIO instance dynamically from Flask's current_app extensions.
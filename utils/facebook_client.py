@@ -1,5 +1,93 @@
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from requests.adapters import HTTPAdapter
+
 from facebook_business.api import FacebookAdsApi
+from facebook_business.session import FacebookSession
+
+API_VERSION = 'v20.0'
+
+# Connection pool per account; sized to match the per-ad-set worker count
+# in media processing so concurrent uploads never wait for a connection.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 10
+
+# APIs kept at once; rotated tokens would otherwise add one forever, so the least recently used is dropped
+MAX_POOLED_APIS = int(os.environ.get("MAX_POOLED_APIS", 256))
+
+_api_pool = OrderedDict()  # Maps (app_id, access_token) to a FacebookAdsApi instance, least recently used first
+_pool_lock = Lock()
+
+def _build_api(app_id, app_secret, access_token):
+    """
+    Creates a FacebookAdsApi with its own keep-alive `requests` connection pool.
+
+    Args:
+        app_id (str): Facebook App ID.
+        app_secret (str): Facebook App Secret.
+        access_token (str): Facebook Access Token.
+
+    Returns:
+        FacebookAdsApi: A new API instance bound to the given credentials.
+    """
+    session = FacebookSession(app_id, app_secret, access_token)
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.requests.mount("https://", adapter)
+    return FacebookAdsApi(session, api_version=API_VERSION)
+
+def get_api(app_id, app_secret, access_token):
+    """
+    Returns the pooled FacebookAdsApi for a set of credentials, creating it on first use.
+
+    Unlike `FacebookAdsApi.init`, this never sets the SDK's process-wide
+    default, so one tenant's token can't leak into SDK objects built for
+    another; pass the returned API as `api=` to every SDK object. At most
+    MAX_POOLED_APIS are kept; the least recently used is dropped first.
+
+    Args:
+        app_id (str): Facebook App ID.
+        app_secret (str): Facebook App Secret.
+        access_token (str): Facebook Access Token.
+
+    Returns:
+        FacebookAdsApi: The API instance for these credentials.
+    """
+    key = (app_id, access_token)
+    evicted = None
+    with _pool_lock:
+        api = _api_pool.get(key)
+        if api is not None:
+            _api_pool.move_to_end(key)
+            return api
+
+        api = _build_api(app_id, app_secret, access_token)
+        _api_pool[key] = api
+        logging.info(f"Created Graph API session for app {app_id}")
+        if len(_api_pool) > MAX_POOLED_APIS:
+            _, evicted = _api_pool.popitem(last=False)
+
+    if evicted is not None:
+        # Drops its idle connections; a task still holding it keeps working on fresh ones
+        evicted._session.requests.close()
+    return api
+
+def get_api_for_config(config):
+    """
+    Returns the pooled API for a campaign config, or None if it carries no access token.
+
+    Args:
+        config (dict): Configuration with `app_id`, `app_secret` and `access_token`.
+
+    Returns:
+        FacebookAdsApi or None: The API to pass to SDK objects.
+    """
+    if not config.get("access_token"):
+        return None
+    return get_api(config.get("app_id"), config.get("app_secret"), config["access_token"])
 
 class FacebookAdsClient:
     def __init__(self, app_id, app_secret, access_token):
-        self.api = FacebookAdsApi.init(app_id, app_secret, access_token, api_version='v20.0')
\ No newline at end of file
+        self.api = get_api(app_id, app_secret, access_token)
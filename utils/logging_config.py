@@ -0,0 +1,230 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+
+# Root level (DEBUG only when asked for) and output format ("json" or "text")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+
+# Records waiting for the writer thread; beyond this, INFO and below are dropped rather than blocking callers
+MAX_QUEUED_RECORDS = int(os.environ.get("LOG_MAX_QUEUED_RECORDS", 10000))
+
+# Hot-path records (tagged `extra={"hot_path": key}`) let through per key per second
+HOT_PATH_LOGS_PER_SECOND = int(os.environ.get("LOG_HOT_PATH_PER_SECOND", 5))
+
+# Fields carried from the current context onto every record
+CONTEXT_FIELDS = ("task_id", "ad_account_id", "stage")
+
+# Secrets that must never reach the logs: Graph tokens, app secrets and proofs, bearer tokens
+SECRET_PATTERNS = [
+    (re.compile(r"(?i)((?:access_token|app_secret|appsecret_proof|client_secret|admin_token)['\"]?\s*[:=]\s*['\"]?)[^'\"&\s,}]+"),
+     r"\1[REDACTED]"),
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._\-]+"), r"\1[REDACTED]"),
+    (re.compile(r"\bEAA[A-Za-z0-9]{20,}"), "[REDACTED]"),
+]
+
+_log_context = contextvars.ContextVar("log_context", default={})
+_listener = None
+
+def redact(text):
+    """Masks access tokens, app secrets and bearer tokens in a string."""
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+@contextmanager
+def log_context(**fields):
+    """Tags every record logged inside the block (in this thread, greenlet or asyncio task) with `fields`."""
+    token = _log_context.set({**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+def bind_log_context(**fields):
+    """Tags the rest of the current context's records with `fields` (e.g. at the top of an asyncio task)."""
+    _log_context.set({**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+def task_log_context(func):
+    """
+    Decorates a function taking `task_id` (and optionally `config`) so every
+    record it logs carries the task ID and the config's ad account.
+    """
+    params = list(inspect.signature(func).parameters)
+    task_index = params.index("task_id") if "task_id" in params else None
+    config_index = params.index("config") if "config" in params else None
+
+    def argument(args, kwargs, name, index):
+        if name in kwargs:
+            return kwargs[name]
+        return args[index] if index is not None and index < len(args) else None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        config = argument(args, kwargs, "config", config_index)
+        with log_context(
+            task_id=argument(args, kwargs, "task_id", task_index) or None,
+            ad_account_id=config.get("ad_account_id") if isinstance(config, dict) else None,
+        ):
+            return func(*args, **kwargs)
+    return wrapper
+
+class ContextFilter(logging.Filter):
+    """Runs on the caller's side: adds context fields and samples hot-path records."""
+
+    def __init__(self, per_second=HOT_PATH_LOGS_PER_SECOND):
+        super().__init__()
+        self.per_second = per_second
+        self.windows = {}  # Hot-path key -> [window start second, records let through, records suppressed]
+
+    def filter(self, record):
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+
+        key = getattr(record, "hot_path", None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        second = int(time.monotonic())
+        window = self.windows.get(key)
+        if window is None or window[0] != second:
+            suppressed = window[2] if window else 0
+            window = self.windows[key] = [second, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed  # Reported on the first record of the next window
+        if window[1] >= self.per_second:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, context fields, exception."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        for key in CONTEXT_FIELDS + ("hot_path", "suppressed"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = redact(record.exc_text)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """The classic text format, with the task ID when there is one, redacted."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        task_id = getattr(record, "task_id", None)
+        return redact(f"[{task_id}] {text}" if task_id else text)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without waiting on I/O. The message
+    and traceback are rendered here, since arguments may change afterwards.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if record.levelno < logging.WARNING and self.queue.qsize() >= MAX_QUEUED_RECORDS:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+def _native(module):
+    """Returns the unpatched standard module even under eventlet, so the writer is a real thread."""
+    if "eventlet" in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched("thread"):
+            return patcher.original(module)
+    return __import__(module)
+
+class _LogWriter:
+    """Native thread writing queued records to the real handlers."""
+
+    def __init__(self, queue, handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self.thread = _native("threading").Thread(target=self._run, name="log-writer", daemon=True)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """
+    Routes all logging through a queue to a native writer thread, so request
+    handlers and workers never wait on stdout.
+
+    Records are JSON lines (or text with `fmt="text"`) tagged with the task
+    ID, ad account and stage from `log_context`, with secrets redacted.
+    Safe to call more than once; later calls replace the pipeline.
+
+    Args:
+        level (str): Root log level, e.g. "INFO".
+        fmt (str): "json" or "text".
+        stream: Output stream (defaults to stdout).
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    queue = _native("queue").SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = _LogWriter(queue, [output])
+    _listener.thread.start()
+    atexit.register(_listener.stop)  # Flush what is queued on shutdown
+    return queue_handler
@@ -1,7 +1,12 @@
+import hmac
 import json
 import logging
+import os
 from flask import request, jsonify
 
+# Shared secret for admin endpoints; admin endpoints are disabled while it is unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
 def validate_campaign_request():
     """
     Validates required fields for creating a campaign.
@@ -18,6 +23,45 @@ def validate_campaign_request():
     return True, None, None
 
 
+def validate_admin_request():
+    """
+    Checks the admin token sent as `Authorization: Bearer <token>` or `X-Admin-Token`.
+
+    Returns:
+        tuple: (bool, response, status_code) - True if authorized, False if error with response message.
+    """
+    if not ADMIN_TOKEN:
+        return False, jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN is not set)"}), 403
+
+    token = request.headers.get("X-Admin-Token", "")
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+
+    if not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        logging.warning(f"Rejected admin request to {request.path} from {request.remote_addr}")
+        return False, jsonify({"error": "Unauthorized"}), 401
+
+    return True, None, None
+
+
+def validate_bulk_campaign_request():
+    """
+    Validates required fields for a bulk campaign submission.
+
+    Returns:
+        tuple: (bool, response, status_code) - True if valid, False if error with response message.
+    """
+    missing_fields = [field for field in ["ad_account_id"] if request.form.get(field) is None]
+    if "manifest" not in request.form and "manifest" not in request.files:
+        missing_fields.append("manifest")
+
+    if missing_fields:
+        return False, jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
+
+    return True, None, None
+
+
 def validate_json_payload():
     """
     Validates and extracts the 'platforms' and 'placements' JSON fields from request.